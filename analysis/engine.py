@@ -1,37 +1,36 @@
-
-from db.init import SessionLocal
-from db.models import VirtualMachine, VMMetric
+from db.storage import get_storage
 from datetime import datetime, timedelta
 
-def get_underutilized_vms(cpu_threshold=10.0, memory_threshold=20.0, days=7):
-    db = SessionLocal()
-    underutilized = []
-
-    try:
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        vms = db.query(VirtualMachine).all()
-
-        for vm in vms:
-            metrics = db.query(VMMetric).filter(
-                VMMetric.vm_id == vm.id,
-                VMMetric.timestamp >= cutoff
-            ).all()
+def get_underutilized_page(cpu_threshold=10.0, memory_threshold=20.0, days=7,
+                           limit=100, offset=0, percentiles=False, storage=None):
+    storage = storage or get_storage()
 
-            if not metrics:
-                continue
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # Averaged, thresholded and paginated by the database, one row per matching VM
+    page = storage.underutilized_vms(
+        cpu_threshold, memory_threshold, since=cutoff, limit=limit, offset=offset, percentiles=percentiles
+    )
 
-            avg_cpu = sum([m.cpu_usage for m in metrics]) / len(metrics)
-            avg_mem = sum([m.memory_usage for m in metrics]) / len(metrics)
-
-            if avg_cpu < cpu_threshold and avg_mem < memory_threshold:
-                underutilized.append({
-                    "vm": vm.name,
-                    "avg_cpu": round(avg_cpu, 2),
-                    "avg_mem": round(avg_mem, 2),
-                    "cpu_threshold": cpu_threshold,
-                    "memory_threshold": memory_threshold
-                })
-    finally:
-        db.close()
-
-    return underutilized
+    underutilized = []
+    for vm in page["items"]:
+        entry = {
+            "vm": vm["name"],
+            "avg_cpu": round(vm["avg_cpu_usage"], 2),
+            "avg_mem": round(vm["avg_memory_usage"], 2),
+            "cpu_threshold": cpu_threshold,
+            "memory_threshold": memory_threshold
+        }
+        if percentiles:
+            entry["p95_cpu"] = _rounded(vm["p95_cpu_usage"])
+            entry["p95_mem"] = _rounded(vm["p95_memory_usage"])
+        underutilized.append(entry)
+
+    return {"total": page["total"], "limit": limit, "offset": offset, "items": underutilized}
+
+def get_underutilized_vms(cpu_threshold=10.0, memory_threshold=20.0, days=7, storage=None):
+    return get_underutilized_page(
+        cpu_threshold, memory_threshold, days, limit=None, storage=storage
+    )["items"]
+
+def _rounded(value):
+    return round(value, 2) if value is not None else None
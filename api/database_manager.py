@@ -3,15 +3,51 @@ IROA Infrastructure Database Manager
 Handles persistence of infrastructure inventory data
 """
 
+import hashlib
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 import logging
 
+from db.migrations import migrate
+from db.sqlite_pool import get_pool
+from .inventory_cache import SerializedInventory, get_inventory_cache
+
 logger = logging.getLogger(__name__)
 
+# Inventory section -> table holding it
+INVENTORY_TABLES = {
+    'datacenters': 'infrastructure_datacenters',
+    'clusters': 'infrastructure_clusters',
+    'hosts': 'infrastructure_hosts',
+    'datastores': 'infrastructure_datastores',
+    'networks': 'infrastructure_networks',
+    'vms': 'infrastructure_vms',
+}
+
+# Live utilisation columns: stored on every sync but left out of the content
+# fingerprint, so load changes neither rewrite rows nor raise *_changed events
+UTILIZATION_COLUMNS = {
+    'infrastructure_clusters': ['used_cpu_mhz', 'used_memory_gb'],
+    'infrastructure_hosts': ['cpu_usage_mhz', 'memory_usage_gb'],
+    'infrastructure_vms': ['cpu_usage_percent', 'memory_usage_percent'],
+}
+
+# Days a deactivated inventory object is kept before compaction deletes it
+INACTIVE_RETENTION_DAYS = 30
+
+# Inventory table -> resource_type of its infrastructure_events
+RESOURCE_TYPES = {
+    'infrastructure_datacenters': 'datacenter',
+    'infrastructure_clusters': 'cluster',
+    'infrastructure_hosts': 'host',
+    'infrastructure_datastores': 'datastore',
+    'infrastructure_networks': 'network',
+    'infrastructure_vms': 'vm',
+}
+
 class InfrastructureDBManager:
     """Manages database operations for infrastructure inventory"""
     
@@ -19,6 +55,7 @@ class InfrastructureDBManager:
         self.db_path = db_path
         self.ensure_db_directory()
         self.init_database()
+        self.inventory_cache = get_inventory_cache(db_path)
     
     def ensure_db_directory(self):
         """Ensure database directory exists"""
@@ -26,100 +63,78 @@ class InfrastructureDBManager:
         db_dir.mkdir(parents=True, exist_ok=True)
     
     def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access
-        return conn
+        """Shared writer connection (context manager; commits on success)"""
+        return get_pool(self.db_path).writer()
+    
+    def get_read_connection(self):
+        """Pooled read-only connection (context manager)"""
+        return get_pool(self.db_path).reader()
     
     def init_database(self):
-        """Initialize database with required schemas"""
+        """Apply pending schema migrations (database/migrations/inventory)"""
         try:
-            # Read and execute the inventory schemas
-            schema_files = [
-                "database/schemas.sql",
-                "database/inventory_schemas.sql",
-                "database/workload_schemas.sql"
-            ]
+            applied = migrate(self.db_path, "inventory")
+            if applied:
+                logger.info(f"Applied database migrations: {', '.join(applied)}")
             
-            with self.get_connection() as conn:
-                for schema_file in schema_files:
-                    if Path(schema_file).exists():
-                        with open(schema_file, 'r') as f:
-                            conn.executescript(f.read())
-                        logger.info(f"Applied database schema: {schema_file}")
-                    else:
-                        logger.warning(f"Schema file not found: {schema_file}")
-                
-                conn.commit()
-                logger.info("Database schemas initialized successfully")
-                
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
     
-    def save_infrastructure_inventory(self, source: str, inventory: Dict[str, Any]) -> bool:
+    def save_infrastructure_inventory(self, source: str, inventory: Dict[str, Any],
+                                      sync_details: Optional[Dict[str, Any]] = None,
+                                      sync_start: Optional[datetime] = None, sweep: bool = True,
+                                      site: str = '') -> bool:
         """
         Save complete infrastructure inventory to database
         
+        Every object saved is stamped with this sync's generation; with sweep,
+        objects of this site and the reported sections that this sync did not
+        see are deactivated when it commits. Other sites of the source are left
+        alone; rows stored before sites were recorded (site '') count as part
+        of every site until a site saves them again and adopts them.
+        
         Args:
             source: Infrastructure source (vcenter, hyperv)
             inventory: Complete inventory data
+            sync_details: Extra details stored with the sync history row (e.g. site)
+            sync_start: When collection started, so the recorded duration covers it
+            sweep: False when the inventory is only part of the source (one of
+                several vCenter sites); see sweep_stale_inventory
+            site: vCenter host the inventory was collected from ('' for sources
+                without sites); objects are keyed by source, site and moid
+                (name for objects without a moid)
             
         Returns:
             bool: Success status
         """
+        sync_start = sync_start or datetime.now()
+        sync_id = None
         try:
-            sync_start = datetime.now()
-            
             with self.get_connection() as conn:
                 # Start sync history record
-                sync_id = self._start_sync_history(conn, source, sync_start)
+                sync_id = self._start_sync_history(conn, source, sync_start, sync_details=sync_details)
+                conn.commit()
                 
                 records_processed = 0
                 records_added = 0
                 records_updated = 0
                 
-                # Save datacenters
-                if 'datacenters' in inventory:
-                    dc_stats = self._save_datacenters(conn, source, inventory['datacenters'])
-                    records_processed += dc_stats['processed']
-                    records_added += dc_stats['added']
-                    records_updated += dc_stats['updated']
-                
-                # Save clusters  
-                if 'clusters' in inventory:
-                    cluster_stats = self._save_clusters(conn, source, inventory['clusters'])
-                    records_processed += cluster_stats['processed']
-                    records_added += cluster_stats['added']
-                    records_updated += cluster_stats['updated']
-                
-                # Save hosts
-                if 'hosts' in inventory:
-                    host_stats = self._save_hosts(conn, source, inventory['hosts'])
-                    records_processed += host_stats['processed']
-                    records_added += host_stats['added']
-                    records_updated += host_stats['updated']
+                # Parents first so children resolve their foreign keys; each
+                # entity type is committed as its own transaction
+                for section, save in self._save_methods():
+                    if section not in inventory:
+                        continue
+                    section_stats = save(conn, source, inventory[section], sync_id, site)
+                    conn.commit()
+                    records_processed += section_stats['processed']
+                    records_added += section_stats['added']
+                    records_updated += section_stats['updated']
                 
-                # Save datastores
-                if 'datastores' in inventory:
-                    ds_stats = self._save_datastores(conn, source, inventory['datastores'])
-                    records_processed += ds_stats['processed']
-                    records_added += ds_stats['added']
-                    records_updated += ds_stats['updated']
-                
-                # Save networks
-                if 'networks' in inventory:
-                    net_stats = self._save_networks(conn, source, inventory['networks'])
-                    records_processed += net_stats['processed']
-                    records_added += net_stats['added']
-                    records_updated += net_stats['updated']
-                
-                # Save VMs
-                if 'vms' in inventory:
-                    vm_stats = self._save_vms(conn, source, inventory['vms'])
-                    records_processed += vm_stats['processed']
-                    records_added += vm_stats['added']
-                    records_updated += vm_stats['updated']
+                records_deleted = 0
+                if sweep:
+                    sections = [section for section in INVENTORY_TABLES if section in inventory]
+                    records_deleted = self._sweep_stale_rows(conn, source, sections, sync_id, sync_id, site)
                 
                 # Complete sync history
                 sync_end = datetime.now()
@@ -127,29 +142,224 @@ class InfrastructureDBManager:
                 
                 self._complete_sync_history(
                     conn, sync_id, sync_end, duration,
-                    records_processed, records_added, records_updated, 0
+                    records_processed, records_added, records_updated, records_deleted
                 )
                 
                 # Update infrastructure summary
                 self._update_infrastructure_summary(conn, source)
                 
                 conn.commit()
+                self.inventory_cache.invalidate(source)
                 
                 logger.info(f"Successfully saved {source} inventory: "
-                          f"{records_processed} processed, {records_added} added, {records_updated} updated")
+                          f"{records_processed} processed, {records_added} added, {records_updated} updated, "
+                          f"{records_deleted} deactivated")
                 
                 return True
                 
         except Exception as e:
             logger.error(f"Error saving {source} inventory: {e}")
+            if sync_id is not None:
+                self._fail_sync_history(source, sync_id, sync_start, str(e))
             return False
     
-    def _start_sync_history(self, conn: sqlite3.Connection, source: str, started_at: datetime) -> int:
+    def _save_methods(self):
+        """Inventory sections and their save methods, parents before children"""
+        return [
+            ('datacenters', self._save_datacenters),
+            ('clusters', self._save_clusters),
+            ('hosts', self._save_hosts),
+            ('datastores', self._save_datastores),
+            ('networks', self._save_networks),
+            ('vms', self._save_vms),
+        ]
+    
+    def apply_inventory_delta(self, source: str, upserts: Dict[str, List[Dict]],
+                              removals: Dict[str, List[str]], site: str = '') -> Dict[str, int]:
+        """
+        Apply an incremental inventory change set
+
+        Upserted records go through the regular _save_* methods (parents first),
+        which also re-activate them; removed moids are soft-deleted with
+        is_active = 0. Nothing is swept, the delta only covers what changed.
+
+        Args:
+            source: Infrastructure source (vcenter, hyperv)
+            upserts: Changed records per inventory section
+            removals: Removed moids per inventory section
+            site: vCenter host the changes came from ('' for sources without sites)
+
+        Returns:
+            Dict with processed/added/updated/deleted counts
+        """
+        stats = {'processed': 0, 'added': 0, 'updated': 0, 'deleted': 0}
+        sync_start = datetime.now()
+
+        with self.get_connection() as conn:
+            sync_id = self._start_sync_history(conn, source, sync_start, sync_type='incremental')
+
+            for section, save in self._save_methods():
+                records = upserts.get(section) or []
+                if not records:
+                    continue
+                section_stats = save(conn, source, records, sync_id, site)
+                for key in ('processed', 'added', 'updated'):
+                    stats[key] += section_stats[key]
+
+            now = datetime.now()
+            for section, moids in (removals or {}).items():
+                if not moids or section not in INVENTORY_TABLES:
+                    continue
+                table = INVENTORY_TABLES[section]
+                stored = self._load_keyed_rows(conn, table, source, site)
+                removed = {}
+                for moid in moids:
+                    row = stored.get(self._row_key(None, moid))
+                    if row is not None and row['is_active']:
+                        removed[row['id']] = row
+                conn.executemany(
+                    f"UPDATE {table} SET is_active = 0, updated_at = ? WHERE id = ?",
+                    [(now, row_id) for row_id in removed]
+                )
+                self._record_events(conn, source, sync_id, RESOURCE_TYPES[table], [
+                    ('deleted', row['moid'], row['name']) for row in removed.values()
+                ], now)
+                stats['deleted'] += len(removed)
+
+            sync_end = datetime.now()
+            self._complete_sync_history(
+                conn, sync_id, sync_end, int((sync_end - sync_start).total_seconds()),
+                stats['processed'], stats['added'], stats['updated'], stats['deleted']
+            )
+
+            if stats['processed'] or stats['deleted']:
+                self._update_infrastructure_summary(conn, source)
+
+            conn.commit()
+        self.inventory_cache.invalidate(source)
+
+        logger.info(f"Applied {source} inventory delta: {stats['processed']} processed, "
+                    f"{stats['added']} added, {stats['updated']} updated, {stats['deleted']} removed")
+        return stats
+
+    def get_sync_generation(self) -> int:
+        """Generation of the newest sync so far (syncs started later are stamped higher)"""
+        with self.get_read_connection() as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM infrastructure_sync_history").fetchone()[0]
+    
+    def sweep_stale_inventory(self, source: str, min_generation: int,
+                              sections: Optional[List[str]] = None) -> int:
+        """
+        Deactivate objects not seen by any sync since min_generation
+        
+        For sources saved in parts without sweep (the multi-site vCenter
+        fan-out): once every part has been saved, take min_generation from
+        get_sync_generation() + 1 as read before the first part. A sweep
+        that deactivates anything is recorded as a 'sweep' sync, which moves
+        the inventory version on for every process serving the cache.
+        
+        Args:
+            source: Infrastructure source (vcenter, hyperv)
+            min_generation: Objects last stamped below this are deactivated
+            sections: Inventory sections to sweep (default: all)
+            
+        Returns:
+            Number of objects deactivated
+        """
+        started_at = datetime.now()
+        with self.get_connection() as conn:
+            deactivated = self._sweep_stale_rows(conn, source, sections or list(INVENTORY_TABLES), min_generation)
+            if deactivated:
+                self._update_infrastructure_summary(conn, source)
+                sync_id = self._start_sync_history(conn, source, started_at, sync_type='sweep')
+                completed_at = datetime.now()
+                self._complete_sync_history(conn, sync_id, completed_at,
+                                            int((completed_at - started_at).total_seconds()),
+                                            deactivated, 0, 0, deactivated)
+            conn.commit()
+        if deactivated:
+            self.inventory_cache.invalidate(source)
+            logger.info(f"Deactivated {deactivated} stale {source} inventory objects")
+        return deactivated
+    
+    def purge_inactive_inventory(self, retention_days: int = INACTIVE_RETENTION_DAYS) -> Dict[str, int]:
+        """
+        Physically delete objects inactive for longer than retention_days
+        
+        Children go first, together with their datastore/network mappings;
+        inventory events older than the window are purged as well.
+        
+        Returns:
+            Rows deleted per inventory section (plus 'events')
+        """
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        purged = {}
+        with self.get_connection() as conn:
+            expired = "is_active = 0 AND updated_at < ?"
+            conn.execute(
+                "DELETE FROM vm_datastore_mapping WHERE "
+                f"vm_id IN (SELECT id FROM infrastructure_vms WHERE {expired}) OR "
+                f"datastore_id IN (SELECT id FROM infrastructure_datastores WHERE {expired})",
+                (cutoff, cutoff)
+            )
+            conn.execute(
+                "DELETE FROM vm_network_mapping WHERE "
+                f"vm_id IN (SELECT id FROM infrastructure_vms WHERE {expired}) OR "
+                f"network_id IN (SELECT id FROM infrastructure_networks WHERE {expired})",
+                (cutoff, cutoff)
+            )
+            for section, _ in reversed(self._save_methods()):
+                purged[section] = conn.execute(
+                    f"DELETE FROM {INVENTORY_TABLES[section]} WHERE {expired}", (cutoff,)
+                ).rowcount
+            purged['events'] = conn.execute(
+                "DELETE FROM infrastructure_events WHERE event_timestamp < ?", (cutoff,)
+            ).rowcount
+            conn.commit()
+        logger.info(f"Purged inventory inactive for more than {retention_days} days: {purged}")
+        return purged
+    
+    def record_failed_sync(self, source: str, started_at: datetime, error: str,
+                           sync_details: Optional[Dict[str, Any]] = None, status: str = 'failed'):
+        """Record a sync that produced no inventory (error or timeout)"""
+        try:
+            completed_at = datetime.now()
+            with self.get_connection() as conn:
+                conn.execute(
+                    "INSERT INTO infrastructure_sync_history "
+                    "(source, sync_type, status, started_at, completed_at, duration_seconds, "
+                    "error_message, sync_details, triggered_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (source, 'full', status, started_at, completed_at,
+                     int((completed_at - started_at).total_seconds()), error,
+                     json.dumps(sync_details) if sync_details else None, 'api')
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error recording failed {source} sync: {e}")
+    
+    def _fail_sync_history(self, source: str, sync_id: int, started_at: datetime, error: str):
+        """Mark a sync that was interrupted part way as failed"""
+        try:
+            completed_at = datetime.now()
+            with self.get_connection() as conn:
+                conn.execute(
+                    "UPDATE infrastructure_sync_history SET status = ?, completed_at = ?, "
+                    "duration_seconds = ?, error_message = ? WHERE id = ?",
+                    ('failed', completed_at, int((completed_at - started_at).total_seconds()), error, sync_id)
+                )
+                conn.commit()
+            # Sections committed before the failure are visible
+            self.inventory_cache.invalidate(source)
+        except Exception as e:
+            logger.error(f"Error marking sync {sync_id} as failed: {e}")
+    
+    def _start_sync_history(self, conn: sqlite3.Connection, source: str, started_at: datetime,
+                            sync_type: str = 'full', sync_details: Optional[Dict[str, Any]] = None) -> int:
         """Start sync history record"""
         cursor = conn.execute(
-            "INSERT INTO infrastructure_sync_history (source, sync_type, status, started_at, triggered_by) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (source, 'full', 'running', started_at, 'api')
+            "INSERT INTO infrastructure_sync_history (source, sync_type, status, started_at, sync_details, triggered_by) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, sync_type, 'running', started_at, json.dumps(sync_details) if sync_details else None, 'api')
         )
         return cursor.lastrowid
     
@@ -164,417 +374,334 @@ class InfrastructureDBManager:
             ('success', completed_at, duration, processed, added, updated, deleted, sync_id)
         )
     
-    def _save_datacenters(self, conn: sqlite3.Connection, source: str, datacenters: List[Dict]) -> Dict[str, int]:
-        """Save datacenters to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
-        
-        for dc in datacenters:
-            stats['processed'] += 1
-            
-            # Check if datacenter exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_datacenters WHERE name = ? AND source = ?",
-                (dc['name'], source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_datacenters SET "
-                    "moid = ?, description = ?, updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (dc.get('moid'), dc.get('description'), now, now, existing['id'])
-                )
-                stats['updated'] += 1
-            else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_datacenters "
-                    "(name, moid, source, description, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?)",
-                    (dc['name'], dc.get('moid'), source, dc.get('description'), now)
-                )
-                stats['added'] += 1
+    def _load_name_map(self, conn: sqlite3.Connection, table: str, source: str,
+                       columns: str = "id", site: str = '') -> Dict[str, Any]:
+        """Preload name -> id (or name -> row) for one source and site in a single query
         
-        return stats
+        Names need not be unique; a name shared by several rows maps to the
+        active, most recently stored one.
+        """
+        rows = conn.execute(f"SELECT name, {columns} FROM {table} WHERE source = ? AND site = ? "
+                            "ORDER BY is_active, id", (source, site)).fetchall()
+        if columns == "id":
+            return {row['name']: row['id'] for row in rows}
+        return {row['name']: row for row in rows}
     
-    def _save_clusters(self, conn: sqlite3.Connection, source: str, clusters: List[Dict]) -> Dict[str, int]:
-        """Save clusters to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
-        
-        for cluster in clusters:
-            stats['processed'] += 1
-            
-            # Get datacenter ID
-            datacenter_id = None
-            if cluster.get('datacenter'):
-                dc_row = conn.execute(
-                    "SELECT id FROM infrastructure_datacenters WHERE name = ? AND source = ?",
-                    (cluster['datacenter'], source)
-                ).fetchone()
-                if dc_row:
-                    datacenter_id = dc_row['id']
-            
-            # Check if cluster exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_clusters WHERE name = ? AND source = ?",
-                (cluster['name'], source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_clusters SET "
-                    "moid = ?, datacenter_id = ?, total_cpu_cores = ?, total_cpu_mhz = ?, "
-                    "used_cpu_mhz = ?, total_memory_gb = ?, used_memory_gb = ?, "
-                    "num_hosts = ?, num_vms = ?, drs_enabled = ?, ha_enabled = ?, "
-                    "updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (
-                        cluster.get('moid'), datacenter_id, cluster.get('total_cpu_cores', 0),
-                        cluster.get('total_cpu_mhz', 0), cluster.get('used_cpu_mhz', 0),
-                        cluster.get('total_memory_gb', 0), cluster.get('used_memory_gb', 0),
-                        cluster.get('num_hosts', 0), cluster.get('num_vms', 0),
-                        cluster.get('drs_enabled', False), cluster.get('ha_enabled', False),
-                        now, now, existing['id']
-                    )
-                )
-                stats['updated'] += 1
-            else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_clusters "
-                    "(name, moid, datacenter_id, source, total_cpu_cores, total_cpu_mhz, "
-                    "used_cpu_mhz, total_memory_gb, used_memory_gb, num_hosts, num_vms, "
-                    "drs_enabled, ha_enabled, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        cluster['name'], cluster.get('moid'), datacenter_id, source,
-                        cluster.get('total_cpu_cores', 0), cluster.get('total_cpu_mhz', 0),
-                        cluster.get('used_cpu_mhz', 0), cluster.get('total_memory_gb', 0),
-                        cluster.get('used_memory_gb', 0), cluster.get('num_hosts', 0),
-                        cluster.get('num_vms', 0), cluster.get('drs_enabled', False),
-                        cluster.get('ha_enabled', False), now
-                    )
-                )
-                stats['added'] += 1
-        
-        return stats
+    @staticmethod
+    def _row_key(name: str, moid: Optional[str]) -> tuple:
+        """Identity of an inventory object within its source and site: its moid, else its name"""
+        return ('moid', moid) if moid else ('name', name)
     
-    def _save_hosts(self, conn: sqlite3.Connection, source: str, hosts: List[Dict]) -> Dict[str, int]:
-        """Save hosts to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
-        
-        for host in hosts:
-            stats['processed'] += 1
-            
-            # Get cluster and datacenter IDs
-            cluster_id = None
-            datacenter_id = None
-            
-            if host.get('cluster'):
-                cluster_row = conn.execute(
-                    "SELECT id, datacenter_id FROM infrastructure_clusters WHERE name = ? AND source = ?",
-                    (host['cluster'], source)
-                ).fetchone()
-                if cluster_row:
-                    cluster_id = cluster_row['id']
-                    datacenter_id = cluster_row['datacenter_id']
-            
-            # Check if host exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_hosts WHERE name = ? AND source = ?",
-                (host['name'], source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_hosts SET "
-                    "moid = ?, cluster_id = ?, datacenter_id = ?, cpu_cores = ?, "
-                    "logical_cores = ?, cpu_threads = ?, cpu_mhz = ?, memory_gb = ?, "
-                    "cpu_usage_mhz = ?, memory_usage_gb = ?, power_state = ?, "
-                    "connection_state = ?, num_vms = ?, vendor = ?, model = ?, version = ?, "
-                    "updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (
-                        host.get('moid'), cluster_id, datacenter_id, host.get('cpu_cores', 0),
-                        host.get('logical_cores', 0), host.get('cpu_threads', 0),
-                        host.get('cpu_mhz', 0), host.get('memory_gb', 0),
-                        host.get('cpu_usage_mhz', 0), host.get('memory_usage_gb', 0),
-                        host.get('power_state', 'unknown'), host.get('connection_state', 'unknown'),
-                        host.get('num_vms', 0), host.get('vendor'), host.get('model'),
-                        host.get('version'), now, now, existing['id']
-                    )
-                )
-                stats['updated'] += 1
-            else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_hosts "
-                    "(name, moid, cluster_id, datacenter_id, source, cpu_cores, logical_cores, "
-                    "cpu_threads, cpu_mhz, memory_gb, cpu_usage_mhz, memory_usage_gb, "
-                    "power_state, connection_state, num_vms, vendor, model, version, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        host['name'], host.get('moid'), cluster_id, datacenter_id, source,
-                        host.get('cpu_cores', 0), host.get('logical_cores', 0),
-                        host.get('cpu_threads', 0), host.get('cpu_mhz', 0),
-                        host.get('memory_gb', 0), host.get('cpu_usage_mhz', 0),
-                        host.get('memory_usage_gb', 0), host.get('power_state', 'unknown'),
-                        host.get('connection_state', 'unknown'), host.get('num_vms', 0),
-                        host.get('vendor'), host.get('model'), host.get('version'), now
-                    )
-                )
-                stats['added'] += 1
+    def _load_keyed_rows(self, conn: sqlite3.Connection, table: str, source: str,
+                         site: str = '') -> Dict[tuple, Dict[str, Any]]:
+        """
+        Preload the stored rows of one source and site by object key (see _row_key)
         
-        return stats
+        With a site, rows stored before sites were recorded (site '') are
+        included under keys the site has no row for, so the site's first
+        sync adopts them rather than storing every object a second time.
+        """
+        rows = conn.execute(
+            f"SELECT id, name, moid, site, content_hash, is_active FROM {table} "
+            "WHERE source = ? AND site IN (?, '') ORDER BY site = ?",
+            (source, site, site)
+        ).fetchall()
+        return {self._row_key(row['name'], row['moid']): dict(row) for row in rows}
     
-    def _save_datastores(self, conn: sqlite3.Connection, source: str, datastores: List[Dict]) -> Dict[str, int]:
-        """Save datastores to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
-        
-        for ds in datastores:
-            stats['processed'] += 1
-            
-            # Handle different datastore formats (vCenter vs HyperV)
-            name = ds.get('name') or f"{ds.get('DriveLetter', 'Unknown')}:"
-            
-            # Check if datastore exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_datastores WHERE name = ? AND source = ?",
-                (name, source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_datastores SET "
-                    "moid = ?, type = ?, capacity_gb = ?, free_space_gb = ?, "
-                    "used_space_gb = ?, usage_percent = ?, accessible = ?, "
-                    "maintenance_mode = ?, num_vms = ?, drive_letter = ?, "
-                    "file_system = ?, label = ?, updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (
-                        ds.get('moid'), ds.get('type') or ds.get('FileSystem'),
-                        ds.get('capacity_gb') or ds.get('SizeGB', 0),
-                        ds.get('free_space_gb') or ds.get('FreeSpaceGB', 0),
-                        ds.get('used_space_gb') or ds.get('UsedSpaceGB', 0),
-                        ds.get('usage_percent') or ds.get('UsagePercent', 0),
-                        ds.get('accessible', True), ds.get('maintenance_mode', 'normal'),
-                        ds.get('num_vms', 0), ds.get('DriveLetter'),
-                        ds.get('FileSystem'), ds.get('Label'), now, now, existing['id']
-                    )
-                )
-                stats['updated'] += 1
-            else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_datastores "
-                    "(name, moid, source, type, capacity_gb, free_space_gb, used_space_gb, "
-                    "usage_percent, accessible, maintenance_mode, num_vms, drive_letter, "
-                    "file_system, label, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        name, ds.get('moid'), source, ds.get('type') or ds.get('FileSystem'),
-                        ds.get('capacity_gb') or ds.get('SizeGB', 0),
-                        ds.get('free_space_gb') or ds.get('FreeSpaceGB', 0),
-                        ds.get('used_space_gb') or ds.get('UsedSpaceGB', 0),
-                        ds.get('usage_percent') or ds.get('UsagePercent', 0),
-                        ds.get('accessible', True), ds.get('maintenance_mode', 'normal'),
-                        ds.get('num_vms', 0), ds.get('DriveLetter'),
-                        ds.get('FileSystem'), ds.get('Label'), now
-                    )
-                )
-                stats['added'] += 1
+    def _upsert_rows(self, conn: sqlite3.Connection, table: str, source: str,
+                     columns: List[str], rows: List[tuple], sync_id: Optional[int] = None,
+                     site: str = '') -> Dict[str, int]:
+        """
+        Diff prepared rows against the stored fingerprints and write the changes
         
-        return stats
-    
-    def _save_networks(self, conn: sqlite3.Connection, source: str, networks: List[Dict]) -> Dict[str, int]:
-        """Save networks to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
+        Each row is (name, moid, *other columns values) and is matched to the
+        stored row of the same moid, or of the same name if it has none, so
+        renamed objects keep their row. It is fingerprinted over the column
+        values, except the table's UTILIZATION_COLUMNS. New objects are
+        inserted and renamed rows, rows whose fingerprint differs or that had
+        been deactivated are rewritten (one executemany each); unchanged rows
+        only get last_sync and their utilisation values updated. Unsited rows
+        are adopted by the site only when the name matches as well. Every row
+        seen is stamped with sync_id as its sync_generation. An object
+        repeated in the batch is compared with its previous occurrence, so a
+        differing repeat counts as an update. Created and changed objects are
+        recorded as infrastructure_events (a deactivated object that is back
+        counts as created).
+        """
+        stats = {'processed': len(rows), 'added': 0, 'updated': 0}
+        if not rows:
+            return stats
         
-        for net in networks:
-            stats['processed'] += 1
-            
-            # Check if network exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_networks WHERE name = ? AND source = ?",
-                (net['name'], source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_networks SET "
-                    "moid = ?, network_type = ?, accessible = ?, num_vms = ?, "
-                    "switch_type = ?, adapter_description = ?, allow_management_os = ?, "
-                    "updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (
-                        net.get('moid'), net.get('SwitchType'), net.get('accessible', True),
-                        net.get('num_vms', 0), net.get('SwitchType'),
-                        net.get('NetAdapterInterfaceDescription'), net.get('AllowManagementOS', False),
-                        now, now, existing['id']
-                    )
-                )
+        stored = self._load_keyed_rows(conn, table, source, site)
+        utilization = UTILIZATION_COLUMNS.get(table, [])
+        # Row positions (after the name) of the fingerprinted and the utilisation values
+        content = [i for i, column in enumerate(columns, 1) if column not in utilization]
+        live = [columns.index(column) + 1 for column in utilization]
+        pending = {}
+        unchanged = {}
+        events = []
+        for row in rows:
+            row = (row[0], row[1] or None) + tuple(row[2:])
+            key = self._row_key(row[0], row[1])
+            fingerprint = self._fingerprint(tuple(row[i] for i in content))
+            current = stored.get(key)
+            if current is not None and current['site'] != site and current['name'] != row[0]:
+                # An unsited row of another name is not taken for this object
+                current = None
+            if current is None:
+                stats['added'] += 1
+                events.append(('created', row))
+            elif not current['is_active']:
+                stats['updated'] += 1
+                events.append(('created', row))
+            elif current['content_hash'] != fingerprint or current['name'] != row[0]:
                 stats['updated'] += 1
+                # Rows stored before fingerprints existed are rewritten silently
+                if current['content_hash'] is not None:
+                    events.append(('changed', row))
             else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_networks "
-                    "(name, moid, source, network_type, accessible, num_vms, switch_type, "
-                    "adapter_description, allow_management_os, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        net['name'], net.get('moid'), source, net.get('SwitchType'),
-                        net.get('accessible', True), net.get('num_vms', 0),
-                        net.get('SwitchType'), net.get('NetAdapterInterfaceDescription'),
-                        net.get('AllowManagementOS', False), now
-                    )
-                )
-                stats['added'] += 1
+                if key not in pending:
+                    unchanged[current['id']] = row
+                continue
+            stored[key] = dict(current or {'id': None}, name=row[0], site=site,
+                               content_hash=fingerprint, is_active=1)
+            pending[key] = row + (fingerprint, sync_id)
         
-        return stats
-    
-    def _save_vms(self, conn: sqlite3.Connection, source: str, vms: List[Dict]) -> Dict[str, int]:
-        """Save VMs to database"""
-        stats = {'processed': 0, 'added': 0, 'updated': 0}
+        now = datetime.now()
+        write_columns = ['name', 'moid'] + columns[1:] + ['content_hash', 'sync_generation']
+        inserts = [row for key, row in pending.items() if stored[key]['id'] is None]
+        if inserts:
+            insert_columns = ['source', 'site'] + write_columns + ['last_sync']
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(insert_columns)}) "
+                f"VALUES ({', '.join('?' for _ in insert_columns)})",
+                [(source, site) + row + (now,) for row in inserts]
+            )
+        rewrites = [(stored[key]['id'], row) for key, row in pending.items() if stored[key]['id'] is not None]
+        if rewrites:
+            assignments = "".join(f", {column} = ?" for column in write_columns)
+            conn.executemany(
+                f"UPDATE {table} SET site = ?{assignments}, is_active = 1, updated_at = ?, last_sync = ? "
+                "WHERE id = ?",
+                [(site,) + row + (now, now, row_id) for row_id, row in rewrites]
+            )
         
-        for vm in vms:
-            stats['processed'] += 1
-            
-            # Get related IDs
-            cluster_id = self._get_cluster_id(conn, vm.get('cluster'), source)
-            host_id = self._get_host_id(conn, vm.get('host'), source)
-            datacenter_id = self._get_datacenter_id(conn, vm.get('datacenter'), source)
-            
-            # Handle different VM name formats
-            vm_name = vm.get('vm') or vm.get('name')
-            
-            # Check if VM exists
-            existing = conn.execute(
-                "SELECT id FROM infrastructure_vms WHERE name = ? AND source = ?",
-                (vm_name, source)
-            ).fetchone()
-            
-            now = datetime.now()
-            
-            if existing:
-                # Update existing
-                conn.execute(
-                    "UPDATE infrastructure_vms SET "
-                    "moid = ?, vm_id = ?, cluster_id = ?, host_id = ?, datacenter_id = ?, "
-                    "status = ?, power_state = ?, cpu_cores = ?, memory_gb = ?, "
-                    "cpu_usage_percent = ?, memory_usage_percent = ?, guest_os = ?, "
-                    "tools_status = ?, annotation = ?, updated_at = ?, last_sync = ? "
-                    "WHERE id = ?",
-                    (
-                        vm.get('moid'), vm.get('uuid') or vm.get('vm_id'), cluster_id, host_id,
-                        datacenter_id, vm.get('status', 'unknown'), vm.get('power_state', 'unknown'),
-                        vm.get('cores', 1), vm.get('memory', 1), vm.get('cpu', 0),
-                        vm.get('memory_usage', 0), vm.get('guest_os'), vm.get('tools_status'),
-                        vm.get('details', {}).get('annotation'), now, now, existing['id']
-                    )
-                )
-                stats['updated'] += 1
-            else:
-                # Insert new
-                conn.execute(
-                    "INSERT INTO infrastructure_vms "
-                    "(name, moid, vm_id, cluster_id, host_id, datacenter_id, source, status, "
-                    "power_state, cpu_cores, memory_gb, cpu_usage_percent, memory_usage_percent, "
-                    "guest_os, tools_status, annotation, last_sync) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        vm_name, vm.get('moid'), vm.get('uuid') or vm.get('vm_id'),
-                        cluster_id, host_id, datacenter_id, source, vm.get('status', 'unknown'),
-                        vm.get('power_state', 'unknown'), vm.get('cores', 1), vm.get('memory', 1),
-                        vm.get('cpu', 0), vm.get('memory_usage', 0), vm.get('guest_os'),
-                        vm.get('tools_status'), vm.get('details', {}).get('annotation'), now
-                    )
-                )
-                stats['added'] += 1
+        if unchanged:
+            assignments = "".join(f", {column} = ?" for column in utilization)
+            conn.executemany(
+                f"UPDATE {table} SET site = ?, last_sync = ?, sync_generation = COALESCE(?, sync_generation)"
+                f"{assignments} WHERE id = ?",
+                [(site, now, sync_id) + tuple(row[i] for i in live) + (row_id,) for row_id, row in unchanged.items()]
+            )
         
+        self._record_events(conn, source, sync_id, RESOURCE_TYPES[table], [
+            (change, row[1] or row[0], row[0]) for change, row in events
+        ], now)
         return stats
     
-    def _get_cluster_id(self, conn: sqlite3.Connection, cluster_name: str, source: str) -> Optional[int]:
-        """Get cluster ID by name"""
-        if not cluster_name:
-            return None
-        
-        row = conn.execute(
-            "SELECT id FROM infrastructure_clusters WHERE name = ? AND source = ?",
-            (cluster_name, source)
-        ).fetchone()
+    def _sweep_stale_rows(self, conn: sqlite3.Connection, source: str, sections: List[str],
+                          min_generation: int, sync_id: Optional[int] = None,
+                          site: Optional[str] = None) -> int:
+        """
+        Deactivate the active rows of these sections last seen before min_generation
         
-        return row['id'] if row else None
+        One set-based UPDATE per table; rows from before generations were
+        stamped count as stale. With a site only that site's rows (and the
+        unsited ones) are swept, otherwise every site of the source. Returns
+        the number of rows deactivated.
+        """
+        now = datetime.now()
+        deactivated = 0
+        stale = "source = ? AND is_active = 1 AND (sync_generation IS NULL OR sync_generation < ?)"
+        params = (source, min_generation)
+        if site is not None:
+            stale += " AND site IN (?, '')"
+            params += (site,)
+        for section in sections:
+            table = INVENTORY_TABLES[section]
+            removed = conn.execute(f"SELECT name, moid FROM {table} WHERE {stale}", params).fetchall()
+            if not removed:
+                continue
+            conn.execute(f"UPDATE {table} SET is_active = 0, updated_at = ? WHERE {stale}", (now,) + params)
+            self._record_events(conn, source, sync_id, RESOURCE_TYPES[table], [
+                ('deleted', row['moid'] or row['name'], row['name']) for row in removed
+            ], now)
+            deactivated += len(removed)
+        return deactivated
     
-    def _get_host_id(self, conn: sqlite3.Connection, host_name: str, source: str) -> Optional[int]:
-        """Get host ID by name"""
-        if not host_name:
-            return None
-            
-        row = conn.execute(
-            "SELECT id FROM infrastructure_hosts WHERE name = ? AND source = ?",
-            (host_name, source)
-        ).fetchone()
-        
-        return row['id'] if row else None
+    @staticmethod
+    def _fingerprint(values: tuple) -> str:
+        """Content hash of a row's synced column values"""
+        return hashlib.sha1(json.dumps(values, default=str).encode('utf-8')).hexdigest()
     
-    def _get_datacenter_id(self, conn: sqlite3.Connection, datacenter_name: str, source: str) -> Optional[int]:
-        """Get datacenter ID by name"""
-        if not datacenter_name:
-            return None
-            
-        row = conn.execute(
-            "SELECT id FROM infrastructure_datacenters WHERE name = ? AND source = ?",
-            (datacenter_name, source)
-        ).fetchone()
-        
-        return row['id'] if row else None
+    def _record_events(self, conn: sqlite3.Connection, source: str, sync_id: Optional[int],
+                       resource_type: str, changes: List[tuple], timestamp: datetime):
+        """Insert (change, resource_id, name) tuples as infrastructure_events rows"""
+        if not changes:
+            return
+        conn.executemany(
+            "INSERT INTO infrastructure_events (source, sync_id, event_type, severity, resource_type, "
+            "resource_id, resource_name, title, event_timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (source, sync_id, f"{resource_type}_{change}", 'info', resource_type, resource_id, name,
+                 f"{resource_type.capitalize()} {name} {change}", timestamp)
+                for change, resource_id, name in changes
+            ]
+        )
+    
+    def _save_datacenters(self, conn: sqlite3.Connection, source: str, datacenters: List[Dict],
+                          sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save datacenters to database"""
+        rows = [(dc['name'], dc.get('moid'), dc.get('description')) for dc in datacenters]
+        return self._upsert_rows(conn, 'infrastructure_datacenters', source, ['moid', 'description'],
+                                 rows, sync_id, site)
+    
+    def _save_clusters(self, conn: sqlite3.Connection, source: str, clusters: List[Dict],
+                       sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save clusters to database"""
+        datacenter_ids = self._load_name_map(conn, 'infrastructure_datacenters', source, "id", site)
+        rows = [
+            (
+                cluster['name'], cluster.get('moid'), datacenter_ids.get(cluster.get('datacenter')),
+                cluster.get('total_cpu_cores', 0), cluster.get('total_cpu_mhz', 0),
+                cluster.get('used_cpu_mhz', 0), cluster.get('total_memory_gb', 0),
+                cluster.get('used_memory_gb', 0), cluster.get('num_hosts', 0),
+                cluster.get('num_vms', 0), cluster.get('drs_enabled', False),
+                cluster.get('ha_enabled', False)
+            )
+            for cluster in clusters
+        ]
+        return self._upsert_rows(conn, 'infrastructure_clusters', source, [
+            'moid', 'datacenter_id', 'total_cpu_cores', 'total_cpu_mhz', 'used_cpu_mhz',
+            'total_memory_gb', 'used_memory_gb', 'num_hosts', 'num_vms', 'drs_enabled', 'ha_enabled'
+        ], rows, sync_id, site)
+    
+    def _save_hosts(self, conn: sqlite3.Connection, source: str, hosts: List[Dict],
+                    sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save hosts to database"""
+        clusters = self._load_name_map(conn, 'infrastructure_clusters', source, "id, datacenter_id", site)
+        rows = []
+        for host in hosts:
+            cluster = clusters.get(host.get('cluster'))
+            rows.append((
+                host['name'], host.get('moid'),
+                cluster['id'] if cluster else None, cluster['datacenter_id'] if cluster else None,
+                host.get('cpu_cores', 0), host.get('logical_cores', 0),
+                host.get('cpu_threads', 0), host.get('cpu_mhz', 0),
+                host.get('memory_gb', 0), host.get('cpu_usage_mhz', 0),
+                host.get('memory_usage_gb', 0), host.get('power_state', 'unknown'),
+                host.get('connection_state', 'unknown'), host.get('num_vms', 0),
+                host.get('vendor'), host.get('model'), host.get('version')
+            ))
+        return self._upsert_rows(conn, 'infrastructure_hosts', source, [
+            'moid', 'cluster_id', 'datacenter_id', 'cpu_cores', 'logical_cores', 'cpu_threads',
+            'cpu_mhz', 'memory_gb', 'cpu_usage_mhz', 'memory_usage_gb', 'power_state',
+            'connection_state', 'num_vms', 'vendor', 'model', 'version'
+        ], rows, sync_id, site)
+    
+    def _save_datastores(self, conn: sqlite3.Connection, source: str, datastores: List[Dict],
+                         sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save datastores to database"""
+        rows = [
+            (
+                # Handle different datastore formats (vCenter vs HyperV)
+                ds.get('name') or f"{ds.get('DriveLetter', 'Unknown')}:",
+                ds.get('moid'), ds.get('type') or ds.get('FileSystem'),
+                ds.get('capacity_gb') or ds.get('SizeGB', 0),
+                ds.get('free_space_gb') or ds.get('FreeSpaceGB', 0),
+                ds.get('used_space_gb') or ds.get('UsedSpaceGB', 0),
+                ds.get('usage_percent') or ds.get('UsagePercent', 0),
+                ds.get('accessible', True), ds.get('maintenance_mode', 'normal'),
+                ds.get('num_vms', 0), ds.get('DriveLetter'),
+                ds.get('FileSystem'), ds.get('Label')
+            )
+            for ds in datastores
+        ]
+        return self._upsert_rows(conn, 'infrastructure_datastores', source, [
+            'moid', 'type', 'capacity_gb', 'free_space_gb', 'used_space_gb', 'usage_percent',
+            'accessible', 'maintenance_mode', 'num_vms', 'drive_letter', 'file_system', 'label'
+        ], rows, sync_id, site)
+    
+    def _save_networks(self, conn: sqlite3.Connection, source: str, networks: List[Dict],
+                       sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save networks to database"""
+        rows = [
+            (
+                net['name'], net.get('moid'), net.get('SwitchType'), net.get('accessible', True),
+                net.get('num_vms', 0), net.get('SwitchType'),
+                net.get('NetAdapterInterfaceDescription'), net.get('AllowManagementOS', False)
+            )
+            for net in networks
+        ]
+        return self._upsert_rows(conn, 'infrastructure_networks', source, [
+            'moid', 'network_type', 'accessible', 'num_vms', 'switch_type',
+            'adapter_description', 'allow_management_os'
+        ], rows, sync_id, site)
+    
+    def _save_vms(self, conn: sqlite3.Connection, source: str, vms: List[Dict],
+                  sync_id: Optional[int] = None, site: str = '') -> Dict[str, int]:
+        """Save VMs to database"""
+        cluster_ids = self._load_name_map(conn, 'infrastructure_clusters', source, "id", site)
+        host_ids = self._load_name_map(conn, 'infrastructure_hosts', source, "id", site)
+        datacenter_ids = self._load_name_map(conn, 'infrastructure_datacenters', source, "id", site)
+        rows = [
+            (
+                # Handle different VM name formats
+                vm.get('vm') or vm.get('name'), vm.get('moid'), vm.get('uuid') or vm.get('vm_id'),
+                cluster_ids.get(vm.get('cluster')), host_ids.get(vm.get('host')),
+                datacenter_ids.get(vm.get('datacenter')), vm.get('status', 'unknown'),
+                vm.get('power_state', 'unknown'), vm.get('cores', 1), vm.get('memory', 1),
+                vm.get('cpu', 0), vm.get('memory_usage', 0), vm.get('guest_os'),
+                vm.get('tools_status'), (vm.get('details') or {}).get('annotation')
+            )
+            for vm in vms
+        ]
+        return self._upsert_rows(conn, 'infrastructure_vms', source, [
+            'moid', 'vm_id', 'cluster_id', 'host_id', 'datacenter_id', 'status', 'power_state',
+            'cpu_cores', 'memory_gb', 'cpu_usage_percent', 'memory_usage_percent', 'guest_os',
+            'tools_status', 'annotation'
+        ], rows, sync_id, site)
     
     def _update_infrastructure_summary(self, conn: sqlite3.Connection, source: str):
         """Update infrastructure summary statistics"""
         try:
-            # Calculate summary statistics
+            # One single-row aggregate per table, combined side by side: joining
+            # the tables on source alone would multiply their row counts
             summary_query = """
-                SELECT 
-                    COUNT(DISTINCT d.id) as total_datacenters,
-                    COUNT(DISTINCT c.id) as total_clusters,
-                    COUNT(DISTINCT h.id) as total_hosts,
-                    COUNT(DISTINCT ds.id) as total_datastores,
-                    COUNT(DISTINCT n.id) as total_networks,
-                    COUNT(DISTINCT v.id) as total_vms,
-                    SUM(CASE WHEN v.status = 'running' THEN 1 ELSE 0 END) as running_vms,
-                    SUM(CASE WHEN v.status = 'stopped' THEN 1 ELSE 0 END) as stopped_vms,
-                    SUM(COALESCE(h.cpu_cores, 0)) as total_cpu_cores,
-                    SUM(COALESCE(h.memory_gb, 0)) as total_memory_gb,
-                    SUM(COALESCE(ds.capacity_gb, 0)) as total_storage_gb,
-                    SUM(COALESCE(ds.used_space_gb, 0)) as used_storage_gb,
-                    AVG(COALESCE(v.cpu_usage_percent, 0)) as avg_cpu_utilization,
-                    AVG(COALESCE(v.memory_usage_percent, 0)) as avg_memory_utilization,
-                    SUM(CASE WHEN v.status = 'running' AND v.cpu_usage_percent < 30 AND v.memory_usage_percent < 50 THEN 1 ELSE 0 END) as underutilized_vms
-                FROM (SELECT ? as source) src
-                LEFT JOIN infrastructure_datacenters d ON d.source = src.source AND d.is_active = 1
-                LEFT JOIN infrastructure_clusters c ON c.source = src.source AND c.is_active = 1
-                LEFT JOIN infrastructure_hosts h ON h.source = src.source AND h.is_active = 1
-                LEFT JOIN infrastructure_datastores ds ON ds.source = src.source AND ds.is_active = 1
-                LEFT JOIN infrastructure_networks n ON n.source = src.source AND n.is_active = 1
-                LEFT JOIN infrastructure_vms v ON v.source = src.source AND v.is_active = 1
+                SELECT
+                    (SELECT COUNT(*) FROM infrastructure_datacenters
+                     WHERE source = :source AND is_active = 1) as total_datacenters,
+                    (SELECT COUNT(*) FROM infrastructure_clusters
+                     WHERE source = :source AND is_active = 1) as total_clusters,
+                    (SELECT COUNT(*) FROM infrastructure_networks
+                     WHERE source = :source AND is_active = 1) as total_networks,
+                    h.total_hosts, h.total_cpu_cores, h.total_memory_gb,
+                    ds.total_datastores, ds.total_storage_gb, ds.used_storage_gb,
+                    v.total_vms, v.running_vms, v.stopped_vms,
+                    v.avg_cpu_utilization, v.avg_memory_utilization, v.underutilized_vms
+                FROM (
+                    SELECT COUNT(*) as total_hosts,
+                           TOTAL(COALESCE(cpu_cores, 0)) as total_cpu_cores,
+                           TOTAL(COALESCE(memory_gb, 0)) as total_memory_gb
+                    FROM infrastructure_hosts WHERE source = :source AND is_active = 1
+                ) h, (
+                    SELECT COUNT(*) as total_datastores,
+                           TOTAL(COALESCE(capacity_gb, 0)) as total_storage_gb,
+                           TOTAL(COALESCE(used_space_gb, 0)) as used_storage_gb
+                    FROM infrastructure_datastores WHERE source = :source AND is_active = 1
+                ) ds, (
+                    SELECT COUNT(*) as total_vms,
+                           TOTAL(status = 'running') as running_vms,
+                           TOTAL(status = 'stopped') as stopped_vms,
+                           COALESCE(AVG(COALESCE(cpu_usage_percent, 0)), 0) as avg_cpu_utilization,
+                           COALESCE(AVG(COALESCE(memory_usage_percent, 0)), 0) as avg_memory_utilization,
+                           TOTAL(status = 'running' AND cpu_usage_percent < 30 AND memory_usage_percent < 50)
+                               as underutilized_vms
+                    FROM infrastructure_vms WHERE source = :source AND is_active = 1
+                ) v
             """
             
-            result = conn.execute(summary_query, (source,)).fetchone()
+            result = conn.execute(summary_query, {'source': source}).fetchone()
             
             if result:
                 # Insert or update summary
@@ -612,33 +739,62 @@ class InfrastructureDBManager:
             Complete inventory data or None if not found
         """
         try:
-            with self.get_connection() as conn:
-                # Get summary
-                summary = conn.execute(
-                    "SELECT * FROM infrastructure_summary WHERE source = ?",
-                    (source,)
-                ).fetchone()
-                
-                if not summary:
-                    return None
-                
-                # Get detailed data
-                inventory = {
-                    'datacenters': self._get_datacenters(conn, source),
-                    'clusters': self._get_clusters(conn, source),
-                    'hosts': self._get_hosts(conn, source),
-                    'datastores': self._get_datastores(conn, source),
-                    'networks': self._get_networks(conn, source),
-                    'vms': self._get_vms(conn, source),
-                    'summary': dict(summary)
-                }
-                
-                return inventory
-                
+            return self._load_inventory(source)
         except Exception as e:
             logger.error(f"Error retrieving {source} inventory: {e}")
             return None
     
+    def get_serialized_inventory(self, source: str) -> Optional[SerializedInventory]:
+        """
+        Inventory as pre-encoded JSON, served from the inventory cache
+        
+        The cache entry is keyed by the last completed sync, so it is reused
+        until a sync of this source commits (from any process).
+        
+        Args:
+            source: Infrastructure source (vcenter, hyperv)
+            
+        Returns:
+            Serialized inventory and VM list, or None if not found
+        """
+        try:
+            version = self.get_inventory_version(source)
+            return self.inventory_cache.get(source, version, lambda: self._load_inventory(source))
+        except Exception as e:
+            logger.error(f"Error retrieving {source} inventory: {e}")
+            return None
+    
+    def get_inventory_version(self, source: str) -> Optional[int]:
+        """Id of the last completed (successful or failed) sync or sweep of a source"""
+        with self.get_read_connection() as conn:
+            return conn.execute(
+                "SELECT MAX(id) FROM infrastructure_sync_history "
+                "WHERE source = ? AND completed_at IS NOT NULL",
+                (source,)
+            ).fetchone()[0]
+    
+    def _load_inventory(self, source: str) -> Optional[Dict[str, Any]]:
+        with self.get_read_connection() as conn:
+            # Get summary
+            summary = conn.execute(
+                "SELECT * FROM infrastructure_summary WHERE source = ?",
+                (source,)
+            ).fetchone()
+            
+            if not summary:
+                return None
+            
+            # Get detailed data
+            return {
+                'datacenters': self._get_datacenters(conn, source),
+                'clusters': self._get_clusters(conn, source),
+                'hosts': self._get_hosts(conn, source),
+                'datastores': self._get_datastores(conn, source),
+                'networks': self._get_networks(conn, source),
+                'vms': self._get_vms(conn, source),
+                'summary': dict(summary)
+            }
+    
     def _get_datacenters(self, conn: sqlite3.Connection, source: str) -> List[Dict]:
         """Get datacenters from database"""
         rows = conn.execute(
@@ -708,7 +864,7 @@ class InfrastructureDBManager:
     def get_sync_history(self, source: str, limit: int = 10) -> List[Dict]:
         """Get sync history for a source"""
         try:
-            with self.get_connection() as conn:
+            with self.get_read_connection() as conn:
                 rows = conn.execute(
                     "SELECT * FROM infrastructure_sync_history "
                     "WHERE source = ? ORDER BY started_at DESC LIMIT ?",
@@ -719,4 +875,20 @@ class InfrastructureDBManager:
                 
         except Exception as e:
             logger.error(f"Error retrieving sync history for {source}: {e}")
+            return []
+    
+    def get_infrastructure_events(self, source: str, limit: int = 100) -> List[Dict]:
+        """Most recent created/changed/deleted inventory events for a source"""
+        try:
+            with self.get_read_connection() as conn:
+                rows = conn.execute(
+                    "SELECT * FROM infrastructure_events "
+                    "WHERE source = ? ORDER BY event_timestamp DESC, id DESC LIMIT ?",
+                    (source, limit)
+                ).fetchall()
+                
+                return [dict(row) for row in rows]
+                
+        except Exception as e:
+            logger.error(f"Error retrieving infrastructure events for {source}: {e}")
             return []
\ No newline at end of file
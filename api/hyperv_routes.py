@@ -2,7 +2,7 @@
 # HYPER-V INFRASTRUCTURE MANAGEMENT ENDPOINTS
 # =============================================================================
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from datetime import datetime
 import json
 from .database_manager import InfrastructureDBManager
@@ -429,12 +429,12 @@ async def sync_hyperv_inventory_with_credentials(request: ConnectionTestRequest)
 async def get_hyperv_inventory():
     """Get complete HyperV infrastructure inventory"""
     # First try to get from database
-    db_inventory = db_manager.get_infrastructure_inventory('hyperv')
+    db_inventory = db_manager.get_serialized_inventory('hyperv')
     if db_inventory:
-        return {
-            "status": "success",
-            "inventory": db_inventory
-        }
+        return Response(
+            content=b'{"status":"success","inventory":' + db_inventory.inventory + b'}',
+            media_type="application/json"
+        )
     
     # Fallback to cache
     global hyperv_inventory_cache
@@ -454,10 +454,10 @@ async def get_hyperv_vms():
     """Get all cached HyperV VMs"""
     try:
         # First try to get from database
-        db_inventory = db_manager.get_infrastructure_inventory('hyperv')
-        if db_inventory and db_inventory.get('vms'):
-            print(f"📊 HyperV VMs endpoint: Returning {len(db_inventory['vms'])} database VMs")
-            return db_inventory['vms']
+        db_inventory = db_manager.get_serialized_inventory('hyperv')
+        if db_inventory and db_inventory.vm_count:
+            print(f"📊 HyperV VMs endpoint: Returning {db_inventory.vm_count} database VMs")
+            return Response(content=db_inventory.vms, media_type="application/json")
         
         # Fallback to cache
         print(f"📊 HyperV VMs endpoint: Returning {len(hyperv_vms_cache)} cached VMs")
@@ -471,10 +471,10 @@ async def get_hyperv_inventory():
     """Get cached HyperV inventory (datacenters, clusters, hosts)"""
     try:
         # First try to get from database
-        db_inventory = db_manager.get_infrastructure_inventory('hyperv')
+        db_inventory = db_manager.get_serialized_inventory('hyperv')
         if db_inventory:
-            print(f"📊 HyperV Inventory endpoint: Returning database inventory with {db_inventory.get('summary', {}).get('total_vms', 0)} total VMs")
-            return db_inventory
+            print(f"📊 HyperV Inventory endpoint: Returning database inventory with {db_inventory.total_vms} total VMs")
+            return Response(content=db_inventory.inventory, media_type="application/json")
         
         # Fallback to cache
         print(f"📊 HyperV Inventory endpoint: Returning cached inventory with {hyperv_inventory_cache.get('summary', {}).get('total_vms', 0)} total VMs")
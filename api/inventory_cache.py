@@ -0,0 +1,113 @@
+"""
+IROA Inventory Cache
+In-process read-through cache of the stored infrastructure inventory, keyed by
+source and the id of the last completed infrastructure_sync_history row and
+held as pre-serialized JSON so the inventory endpoints skip the table scans
+and the response encoding until the next sync lands
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class SerializedInventory(NamedTuple):
+    version: Optional[int]
+    inventory: bytes
+    vms: bytes
+    vm_count: int
+    total_vms: int
+
+
+def serialize_inventory(version: Optional[int], inventory: Dict[str, Any]) -> SerializedInventory:
+    """Encode an inventory (as returned by get_infrastructure_inventory) once"""
+    vms = inventory.get('vms') or []
+    return SerializedInventory(
+        version=version,
+        inventory=_dumps(inventory),
+        vms=_dumps(vms),
+        vm_count=len(vms),
+        total_vms=(inventory.get('summary') or {}).get('total_vms') or 0,
+    )
+
+
+def _dumps(value: Any) -> bytes:
+    # Rows come straight from sqlite3; default=str covers any stray datetime
+    return json.dumps(value, default=str, separators=(',', ':')).encode('utf-8')
+
+
+class InventoryCache:
+    """
+    Serialized inventories per source
+
+    An entry is served while its version matches the caller's current sync
+    version. invalidate() drops the entry and bumps a per-source generation so
+    a load that raced with the sync commit is not stored afterwards.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Optional[SerializedInventory]] = {}
+        self._versions: Dict[str, Optional[int]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, source: str, version: Optional[int],
+            loader: Callable[[], Optional[Dict[str, Any]]]) -> Optional[SerializedInventory]:
+        """Cached inventory for this version, loading and serializing it on a miss
+
+        The loader's exceptions propagate and nothing is cached.
+        """
+        with self._lock:
+            if source in self._entries and self._versions[source] == version:
+                self.stats["hits"] += 1
+                return self._entries[source]
+            self.stats["misses"] += 1
+            generation = self._generations.get(source, 0)
+
+        inventory = loader()
+        entry = serialize_inventory(version, inventory) if inventory is not None else None
+
+        with self._lock:
+            if self._generations.get(source, 0) == generation:
+                self._entries[source] = entry
+                self._versions[source] = version
+        return entry
+
+    def invalidate(self, source: str):
+        """Forget a source's inventory (called once its sync has committed)"""
+        with self._lock:
+            self._entries.pop(source, None)
+            self._versions.pop(source, None)
+            self._generations[source] = self._generations.get(source, 0) + 1
+            self.stats["invalidations"] += 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                hit_ratio=round(self.stats["hits"] / lookups, 4) if lookups else None,
+                cached_sources={source: self._versions[source] for source in self._entries},
+            )
+
+
+_caches: Dict[str, InventoryCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_inventory_cache(db_path: str) -> InventoryCache:
+    """Process-wide cache for a database file (keyed by absolute path)"""
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = InventoryCache()
+        return cache
+
+
+def inventory_cache_statistics() -> List[Dict[str, Any]]:
+    with _caches_lock:
+        caches = list(_caches.items())
+    return [dict(cache.status(), db_path=db_path) for db_path, cache in caches]
@@ -1,9 +1,11 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes import router as api_router
+from api.routes import router as api_router, start_collection_scheduler, stop_collection_scheduler
 from api.hyperv_routes import router as hyperv_router
+from api.metrics_collector import metrics_collector
 from api.workload_routes import router as workload_router
+from monitoring.system_sampler import get_system_sampler, stop_system_sampler
 
 app = FastAPI(title="IROA - Intelligent Resource Optimization Agent")
 
@@ -31,6 +33,19 @@ app.include_router(api_router)
 app.include_router(hyperv_router)
 app.include_router(workload_router, prefix="/workload")
 
+@app.on_event("startup")
+async def start_background_collection():
+    # Warm the local system sampler so the first capacity request has history
+    get_system_sampler()
+    await start_collection_scheduler()
+
+@app.on_event("shutdown")
+async def stop_background_collection():
+    await stop_collection_scheduler()
+    stop_system_sampler()
+    # Write out the queued metrics history before the process exits
+    metrics_collector.close()
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
@@ -5,88 +5,142 @@ Handles collection, storage, and retrieval of historical metrics for forecasting
 
 import sqlite3
 import json
+import os
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import logging
-from pathlib import Path
+
+import numpy as np
+
+from config.config import settings
+from db.cold_tier import ColdTier
+from db.migrations import migrate
+from db.partitions import TIMESTAMP_MS_COLUMN, PartitionedTables, from_epoch_ms, to_epoch_ms
+from db.sqlite_pool import get_pool
+from db.write_buffer import WriteBuffer
+from .metrics_rollups import (
+    DEFAULT_QUANTILES, ROLLUP_SOURCES, MetricsRollups, pick_resolution
+)
 
 logger = logging.getLogger(__name__)
 
+# Insert column order of the partitioned history tables
+VM_HISTORY_COLUMNS = (
+    'vm_id', 'vm_name', 'cluster_name', 'host_name', 'datacenter_name',
+    'allocated_vcpus', 'allocated_memory_gb', 'allocated_storage_gb',
+    'cpu_usage_percent', 'memory_usage_percent', 'storage_usage_gb',
+    'power_state', 'vm_status', 'metric_timestamp'
+)
+HOST_HISTORY_COLUMNS = (
+    'host_id', 'host_name', 'cluster_name', 'datacenter_name',
+    'physical_cpu_cores', 'physical_memory_gb', 'physical_storage_gb',
+    'allocated_vcpus', 'cpu_usage_percent', 'memory_usage_percent',
+    'storage_usage_percent', 'total_vms', 'running_vms',
+    'host_status', 'metric_timestamp'
+)
+CLUSTER_HISTORY_COLUMNS = (
+    'cluster_name', 'datacenter_name',
+    'total_physical_cpu_cores', 'total_physical_memory_gb', 'total_physical_storage_gb',
+    'total_allocated_vcpus', 'avg_cpu_usage_percent', 'avg_memory_usage_percent',
+    'avg_storage_usage_percent', 'total_hosts', 'connected_hosts',
+    'total_vms', 'running_vms', 'peak_cpu_usage_percent', 'peak_memory_usage_percent',
+    'metric_timestamp'
+)
+
+# Resource type (write buffer key) -> history table and its insert columns
+HISTORY_WRITES = {
+    'vm': ('vm_metrics_history', VM_HISTORY_COLUMNS),
+    'host': ('host_metrics_history', HOST_HISTORY_COLUMNS),
+    'cluster': ('cluster_metrics_history', CLUSTER_HISTORY_COLUMNS),
+}
+
 class MetricsCollector:
-    def __init__(self, db_path: str = "database/iroa.db"):
+    def __init__(self, db_path: str = "database/iroa.db", archive_dir: Optional[str] = None,
+                 write_buffer: Optional[Dict] = None):
+        """
+        write_buffer: WriteBuffer options (flush_rows, flush_interval, max_rows,
+        overflow); spill files go to a spill/ directory next to the database
+        """
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.partitions = PartitionedTables()
+        self.cold = ColdTier(archive_dir or os.path.join(os.path.dirname(db_path), "archive"))
+        self.rollups = MetricsRollups(cold_tier=self.cold)
         self.ensure_schema()
+        options = dict(write_buffer or {})
+        options.setdefault('spill_dir', os.path.join(os.path.dirname(db_path), "spill"))
+        self.writer = WriteBuffer(self._write_history, name="metrics-writer", **options)
     
     def ensure_schema(self):
-        """Ensure metrics history schema exists"""
-        schema_path = Path(__file__).parent.parent / "database" / "metrics_history_schema.sql"
-        if schema_path.exists():
-            with open(schema_path, 'r') as f:
-                schema_sql = f.read()
-            
-            conn = sqlite3.connect(self.db_path)
-            try:
-                conn.executescript(schema_sql)
-                conn.commit()
-                logger.info("Metrics history schema initialized")
-            except Exception as e:
-                logger.error(f"Failed to initialize metrics schema: {e}")
-            finally:
-                conn.close()
+        """Apply pending metrics history migrations (database/migrations/metrics)"""
+        try:
+            applied = migrate(self.db_path, "metrics")
+            if applied:
+                logger.info(f"Metrics history migrations applied: {', '.join(applied)}")
+        except Exception as e:
+            logger.error(f"Failed to initialize metrics schema: {e}")
+    
+    def _write_history(self, batches: Dict[str, List[tuple]]):
+        """Write-buffer sink: insert every queued batch and fold them into the rollups in one transaction"""
+        conn = self.pool.acquire_writer()
+        committed = False
+        try:
+            for resource_type, rows in batches.items():
+                table, columns = HISTORY_WRITES[resource_type]
+                self.partitions.insert(conn, table, columns, rows)
+            self.rollups.update(conn, list(batches))
+            committed = True
+        finally:
+            self.pool.release(conn, commit=committed)
+        logger.info("Stored metrics history: " + ", ".join(
+            f"{len(rows)} {resource_type}" for resource_type, rows in batches.items()
+        ))
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued metrics sample has been written"""
+        return self.writer.flush(timeout)
+    
+    def close(self, timeout: Optional[float] = None):
+        """Flush the write buffer and stop its writer thread (called on shutdown)"""
+        self.writer.close(timeout)
+    
+    def get_write_buffer_status(self) -> Dict:
+        return self.writer.status()
     
     def store_vm_metrics(self, vm_data: Dict) -> bool:
-        """Store VM metrics to historical database"""
+        """Queue VM metrics for the historical database (written by the write buffer)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Current timestamp
-            now = datetime.now().isoformat()
-            
-            for vm in vm_data.get('vms', []):
-                cursor.execute("""
-                    INSERT INTO vm_metrics_history (
-                        vm_id, vm_name, cluster_name, host_name, datacenter_name,
-                        allocated_vcpus, allocated_memory_gb, allocated_storage_gb,
-                        cpu_usage_percent, memory_usage_percent, storage_usage_gb,
-                        power_state, vm_status, metric_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    vm.get('id', vm.get('vm_id', '')),
-                    vm.get('name', vm.get('vm', '')),
-                    vm.get('cluster', ''),
-                    vm.get('host', ''),
-                    vm.get('datacenter', ''),
-                    vm.get('cores', 0),
-                    vm.get('memory', 0),
-                    vm.get('storage', 0),
-                    vm.get('cpu', 0),
-                    vm.get('memory_usage', 0),
-                    vm.get('storage_used', 0),
-                    vm.get('power_state', 'unknown'),
-                    vm.get('status', 'unknown'),
-                    now
-                ))
-            
-            conn.commit()
-            logger.info(f"Stored metrics for {len(vm_data.get('vms', []))} VMs")
-            return True
+            now = datetime.utcnow().isoformat()
+            
+            rows = [(
+                vm.get('id', vm.get('vm_id', '')),
+                vm.get('name', vm.get('vm', '')),
+                vm.get('cluster', ''),
+                vm.get('host', ''),
+                vm.get('datacenter', ''),
+                vm.get('cores', 0),
+                vm.get('memory', 0),
+                vm.get('storage', 0),
+                vm.get('cpu', 0),
+                vm.get('memory_usage', 0),
+                vm.get('storage_used', 0),
+                vm.get('power_state', 'unknown'),
+                vm.get('status', 'unknown'),
+                now
+            ) for vm in vm_data.get('vms', [])]
+            return self.writer.submit('vm', rows)
             
         except Exception as e:
             logger.error(f"Failed to store VM metrics: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
     
     def store_host_metrics(self, host_data: Dict) -> bool:
-        """Store host metrics to historical database"""
+        """Queue host metrics for the historical database (written by the write buffer)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            now = datetime.now().isoformat()
+            now = datetime.utcnow().isoformat()
             
+            rows = []
             for host in host_data.get('hosts', []):
                 # Calculate allocated vCPUs from VMs on this host
                 allocated_vcpus = sum(vm.get('cores', 0) for vm in host_data.get('vms', []) 
@@ -96,15 +150,7 @@ class MetricsCollector:
                 host_vms = [vm for vm in host_data.get('vms', []) if vm.get('host') == host.get('name')]
                 running_vms = len([vm for vm in host_vms if vm.get('status') == 'running'])
                 
-                cursor.execute("""
-                    INSERT INTO host_metrics_history (
-                        host_id, host_name, cluster_name, datacenter_name,
-                        physical_cpu_cores, physical_memory_gb, physical_storage_gb,
-                        allocated_vcpus, cpu_usage_percent, memory_usage_percent, 
-                        storage_usage_percent, total_vms, running_vms,
-                        host_status, metric_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
+                rows.append((
                     host.get('id', host.get('name', '')),
                     host.get('name', ''),
                     host.get('cluster', ''),
@@ -121,82 +167,162 @@ class MetricsCollector:
                     host.get('status', 'unknown'),
                     now
                 ))
-            
-            conn.commit()
-            logger.info(f"Stored metrics for {len(host_data.get('hosts', []))} hosts")
-            return True
+            return self.writer.submit('host', rows)
             
         except Exception as e:
             logger.error(f"Failed to store host metrics: {e}")
             return False
-        finally:
-            if conn:
-                conn.close()
     
     def store_cluster_metrics(self, cluster_data: Dict) -> bool:
-        """Store cluster aggregate metrics"""
+        """Queue cluster aggregate metrics (written by the write buffer)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            now = datetime.now().isoformat()
-            
-            for cluster in cluster_data.get('clusters', []):
-                cursor.execute("""
-                    INSERT INTO cluster_metrics_history (
-                        cluster_name, datacenter_name,
-                        total_physical_cpu_cores, total_physical_memory_gb, total_physical_storage_gb,
-                        total_allocated_vcpus, avg_cpu_usage_percent, avg_memory_usage_percent,
-                        avg_storage_usage_percent, total_hosts, connected_hosts,
-                        total_vms, running_vms, peak_cpu_usage_percent, peak_memory_usage_percent,
-                        metric_timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    cluster.get('cluster', cluster.get('name', '')),
-                    cluster.get('datacenter', ''),
-                    cluster.get('physical_cpu_cores', 0),
-                    cluster.get('total_memory_gb', 0),
-                    cluster.get('total_storage_gb', 0),
-                    cluster.get('allocated_vcpus', 0),
-                    cluster.get('cpu_utilization', 0),
-                    cluster.get('memory_utilization', 0),
-                    cluster.get('storage_utilization', 0),
-                    cluster.get('host_count', 0),
-                    cluster.get('connected_hosts', cluster.get('host_count', 0)),
-                    cluster.get('current_vms', 0),
-                    cluster.get('running_vms', cluster.get('current_vms', 0)),
-                    cluster.get('peak_cpu_usage', cluster.get('cpu_utilization', 0)),
-                    cluster.get('peak_memory_usage', cluster.get('memory_utilization', 0)),
-                    now
-                ))
-            
-            conn.commit()
-            logger.info(f"Stored metrics for {len(cluster_data.get('clusters', []))} clusters")
-            return True
+            now = datetime.utcnow().isoformat()
+            
+            rows = [(
+                cluster.get('cluster', cluster.get('name', '')),
+                cluster.get('datacenter', ''),
+                cluster.get('physical_cpu_cores', 0),
+                cluster.get('total_memory_gb', 0),
+                cluster.get('total_storage_gb', 0),
+                cluster.get('allocated_vcpus', 0),
+                cluster.get('cpu_utilization', 0),
+                cluster.get('memory_utilization', 0),
+                cluster.get('storage_utilization', 0),
+                cluster.get('host_count', 0),
+                cluster.get('connected_hosts', cluster.get('host_count', 0)),
+                cluster.get('current_vms', 0),
+                cluster.get('running_vms', cluster.get('current_vms', 0)),
+                cluster.get('peak_cpu_usage', cluster.get('cpu_utilization', 0)),
+                cluster.get('peak_memory_usage', cluster.get('memory_utilization', 0)),
+                now
+            ) for cluster in cluster_data.get('clusters', [])]
+            return self.writer.submit('cluster', rows)
             
         except Exception as e:
             logger.error(f"Failed to store cluster metrics: {e}")
             return False
+    
+    def update_rollups(self) -> Dict[str, int]:
+        """Fold raw rows written outside the store_* methods (e.g. backfills) into the rollups"""
+        conn = None
+        try:
+            conn = self.pool.acquire_writer()
+            processed = self.rollups.update(conn)
+            conn.commit()
+            return processed
+        except Exception as e:
+            logger.error(f"Failed to update metric rollups: {e}")
+            return {}
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
-    def get_vm_history(self, vm_id: str, hours: int = 24) -> List[Dict]:
-        """Get historical metrics for a specific VM"""
+    def archive_cold_partitions(self) -> Dict:
+        """Compact history partitions past their archive age into the columnar cold tier"""
+        stats = {'archived': [], 'skipped': []}
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            with self.pool.writer() as conn:
+                # Rollups must have seen every row before it leaves SQLite
+                self.rollups.update(conn)
+                due = self.cold.due(conn)
+            for table, partition in due:
+                # Reading and writing the files holds only a reader; the
+                # writer is taken for the swap
+                with self.pool.reader() as conn:
+                    meta = self.cold.write_block(conn, table, partition)
+                with self.pool.writer() as conn:
+                    attached = self.cold.attach_block(conn, meta)
+                stats['archived' if attached else 'skipped'].append(partition)
+        except Exception as e:
+            logger.error(f"Failed to archive metrics partitions: {e}")
+            stats['error'] = str(e)
+        if stats['archived']:
+            logger.info(f"Archived {len(stats['archived'])} metrics partitions to {self.cold.archive_dir}")
+        return stats
+    
+    def apply_retention(self) -> List[str]:
+        """Drop history partitions and cold blocks older than their table's retention window"""
+        conn = None
+        expired_blocks = []
+        try:
+            conn = self.pool.acquire_writer()
+            dropped = self.partitions.drop_expired(conn)
+            expired_blocks = self.cold.drop_expired(conn)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to apply metrics retention: {e}")
+            return []
+        finally:
+            if conn:
+                self.pool.release(conn)
+        self.cold.remove_files(expired_blocks)
+        return dropped + expired_blocks
+    
+    def run_maintenance(self) -> Dict:
+        """Periodic upkeep: archive cold partitions, then apply retention"""
+        stats = self.archive_cold_partitions()
+        stats['dropped'] = self.apply_retention()
+        return stats
+    
+    def get_retention_policies(self) -> Dict[str, Dict]:
+        """Partition period, retention window and archive age of each history table"""
+        conn = None
+        try:
+            conn = self.pool.acquire_reader()
+            policies = self.partitions.policies(conn)
+            for table, settings in self.cold.settings(conn).items():
+                policies[table]['archive_after_days'] = settings['archive_after_days']
+            return policies
+        finally:
+            if conn:
+                self.pool.release(conn)
+    
+    def set_retention(self, table: str, retention_days: Optional[int] = None,
+                      archive_after_days: Optional[int] = None) -> List[str]:
+        """Change a history table's retention window and/or archive age; drops what falls outside retention"""
+        conn = None
+        try:
+            conn = self.pool.acquire_writer()
+            policy = self.partitions.policy(conn, table)
+            if archive_after_days is not None:
+                self.cold.set_archive_age(conn, table, archive_after_days)
+            if retention_days is not None:
+                self.partitions.set_policy(conn, table, policy['period'], retention_days)
+            conn.commit()
+        finally:
+            if conn:
+                self.pool.release(conn)
+        return self.apply_retention()
+    
+    def get_vm_history(self, vm_id: str, hours: int = 24, max_points: Optional[int] = None) -> List[Dict]:
+        """Get historical metrics for a specific VM
+
+        With max_points, returns buckets from the finest rollup that stays
+        within that many points over the range (see pick_resolution);
+        otherwise the raw rows.
+        """
+        conn = None
+        try:
+            conn = self.pool.acquire_reader()
             cursor = conn.cursor()
             
-            since = (datetime.now() - timedelta(hours=hours)).isoformat()
-            
-            cursor.execute("""
-                SELECT * FROM vm_metrics_history 
-                WHERE vm_id = ? AND metric_timestamp >= ?
-                ORDER BY metric_timestamp ASC
-            """, (vm_id, since))
-            
-            results = [dict(row) for row in cursor.fetchall()]
+            since = datetime.utcnow() - timedelta(hours=hours)
+            resolution = pick_resolution(hours, max_points)
+            if resolution:
+                return self.rollups.history(conn, 'vm', vm_id, resolution, since)
+            
+            cursor.execute(f"""
+                SELECT * FROM {self.partitions.source(conn, 'vm_metrics_history', since)}
+                WHERE vm_id = ? AND metric_ts_ms >= ?
+                ORDER BY metric_ts_ms ASC
+            """, (vm_id, to_epoch_ms(since)))
+            
+            results = self.cold.read(conn, 'vm_metrics_history', vm_id, since)
+            cold_rows = len(results)
+            results.extend(dict(row) for row in cursor.fetchall())
+            if cold_rows:
+                # A late hot partition can overlap an archived period
+                results.sort(key=lambda row: row['metric_ts_ms'])
             return results
             
         except Exception as e:
@@ -204,24 +330,37 @@ class MetricsCollector:
             return []
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
-    def get_cluster_history(self, cluster_name: str, hours: int = 24) -> List[Dict]:
-        """Get historical metrics for a cluster"""
+    def get_cluster_history(self, cluster_name: str, hours: int = 24, max_points: Optional[int] = None) -> List[Dict]:
+        """Get historical metrics for a cluster
+
+        With max_points, returns buckets from the finest rollup that stays
+        within that many points over the range (see pick_resolution);
+        otherwise the raw rows.
+        """
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self.pool.acquire_reader()
             cursor = conn.cursor()
             
-            since = (datetime.now() - timedelta(hours=hours)).isoformat()
-            
-            cursor.execute("""
-                SELECT * FROM cluster_metrics_history 
-                WHERE cluster_name = ? AND metric_timestamp >= ?
-                ORDER BY metric_timestamp ASC
-            """, (cluster_name, since))
-            
-            results = [dict(row) for row in cursor.fetchall()]
+            since = datetime.utcnow() - timedelta(hours=hours)
+            resolution = pick_resolution(hours, max_points)
+            if resolution:
+                return self.rollups.history(conn, 'cluster', cluster_name, resolution, since)
+            
+            cursor.execute(f"""
+                SELECT * FROM {self.partitions.source(conn, 'cluster_metrics_history', since)}
+                WHERE cluster_name = ? AND metric_ts_ms >= ?
+                ORDER BY metric_ts_ms ASC
+            """, (cluster_name, to_epoch_ms(since)))
+            
+            results = self.cold.read(conn, 'cluster_metrics_history', cluster_name, since)
+            cold_rows = len(results)
+            results.extend(dict(row) for row in cursor.fetchall())
+            if cold_rows:
+                # A late hot partition can overlap an archived period
+                results.sort(key=lambda row: row['metric_ts_ms'])
             return results
             
         except Exception as e:
@@ -229,13 +368,75 @@ class MetricsCollector:
             return []
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
+    def get_metric_series(self, resource_type: str, resource_id: str, metric_name: str,
+                          hours: int = 24) -> Tuple[np.ndarray, np.ndarray]:
+        """Raw samples of one metric as (int64 epoch ms, float64 values) arrays in time order
+
+        Reads the integer timestamp column and the cold tier's arrays
+        directly, so analysis code gets numpy input without a per-row
+        timestamp parse. Missing values are NaN.
+        """
+        source = ROLLUP_SOURCES[resource_type]
+        if metric_name not in source['metrics']:
+            raise ValueError(f"Unknown {resource_type} metric: {metric_name}")
+        conn = None
+        try:
+            conn = self.pool.acquire_reader()
+            since = datetime.utcnow() - timedelta(hours=hours)
+            rows = conn.execute(f"""
+                SELECT {TIMESTAMP_MS_COLUMN}, {metric_name}
+                FROM {self.partitions.source(conn, source['table'], since)}
+                WHERE {source['id_field']} = ? AND {TIMESTAMP_MS_COLUMN} >= ?
+                ORDER BY {TIMESTAMP_MS_COLUMN} ASC
+            """, (resource_id, to_epoch_ms(since))).fetchall()
+            timestamps = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            values = np.array([row[1] for row in rows], dtype=np.float64)
+
+            cold_timestamps, cold_values = self.cold.series(conn, source['table'], resource_id, metric_name, since)
+            if len(cold_timestamps):
+                timestamps = np.concatenate([cold_timestamps, timestamps])
+                values = np.concatenate([cold_values, values])
+                # A late hot partition can overlap an archived period
+                order = np.argsort(timestamps, kind='stable')
+                timestamps, values = timestamps[order], values[order]
+            return timestamps, values
+        finally:
+            if conn:
+                self.pool.release(conn)
+
+    def get_quantiles(self, resource_type: str, resource_id: str, metric_name: str, hours: int = 24 * 7,
+                      quantiles=DEFAULT_QUANTILES) -> Dict:
+        """Quantiles of one metric over the last hours, merged from the rollup digests
+
+        Covers samples already written by the write buffer; see
+        MetricsRollups.quantiles for the result fields.
+        """
+        source = ROLLUP_SOURCES.get(resource_type)
+        if source is None:
+            raise ValueError(f"Unknown resource type: {resource_type}")
+        if metric_name not in source['metrics']:
+            raise ValueError(f"Unknown {resource_type} metric: {metric_name}")
+        if any(not 0 <= q <= 1 for q in quantiles):
+            raise ValueError("Quantiles must be between 0 and 1")
+        conn = None
+        try:
+            conn = self.pool.acquire_reader()
+            until = datetime.utcnow()
+            since = until - timedelta(hours=hours)
+            result = self.rollups.quantiles(conn, resource_type, resource_id, metric_name, since, until, quantiles)
+        finally:
+            if conn:
+                self.pool.release(conn)
+        return dict(result, resource_type=resource_type, resource_id=resource_id, metric=metric_name,
+                    since=since.isoformat(), until=until.isoformat())
+
     def get_forecasting_data(self, resource_type: str, resource_id: str, metric_name: str) -> Optional[Dict]:
         """Get forecasting data for a resource"""
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self.pool.acquire_reader()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -252,99 +453,80 @@ class MetricsCollector:
             return None
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
     def calculate_forecasting_aggregates(self, resource_type: str, resource_id: str) -> bool:
         """Calculate and store forecasting aggregates for a resource"""
+        if resource_type == 'vm':
+            metrics = ['cpu_usage_percent', 'memory_usage_percent']
+        elif resource_type == 'host':
+            metrics = ['cpu_usage_percent', 'memory_usage_percent', 'vcpu_allocation_percent']
+        elif resource_type == 'cluster':
+            metrics = ['avg_cpu_usage_percent', 'avg_memory_usage_percent', 'vcpu_allocation_percent']
+        else:
+            logger.error(f"Unknown resource type: {resource_type}")
+            return False
+
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Determine the source table
-            if resource_type == 'vm':
-                table = 'vm_metrics_history'
-                id_field = 'vm_id'
-                metrics = ['cpu_usage_percent', 'memory_usage_percent']
-            elif resource_type == 'host':
-                table = 'host_metrics_history'
-                id_field = 'host_id'
-                metrics = ['cpu_usage_percent', 'memory_usage_percent', 'vcpu_allocation_percent']
-            elif resource_type == 'cluster':
-                table = 'cluster_metrics_history'
-                id_field = 'cluster_name'
-                metrics = ['avg_cpu_usage_percent', 'avg_memory_usage_percent', 'vcpu_allocation_percent']
-            else:
-                logger.error(f"Unknown resource type: {resource_type}")
-                return False
-            
-            # Calculate aggregates for each metric
+            aggregates = []
             for metric in metrics:
-                # Get data from the last 30 days
-                cursor.execute(f"""
-                    SELECT {metric}, metric_timestamp 
-                    FROM {table} 
-                    WHERE {id_field} = ? AND metric_timestamp >= datetime('now', '-30 days')
-                    ORDER BY metric_timestamp ASC
-                """, (resource_id,))
-                
-                data = cursor.fetchall()
-                if not data:
-                    continue
-                
-                values = [row[0] for row in data]
-                timestamps = [datetime.fromisoformat(row[1]) for row in data]
-                
+                # Last 30 days as epoch-ms and value arrays: no per-row timestamp parsing
+                timestamps, values = self.get_metric_series(resource_type, resource_id, metric, hours=30 * 24)
+                present = ~np.isnan(values)
+                timestamps, values = timestamps[present], values[present]
+
                 if len(values) < 2:
                     continue
-                
-                # Calculate basic statistics
-                hourly_avg = sum(values) / len(values)
-                std_dev = (sum((x - hourly_avg) ** 2 for x in values) / len(values)) ** 0.5
-                min_val = min(values)
-                max_val = max(values)
-                
-                # Calculate percentile 95
-                sorted_values = sorted(values)
-                p95_idx = int(len(sorted_values) * 0.95)
-                percentile_95 = sorted_values[p95_idx] if p95_idx < len(sorted_values) else max_val
-                
-                # Simple linear regression for trend
-                n = len(values)
-                sum_x = sum(range(n))
-                sum_y = sum(values)
-                sum_xy = sum(i * values[i] for i in range(n))
-                sum_x2 = sum(i * i for i in range(n))
-                
-                slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x) if (n * sum_x2 - sum_x * sum_x) != 0 else 0
-                
+
+                # Hourly averages, grouped on the integer timestamps
+                hours, inverse = np.unique((timestamps - timestamps[0]) // 3600000, return_inverse=True)
+                if len(hours) < 2:
+                    continue
+                hourly_values = np.bincount(inverse, weights=values) / np.bincount(inverse)
+
+                # Calculate basic statistics over the raw samples
+                hourly_avg = float(values.mean())
+                std_dev = float(values.std())
+                min_val = float(values.min())
+                max_val = float(values.max())
+                percentile_95 = float(np.percentile(values, 95))
+
+                # Simple linear regression of the hourly averages against hours elapsed
+                hours = hours.astype(np.float64)
+                hours_dev = hours - hours.mean()
+                denominator = float((hours_dev * hours_dev).sum())
+                slope = float((hours_dev * (hourly_values - hourly_values.mean())).sum()) / denominator if denominator else 0
+
                 # Project forecast (simple linear extrapolation)
                 forecast_7d = hourly_avg + (slope * 7 * 24)  # 7 days * 24 hours
                 forecast_14d = hourly_avg + (slope * 14 * 24)
                 forecast_30d = hourly_avg + (slope * 30 * 24)
-                
+
                 # Calculate confidence (inverse of coefficient of variation)
                 cv = std_dev / hourly_avg if hourly_avg > 0 else 1
                 confidence = max(0, min(100, 100 - (cv * 100)))
-                
-                # Store the aggregate
-                cursor.execute("""
-                    INSERT OR REPLACE INTO forecasting_aggregates (
-                        resource_type, resource_id, metric_name,
-                        hourly_avg, daily_avg, weekly_avg, monthly_avg,
-                        growth_rate_daily, std_deviation, min_value, max_value, percentile_95,
-                        forecast_7d, forecast_14d, forecast_30d, forecast_confidence,
-                        period_start, period_end, last_updated
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
+
+                aggregates.append((
                     resource_type, resource_id, metric,
                     hourly_avg, hourly_avg, hourly_avg, hourly_avg,  # Simplified for now
                     slope * 24,  # Daily growth rate
                     std_dev, min_val, max_val, percentile_95,
                     max(0, forecast_7d), max(0, forecast_14d), max(0, forecast_30d), confidence,
-                    timestamps[0].isoformat(), timestamps[-1].isoformat(),
-                    datetime.now().isoformat()
+                    from_epoch_ms(timestamps[0]).isoformat(), from_epoch_ms(timestamps[-1]).isoformat(),
+                    datetime.utcnow().isoformat()
                 ))
-            
+
+            conn = self.pool.acquire_writer()
+            conn.executemany("""
+                INSERT OR REPLACE INTO forecasting_aggregates (
+                    resource_type, resource_id, metric_name,
+                    hourly_avg, daily_avg, weekly_avg, monthly_avg,
+                    growth_rate_daily, std_deviation, min_value, max_value, percentile_95,
+                    forecast_7d, forecast_14d, forecast_30d, forecast_confidence,
+                    period_start, period_end, last_updated
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, aggregates)
             conn.commit()
             logger.info(f"Calculated forecasting aggregates for {resource_type}:{resource_id}")
             return True
@@ -354,14 +536,15 @@ class MetricsCollector:
             return False
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
     def store_infrastructure_event(self, event_type: str, severity: str, resource_type: str, 
                                  resource_id: str, resource_name: str, title: str, 
                                  description: str = None) -> bool:
         """Store an infrastructure event"""
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.pool.acquire_writer()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -371,7 +554,7 @@ class MetricsCollector:
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 event_type, severity, resource_type, resource_id, resource_name,
-                title, description, datetime.now().isoformat()
+                title, description, datetime.utcnow().isoformat()
             ))
             
             conn.commit()
@@ -383,16 +566,16 @@ class MetricsCollector:
             return False
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
     
     def get_recent_events(self, hours: int = 24, limit: int = 50) -> List[Dict]:
         """Get recent infrastructure events"""
+        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+            conn = self.pool.acquire_reader()
             cursor = conn.cursor()
             
-            since = (datetime.now() - timedelta(hours=hours)).isoformat()
+            since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
             
             cursor.execute("""
                 SELECT * FROM infrastructure_events 
@@ -409,8 +592,8 @@ class MetricsCollector:
             return []
         finally:
             if conn:
-                conn.close()
+                self.pool.release(conn)
 
 
 # Global metrics collector instance
-metrics_collector = MetricsCollector()
\ No newline at end of file
+metrics_collector = MetricsCollector(write_buffer=settings.METRICS_WRITE_BUFFER)
\ No newline at end of file
@@ -0,0 +1,447 @@
+"""
+Metrics Rollup Module
+Maintains 5-minute, hourly and daily aggregates of the metrics history tables,
+each with a mergeable quantile sketch, so history, forecasting and percentile
+reads do not have to scan raw rows
+"""
+
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+from db.cold_tier import ColdTier
+from db.partitions import TIMESTAMP_MS_COLUMN, PartitionedTables, from_epoch_ms, to_epoch_ms
+from .tdigest import TDigest
+
+logger = logging.getLogger(__name__)
+
+# (name, bucket width in seconds), finest first
+RESOLUTIONS = [('5m', 300), ('1h', 3600), ('1d', 86400)]
+RESOLUTION_SECONDS = dict(RESOLUTIONS)
+
+# Raw history table, resource id column and rolled-up metric columns per resource type
+ROLLUP_SOURCES = {
+    'vm': {
+        'table': 'vm_metrics_history',
+        'id_field': 'vm_id',
+        'metrics': ['cpu_usage_percent', 'memory_usage_percent', 'storage_usage_gb',
+                    'network_rx_mbps', 'network_tx_mbps']
+    },
+    'host': {
+        'table': 'host_metrics_history',
+        'id_field': 'host_id',
+        'metrics': ['cpu_usage_percent', 'memory_usage_percent', 'storage_usage_percent',
+                    'vcpu_allocation_percent']
+    },
+    'cluster': {
+        'table': 'cluster_metrics_history',
+        'id_field': 'cluster_name',
+        'metrics': ['avg_cpu_usage_percent', 'avg_memory_usage_percent', 'avg_storage_usage_percent',
+                    'vcpu_allocation_percent']
+    }
+}
+
+# Raw rows folded in per round trip
+DEFAULT_BATCH_SIZE = 50000
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the bucket containing timestamp (buckets align to the epoch)"""
+    seconds = RESOLUTION_SECONDS[resolution]
+    elapsed = timestamp - datetime.min
+    offset = elapsed.days * 86400 + elapsed.seconds
+    return datetime.min + timedelta(seconds=offset - offset % seconds)
+
+
+def bucket_start_ms(ms: int, resolution: str) -> int:
+    """bucket_start() on epoch milliseconds, for per-row use without datetime parsing.
+
+    Both align to the epoch, and history timestamps are naive UTC, so the
+    two agree for every resolution.
+    """
+    width = RESOLUTION_SECONDS[resolution] * 1000
+    return ms - ms % width
+
+
+def percentile_95(values: List[float]) -> float:
+    """Same nearest-rank p95 as the forecasting aggregates use"""
+    sorted_values = sorted(values)
+    index = int(len(sorted_values) * 0.95)
+    return sorted_values[index] if index < len(sorted_values) else sorted_values[-1]
+
+
+def weighted_percentile_95(children: List[Tuple[float, int]]) -> float:
+    """p95 of a coarse bucket from its children's (p95, sample_count).
+
+    Percentiles do not merge exactly; this takes the smallest child p95 whose
+    cumulative sample count reaches 95% of the bucket, which stays within the
+    children's p95 range and tracks the exact value closely when samples are
+    spread evenly over the bucket.
+    """
+    ordered = sorted(children)
+    target = 0.95 * sum(count for _, count in ordered)
+    cumulative = 0
+    for value, count in ordered:
+        cumulative += count
+        if cumulative >= target:
+            return value
+    return ordered[-1][0]
+
+
+def merge_digests(blobs: Iterable[Optional[bytes]]) -> Optional[TDigest]:
+    """One digest from serialized bucket digests; None if any bucket has none"""
+    merged = TDigest()
+    for blob in blobs:
+        if blob is None:
+            return None
+        merged.merge(TDigest.from_bytes(blob))
+    return merged
+
+
+def quantile_label(q: float) -> str:
+    """0.95 -> 'p95', 0.999 -> 'p99.9'"""
+    return f"p{round(q * 100, 6):g}"
+
+
+def pick_resolution(hours: float, max_points: Optional[int]) -> Optional[str]:
+    """Finest resolution with at most max_points buckets over the range.
+
+    None means raw rows (no point budget given). Ranges with more days than
+    max_points get daily buckets, the coarsest there are.
+    """
+    if not max_points:
+        return None
+    for name, seconds in RESOLUTIONS:
+        if hours * 3600 / seconds <= max_points:
+            return name
+    return RESOLUTIONS[-1][0]
+
+
+def cover_range(since: datetime, until: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Fewest rollup buckets spanning [since, until), as (resolution, start, end) ranges.
+
+    Whole days come from daily buckets, the hours either side of them from
+    hourly buckets and the edges from 5-minute buckets. The 5-minute
+    buckets holding since and until are included whole, as in history().
+    """
+    finest = timedelta(seconds=RESOLUTION_SECONDS['5m'])
+    end = bucket_start(until, '5m')
+    if end < until:
+        end += finest
+    pending = [(bucket_start(since, '5m'), end)]
+    cover = []
+    for name, seconds in reversed(RESOLUTIONS):
+        width = timedelta(seconds=seconds)
+        remaining = []
+        for start, end in pending:
+            inner_start = bucket_start(start, name)
+            if inner_start < start:
+                inner_start += width
+            inner_end = bucket_start(end, name)
+            if inner_start < inner_end:
+                cover.append((name, inner_start, inner_end))
+                remaining += [(start, inner_start), (inner_end, end)]
+            else:
+                remaining.append((start, end))
+        pending = [(start, end) for start, end in remaining if start < end]
+    return sorted(cover, key=lambda part: part[1])
+
+
+def _contiguous_ranges(starts: Iterable[datetime], width: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Merge bucket starts into [start, end) ranges so each range is one query"""
+    ranges = []
+    for start in sorted(set(starts)):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], start + width)
+        else:
+            ranges.append((start, start + width))
+    return ranges
+
+
+class MetricsRollups:
+    """Incremental rollups over the raw history tables.
+
+    Raw rows are folded in by id, past a per-partition watermark kept in
+    metric_rollup_state, so each call only reads rows that landed since the
+    previous one (the first call catches up on all existing history). Every
+    5-minute bucket touched by new rows is recomputed exactly from its raw
+    rows. The new rows are then added to their hourly and daily buckets:
+    count, sum, sum of squares, min and max merge exactly, and the values
+    are folded into the bucket's t-digest, from which p95 above 5 minutes
+    is read. A coarse bucket stored before the digests existed is rebuilt
+    from its finer buckets instead (weighted_percentile_95 when a child has
+    no digest either).
+
+    update() runs on the caller's connection and does not commit, so rollups
+    land in the same transaction as the raw rows that produced them.
+    """
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, cold_tier: Optional[ColdTier] = None):
+        self.batch_size = batch_size
+        self.partitions = PartitionedTables()
+        # Samples already archived still count when their bucket is rebuilt
+        self.cold_tier = cold_tier
+
+    def update(self, conn: sqlite3.Connection, resource_types: Iterable[str] = None) -> Dict[str, int]:
+        """Fold new raw rows into the rollups; returns raw rows processed per type"""
+        processed = {}
+        for resource_type in resource_types or ROLLUP_SOURCES:
+            processed[resource_type] = self._update_source(conn, resource_type)
+        return processed
+
+    def _update_source(self, conn: sqlite3.Connection, resource_type: str) -> int:
+        table = ROLLUP_SOURCES[resource_type]['table']
+        watermarks = dict(conn.execute(
+            "SELECT source_table, last_raw_id FROM metric_rollup_state WHERE source_table LIKE ?", (f"{table}_%",)
+        ).fetchall())
+        total = 0
+        for partition in self.partitions.partitions(conn, table):
+            total += self._update_partition(conn, resource_type, partition, watermarks.get(partition, 0))
+        # Forget the watermarks of partitions retention has dropped
+        conn.execute("""
+            DELETE FROM metric_rollup_state WHERE source_table LIKE ?
+              AND source_table NOT IN (SELECT partition_table FROM partitions)
+        """, (f"{table}_%",))
+        return total
+
+    def _update_partition(self, conn: sqlite3.Connection, resource_type: str, partition: str, watermark: int) -> int:
+        source = ROLLUP_SOURCES[resource_type]
+        total = 0
+        while True:
+            new_rows = conn.execute(f"""
+                SELECT id, {source['id_field']}, {TIMESTAMP_MS_COLUMN}, {', '.join(source['metrics'])}
+                FROM "{partition}" WHERE id > ? ORDER BY id LIMIT ?
+            """, (watermark, self.batch_size)).fetchall()
+            if not new_rows:
+                break
+            # New metric values per (resource, 5-minute bucket start)
+            starts = {}
+            new_samples = defaultdict(list)
+            for row in new_rows:
+                ms = bucket_start_ms(row[2], '5m')
+                if ms not in starts:
+                    starts[ms] = from_epoch_ms(ms)
+                new_samples[(row[1], starts[ms])].append(row[3:])
+            self._rollup_raw(conn, resource_type, set(new_samples))
+            for finer, coarser in (('5m', '1h'), ('1h', '1d')):
+                self._fold_samples(conn, resource_type, finer, coarser, new_samples)
+            watermark = new_rows[-1][0]
+            total += len(new_rows)
+        if total:
+            conn.execute("""
+                INSERT INTO metric_rollup_state (source_table, last_raw_id, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(source_table) DO UPDATE SET
+                    last_raw_id = excluded.last_raw_id, updated_at = excluded.updated_at
+            """, (partition, watermark))
+        return total
+
+    def _rollup_raw(self, conn: sqlite3.Connection, resource_type: str, touched: set):
+        """Recompute the touched 5-minute buckets from raw rows"""
+        source = ROLLUP_SOURCES[resource_type]
+        metrics = source['metrics']
+        # Rows are matched to buckets on epoch ms; starts are only converted per bucket
+        starts = {(resource_id, to_epoch_ms(start)): start for resource_id, start in touched}
+        samples = defaultdict(list)
+        width = timedelta(seconds=RESOLUTION_SECONDS['5m'])
+        for start, end in _contiguous_ranges((bucket for _, bucket in touched), width):
+            cursor = conn.execute(f"""
+                SELECT {source['id_field']}, {TIMESTAMP_MS_COLUMN}, {', '.join(metrics)}
+                FROM {self.partitions.source(conn, source['table'], start, end)}
+                WHERE {TIMESTAMP_MS_COLUMN} >= ? AND {TIMESTAMP_MS_COLUMN} < ?
+            """, (to_epoch_ms(start), to_epoch_ms(end)))
+            for row in cursor:
+                key = (row[0], bucket_start_ms(row[1], '5m'))
+                if key in starts:
+                    samples[key].append(row[2:])
+            if self.cold_tier:
+                for resource_id, ms, values in self.cold_tier.scan(conn, source['table'], metrics, start, end):
+                    key = (resource_id, bucket_start_ms(ms, '5m'))
+                    if key in starts:
+                        samples[key].append(values)
+
+        rows = []
+        for key, bucket_rows in samples.items():
+            resource_id, start = key[0], starts[key]
+            for position, metric in enumerate(metrics):
+                values = [r[position] for r in bucket_rows if r[position] is not None]
+                if not values:
+                    continue
+                rows.append((
+                    resource_type, '5m', resource_id, metric, start.isoformat(),
+                    len(values), sum(values), sum(v * v for v in values),
+                    min(values), max(values), percentile_95(values), TDigest.of(values).to_bytes()
+                ))
+        self._write(conn, rows)
+
+    def _fold_samples(self, conn: sqlite3.Connection, resource_type: str, finer: str, coarser: str,
+                      new_samples: Dict[Tuple[str, datetime], List[tuple]]):
+        """Add new samples to the coarser buckets they fall in.
+
+        Only the stored coarse buckets are read, not their children, so the
+        cost follows the new rows rather than how much of the bucket has
+        elapsed.
+        """
+        metrics = ROLLUP_SOURCES[resource_type]['metrics']
+        added = defaultdict(list)
+        for (resource_id, start), bucket_rows in new_samples.items():
+            parent = bucket_start(start, coarser)
+            for position, metric in enumerate(metrics):
+                added[(resource_id, metric, parent)].extend(
+                    r[position] for r in bucket_rows if r[position] is not None
+                )
+
+        stored = {}
+        width = timedelta(seconds=RESOLUTION_SECONDS[coarser])
+        for start, end in _contiguous_ranges((parent for _, _, parent in added), width):
+            cursor = conn.execute("""
+                SELECT resource_id, metric_name, bucket_start,
+                       sample_count, sum, sum_sq, min_value, max_value, digest
+                FROM metric_rollups
+                WHERE resource_type = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+            """, (resource_type, coarser, start.isoformat(), end.isoformat()))
+            for row in cursor:
+                key = (row[0], row[1], datetime.fromisoformat(row[2]))
+                if key in added:
+                    stored[key] = row[3:]
+
+        rows = []
+        rebuild = set()
+        for key, values in added.items():
+            if not values:
+                continue
+            resource_id, metric, start = key
+            count, total, total_sq = len(values), sum(values), sum(v * v for v in values)
+            low, high = min(values), max(values)
+            digest = TDigest.of(values)
+            previous = stored.get(key)
+            if previous is not None:
+                if previous[5] is None:
+                    rebuild.add((resource_id, start))
+                    continue
+                count, total, total_sq = count + previous[0], total + previous[1], total_sq + previous[2]
+                low, high = min(low, previous[3]), max(high, previous[4])
+                digest.merge(TDigest.from_bytes(previous[5]))
+            rows.append((
+                resource_type, coarser, resource_id, metric, start.isoformat(),
+                count, total, total_sq, low, high, digest.quantile(0.95), digest.to_bytes()
+            ))
+        self._write(conn, rows)
+        if rebuild:
+            self._rollup_buckets(conn, resource_type, finer, coarser, rebuild)
+
+    def _rollup_buckets(self, conn: sqlite3.Connection, resource_type: str,
+                        finer: str, coarser: str, touched: set):
+        """Rebuild the touched coarser buckets from their finer buckets"""
+        children = defaultdict(list)
+        width = timedelta(seconds=RESOLUTION_SECONDS[coarser])
+        for start, end in _contiguous_ranges((bucket for _, bucket in touched), width):
+            cursor = conn.execute("""
+                SELECT resource_id, metric_name, bucket_start,
+                       sample_count, sum, sum_sq, min_value, max_value, p95, digest
+                FROM metric_rollups
+                WHERE resource_type = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+            """, (resource_type, finer, start.isoformat(), end.isoformat()))
+            for row in cursor:
+                parent = bucket_start(datetime.fromisoformat(row[2]), coarser)
+                if (row[0], parent) in touched:
+                    children[(row[0], row[1], parent)].append(row[3:])
+
+        rows = []
+        for (resource_id, metric, start), parts in children.items():
+            digest = merge_digests(p[6] for p in parts)
+            if digest is not None:
+                p95, blob = digest.quantile(0.95), digest.to_bytes()
+            else:
+                p95, blob = weighted_percentile_95([(p[5], p[0]) for p in parts]), None
+            rows.append((
+                resource_type, coarser, resource_id, metric, start.isoformat(),
+                sum(p[0] for p in parts), sum(p[1] for p in parts), sum(p[2] for p in parts),
+                min(p[3] for p in parts), max(p[4] for p in parts), p95, blob
+            ))
+        self._write(conn, rows)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        if rows:
+            conn.executemany("""
+                INSERT OR REPLACE INTO metric_rollups (
+                    resource_type, resolution, resource_id, metric_name, bucket_start,
+                    sample_count, sum, sum_sq, min_value, max_value, p95, digest
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def history(self, conn: sqlite3.Connection, resource_type: str, resource_id: str,
+                resolution: str, since: datetime) -> List[Dict]:
+        """Buckets of one resource from since onwards, one dict per bucket.
+
+        Each metric column carries the bucket average, as in the raw rows,
+        alongside <metric>_min, <metric>_max and <metric>_p95.
+        """
+        cursor = conn.execute("""
+            SELECT metric_name, bucket_start, sample_count, sum, min_value, max_value, p95
+            FROM metric_rollups
+            WHERE resource_type = ? AND resolution = ? AND resource_id = ? AND bucket_start >= ?
+        """, (resource_type, resolution, resource_id, bucket_start(since, resolution).isoformat()))
+        buckets: Dict[str, Dict] = {}
+        for metric, start, count, total, low, high, p95 in cursor:
+            bucket = buckets.setdefault(start, {
+                ROLLUP_SOURCES[resource_type]['id_field']: resource_id,
+                'metric_timestamp': start,
+                'resolution': resolution,
+                'sample_count': 0
+            })
+            bucket[metric] = total / count
+            bucket[f'{metric}_min'] = low
+            bucket[f'{metric}_max'] = high
+            bucket[f'{metric}_p95'] = p95
+            bucket['sample_count'] = max(bucket['sample_count'], count)
+        return [buckets[start] for start in sorted(buckets)]
+
+    def series(self, conn: sqlite3.Connection, resource_type: str, resource_id: str,
+               metric_name: str, resolution: str, since: datetime) -> List[sqlite3.Row]:
+        """Bucket rows of one metric in time order"""
+        return conn.execute("""
+            SELECT bucket_start, sample_count, sum, sum_sq, min_value, max_value, p95, digest
+            FROM metric_rollups
+            WHERE resource_type = ? AND resolution = ? AND resource_id = ? AND metric_name = ?
+              AND bucket_start >= ?
+            ORDER BY bucket_start ASC
+        """, (resource_type, resolution, resource_id, metric_name,
+              bucket_start(since, resolution).isoformat())).fetchall()
+
+    def quantiles(self, conn: sqlite3.Connection, resource_type: str, resource_id: str, metric_name: str,
+                  since: datetime, until: datetime, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> Dict:
+        """Quantiles of one metric over [since, until) from the bucket digests.
+
+        Merges the fewest buckets that span the window (cover_range), so the
+        cost depends on the number of days in it, not the number of samples.
+        Buckets without a digest are left out and counted in
+        buckets_without_digest.
+        """
+        merged = TDigest()
+        buckets = missing = 0
+        for resolution, start, end in cover_range(since, until):
+            cursor = conn.execute("""
+                SELECT digest FROM metric_rollups
+                WHERE resource_type = ? AND resolution = ? AND resource_id = ? AND metric_name = ?
+                  AND bucket_start >= ? AND bucket_start < ?
+            """, (resource_type, resolution, resource_id, metric_name, start.isoformat(), end.isoformat()))
+            for (blob,) in cursor:
+                buckets += 1
+                if blob is None:
+                    missing += 1
+                else:
+                    merged.merge(TDigest.from_bytes(blob))
+        samples = int(merged.count)
+        return {
+            'samples': samples,
+            'buckets': buckets,
+            'buckets_without_digest': missing,
+            'min': merged.min if samples else None,
+            'max': merged.max if samples else None,
+            'quantiles': {quantile_label(q): merged.quantile(q) for q in quantiles},
+        }
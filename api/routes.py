@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Response, status
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from datetime import timedelta
@@ -25,7 +25,10 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Any
 import json
 import os
-from .database_manager import InfrastructureDBManager
+import asyncio
+from .database_manager import INACTIVE_RETENTION_DAYS, InfrastructureDBManager
+from .inventory_cache import inventory_cache_statistics
+from db.partitions import to_epoch_ms
 
 router = APIRouter()
 
@@ -181,13 +184,18 @@ def list_recommendations():
         ]
 
 @router.get("/underutilized")
-def list_underutilized():
+def list_underutilized(limit: int = 100, offset: int = 0, percentiles: bool = False,
+                       cpu_threshold: float = 10.0, memory_threshold: float = 20.0, days: int = 7):
+    limit = max(1, min(limit, 1000))
+    offset = max(0, offset)
     try:
-        from analysis.engine import get_underutilized_vms
-        return get_underutilized_vms()
+        from analysis.engine import get_underutilized_page
+        return get_underutilized_page(
+            cpu_threshold, memory_threshold, days, limit=limit, offset=offset, percentiles=percentiles
+        )
     except Exception as e:
-        # Return sample data if database unavailable
-        return []
+        # Return an empty page if database unavailable
+        return {"total": 0, "limit": limit, "offset": offset, "items": []}
 
 @router.get("/forecast/{vm_id}")
 def get_forecast(vm_id: int, hours: int = 24):
@@ -256,24 +264,22 @@ async def get_mac_stats():
 async def get_database_status():
     """Check database connectivity and health"""
     try:
-        import sqlite3
-        import os
+        from db.sqlite_pool import get_pool, pool_statistics
         
         db_path = "data/iroa.db"
-        if not os.path.exists("data"):
-            os.makedirs("data")
-            
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        result = cursor.fetchone()
-        conn.close()
+        with get_pool(db_path).reader() as conn:
+            result = conn.execute("SELECT 1").fetchone()
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
         
         return {
             "status": "connected",
             "message": "Database is accessible",
             "database_path": db_path,
-            "test_result": result[0] if result else None
+            "test_result": result[0] if result else None,
+            "journal_mode": journal_mode,
+            "connection_pools": pool_statistics(),
+            "inventory_caches": inventory_cache_statistics(),
+            "metrics_write_buffer": metrics_collector.get_write_buffer_status()
         }
     except Exception as e:
         return {
@@ -310,9 +316,8 @@ async def test_vcenter_connection(request: ConnectionTestRequest):
     try:
         # Try to import vCenter SDK
         try:
-            from pyVim.connect import SmartConnect, Disconnect
             from pyVmomi import vim
-            import ssl
+            from monitoring.vcenter_session import vcenter_sessions
         except ImportError:
             # If SDK not available, do basic connectivity test
             import socket
@@ -350,29 +355,13 @@ async def test_vcenter_connection(request: ConnectionTestRequest):
                 "connection_type": "basic"
             }
         
-        # Full vCenter SDK connection test
-        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-        context.verify_mode = ssl.CERT_NONE
-        
-        # Connect to vCenter
-        si = SmartConnect(
-            host=request.host,
-            user=request.username,
-            pwd=request.password,
-            sslContext=context,
-            port=443
+        # Full vCenter SDK connection test through the shared session pool
+        # (a changed password forces a fresh login, so credentials are verified)
+        datacenter_count = vcenter_sessions.run(
+            request.host, request.username, request.password,
+            lambda si: len(si.RetrieveContent().rootFolder.childEntity)
         )
         
-        if not si:
-            raise HTTPException(status_code=400, detail="Failed to connect to vCenter")
-        
-        # Get basic info to verify connection
-        content = si.RetrieveContent()
-        datacenter_count = len(content.rootFolder.childEntity)
-        
-        # Disconnect
-        Disconnect(si)
-        
         return {
             "status": "success",
             "message": f"Successfully authenticated to vCenter at {request.host}",
@@ -394,6 +383,10 @@ async def test_vcenter_connection(request: ConnectionTestRequest):
 @router.post("/admin/vcenter/sync")
 async def sync_vcenter_vms():
     """Pull all VM data from vCenter using saved credentials"""
+    async with _source_lock("vcenter"):
+        return await _sync_vcenter_vms()
+
+async def _sync_vcenter_vms():
     print("🔄 Starting vCenter VM sync...")
     
     try:
@@ -401,6 +394,11 @@ async def sync_vcenter_vms():
         config = load_integration_config()
         vcenter_config = config.get('vcenter')
         
+        # Several configured vCenters are collected in parallel
+        from monitoring.vcenter_multisite import vcenter_sites
+        if len(vcenter_sites(config)) > 1 or (config.get('vcenters') and not vcenter_config):
+            return await _sync_all_vcenters()
+        
         if not vcenter_config:
             raise HTTPException(status_code=400, detail="No vCenter configuration found. Please save vCenter credentials first.")
         
@@ -415,15 +413,13 @@ async def sync_vcenter_vms():
         
         # Try to import vCenter SDK
         try:
-            from pyVim.connect import SmartConnect, Disconnect
             from pyVmomi import vim
-            import ssl
         except ImportError:
             raise HTTPException(status_code=500, detail="vCenter SDK (pyVmomi) not available. Cannot sync VM data.")
         
         # Use saved credentials for automatic sync
         request_obj = type('obj', (object,), {'host': host, 'username': username, 'password': password})
-        return await sync_vcenter_inventory_with_credentials(request_obj)
+        return await _sync_vcenter_inventory_with_credentials(request_obj)
         
     except Exception as e:
         print(f"❌ vCenter sync failed: {str(e)}")
@@ -447,6 +443,15 @@ async def get_vcenter_inventory():
         "inventory": vcenter_inventory_cache
     }
 
+@router.get("/admin/vcenter/sessions")
+async def get_vcenter_sessions():
+    """Pooled vCenter sessions and login/reuse counters"""
+    try:
+        from monitoring.vcenter_session import vcenter_sessions
+    except ImportError:
+        return {"sessions": []}
+    return vcenter_sessions.status()
+
 @router.get("/admin/vcenter/clusters")
 async def get_vcenter_clusters():
     """Get vCenter compute clusters with resource utilization"""
@@ -489,6 +494,10 @@ async def get_vcenter_datastores():
 @router.post("/admin/vcenter/sync-with-credentials")
 async def sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest):
     """Pull complete vCenter infrastructure inventory with provided credentials"""
+    async with _source_lock("vcenter"):
+        return await _sync_vcenter_inventory_with_credentials(request)
+
+async def _sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest):
     print("🔄 Starting comprehensive vCenter inventory sync...")
     
     if not request.host or not request.username or not request.password:
@@ -497,237 +506,33 @@ async def sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest
     try:
         # Import vCenter SDK
         try:
-            from pyVim.connect import SmartConnect, Disconnect
             from pyVmomi import vim
-            import ssl
+            from monitoring.vcenter_inventory import collect_vcenter_inventory
+            from monitoring.vcenter_session import vcenter_sessions
         except ImportError:
             raise HTTPException(status_code=500, detail="vCenter SDK (pyVmomi) not available. Install with: pip install pyvmomi")
         
         print(f"🏢 Connecting to vCenter: {request.host}")
         
-        # Create SSL context
-        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-        context.verify_mode = ssl.CERT_NONE
-        
-        si = SmartConnect(
-            host=request.host,
-            user=request.username,
-            pwd=request.password,
-            sslContext=context,
-            port=443
+        # Pull the whole inventory through the PropertyCollector: explicit
+        # property paths, paginated RetrievePropertiesEx and a local
+        # host -> cluster -> datacenter map instead of per-attribute round trips.
+        # The session comes from the shared pool and stays logged in.
+        print("📦 Retrieving inventory via PropertyCollector...")
+        inventory_data = vcenter_sessions.run(
+            request.host, request.username, request.password,
+            lambda si: collect_vcenter_inventory(si.RetrieveContent())
         )
         
-        if not si:
-            raise HTTPException(status_code=400, detail="Failed to connect to vCenter")
-        
-        content = si.RetrieveContent()
-        inventory_data = {}
-        
-        # 1. Get Datacenters
-        print("📍 Collecting datacenter information...")
-        datacenters = []
-        for datacenter in content.rootFolder.childEntity:
-            if isinstance(datacenter, vim.Datacenter):
-                dc_data = {
-                    "name": datacenter.name,
-                    "moid": datacenter._moId,
-                    "clusters": [],
-                    "hosts": [],
-                    "datastores": [],
-                    "networks": []
-                }
-                datacenters.append(dc_data)
+        datacenters = inventory_data["datacenters"]
+        clusters = inventory_data["clusters"]
+        hosts = inventory_data["hosts"]
+        datastores = inventory_data["datastores"]
+        networks = inventory_data["networks"]
+        vms = inventory_data["vms"]
+        underutilized_vms = inventory_data["underutilized_vms"]
         
-        # 2. Get Compute Clusters and Hosts
-        print("🖥️ Collecting cluster and host information...")
-        clusters = []
-        hosts = []
-        
-        cluster_container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.ClusterComputeResource], True
-        )
-        
-        for cluster in cluster_container.view:
-            # Cluster resource summary
-            summary = cluster.summary
-            cluster_data = {
-                "name": cluster.name,
-                "moid": cluster._moId,
-                "datacenter": cluster.parent.parent.name if cluster.parent and cluster.parent.parent else "Unknown",
-                "total_cpu_cores": summary.numCpuCores,
-                "total_cpu_mhz": summary.totalCpu,
-                "used_cpu_mhz": summary.totalCpu - summary.effectiveCpu if summary.effectiveCpu else 0,
-                "total_memory_gb": round(summary.totalMemory / (1024**3), 2),
-                "used_memory_gb": round((summary.totalMemory - summary.effectiveMemory * 1024**2) / (1024**3), 2) if summary.effectiveMemory else 0,
-                "num_hosts": summary.numHosts,
-                "num_vms": 0,  # Will be calculated later
-                "drs_enabled": cluster.configuration.drsConfig.enabled if cluster.configuration.drsConfig else False,
-                "ha_enabled": cluster.configuration.dasConfig.enabled if cluster.configuration.dasConfig else False,
-                "hosts": []
-            }
-            
-            # Get hosts in this cluster
-            for host in cluster.host:
-                host_summary = host.summary
-                
-                # Calculate logical cores (vCPUs) - physical cores * threads per core
-                physical_cores = host_summary.hardware.numCpuCores
-                cpu_threads = host_summary.hardware.numCpuThreads
-                logical_cores = cpu_threads if cpu_threads else physical_cores * 2  # Default to 2x if threads not available
-                
-                host_data = {
-                    "name": host.name,
-                    "moid": host._moId,
-                    "cluster": cluster.name,
-                    "datacenter": cluster.parent.parent.name if cluster.parent and cluster.parent.parent else "Unknown",
-                    "cpu_cores": physical_cores,  # Physical cores
-                    "logical_cores": logical_cores,  # Logical cores (vCPUs) for VM allocation
-                    "cpu_threads": cpu_threads,  # Total CPU threads
-                    "cpu_mhz": host_summary.hardware.cpuMhz * physical_cores,
-                    "memory_gb": round(host_summary.hardware.memorySize / (1024**3), 2),
-                    "cpu_usage_mhz": host_summary.quickStats.overallCpuUsage if host_summary.quickStats else 0,
-                    "memory_usage_gb": round(host_summary.quickStats.overallMemoryUsage / 1024, 2) if host_summary.quickStats else 0,
-                    "power_state": str(host_summary.runtime.powerState),
-                    "connection_state": str(host_summary.runtime.connectionState),
-                    "num_vms": len(host.vm),
-                    "vendor": host_summary.hardware.vendor,
-                    "model": host_summary.hardware.model,
-                    "version": host_summary.config.product.version if host_summary.config.product else "Unknown"
-                }
-                hosts.append(host_data)
-                cluster_data["hosts"].append(host_data)
-            
-            clusters.append(cluster_data)
-        
-        cluster_container.Destroy()
-        
-        # 3. Get Datastores
-        print("💾 Collecting datastore information...")
-        datastores = []
-        
-        datastore_container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.Datastore], True
-        )
-        
-        for ds in datastore_container.view:
-            if ds.summary.accessible:
-                ds_data = {
-                    "name": ds.name,
-                    "moid": ds._moId,
-                    "type": ds.summary.type,
-                    "capacity_gb": round(ds.summary.capacity / (1024**3), 2),
-                    "free_space_gb": round(ds.summary.freeSpace / (1024**3), 2),
-                    "used_space_gb": round((ds.summary.capacity - ds.summary.freeSpace) / (1024**3), 2),
-                    "usage_percent": round(((ds.summary.capacity - ds.summary.freeSpace) / ds.summary.capacity) * 100, 1),
-                    "accessible": ds.summary.accessible,
-                    "maintenance_mode": ds.summary.maintenanceMode if hasattr(ds.summary, 'maintenanceMode') else "normal",
-                    "num_vms": len(ds.vm) if ds.vm else 0
-                }
-                datastores.append(ds_data)
-        
-        datastore_container.Destroy()
-        
-        # 4. Get Networks
-        print("🌐 Collecting network information...")
-        networks = []
-        
-        network_container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.Network], True
-        )
-        
-        for network in network_container.view:
-            net_data = {
-                "name": network.name,
-                "moid": network._moId,
-                "accessible": network.summary.accessible if hasattr(network.summary, 'accessible') else True,
-                "num_vms": len(network.vm) if network.vm else 0
-            }
-            networks.append(net_data)
-        
-        network_container.Destroy()
-        
-        # 5. Get VMs with enhanced cluster/datacenter mapping
-        print("🖥️ Collecting virtual machine information...")
-        vm_container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.VirtualMachine], True
-        )
-        
-        vms = []
-        underutilized_vms = []
-        
-        print(f"📊 Processing {len(vm_container.view)} VMs...")
-        
-        for vm in vm_container.view:
-            try:
-                summary = vm.summary
-                config = summary.config
-                runtime = summary.runtime
-                
-                # Get datacenter and cluster info
-                datacenter_name = "Unknown"
-                cluster_name = "Unknown"
-                host_name = "Unknown"
-                
-                if vm.runtime.host:
-                    host_name = vm.runtime.host.name
-                    if vm.runtime.host.parent:
-                        cluster_name = vm.runtime.host.parent.name
-                        if vm.runtime.host.parent.parent and vm.runtime.host.parent.parent.parent:
-                            datacenter_name = vm.runtime.host.parent.parent.parent.name
-                
-                # Calculate resource usage
-                cpu_usage = 0
-                memory_usage = 0
-                
-                if summary.quickStats:
-                    if summary.quickStats.overallCpuUsage and config.numCpu:
-                        cpu_mhz_per_core = 2000
-                        total_cpu_mhz = config.numCpu * cpu_mhz_per_core
-                        cpu_usage = (summary.quickStats.overallCpuUsage / total_cpu_mhz) * 100
-                    
-                    if summary.quickStats.hostMemoryUsage and config.memorySizeMB:
-                        memory_usage = (summary.quickStats.hostMemoryUsage / config.memorySizeMB) * 100
-                
-                vm_data = {
-                    "vm": config.name,
-                    "status": "running" if runtime.powerState == vim.VirtualMachinePowerState.poweredOn else "stopped",
-                    "cpu": round(cpu_usage, 1),
-                    "memory_usage": round(memory_usage, 1),
-                    "cores": config.numCpu,
-                    "memory": round(config.memorySizeMB / 1024, 1),
-                    "cluster": cluster_name,
-                    "datacenter": datacenter_name,
-                    "host": host_name,
-                    "source": "vcenter",
-                    "guest_os": config.guestFullName or "Unknown",
-                    "tools_status": vm.guest.toolsStatus if vm.guest else "Unknown",
-                    "uuid": config.uuid,
-                    "details": {
-                        "avg_cpu": round(cpu_usage, 1),
-                        "avg_mem": round(memory_usage, 1),
-                        "disk_usage": round((summary.storage.committed / (1024**3)), 1) if summary.storage else 0,
-                        "power_state": str(runtime.powerState),
-                        "annotation": config.annotation or ""
-                    }
-                }
-                
-                vms.append(vm_data)
-                
-                # Update cluster VM count
-                for cluster in clusters:
-                    if cluster["name"] == cluster_name:
-                        cluster["num_vms"] += 1
-                        break
-                
-                # Check if VM is underutilized
-                if runtime.powerState == vim.VirtualMachinePowerState.poweredOn and cpu_usage < 30 and memory_usage < 50:
-                    underutilized_vms.append(vm_data)
-                    
-            except Exception as e:
-                print(f"⚠️ Error processing VM {vm.name if hasattr(vm, 'name') else 'Unknown'}: {e}")
-                continue
-        
-        vm_container.Destroy()
+        print(f"📊 Retrieved {len(vms)} VMs in {inventory_data['retrieval_calls']} PropertyCollector calls")
         
         # Store comprehensive inventory in global cache
         global vcenter_vms_cache, vcenter_inventory_cache
@@ -738,24 +543,9 @@ async def sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest
             "hosts": hosts,
             "datastores": datastores,
             "networks": networks,
-            "vms": vms,
-            "summary": {
-                "total_datacenters": len(datacenters),
-                "total_clusters": len(clusters),
-                "total_hosts": len(hosts),
-                "total_datastores": len(datastores),
-                "total_networks": len(networks),
-                "total_vms": len(vms),
-                "running_vms": len([vm for vm in vms if vm["status"] == "running"]),
-                "underutilized_vms": len(underutilized_vms),
-                "total_cpu_cores": sum(cluster["total_cpu_cores"] for cluster in clusters),
-                "total_memory_gb": sum(cluster["total_memory_gb"] for cluster in clusters),
-                "total_storage_gb": sum(ds["capacity_gb"] for ds in datastores),
-                "used_storage_gb": sum(ds["used_space_gb"] for ds in datastores)
-            }
+            "vms": vms
         }
-        
-        Disconnect(si)
+        vcenter_inventory_cache["summary"] = _vcenter_inventory_summary(vcenter_inventory_cache)
         
         # Save persistent configuration with credentials for continuous updates
         config = load_integration_config()
@@ -768,9 +558,11 @@ async def sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest
         }
         save_integration_config(config)
         
-        # Save inventory data to database for persistence
+        # Save inventory data to database for persistence; the sweep only
+        # touches this vCenter's objects, not those of other configured sites
         try:
-            db_success = db_manager.save_infrastructure_inventory('vcenter', vcenter_inventory_cache)
+            db_success = db_manager.save_infrastructure_inventory('vcenter', vcenter_inventory_cache,
+                                                                  site=request.host)
             if db_success:
                 print("💾 vCenter inventory data saved to database")
             else:
@@ -810,15 +602,235 @@ async def sync_vcenter_inventory_with_credentials(request: ConnectionTestRequest
             raise HTTPException(status_code=500, detail=f"vCenter VM sync failed: {error_msg}")
 
 
+def _vcenter_inventory_summary(inventory: Dict[str, List[Dict]]) -> Dict[str, Any]:
+    """Summary block for the vCenter inventory cache"""
+    vms = inventory["vms"]
+    return {
+        "total_datacenters": len(inventory["datacenters"]),
+        "total_clusters": len(inventory["clusters"]),
+        "total_hosts": len(inventory["hosts"]),
+        "total_datastores": len(inventory["datastores"]),
+        "total_networks": len(inventory["networks"]),
+        "total_vms": len(vms),
+        "running_vms": len([vm for vm in vms if vm["status"] == "running"]),
+        "underutilized_vms": len([
+            vm for vm in vms
+            if vm["status"] == "running" and vm["cpu"] < 30 and vm["memory_usage"] < 50
+        ]),
+        "total_cpu_cores": sum(cluster["total_cpu_cores"] for cluster in inventory["clusters"]),
+        "total_memory_gb": sum(cluster["total_memory_gb"] for cluster in inventory["clusters"]),
+        "total_storage_gb": sum(ds["capacity_gb"] for ds in inventory["datastores"]),
+        "used_storage_gb": sum(ds["used_space_gb"] for ds in inventory["datastores"])
+    }
+
+def _apply_vcenter_delta_to_cache(delta: Dict[str, Dict], site: str):
+    """Patch the in-memory vCenter caches with a change tracker delta of one site (keyed by moid)"""
+    global vcenter_vms_cache, vcenter_inventory_cache
+    inventory = {}
+    for section in ("datacenters", "clusters", "hosts", "datastores", "networks", "vms"):
+        removed = set(delta["removals"].get(section, []))
+        upserts = {item["moid"]: dict(item, vcenter=site) for item in delta["upserts"].get(section, [])}
+        items = []
+        for item in vcenter_inventory_cache.get(section, []):
+            if item.get("vcenter", site) != site:
+                # Another vCenter's object; moids are only unique per vCenter
+                items.append(item)
+                continue
+            if item.get("moid") in removed and item.get("moid") not in upserts:
+                continue
+            items.append(upserts.pop(item.get("moid"), item))
+        items.extend(upserts.values())
+        inventory[section] = items
+
+    inventory["summary"] = _vcenter_inventory_summary(inventory)
+    vcenter_inventory_cache = inventory
+    vcenter_vms_cache = inventory["vms"]
+
+def _drop_vcenter_tracker(host: str):
+    """Release a vCenter change tracker (the pooled session stays open)"""
+    entry = vcenter_change_trackers.pop(host, None)
+    if entry:
+        entry["tracker"].stop()
+
+@router.post("/admin/vcenter/sync-all")
+async def sync_all_vcenters():
+    """Sync every configured vCenter in parallel and merge into one inventory.
+
+    Sites come from the `vcenters` list in the integration config (plus the
+    legacy single `vcenter` entry). Each site runs in its own worker thread;
+    a slow or failing site keeps its previous inventory and does not hold
+    back the others. Every site gets its own infrastructure_sync_history row.
+    """
+    async with _source_lock("vcenter"):
+        return await _sync_all_vcenters()
+
+async def _sync_all_vcenters():
+    from monitoring.vcenter_multisite import vcenter_sites, collect_sites, merge_inventories, DEFAULT_SITE_TIMEOUT
+    
+    config = load_integration_config()
+    sites = vcenter_sites(config)
+    if not sites:
+        raise HTTPException(status_code=400, detail="No vCenter configuration found. Please save vCenter credentials first.")
+    
+    try:
+        from monitoring.vcenter_inventory import collect_vcenter_inventory
+        from monitoring.vcenter_session import vcenter_sessions
+    except ImportError:
+        raise HTTPException(status_code=500, detail="vCenter SDK (pyVmomi) not available. Install with: pip install pyvmomi")
+    
+    def collect(site):
+        return vcenter_sessions.run(
+            site['host'], site['username'], site['password'],
+            lambda si: collect_vcenter_inventory(si.RetrieveContent()),
+            port=site.get('port', 443)
+        )
+    
+    fanout_start = datetime.now()
+    # Sites are saved without sweeping; objects none of them reported are
+    # deactivated once all have succeeded
+    fanout_generation = db_manager.get_sync_generation() + 1
+    
+    def persist(site, result):
+        # Runs in the coordinating thread as each site completes (SQLite has one writer)
+        details = {"site": site['host'], "collect_seconds": result["duration_seconds"]}
+        if result["status"] == "success":
+            inventory = result["inventory"]
+            details["retrieval_calls"] = inventory.get("retrieval_calls")
+            db_manager.save_infrastructure_inventory('vcenter', inventory, sync_details=details,
+                                                     sync_start=fanout_start, sweep=False, site=site['host'])
+            print(f"  ✅ {site['host']}: {len(inventory['vms'])} VMs in {result['duration_seconds']}s")
+        else:
+            db_manager.record_failed_sync('vcenter', fanout_start, result["error"], details, status=result["status"])
+            print(f"  ❌ {site['host']}: {result['status']} after {result['duration_seconds']}s ({result['error']})")
+    
+    print(f"🔄 Syncing {len(sites)} vCenters in parallel...")
+    timeout = config.get('vcenter_sync_timeout_seconds', DEFAULT_SITE_TIMEOUT)
+    results = await asyncio.to_thread(collect_sites, sites, collect, persist, timeout)
+    
+    global vcenter_vms_cache, vcenter_inventory_cache
+    merged = merge_inventories(vcenter_inventory_cache, results)
+    merged["summary"] = _vcenter_inventory_summary(merged)
+    merged["summary"]["sites"] = {
+        host: {key: value for key, value in result.items() if key != "inventory"}
+        for host, result in results.items()
+    }
+    vcenter_inventory_cache = merged
+    vcenter_vms_cache = merged["vms"]
+    
+    # Fresh change tracking per site is needed after a full resync
+    for site in sites:
+        _drop_vcenter_tracker(site['host'])
+    
+    succeeded = [host for host, result in results.items() if result["status"] == "success"]
+    if len(succeeded) == len(sites):
+        await asyncio.to_thread(db_manager.sweep_stale_inventory, 'vcenter', fanout_generation)
+    return {
+        "status": "success" if len(succeeded) == len(sites) else ("partial" if succeeded else "failed"),
+        "sites": merged["summary"]["sites"],
+        "inventory": merged["summary"],
+        "vm_count": len(merged["vms"])
+    }
+
+@router.post("/admin/vcenter/sync-incremental")
+async def sync_vcenter_incremental():
+    """Apply only the vCenter objects changed since the previous sync.
+
+    Keeps a PropertyCollector filter and WaitForUpdatesEx version per
+    vCenter. The first call (or the first after an error) loads the full
+    inventory; later calls only transfer and persist changed objects.
+    """
+    async with _source_lock("vcenter"):
+        return await _sync_vcenter_incremental()
+
+async def _sync_vcenter_incremental():
+    config = load_integration_config()
+    vcenter_config = config.get('vcenter')
+    if not vcenter_config:
+        raise HTTPException(status_code=400, detail="No vCenter configuration found. Please save vCenter credentials first.")
+
+    host = vcenter_config.get('host')
+    username = vcenter_config.get('username')
+    password = vcenter_config.get('password')
+    if not host or not username or not password:
+        raise HTTPException(status_code=400, detail="Incomplete vCenter configuration. Please reconfigure vCenter connection.")
+
+    try:
+        from monitoring.vcenter_inventory import VCenterChangeTracker
+        from monitoring.vcenter_session import vcenter_sessions
+    except ImportError:
+        raise HTTPException(status_code=500, detail="vCenter SDK (pyVmomi) not available. Install with: pip install pyvmomi")
+
+    def poll_and_persist():
+        # SOAP round trips and SQLite writes block; run off the event loop
+        try:
+            si = vcenter_sessions.get(host, username, password)
+            entry = vcenter_change_trackers.get(host)
+            if entry is not None and entry["si"] is not si:
+                # The pool logged in again; filters die with the old session
+                _drop_vcenter_tracker(host)
+                entry = None
+            if entry is None:
+                print(f"🏢 Starting vCenter change tracking: {host}")
+                entry = {"si": si, "tracker": VCenterChangeTracker(si.RetrieveContent())}
+                vcenter_change_trackers[host] = entry
+
+            tracker = entry["tracker"]
+            initial = not tracker.started
+            calls_before = tracker.calls
+            changes = tracker.poll()
+            if initial:
+                # First cycle: the filter reports every object, persist a full sync
+                inventory = tracker.build_inventory()
+                inventory.pop("underutilized_vms", None)
+                inventory["summary"] = _vcenter_inventory_summary(inventory)
+                db_manager.save_infrastructure_inventory('vcenter', inventory, site=host)
+                return tracker, changes, tracker.calls - calls_before, inventory, None, {"processed": len(changes)}
+            delta = tracker.build_delta(changes)
+            db_stats = db_manager.apply_inventory_delta('vcenter', delta["upserts"], delta["removals"], site=host)
+            return tracker, changes, tracker.calls - calls_before, None, delta, db_stats
+        except Exception:
+            _drop_vcenter_tracker(host)
+            vcenter_sessions.invalidate(host, username)
+            raise
+
+    try:
+        tracker, changes, calls, inventory, delta, db_stats = await asyncio.to_thread(poll_and_persist)
+    except Exception as e:
+        print(f"❌ Incremental vCenter sync failed, resetting change tracking: {e}")
+        raise HTTPException(status_code=500, detail=f"Incremental vCenter sync failed: {str(e)}")
+
+    global vcenter_vms_cache, vcenter_inventory_cache
+    initial = inventory is not None
+    if initial:
+        vcenter_inventory_cache = inventory
+        vcenter_vms_cache = inventory["vms"]
+    else:
+        _apply_vcenter_delta_to_cache(delta, host)
+
+    vcenter_config['last_sync'] = datetime.now().isoformat()
+    save_integration_config(config)
+
+    print(f"🔄 Incremental vCenter sync: {len(changes)} changed objects in {calls} PropertyCollector calls")
+    return {
+        "status": "success",
+        "mode": "full" if initial else "incremental",
+        "changed_objects": len(changes),
+        "retrieval_calls": calls,
+        "version": tracker.version,
+        "database": db_stats,
+        "inventory": vcenter_inventory_cache["summary"]
+    }
+
+
 @router.get("/vcenter/vms")
 async def get_vcenter_vms():
     """Get all cached vCenter VMs"""
     try:
         # First try to get from database
-        db_inventory = db_manager.get_infrastructure_inventory('vcenter')
-        if db_inventory and db_inventory.get('vms'):
-            print(f"📊 vCenter VMs endpoint: Returning {len(db_inventory['vms'])} database VMs")
-            return db_inventory['vms']
+        db_inventory = db_manager.get_serialized_inventory('vcenter')
+        if db_inventory and db_inventory.vm_count:
+            print(f"📊 vCenter VMs endpoint: Returning {db_inventory.vm_count} database VMs")
+            return Response(content=db_inventory.vms, media_type="application/json")
         
         # Fallback to cache
         print(f"📊 vCenter VMs endpoint: Returning {len(vcenter_vms_cache)} cached VMs")
@@ -853,10 +865,10 @@ async def get_vcenter_inventory():
     """Get cached vCenter inventory (datacenters, clusters, hosts)"""
     try:
         # First try to get from database
-        db_inventory = db_manager.get_infrastructure_inventory('vcenter')
+        db_inventory = db_manager.get_serialized_inventory('vcenter')
         if db_inventory:
-            print(f"📊 vCenter Inventory endpoint: Returning database inventory with {db_inventory.get('summary', {}).get('total_vms', 0)} total VMs")
-            return db_inventory
+            print(f"📊 vCenter Inventory endpoint: Returning database inventory with {db_inventory.total_vms} total VMs")
+            return Response(content=db_inventory.inventory, media_type="application/json")
         
         # Fallback to cache
         print(f"📊 vCenter Inventory endpoint: Returning cached inventory with {vcenter_inventory_cache.get('summary', {}).get('total_vms', 0)} total VMs")
@@ -976,6 +988,10 @@ vcenter_inventory_cache = {
     "stopped_vms": 1
 }
 
+# Per-vCenter change trackers for incremental sync, keyed by host:
+# {"si": pooled service instance, "tracker": VCenterChangeTracker}
+vcenter_change_trackers = {}
+
 # Configuration persistence
 CONFIG_FILE = "config/integrations.json"
 
@@ -1004,6 +1020,99 @@ def save_integration_config(config):
     except Exception:
         return False
 
+# ================================
+# CONTINUOUS COLLECTION SCHEDULER
+# ================================
+
+def _collection_jobs():
+    """Integration name -> coroutine factory run by the collection scheduler"""
+    async def hyperv_job():
+        from .hyperv_routes import sync_hyperv_vms
+        return await sync_hyperv_vms()
+
+    async def vcenter_job():
+        config = load_integration_config()
+        # The scheduler holds the vcenter source lock for the run
+        if config.get('vcenters'):
+            return await _sync_all_vcenters()
+        return await _sync_vcenter_incremental()
+
+    return {
+        "vcenter": vcenter_job,
+        "prometheus": sync_prometheus_data,
+        "zabbix": sync_zabbix_data,
+        "hyperv": hyperv_job,
+        "metrics_maintenance": run_metrics_maintenance,
+    }
+
+def _scheduled_source_config(config, name):
+    """Scheduler settings for a source; a `vcenters` list also enables vcenter.
+
+    Metrics maintenance (cold-tier archiving, retention and inventory purging) runs hourly
+    unless configured otherwise.
+    """
+    if name == "vcenter" and config.get("vcenters"):
+        return config.get("vcenter") or {"collection_enabled": True}
+    if name == "metrics_maintenance":
+        return config.get(name) or {"collection_interval_seconds": 3600}
+    return config.get(name)
+
+def _scheduler_settings():
+    return load_integration_config().get("scheduler", {})
+
+collection_scheduler = None
+
+# One lock per source, shared by scheduled runs and the manual sync routes so
+# two collections of the same source (and its change trackers and caches)
+# never run at once. The underscore sync functions expect the caller to hold it.
+source_locks: Dict[str, asyncio.Lock] = {}
+
+def _source_lock(name: str) -> asyncio.Lock:
+    if name not in source_locks:
+        source_locks[name] = asyncio.Lock()
+    return source_locks[name]
+
+async def start_collection_scheduler():
+    """Start per-integration collection loops (called on API startup)"""
+    global collection_scheduler
+    from monitoring.scheduler import CollectionScheduler
+    
+    settings = _scheduler_settings()
+    if not settings.get("enabled", True):
+        print("⏸️ Collection scheduler disabled in config")
+        return
+    collection_scheduler = CollectionScheduler(
+        _collection_jobs(), load_integration_config,
+        max_concurrent_jobs=settings.get("max_concurrent_jobs", 4),
+        source_config=_scheduled_source_config, locks=source_locks
+    )
+    await collection_scheduler.start()
+    print(f"⏱️ Collection scheduler started for: {', '.join(collection_scheduler.sources) or 'no integrations yet'}")
+
+async def stop_collection_scheduler():
+    global collection_scheduler
+    if collection_scheduler is not None:
+        await collection_scheduler.stop()
+        collection_scheduler = None
+
+@router.get("/admin/scheduler/status")
+async def get_scheduler_status():
+    """Per-source schedule, timing and failure statistics"""
+    if collection_scheduler is None:
+        return {"running": False, "sources": {}}
+    return collection_scheduler.status()
+
+@router.post("/admin/scheduler/run/{source}")
+async def run_scheduled_collection(source: str):
+    """Trigger one scheduled collection now (skipped if that source is already running)"""
+    if collection_scheduler is None:
+        raise HTTPException(status_code=503, detail="Collection scheduler is not running")
+    try:
+        ran = await collection_scheduler.run_now(source)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No scheduled collection for {source}")
+    return {"source": source, "ran": ran, "stats": collection_scheduler.status()["sources"][source]}
+
 @router.post("/admin/{integration_type}/save")
 async def save_integration(integration_type: str, request: ConnectionTestRequest):
     """Save integration configuration"""
@@ -1212,21 +1321,7 @@ async def sync_prometheus_data():
         
         print(f"📊 Connecting to Prometheus: {host}")
         
-        # Import required libraries
-        import requests
-        import time
-        from datetime import datetime, timedelta
-        
-        # Test connectivity
-        health_url = f"{host}/-/healthy"
-        try:
-            response = requests.get(health_url, timeout=10)
-            if response.status_code != 200:
-                raise Exception(f"Prometheus health check failed: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Cannot reach Prometheus at {host}: {str(e)}")
-        
-        print("✅ Prometheus connectivity verified")
+        from monitoring.prometheus_async import AsyncPrometheusClient
         
         # Define metrics to collect
         metrics_queries = {
@@ -1238,65 +1333,32 @@ async def sync_prometheus_data():
             "load_average": "node_load1"
         }
         
-        collected_data = {}
-        
-        # Collect current metrics
-        print("📈 Collecting current metrics...")
-        for metric_name, query in metrics_queries.items():
-            try:
-                response = requests.get(f"{host}/api/v1/query", 
-                                      params={"query": query}, 
-                                      timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('data', {}).get('result'):
-                        collected_data[metric_name] = data['data']['result']
-                        print(f"  ✅ {metric_name}: {len(data['data']['result'])} data points")
-                    else:
-                        print(f"  ⚠️ {metric_name}: No data returned")
-                        collected_data[metric_name] = []
-                else:
-                    print(f"  ❌ {metric_name}: Query failed ({response.status_code})")
-                    collected_data[metric_name] = []
-                    
-            except Exception as e:
-                print(f"  ❌ {metric_name}: Error - {str(e)}")
-                collected_data[metric_name] = []
-        
-        # Collect historical data (last 24 hours)
-        print("📊 Collecting historical data...")
+        # All queries share one pooled async client; instant and range queries
+        # run concurrently and ranges are fetched as parallel 6h windows
         end_time = int(time.time())
         start_time = end_time - (24 * 3600)  # 24 hours ago
+        async with AsyncPrometheusClient(
+            host, max_concurrency=prometheus_config.get('max_concurrency', 8)
+        ) as client:
+            if not await client.healthy():
+                raise Exception(f"Cannot reach Prometheus at {host}")
+            print("✅ Prometheus connectivity verified")
+            
+            print("📈 Collecting current and historical metrics...")
+            collected_data, historical_series = await asyncio.gather(
+                client.query_many(metrics_queries),
+                client.query_range_many(metrics_queries, start_time, end_time, step=300)
+            )
+            request_count = client.requests
+        
+        for metric_name, result in collected_data.items():
+            print(f"  ✅ {metric_name}: {len(result)} data points" if result else f"  ⚠️ {metric_name}: No data returned")
         
         historical_data = {}
-        for metric_name, query in metrics_queries.items():
-            try:
-                response = requests.get(f"{host}/api/v1/query_range", 
-                                      params={
-                                          "query": query,
-                                          "start": start_time,
-                                          "end": end_time, 
-                                          "step": "300"  # 5 minute intervals
-                                      }, 
-                                      timeout=15)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('data', {}).get('result'):
-                        historical_data[metric_name] = data['data']['result']
-                        total_points = sum(len(series.get('values', [])) for series in data['data']['result'])
-                        print(f"  ✅ {metric_name}: {total_points} historical points")
-                    else:
-                        historical_data[metric_name] = []
-                        print(f"  ⚠️ {metric_name}: No historical data")
-                else:
-                    print(f"  ❌ {metric_name}: Historical query failed ({response.status_code})")
-                    historical_data[metric_name] = []
-                    
-            except Exception as e:
-                print(f"  ❌ {metric_name}: Historical error - {str(e)}")
-                historical_data[metric_name] = []
+        for metric_name, series in historical_series.items():
+            total_points = sum(len(s) for s in series)
+            print(f"  ✅ {metric_name}: {total_points} historical points" if series else f"  ⚠️ {metric_name}: No historical data")
+            historical_data[metric_name] = [s.to_matrix_entry() for s in series]
         
         # Calculate summary statistics
         total_metrics = len([m for m in collected_data.values() if m])
@@ -1309,6 +1371,7 @@ async def sync_prometheus_data():
             "metrics_collected": total_metrics,
             "historical_series": total_historical,
             "sync_duration": "24h",
+            "http_requests": request_count,
             "data": {
                 "current_metrics": collected_data,
                 "historical_data": historical_data
@@ -1326,6 +1389,73 @@ async def sync_prometheus_data():
         print(f"❌ Prometheus sync failed: {error_msg}")
         raise HTTPException(status_code=500, detail=f"Prometheus sync failed: {error_msg}")
 
+@router.post("/admin/prometheus/backfill")
+async def backfill_prometheus_history(hours: int = 24):
+    """Backfill raw Prometheus samples into vm_metrics_history via remote read"""
+    config = load_integration_config()
+    prometheus_config = config.get('prometheus')
+    if not prometheus_config or not prometheus_config.get('host'):
+        raise HTTPException(status_code=400, detail="No Prometheus configuration found. Please save Prometheus credentials first.")
+    
+    from monitoring.prometheus_remote_read import RemoteReadBackfill
+    
+    remote_read_config = prometheus_config.get('remote_read', {})
+    backfill = RemoteReadBackfill(
+        prometheus_config['host'],
+        selectors=remote_read_config.get('selectors'),
+        db_path=metrics_collector.db_path,
+        window_seconds=remote_read_config.get('window_seconds', 3600)
+    )
+    end = datetime.utcnow()
+    print(f"📥 Prometheus remote-read backfill: last {hours}h from {prometheus_config['host']}")
+    # Blocking HTTP + SQLite work runs off the event loop
+    stats = await asyncio.to_thread(backfill.run, end - timedelta(hours=hours), end)
+    
+    if stats["status"] != "success":
+        print(f"❌ Prometheus backfill stopped after {stats['windows']} windows: {stats.get('error')}")
+        raise HTTPException(status_code=502, detail=f"Prometheus backfill failed (resumable): {stats.get('error')}")
+    
+    print(f"✅ Backfilled {stats['samples']} samples into {stats['rows']} rows "
+          f"({stats['windows']} windows, {stats['skipped']} already done)")
+    stats['rollups'] = await asyncio.to_thread(metrics_collector.update_rollups)
+    return stats
+
+@router.get("/metrics/{resource_type}/{resource_id}/quantiles")
+async def get_metric_quantiles(resource_type: str, resource_id: str, metric: str,
+                               hours: int = 24 * 7, q: str = "0.5,0.95,0.99"):
+    """Arbitrary quantiles (q, comma-separated, 0..1) of one metric over the last hours, from the rollup sketches"""
+    try:
+        quantiles = [float(value) for value in q.split(",") if value.strip()]
+        return await asyncio.to_thread(
+            metrics_collector.get_quantiles, resource_type, resource_id, metric, hours, quantiles
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/admin/metrics/retention")
+async def get_metrics_retention():
+    """Partition period and retention window of each metrics history table"""
+    return await asyncio.to_thread(metrics_collector.get_retention_policies)
+
+@router.put("/admin/metrics/retention/{table}")
+async def set_metrics_retention(table: str, retention_days: Optional[int] = None,
+                                archive_after_days: Optional[int] = None):
+    """Change a metrics history table's retention and/or cold-tier archive age; expired data is dropped immediately"""
+    try:
+        dropped = await asyncio.to_thread(metrics_collector.set_retention, table, retention_days, archive_after_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"🗑️ {table} retention updated, dropped {len(dropped)} partitions/blocks")
+    return {"table": table, "policy": (await get_metrics_retention()).get(table), "dropped": dropped}
+
+@router.post("/admin/metrics/maintenance")
+async def run_metrics_maintenance():
+    """Archive history partitions past their archive age, apply retention and purge long-inactive inventory now"""
+    stats = await asyncio.to_thread(metrics_collector.run_maintenance)
+    retention_days = load_integration_config().get('inventory_retention_days', INACTIVE_RETENTION_DAYS)
+    stats['inventory_purged'] = await asyncio.to_thread(db_manager.purge_inactive_inventory, retention_days)
+    return stats
+
 @router.post("/admin/zabbix/sync") 
 async def sync_zabbix_data():
     """Pull monitoring data from Zabbix using saved configuration"""
@@ -1786,9 +1916,11 @@ async def store_historical_analytics():
             raise HTTPException(status_code=404, detail="No vCenter VM data available to store")
         
         # Create historical data point
-        timestamp = datetime.now().isoformat()
+        now = datetime.utcnow()
+        timestamp = now.isoformat()
         historical_point = {
             "timestamp": timestamp,
+            "timestamp_ms": to_epoch_ms(now),
             "total_vms": len(current_vms),
             "clusters": {},
             "vms": []
@@ -1858,12 +1990,11 @@ async def get_historical_analytics(hours: int = 24, cluster: str = None):
     """Get historical analytics data with optional cluster filtering"""
     try:
         # Filter data by time range
-        cutoff_time = datetime.now() - timedelta(hours=hours)
+        cutoff_ms = to_epoch_ms(datetime.utcnow() - timedelta(hours=hours))
         filtered_data = []
         
         for point in historical_analytics_data:
-            point_time = datetime.fromisoformat(point["timestamp"])
-            if point_time >= cutoff_time:
+            if point["timestamp_ms"] >= cutoff_ms:
                 if cluster and cluster in point["clusters"]:
                     # Return cluster-specific data
                     filtered_point = {
@@ -2053,11 +2184,14 @@ async def get_prometheus_analytics():
 async def get_capacity_analysis():
     """Get infrastructure capacity analysis and recommendations"""
     try:
-        # Get current system metrics
-        cpu_count = psutil.cpu_count()
-        memory_total = psutil.virtual_memory().total / (1024**3)  # GB
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory_percent = psutil.virtual_memory().percent
+        from monitoring.system_sampler import get_system_sampler
+        
+        # Current system metrics from the background sampler's latest snapshot
+        sample = get_system_sampler().latest()
+        cpu_count = sample['cpu_count']
+        memory_total = sample['memory_total'] / (1024**3)  # GB
+        cpu_percent = sample['cpu_percent']
+        memory_percent = sample['memory_percent']
         
         # Calculate capacity based on current utilization
         # Assume each VM needs 2 CPU cores and 4GB RAM on average
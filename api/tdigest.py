@@ -0,0 +1,151 @@
+"""
+t-digest Quantile Sketch
+Mergeable, fixed-size summary of a sample distribution (Dunning's merging
+t-digest): a few dozen weighted centroids per metric rollup bucket, merged
+across buckets to answer any quantile over any window without raw rows
+"""
+
+import math
+import struct
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Roughly the number of centroids kept; larger is more accurate and larger
+DEFAULT_COMPRESSION = 100
+
+# Serialized form: header then (mean, weight) per centroid, little-endian
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BHdd')  # format version, compression, min, max
+_CENTROID = struct.Struct('<df')  # float32 weights stay exact up to 2**24 samples per centroid
+
+# Values buffered before they are folded into the centroids, per unit of compression
+_BUFFER_FACTOR = 5
+
+
+class TDigest:
+    """t-digest with the k1 (arcsine) scale function.
+
+    Centroids near the median may hold many samples, those in the tails
+    only a few, so extreme quantiles (p95, p99) stay accurate while the
+    digest keeps about `compression` centroids however many samples it
+    has seen. Min and max are tracked exactly. Digests merge by folding
+    one's centroids into the other, with about the accuracy of a digest
+    built from all the samples at once.
+    """
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []  # (mean, weight), ordered by mean
+        self.min = math.inf
+        self.max = -math.inf
+        self._unmerged: List[Tuple[float, float]] = []
+
+    @classmethod
+    def of(cls, values: Iterable[float], compression: int = DEFAULT_COMPRESSION) -> 'TDigest':
+        digest = cls(compression)
+        digest.update(values)
+        return digest
+
+    @classmethod
+    def merged(cls, digests: Iterable['TDigest'], compression: int = DEFAULT_COMPRESSION) -> 'TDigest':
+        result = cls(compression)
+        for digest in digests:
+            result.merge(digest)
+        return result
+
+    @property
+    def count(self) -> float:
+        return sum(weight for _, weight in self.centroids) + sum(weight for _, weight in self._unmerged)
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def add(self, value: float, weight: float = 1.0):
+        value = float(value)
+        self._unmerged.append((value, weight))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._unmerged) >= _BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        """Fold another digest into this one (other is left unchanged)"""
+        self._unmerged.extend(other.centroids)
+        self._unmerged.extend(other._unmerged)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._unmerged) >= _BUFFER_FACTOR * self.compression:
+            self._compress()
+        return self
+
+    def _q_limit(self, q: float) -> float:
+        """Highest quantile a centroid starting at q may reach: one unit of k further"""
+        k = self.compression / (2 * math.pi) * math.asin(max(-1.0, min(1.0, 2 * q - 1))) + 1
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _compress(self):
+        if not self._unmerged:
+            return
+        points = sorted(self.centroids + self._unmerged)
+        self._unmerged = []
+        total = sum(weight for _, weight in points)
+
+        centroids = []
+        mean, weight = points[0]
+        emitted = 0.0
+        limit = self._q_limit(0.0)
+        for value, value_weight in points[1:]:
+            if (emitted + weight + value_weight) / total <= limit:
+                weight += value_weight
+                mean += (value - mean) * value_weight / weight
+            else:
+                centroids.append((mean, weight))
+                emitted += weight
+                limit = self._q_limit(emitted / total)
+                mean, weight = value, value_weight
+        centroids.append((mean, weight))
+        self.centroids = centroids
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), interpolated between centroid centres; None if empty"""
+        self._compress()
+        if not self.centroids:
+            return None
+        total = sum(weight for _, weight in self.centroids)
+        target = min(max(q, 0.0), 1.0) * total
+        # Knots (cumulative weight, value): min at 0, each centroid at its
+        # centre of mass, max at the total
+        position, value = 0.0, self.min
+        cumulative = 0.0
+        for mean, weight in self.centroids:
+            centre = cumulative + weight / 2
+            if target <= centre:
+                return _interpolate(position, value, centre, mean, target)
+            position, value = centre, mean
+            cumulative += weight
+        return _interpolate(position, value, total, self.max, target)
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        return [self.quantile(q) for q in qs]
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        return _HEADER.pack(_FORMAT_VERSION, self.compression, self.min, self.max) + b''.join(
+            _CENTROID.pack(mean, weight) for mean, weight in self.centroids
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TDigest':
+        version, compression, low, high = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported t-digest format version {version}")
+        digest = cls(compression)
+        digest.min, digest.max = low, high
+        digest.centroids = list(_CENTROID.iter_unpack(data[_HEADER.size:]))
+        return digest
+
+
+def _interpolate(x0: float, y0: float, x1: float, y1: float, x: float) -> float:
+    if x1 <= x0:
+        return y1
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
@@ -11,6 +11,8 @@ import json
 from datetime import datetime, date
 import logging
 
+from db.sqlite_pool import get_pool
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -61,18 +63,17 @@ class SmartFilter(BaseModel):
     filter_criteria: Dict[str, Any]
     is_shared: bool = False
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect("data/iroa.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_connection(read_only: bool = False):
+    """Pooled database connection (context manager; the writer commits on success)"""
+    pool = get_pool("data/iroa.db")
+    return pool.reader() if read_only else pool.writer()
 
 # Workload Groups Management
 @router.get("/workload-groups")
 async def get_workload_groups(customer_view: bool = Query(False)):
     """Get all workload groups"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=True) as conn:
             if customer_view:
                 # Customer view - only show customer-visible groups
                 cursor = conn.execute("""
@@ -228,7 +229,7 @@ async def remove_cluster_from_workload(group_id: int, cluster_name: str):
 async def get_license_types():
     """Get all license types"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=True) as conn:
             cursor = conn.execute("""
                 SELECT * FROM license_types WHERE is_active = 1 ORDER BY vendor, product
             """)
@@ -243,7 +244,7 @@ async def get_license_types():
 async def get_license_pools(workload_group_id: Optional[int] = Query(None)):
     """Get license pools"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=True) as conn:
             if workload_group_id:
                 cursor = conn.execute("""
                     SELECT lp.*, lt.name as license_type_name, lt.vendor, lt.product,
@@ -301,7 +302,7 @@ async def create_license_pool(license_pool: LicensePool):
 async def get_vm_profiles(workload_group_id: Optional[int] = Query(None)):
     """Get VM profiles"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=True) as conn:
             if workload_group_id:
                 cursor = conn.execute("""
                     SELECT vp.*, wg.display_name as workload_group_name
@@ -367,7 +368,7 @@ async def create_vm_profile(vm_profile: VMProfile):
 async def get_smart_filters(page_type: str = Query(...)):
     """Get smart filters for a specific page type"""
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(read_only=True) as conn:
             cursor = conn.execute("""
                 SELECT * FROM smart_filters 
                 WHERE page_type = ? 
@@ -12,5 +12,16 @@ class Settings:
     DB_PASSWORD = os.getenv("DB_PASSWORD")
     MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", 60))
     PROMETHEUS_URL = os.getenv("PROMETHEUS_URL")
+    # Backend of db/storage.py: "postgres" (the DB_* settings) or "sqlite"
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+    SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "database/iroa.db")
+    # Write-behind buffer of the metrics history (db/write_buffer.py); the
+    # overflow policy is block, drop_oldest or spill
+    METRICS_WRITE_BUFFER = {
+        "flush_rows": int(os.getenv("METRICS_WRITE_FLUSH_ROWS", 5000)),
+        "flush_interval": float(os.getenv("METRICS_WRITE_FLUSH_SECONDS", 2.0)),
+        "max_rows": int(os.getenv("METRICS_WRITE_MAX_ROWS", 200000)),
+        "overflow": os.getenv("METRICS_WRITE_OVERFLOW", "block"),
+    }
 
 settings = Settings()
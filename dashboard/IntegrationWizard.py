@@ -6,7 +6,7 @@ import threading
 from monitoring.vcenter_monitor import fetch_vcenter_metrics
 from monitoring.zabbix_connector import ZabbixConnector
 from monitoring.prometheus_monitor import fetch_prometheus_metrics
-from monitoring.store_metrics import store_metrics
+from monitoring.store_metrics import store_metrics_bulk
 from monitoring.mac_monitor import MacSystemMonitor
 
 st.set_page_config(page_title="IROA Integration Wizard", layout="centered")
@@ -49,9 +49,10 @@ if option == "Mac System":
                 system_info = monitor.get_system_info()
                 st.info(f"**Model:** {system_info['model']}\n**CPU:** {system_info['cpu']}\n**Memory:** {system_info['memory']}")
                 
-                cpu = monitor.get_cpu_usage()
-                memory = monitor.get_memory_usage()
-                disk = monitor.get_disk_usage()
+                sample = monitor.sampler.latest()
+                cpu = sample['cpu_percent']
+                memory = sample['memory_percent']
+                disk = sample['disk_percent']
                 
                 col_a, col_b, col_c = st.columns(3)
                 with col_a:
@@ -86,8 +87,10 @@ elif option == "Zabbix":
     if st.button("Test Zabbix Connection & Ingest"):
         try:
             connector = ZabbixConnector(url, user, pwd)
-            connector.ingest_zabbix_metrics()
-            st.success("✅ Zabbix metrics imported successfully!")
+            stats = connector.ingest_zabbix_metrics()
+            if stats["status"] != "success":
+                raise Exception(stats.get("error", "bulk ingest failed"))
+            st.success(f"✅ Imported metrics for {stats['hosts']} Zabbix hosts in {stats['api_calls']} API calls.")
         except Exception as e:
             st.error(f"❌ Failed to connect to Zabbix: {e}")
 
@@ -99,7 +102,9 @@ elif option == "Prometheus":
         try:
             os.environ["PROMETHEUS_URL"] = prom_url
             metrics = fetch_prometheus_metrics()
-            store_metrics(metrics)
-            st.success(f"✅ Ingested {len(metrics)} Prometheus samples.")
+            stats = store_metrics_bulk(metrics)
+            if stats["status"] != "success":
+                raise Exception(stats.get("error", "bulk ingest failed"))
+            st.success(f"✅ Ingested {stats['rows']} Prometheus samples ({stats['rows_per_sec']:.0f} rows/sec).")
         except Exception as e:
             st.error(f"❌ Failed to pull from Prometheus: {e}")
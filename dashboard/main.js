@@ -3359,9 +3359,10 @@ const app = createApp({
             }
           });
           if (underRes.ok) {
-            this.underutilizedVMs = await underRes.json();
-            // Update stats
-            this.stats[1].value = this.underutilizedVMs.length.toString();
+            // Paged response: the first page is listed, the stat shows every match
+            const underPage = await underRes.json();
+            this.underutilizedVMs = underPage.items;
+            this.stats[1].value = underPage.total.toString();
           } else {
             this.showWarning('Failed to load underutilized VMs data. Using cached information.');
             this.underutilizedVMs = this.getMockUnderutilizedVMs();
@@ -0,0 +1,26 @@
+"""
+Unique (name, source) keys for the inventory upserts.
+
+Older versions could store the same object twice; duplicates are collapsed
+first, keeping the oldest row because it is the one the row-at-a-time saves
+updated and the one child rows reference. The per-row VM summary triggers
+recounted the whole source on every insert/update and are dropped; the
+manager refreshes the summary once per sync.
+"""
+
+INVENTORY_TABLES = (
+    "infrastructure_datacenters",
+    "infrastructure_clusters",
+    "infrastructure_hosts",
+    "infrastructure_datastores",
+    "infrastructure_networks",
+    "infrastructure_vms",
+)
+
+
+def upgrade(conn):
+    for table in INVENTORY_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY name, source)")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_name_source ON {table}(name, source)")
+    conn.execute("DROP TRIGGER IF EXISTS update_infrastructure_summary_after_vm_insert")
+    conn.execute("DROP TRIGGER IF EXISTS update_infrastructure_summary_after_vm_update")
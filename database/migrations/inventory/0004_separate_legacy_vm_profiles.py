@@ -0,0 +1,14 @@
+"""
+Move the legacy vm_profiles table out of the way of the workload schema.
+
+0001 created a vm_profiles table without workload_group_id; the workload
+schema's CREATE TABLE IF NOT EXISTS then kept it and its index creation
+failed, so initialisation of a fresh database aborted.
+"""
+
+
+def upgrade(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(vm_profiles)")]
+    if columns and "workload_group_id" not in columns:
+        conn.execute("DROP TRIGGER IF EXISTS update_vm_profiles_timestamp")
+        conn.execute("ALTER TABLE vm_profiles RENAME TO vm_profiles_legacy")
@@ -0,0 +1,15 @@
+-- Covering indexes for the per-table infrastructure_summary aggregates:
+-- each (source, is_active) range holds every column the refresh reads, so
+-- the counts and sums are answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_infrastructure_vms_summary
+    ON infrastructure_vms(source, is_active, status, cpu_usage_percent, memory_usage_percent);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_hosts_summary
+    ON infrastructure_hosts(source, is_active, cpu_cores, memory_gb);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_datastores_summary
+    ON infrastructure_datastores(source, is_active, capacity_gb, used_space_gb);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_datacenters_active
+    ON infrastructure_datacenters(source, is_active);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_clusters_active
+    ON infrastructure_clusters(source, is_active);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_networks_active
+    ON infrastructure_networks(source, is_active);
@@ -0,0 +1,29 @@
+-- Content fingerprints for the inventory diff: a hash of the synced columns
+-- lets a sync skip rows that did not change. Rows stored before this
+-- migration have no fingerprint and are rewritten once, without events.
+ALTER TABLE infrastructure_datacenters ADD COLUMN content_hash TEXT;
+ALTER TABLE infrastructure_clusters ADD COLUMN content_hash TEXT;
+ALTER TABLE infrastructure_hosts ADD COLUMN content_hash TEXT;
+ALTER TABLE infrastructure_datastores ADD COLUMN content_hash TEXT;
+ALTER TABLE infrastructure_networks ADD COLUMN content_hash TEXT;
+ALTER TABLE infrastructure_vms ADD COLUMN content_hash TEXT;
+
+-- Created / changed / deleted inventory objects, written in the same
+-- transaction as the sync that detected them
+CREATE TABLE IF NOT EXISTS infrastructure_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source VARCHAR(50) NOT NULL,          -- vcenter, hyperv, etc.
+    sync_id INTEGER,                      -- infrastructure_sync_history row
+    event_type VARCHAR(50) NOT NULL,      -- vm_created, host_changed, datastore_deleted, ...
+    severity VARCHAR(20) NOT NULL DEFAULT 'info',
+    resource_type VARCHAR(50) NOT NULL,   -- datacenter, cluster, host, datastore, network, vm
+    resource_id VARCHAR(255) NOT NULL,    -- moid when the source has one, else the name
+    resource_name VARCHAR(255) NOT NULL,
+    title TEXT NOT NULL,
+    event_timestamp TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (sync_id) REFERENCES infrastructure_sync_history(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_infrastructure_events_source_ts ON infrastructure_events(source, event_timestamp);
+CREATE INDEX IF NOT EXISTS idx_infrastructure_events_resource ON infrastructure_events(resource_type, resource_id);
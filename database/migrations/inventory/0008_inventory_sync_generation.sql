@@ -0,0 +1,9 @@
+-- Generation of the sync that last saw each inventory object (the
+-- infrastructure_sync_history id). A full sync deactivates the rows of the
+-- sections it reported that carry an older generation.
+ALTER TABLE infrastructure_datacenters ADD COLUMN sync_generation INTEGER;
+ALTER TABLE infrastructure_clusters ADD COLUMN sync_generation INTEGER;
+ALTER TABLE infrastructure_hosts ADD COLUMN sync_generation INTEGER;
+ALTER TABLE infrastructure_datastores ADD COLUMN sync_generation INTEGER;
+ALTER TABLE infrastructure_networks ADD COLUMN sync_generation INTEGER;
+ALTER TABLE infrastructure_vms ADD COLUMN sync_generation INTEGER;
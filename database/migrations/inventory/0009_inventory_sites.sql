@@ -0,0 +1,24 @@
+-- vCenter site (host) each inventory object was collected from. Objects
+-- are keyed by (source, site, name), so same-named objects of different
+-- vCenters no longer overwrite each other. Sources without sites (Hyper-V)
+-- and rows stored before this migration have site ''.
+ALTER TABLE infrastructure_datacenters ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE infrastructure_clusters ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE infrastructure_hosts ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE infrastructure_datastores ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE infrastructure_networks ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+ALTER TABLE infrastructure_vms ADD COLUMN site VARCHAR(255) NOT NULL DEFAULT '';
+
+DROP INDEX IF EXISTS uq_infrastructure_datacenters_name_source;
+DROP INDEX IF EXISTS uq_infrastructure_clusters_name_source;
+DROP INDEX IF EXISTS uq_infrastructure_hosts_name_source;
+DROP INDEX IF EXISTS uq_infrastructure_datastores_name_source;
+DROP INDEX IF EXISTS uq_infrastructure_networks_name_source;
+DROP INDEX IF EXISTS uq_infrastructure_vms_name_source;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_datacenters_source_site_name ON infrastructure_datacenters(source, site, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_clusters_source_site_name ON infrastructure_clusters(source, site, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_hosts_source_site_name ON infrastructure_hosts(source, site, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_datastores_source_site_name ON infrastructure_datastores(source, site, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_networks_source_site_name ON infrastructure_networks(source, site, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_infrastructure_vms_source_site_name ON infrastructure_vms(source, site, name);
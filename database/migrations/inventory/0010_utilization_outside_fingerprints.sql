@@ -0,0 +1,7 @@
+-- Utilisation columns (cluster used_*, host *_usage_*, VM *_usage_percent)
+-- no longer count towards the content fingerprint. Hashes taken with them
+-- would all differ once, so they are cleared and the next sync rewrites
+-- these rows silently, as for rows stored before fingerprints existed.
+UPDATE infrastructure_clusters SET content_hash = NULL;
+UPDATE infrastructure_hosts SET content_hash = NULL;
+UPDATE infrastructure_vms SET content_hash = NULL;
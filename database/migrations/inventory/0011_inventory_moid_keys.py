@@ -0,0 +1,85 @@
+"""
+Key inventory objects by vCenter managed object id.
+
+Names are not unique within a vCenter (two VMs in different folders may
+share one), so objects with a moid are now keyed by (source, site, moid);
+objects without one (Hyper-V) stay keyed by (source, site, name). Empty
+moids become NULL. Rows that already share a key (an object renamed under
+the old name keys left its old row behind) are collapsed onto the active,
+most recently synced one, and whatever referenced the others is pointed at
+it. The datacenter moid is no longer unique on its own: the same moid
+exists in every vCenter.
+"""
+
+import re
+
+INVENTORY_TABLES = (
+    "infrastructure_datacenters",
+    "infrastructure_clusters",
+    "infrastructure_hosts",
+    "infrastructure_datastores",
+    "infrastructure_networks",
+    "infrastructure_vms",
+)
+
+# Columns holding an inventory row's id, per referenced table
+REFERENCES = {
+    "infrastructure_datacenters": [("infrastructure_clusters", "datacenter_id"),
+                                   ("infrastructure_hosts", "datacenter_id"),
+                                   ("infrastructure_vms", "datacenter_id")],
+    "infrastructure_clusters": [("infrastructure_hosts", "cluster_id"), ("infrastructure_vms", "cluster_id")],
+    "infrastructure_hosts": [("infrastructure_vms", "host_id")],
+    "infrastructure_datastores": [("vm_datastore_mapping", "datastore_id")],
+    "infrastructure_networks": [("vm_network_mapping", "network_id")],
+    "infrastructure_vms": [("vm_datastore_mapping", "vm_id"), ("vm_network_mapping", "vm_id")],
+}
+
+
+def drop_datacenter_moid_unique(conn):
+    table = "infrastructure_datacenters"
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    rebuilt = re.sub(r"(moid\s+VARCHAR\(255\))\s+UNIQUE", r"\1", sql, count=1)
+    if rebuilt == sql:
+        return
+    indexes = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )]
+    columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+    conn.execute(rebuilt.replace(table, f"{table}_rekeyed", 1))
+    conn.execute(f"INSERT INTO {table}_rekeyed ({columns}) SELECT {columns} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_rekeyed RENAME TO {table}")
+    for index in indexes:
+        conn.execute(index)
+
+
+def collapse_duplicate_moids(conn, table):
+    duplicates = conn.execute(f"""
+        SELECT id, source, site, moid FROM {table}
+        WHERE moid IS NOT NULL AND (source, site, moid) IN (
+            SELECT source, site, moid FROM {table} WHERE moid IS NOT NULL
+            GROUP BY source, site, moid HAVING COUNT(*) > 1
+        )
+        ORDER BY source, site, moid, is_active DESC, COALESCE(sync_generation, 0) DESC, id DESC
+    """).fetchall()
+    kept = {}
+    for row_id, source, site, moid in duplicates:
+        keep = kept.setdefault((source, site, moid), row_id)
+        if keep == row_id:
+            continue
+        for referencing, column in REFERENCES[table]:
+            conn.execute(f"UPDATE OR IGNORE {referencing} SET {column} = ? WHERE {column} = ?", (keep, row_id))
+            conn.execute(f"DELETE FROM {referencing} WHERE {column} = ?", (row_id,))
+        conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+
+
+def upgrade(conn):
+    drop_datacenter_moid_unique(conn)
+    for table in INVENTORY_TABLES:
+        conn.execute(f"UPDATE {table} SET moid = NULL WHERE moid = ''")
+        collapse_duplicate_moids(conn, table)
+        conn.execute(f"DROP INDEX IF EXISTS uq_{table}_source_site_name")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_source_site_moid "
+                     f"ON {table}(source, site, moid) WHERE moid IS NOT NULL")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_source_site_name "
+                     f"ON {table}(source, site, name) WHERE moid IS NULL")
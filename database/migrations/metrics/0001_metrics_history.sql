@@ -32,14 +32,13 @@ CREATE TABLE IF NOT EXISTS vm_metrics_history (
     
     -- Timestamps
     metric_timestamp DATETIME NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Indexes for time-series queries
-    INDEX idx_vm_metrics_vm_time (vm_id, metric_timestamp),
-    INDEX idx_vm_metrics_cluster_time (cluster_name, metric_timestamp),
-    INDEX idx_vm_metrics_timestamp (metric_timestamp)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_vm_time ON vm_metrics_history(vm_id, metric_timestamp);
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_cluster_time ON vm_metrics_history(cluster_name, metric_timestamp);
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_timestamp ON vm_metrics_history(metric_timestamp);
+
 -- Host Historical Metrics  
 CREATE TABLE IF NOT EXISTS host_metrics_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -82,14 +81,13 @@ CREATE TABLE IF NOT EXISTS host_metrics_history (
     
     -- Timestamps
     metric_timestamp DATETIME NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Indexes
-    INDEX idx_host_metrics_host_time (host_id, metric_timestamp),
-    INDEX idx_host_metrics_cluster_time (cluster_name, metric_timestamp),
-    INDEX idx_host_metrics_timestamp (metric_timestamp)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_host_metrics_host_time ON host_metrics_history(host_id, metric_timestamp);
+CREATE INDEX IF NOT EXISTS idx_host_metrics_cluster_time ON host_metrics_history(cluster_name, metric_timestamp);
+CREATE INDEX IF NOT EXISTS idx_host_metrics_timestamp ON host_metrics_history(metric_timestamp);
+
 -- Cluster Historical Metrics (Aggregated)
 CREATE TABLE IF NOT EXISTS cluster_metrics_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -135,13 +133,12 @@ CREATE TABLE IF NOT EXISTS cluster_metrics_history (
     
     -- Timestamps
     metric_timestamp DATETIME NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Indexes
-    INDEX idx_cluster_metrics_cluster_time (cluster_name, metric_timestamp),
-    INDEX idx_cluster_metrics_timestamp (metric_timestamp)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_cluster_metrics_cluster_time ON cluster_metrics_history(cluster_name, metric_timestamp);
+CREATE INDEX IF NOT EXISTS idx_cluster_metrics_timestamp ON cluster_metrics_history(metric_timestamp);
+
 -- Forecasting Aggregates (Pre-calculated for performance)
 CREATE TABLE IF NOT EXISTS forecasting_aggregates (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -175,14 +172,13 @@ CREATE TABLE IF NOT EXISTS forecasting_aggregates (
     -- Time range this aggregate covers
     period_start DATETIME NOT NULL,
     period_end DATETIME NOT NULL,
-    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Indexes
-    INDEX idx_forecasting_resource (resource_type, resource_id),
-    INDEX idx_forecasting_metric (metric_name),
-    INDEX idx_forecasting_period (period_start, period_end)
+    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_forecasting_resource ON forecasting_aggregates(resource_type, resource_id);
+CREATE INDEX IF NOT EXISTS idx_forecasting_metric ON forecasting_aggregates(metric_name);
+CREATE INDEX IF NOT EXISTS idx_forecasting_period ON forecasting_aggregates(period_start, period_end);
+
 -- Events and Anomalies
 CREATE TABLE IF NOT EXISTS infrastructure_events (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -206,13 +202,23 @@ CREATE TABLE IF NOT EXISTS infrastructure_events (
     
     -- Timestamps
     event_timestamp DATETIME NOT NULL,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    
-    -- Indexes
-    INDEX idx_events_resource (resource_type, resource_id),
-    INDEX idx_events_timestamp (event_timestamp),
-    INDEX idx_events_status (status),
-    INDEX idx_events_severity (severity)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_events_resource ON infrastructure_events(resource_type, resource_id);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON infrastructure_events(event_timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_status ON infrastructure_events(status);
+CREATE INDEX IF NOT EXISTS idx_events_severity ON infrastructure_events(severity);
+
+-- Prometheus remote-read backfill progress (one row per completed window)
+CREATE TABLE IF NOT EXISTS prometheus_backfill_progress (
+    job_key TEXT NOT NULL,            -- hash of endpoint, selectors and window size
+    window_start_ms INTEGER NOT NULL,
+    window_end_ms INTEGER NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 0,
+    rows_loaded INTEGER NOT NULL DEFAULT 0,
+    completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_key, window_start_ms)
 );
 
 -- Cleanup old metrics (keep last 90 days for detailed, 1 year for aggregates)
@@ -0,0 +1,23 @@
+-- Covering indexes for the per-resource time-range scans.
+-- calculate_forecasting_aggregates reads (metric, metric_timestamp) for one
+-- resource over a time range; carrying the metric columns in the index lets
+-- SQLite answer it from the index alone. get_vm_history/get_cluster_history
+-- (SELECT *) use the same (id, metric_timestamp) prefix for the range seek.
+-- Generated columns (vcpu_allocation_percent) are left out: SQLite reads
+-- them from the table even when indexed, so they would only add width.
+
+DROP INDEX IF EXISTS idx_vm_metrics_vm_time;
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_vm_time_cover
+    ON vm_metrics_history(vm_id, metric_timestamp, cpu_usage_percent, memory_usage_percent);
+
+DROP INDEX IF EXISTS idx_vm_metrics_cluster_time;
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_cluster_time_cover
+    ON vm_metrics_history(cluster_name, metric_timestamp, cpu_usage_percent, memory_usage_percent);
+
+DROP INDEX IF EXISTS idx_host_metrics_host_time;
+CREATE INDEX IF NOT EXISTS idx_host_metrics_host_time_cover
+    ON host_metrics_history(host_id, metric_timestamp, cpu_usage_percent, memory_usage_percent);
+
+DROP INDEX IF EXISTS idx_cluster_metrics_cluster_time;
+CREATE INDEX IF NOT EXISTS idx_cluster_metrics_cluster_time_cover
+    ON cluster_metrics_history(cluster_name, metric_timestamp, avg_cpu_usage_percent, avg_memory_usage_percent);
@@ -0,0 +1,15 @@
+-- One aggregate row per (resource_type, resource_id, metric_name).
+-- Without a unique key INSERT OR REPLACE in calculate_forecasting_aggregates
+-- never replaced anything and every recalculation appended a row. Keep the
+-- newest row of each group, then enforce the key; it also serves
+-- get_forecasting_data's lookup, making idx_forecasting_resource redundant.
+
+DELETE FROM forecasting_aggregates
+WHERE id NOT IN (
+    SELECT MAX(id) FROM forecasting_aggregates
+    GROUP BY resource_type, resource_id, metric_name
+);
+
+DROP INDEX IF EXISTS idx_forecasting_resource;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_forecasting_resource_metric
+    ON forecasting_aggregates(resource_type, resource_id, metric_name);
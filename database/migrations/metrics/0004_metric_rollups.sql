@@ -0,0 +1,30 @@
+-- Multi-resolution rollups of the metrics history tables.
+-- One row per (resource, metric, resolution, bucket); avg = sum / sample_count
+-- and the standard deviation follows from sum_sq. bucket_start uses the same
+-- ISO text format as metric_timestamp so both compare directly.
+
+CREATE TABLE IF NOT EXISTS metric_rollups (
+    resource_type TEXT NOT NULL,  -- 'vm', 'host', 'cluster'
+    resolution TEXT NOT NULL,     -- '5m', '1h', '1d'
+    resource_id TEXT NOT NULL,    -- vm_id, host_id, cluster_name
+    metric_name TEXT NOT NULL,    -- column of the raw history table
+    bucket_start TEXT NOT NULL,
+    sample_count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    sum_sq REAL NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    p95 REAL NOT NULL,
+    PRIMARY KEY (resource_type, resolution, resource_id, metric_name, bucket_start)
+) WITHOUT ROWID;
+
+-- Finer buckets of one time range across all resources (used when rolling up)
+CREATE INDEX IF NOT EXISTS idx_metric_rollups_bucket
+    ON metric_rollups(resource_type, resolution, bucket_start);
+
+-- Highest raw row id already folded into the rollups, per raw table
+CREATE TABLE IF NOT EXISTS metric_rollup_state (
+    source_table TEXT PRIMARY KEY,
+    last_raw_id INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
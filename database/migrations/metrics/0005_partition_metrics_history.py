@@ -0,0 +1,59 @@
+"""
+Time-partitioned metrics history.
+
+The cleanup triggers ran a full DELETE of expired rows on every 1000th
+insert (500th for clusters), stalling that one write for seconds on large
+tables. Each history table becomes an empty <table>_template plus one
+table per day (week for clusters) behind a view with the original name;
+existing rows move into their partitions and retention drops whole
+partitions (db/partitions.py). The default windows are the triggers' ones.
+"""
+
+from datetime import datetime, timedelta
+
+from db.partitions import POLICY_TABLE, REGISTRY_INDEX, REGISTRY_TABLE, PartitionedTables, template_table
+
+# (table, partition period, retention days)
+HISTORY_TABLES = (
+    ("vm_metrics_history", "day", 90),
+    ("host_metrics_history", "day", 90),
+    ("cluster_metrics_history", "week", 365),
+)
+
+
+def upgrade(conn):
+    for trigger in ("cleanup_old_vm_metrics", "cleanup_old_host_metrics", "cleanup_old_cluster_metrics"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(POLICY_TABLE)
+    conn.execute(REGISTRY_TABLE)
+    conn.execute(REGISTRY_INDEX)
+
+    partitions = PartitionedTables()
+    for table, period, retention_days in HISTORY_TABLES:
+        template = template_table(table)
+        conn.execute(f"ALTER TABLE {table} RENAME TO {template}")
+        partitions.set_policy(conn, table, period, retention_days)
+
+        # Generated columns cannot be inserted; ids are kept
+        columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_xinfo({template})") if row[6] == 0)
+        days = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT substr(metric_timestamp, 1, 10) FROM {template} ORDER BY 1"
+        )]
+        for day in days:
+            try:
+                start = datetime.strptime(day, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                # Unparseable timestamps stay in the template, still visible through the view
+                continue
+            # Date-only bounds match both 'T' and space separated timestamps
+            bounds = (day, (start + timedelta(days=1)).strftime("%Y-%m-%d"))
+            partition = partitions.ensure_partition(conn, table, start)
+            conn.execute(f"""
+                INSERT INTO "{partition}" ({columns}) SELECT {columns} FROM {template}
+                WHERE metric_timestamp >= ? AND metric_timestamp < ?
+            """, bounds)
+            conn.execute(f"DELETE FROM {template} WHERE metric_timestamp >= ? AND metric_timestamp < ?", bounds)
+        partitions.refresh_view(conn, table)
+        # Rollup watermarks are kept per partition from now on
+        conn.execute("DELETE FROM metric_rollup_state WHERE source_table = ?", (table,))
+    partitions.drop_expired(conn)
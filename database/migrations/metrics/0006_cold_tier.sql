@@ -0,0 +1,26 @@
+-- Columnar cold tier (db/cold_tier.py).
+-- Partitions older than archive_after_days are compacted into per-block
+-- numpy files under database/archive/ and registered here; NULL keeps a
+-- table entirely in SQLite.
+
+ALTER TABLE partition_policies ADD COLUMN resource_column TEXT;
+ALTER TABLE partition_policies ADD COLUMN archive_after_days INTEGER CHECK (archive_after_days > 0);
+
+UPDATE partition_policies SET resource_column = 'vm_id', archive_after_days = 30
+WHERE base_table = 'vm_metrics_history';
+UPDATE partition_policies SET resource_column = 'host_id', archive_after_days = 30
+WHERE base_table = 'host_metrics_history';
+UPDATE partition_policies SET resource_column = 'cluster_name', archive_after_days = 90
+WHERE base_table = 'cluster_metrics_history';
+
+CREATE TABLE IF NOT EXISTS cold_partitions (
+    partition_table TEXT PRIMARY KEY,
+    base_table TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    path TEXT NOT NULL,          -- relative to the archive directory
+    row_count INTEGER NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cold_partitions_base_period ON cold_partitions(base_table, period_start);
@@ -0,0 +1,48 @@
+"""
+Integer epoch-millisecond timestamps on the metrics history tables.
+
+metric_timestamp is ISO text: range predicates compare strings and every
+reader parsed it back per row. Each template and partition gains
+metric_ts_ms INTEGER (epoch milliseconds), existing rows are converted in
+one UPDATE per partition, and the time indexes move from the text column
+to the integer one. metric_timestamp stays, written as before, for
+existing consumers of the views.
+"""
+
+from db.partitions import TIMESTAMP_MS_COLUMN, PartitionedTables, template_table
+
+# julianday() of naive text is local time; 'utc' converts it like datetime.timestamp()
+TO_EPOCH_MS = "CAST(round((julianday(metric_timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+# table -> [(old text index, new integer index, columns)]
+INDEXES = {
+    "vm_metrics_history": [
+        ("idx_vm_metrics_vm_time_cover", "idx_vm_metrics_vm_ts_cover",
+         "vm_id, metric_ts_ms, cpu_usage_percent, memory_usage_percent"),
+        ("idx_vm_metrics_cluster_time_cover", "idx_vm_metrics_cluster_ts_cover",
+         "cluster_name, metric_ts_ms, cpu_usage_percent, memory_usage_percent"),
+        ("idx_vm_metrics_timestamp", "idx_vm_metrics_ts", "metric_ts_ms"),
+    ],
+    "host_metrics_history": [
+        ("idx_host_metrics_host_time_cover", "idx_host_metrics_host_ts_cover",
+         "host_id, metric_ts_ms, cpu_usage_percent, memory_usage_percent"),
+        ("idx_host_metrics_cluster_time", "idx_host_metrics_cluster_ts", "cluster_name, metric_ts_ms"),
+        ("idx_host_metrics_timestamp", "idx_host_metrics_ts", "metric_ts_ms"),
+    ],
+    "cluster_metrics_history": [
+        ("idx_cluster_metrics_cluster_time_cover", "idx_cluster_metrics_cluster_ts_cover",
+         "cluster_name, metric_ts_ms, avg_cpu_usage_percent, avg_memory_usage_percent"),
+        ("idx_cluster_metrics_timestamp", "idx_cluster_metrics_ts", "metric_ts_ms"),
+    ],
+}
+
+
+def upgrade(conn):
+    partitions = PartitionedTables()
+    for table, indexes in INDEXES.items():
+        partitions.add_column(conn, table, f"{TIMESTAMP_MS_COLUMN} INTEGER")
+        for name in [template_table(table)] + partitions.partitions(conn, table):
+            conn.execute(f'UPDATE "{name}" SET {TIMESTAMP_MS_COLUMN} = {TO_EPOCH_MS}')
+        for old_index, new_index, columns in indexes:
+            partitions.drop_index(conn, table, old_index)
+            partitions.create_index(conn, table, new_index, columns)
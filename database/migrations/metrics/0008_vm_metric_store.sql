@@ -0,0 +1,32 @@
+-- SQLite backend of db/storage.py (SQLiteStorage).
+-- Same tables as db/models.py (virtual_machines, vm_metrics) so the
+-- monitors, analysis and ML modules can run without PostgreSQL; sample
+-- times are UTC epoch milliseconds rather than DATETIME text.
+
+CREATE TABLE IF NOT EXISTS virtual_machines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    cluster TEXT,
+    cpu_cores INTEGER,
+    memory_gb REAL,
+    disk_gb REAL,
+    is_powered_on BOOLEAN DEFAULT 1,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_virtual_machines_name ON virtual_machines(name);
+
+CREATE TABLE IF NOT EXISTS vm_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vm_id INTEGER NOT NULL REFERENCES virtual_machines(id),
+    timestamp_ms INTEGER NOT NULL,
+    cpu_usage REAL,
+    memory_usage REAL,
+    disk_io REAL,
+    net_io REAL
+);
+
+-- Per-VM range reads; the averaged metrics ride along for aggregate_metrics()
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_vm_ts
+    ON vm_metrics(vm_id, timestamp_ms, cpu_usage, memory_usage);
+CREATE INDEX IF NOT EXISTS idx_vm_metrics_ts ON vm_metrics(timestamp_ms);
@@ -0,0 +1,7 @@
+-- Quantile sketch per rollup bucket (api/tdigest.py).
+-- 5-minute buckets are sketched from their raw samples, coarser buckets
+-- merge their children's sketches, so any window's percentiles merge a
+-- handful of day/hour/5-minute buckets. Buckets rolled up before this
+-- migration stay NULL until their raw rows are folded in again.
+
+ALTER TABLE metric_rollups ADD COLUMN digest BLOB;
@@ -0,0 +1,96 @@
+"""
+History timestamps in UTC.
+
+metric_timestamp was written as naive local time while the storage layer
+takes naive timestamps as UTC, so the same text meant two instants. From
+now on metric_timestamp (and everything derived from it: partition days,
+rollup buckets) is naive UTC. metric_ts_ms already holds the true instant
+and is unchanged; the text columns are converted from local time:
+
+- metric_timestamp of every history row;
+- 5-minute and hourly rollup bucket starts (exact, since the local offset
+  is a whole number of 5 minutes); daily buckets keep their dates;
+- the periods of archived (cold) partitions, to the UTC instants of their
+  local day boundaries.
+
+Rows that now fall outside their partition's day move to the partition of
+their UTC day. Rollups are brought up to date first, so the moved rows are
+neither folded twice nor skipped. On a host running in UTC nothing changes.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from api.metrics_rollups import MetricsRollups
+from db.partitions import PartitionedTables, template_table
+
+HISTORY_TABLES = ("vm_metrics_history", "host_metrics_history", "cluster_metrics_history")
+
+
+def local_to_utc(text):
+    """Naive local ISO text -> naive UTC ISO text; anything unparseable is kept"""
+    try:
+        moment = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return text
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def upgrade(conn):
+    conn.create_function("local_to_utc", 1, local_to_utc, deterministic=True)
+    partitions = PartitionedTables()
+
+    for table in HISTORY_TABLES:
+        for name in [template_table(table)] + partitions.partitions(conn, table):
+            conn.execute(f"""
+                UPDATE "{name}" SET metric_timestamp = local_to_utc(metric_timestamp)
+                WHERE metric_timestamp != local_to_utc(metric_timestamp)
+            """)
+
+    # Relabelled through a copy: shifting in place could collide with a
+    # bucket not yet shifted
+    conn.execute("""
+        CREATE TEMP TABLE utc_rollups AS SELECT * FROM metric_rollups
+        WHERE resolution IN ('5m', '1h') AND bucket_start != local_to_utc(bucket_start)
+    """)
+    if conn.execute("SELECT COUNT(*) FROM utc_rollups").fetchone()[0]:
+        conn.execute("""
+            DELETE FROM metric_rollups WHERE resolution IN ('5m', '1h')
+              AND bucket_start != local_to_utc(bucket_start)
+        """)
+        conn.execute("UPDATE utc_rollups SET bucket_start = local_to_utc(bucket_start)")
+        conn.execute("INSERT INTO metric_rollups SELECT * FROM utc_rollups")
+    conn.execute("DROP TABLE utc_rollups")
+
+    conn.execute("""
+        UPDATE cold_partitions SET period_start = local_to_utc(period_start), period_end = local_to_utc(period_end)
+        WHERE period_start != local_to_utc(period_start) OR period_end != local_to_utc(period_end)
+    """)
+
+    MetricsRollups().update(conn)
+    for table in HISTORY_TABLES:
+        columns = ", ".join(row[1] for row in conn.execute(f'PRAGMA table_xinfo("{template_table(table)}")')
+                            if row[6] == 0)
+        received = set()
+        for name, start, end in conn.execute(
+            "SELECT partition_table, period_start, period_end FROM partitions WHERE base_table = ?", (table,)
+        ).fetchall():
+            days = [row[0] for row in conn.execute(f"""
+                SELECT DISTINCT substr(metric_timestamp, 1, 10) FROM "{name}"
+                WHERE metric_timestamp < ? OR metric_timestamp >= ?
+            """, (start, end))]
+            for day in days:
+                day_start = datetime.strptime(day, "%Y-%m-%d")
+                target = partitions.ensure_partition(conn, table, day_start)
+                bounds = (day_start.isoformat(), (day_start + timedelta(days=1)).isoformat(), start, end)
+                where = "metric_timestamp >= ? AND metric_timestamp < ? AND (metric_timestamp < ? OR metric_timestamp >= ?)"
+                conn.execute(f'INSERT INTO "{target}" ({columns}) SELECT {columns} FROM "{name}" WHERE {where}', bounds)
+                conn.execute(f'DELETE FROM "{name}" WHERE {where}', bounds)
+                received.add(target)
+        # Every moved row is already in the rollups
+        for target in received:
+            conn.execute(f"""
+                INSERT INTO metric_rollup_state (source_table, last_raw_id, updated_at)
+                SELECT ?, MAX(id), CURRENT_TIMESTAMP FROM "{target}" WHERE true
+                ON CONFLICT(source_table) DO UPDATE SET
+                    last_raw_id = excluded.last_raw_id, updated_at = excluded.updated_at
+            """, (target,))
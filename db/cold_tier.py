@@ -0,0 +1,302 @@
+"""
+Columnar Cold Tier
+Compacts old partitions of the time-partitioned history tables into
+per-block columnar files (float32 columns, delta-encoded integer
+timestamps) that are read back through numpy memory maps
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from db.partitions import (TIMESTAMP_COLUMN, TIMESTAMP_MS_COLUMN, PartitionedTables, from_epoch_ms,
+                           template_table, to_epoch_ms)
+
+logger = logging.getLogger(__name__)
+
+# 2: timestamps are true epoch ms (format 1 blocks counted naive wall-clock ms)
+BLOCK_FORMAT = 2
+TIMESTAMPS_FILE = "ts_delta.npy"
+META_FILE = "meta.json"
+NUMERIC_TYPES = ("REAL", "INTEGER")
+
+
+class ColdBlock:
+    """One archived partition: meta.json plus one .npy file per column.
+
+    Rows are sorted by (resource, timestamp) and meta.json maps each
+    resource to its [start, end) row range, so reading one resource is a
+    slice of each memory-mapped column. Timestamps are stored as deltas
+    from the previous sample of the same resource; the first sample of
+    each resource is a delta from the block's base_ms, so the cumulative
+    sum of any resource's slice restores absolute times.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format", 1) < 2:
+            # Deltas are unchanged; only the base moves from wall clock to epoch.
+            # Format 1 blocks date from local-time history, so the base is local
+            self.meta["base_ms"] = round(datetime.fromisoformat(self.meta["period_start"]).timestamp() * 1000)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def resource_rows(self, resource_id: str, columns: Optional[Sequence[str]] = None,
+                      since_ms: Optional[int] = None, until_ms: Optional[int] = None
+                      ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """(epoch ms timestamps, {column: float32 values}) of one resource"""
+        span = self.meta["resources"].get(resource_id)
+        columns = self.meta["columns"] if columns is None else [c for c in columns if c in self.meta["columns"]]
+        if span is None:
+            return np.empty(0, dtype=np.int64), {c: np.empty(0, dtype=np.float32) for c in columns}
+        start, end = span
+        timestamps = self.meta["base_ms"] + np.cumsum(self.array("ts_delta")[start:end], dtype=np.int64)
+        mask = np.ones(len(timestamps), dtype=bool)
+        if since_ms is not None:
+            mask &= timestamps >= since_ms
+        if until_ms is not None:
+            mask &= timestamps < until_ms
+        return timestamps[mask], {c: np.asarray(self.array(c)[start:end][mask]) for c in columns}
+
+    def resources(self) -> List[str]:
+        return list(self.meta["resources"])
+
+
+class ColdTier:
+    """Archive, read and expire cold blocks of the partitioned tables.
+
+    The block registry (cold_partitions) and each table's archive age and
+    resource column (partition_policies) live in the metrics database;
+    block files live under archive_dir/<table>/<partition>/. Archiving is
+    split in two so the slow part does not hold the writer: write_block()
+    reads the partition on any connection and writes the files to a
+    staging directory, then attach_block() swaps them in on the writer
+    (registering the block and dropping the hot partition) unless rows
+    landed in the partition meanwhile.
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self.partitions = PartitionedTables()
+        self._blocks: Dict[str, ColdBlock] = {}
+
+    def _block(self, relative_path: str) -> ColdBlock:
+        block = self._blocks.get(relative_path)
+        if block is None:
+            block = self._blocks[relative_path] = ColdBlock(os.path.join(self.archive_dir, relative_path))
+        return block
+
+    def settings(self, conn: sqlite3.Connection) -> Dict[str, Dict]:
+        rows = conn.execute(
+            "SELECT base_table, resource_column, archive_after_days FROM partition_policies"
+        ).fetchall()
+        return {row[0]: {"resource_column": row[1], "archive_after_days": row[2]} for row in rows}
+
+    def set_archive_age(self, conn: sqlite3.Connection, base: str, days: Optional[int]):
+        """Archive partitions once they are this many days old (None keeps a table hot)"""
+        if days is not None and days <= 0:
+            raise ValueError("archive_after_days must be positive")
+        self.partitions.policy(conn, base)
+        conn.execute("UPDATE partition_policies SET archive_after_days = ? WHERE base_table = ?", (days, base))
+
+    def due(self, conn: sqlite3.Connection, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+        """(table, partition) pairs whose whole period is older than the table's archive age"""
+        now = now or datetime.utcnow()
+        due = []
+        for base, settings in self.settings(conn).items():
+            if not settings["archive_after_days"]:
+                continue
+            cutoff = now - timedelta(days=settings["archive_after_days"])
+            due.extend((base, row[0]) for row in conn.execute(
+                "SELECT partition_table FROM partitions WHERE base_table = ? AND period_end <= ? ORDER BY period_start",
+                (base, cutoff.isoformat())
+            ))
+        return due
+
+    # Archiving
+
+    def _columns(self, conn: sqlite3.Connection, base: str, resource_column: str) -> Tuple[List[str], List[str]]:
+        """(numeric columns, text attribute columns) of a table, generated columns excluded"""
+        numeric, text = [], []
+        for row in conn.execute(f'PRAGMA table_xinfo("{template_table(base)}")'):
+            name, declared, hidden = row[1], (row[2] or "").upper(), row[6]
+            if hidden or name in ("id", resource_column, TIMESTAMP_COLUMN, TIMESTAMP_MS_COLUMN):
+                continue
+            (numeric if declared in NUMERIC_TYPES else text).append(name)
+        return numeric, text
+
+    def write_block(self, conn: sqlite3.Connection, base: str, partition: str) -> Dict[str, Any]:
+        """Write a partition's rows to a staging directory; returns the block's meta"""
+        resource_column = self.settings(conn)[base]["resource_column"]
+        numeric, text = self._columns(conn, base, resource_column)
+        period_start, period_end = conn.execute(
+            "SELECT period_start, period_end FROM partitions WHERE partition_table = ?", (partition,)
+        ).fetchone()
+        count, max_id = conn.execute(f'SELECT COUNT(*), MAX(id) FROM "{partition}"').fetchone()
+
+        base_ms = to_epoch_ms(period_start)
+        deltas = np.zeros(count, dtype=np.int64)
+        values = {column: np.zeros(count, dtype=np.float32) for column in numeric}
+        resources: Dict[str, List[int]] = {}
+        attributes: Dict[str, Dict[str, Any]] = {}
+        select = ", ".join([resource_column, TIMESTAMP_MS_COLUMN] + numeric + text)
+        cursor = conn.execute(f'SELECT {select} FROM "{partition}" ORDER BY {resource_column}, {TIMESTAMP_MS_COLUMN}')
+        previous_ms = base_ms
+        for i, row in enumerate(cursor):
+            resource_id = row[0]
+            if resource_id not in resources:
+                resources[resource_id] = [i, i]
+                previous_ms = base_ms
+            resources[resource_id][1] = i + 1
+            ms = row[1]
+            deltas[i] = ms - previous_ms
+            previous_ms = ms
+            for position, column in enumerate(numeric):
+                value = row[2 + position]
+                values[column][i] = np.nan if value is None else value
+            # Text columns are near-constant per resource; the latest values are kept
+            attributes[resource_id] = dict(zip(text, row[2 + len(numeric):]))
+
+        staging = os.path.join(self.archive_dir, base, f"{partition}.staging")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        # A week in milliseconds fits int32 comfortably
+        delta_type = np.int32 if count == 0 or np.abs(deltas).max() < 2 ** 31 else np.int64
+        np.save(os.path.join(staging, TIMESTAMPS_FILE), deltas.astype(delta_type))
+        for column, array in values.items():
+            np.save(os.path.join(staging, f"{column}.npy"), array)
+        meta = {
+            "format": BLOCK_FORMAT, "table": base, "partition": partition,
+            "period_start": period_start, "period_end": period_end, "base_ms": base_ms,
+            "rows": count, "max_id": max_id, "resource_column": resource_column,
+            "columns": numeric, "resources": resources, "attributes": attributes
+        }
+        with open(os.path.join(staging, META_FILE), "w") as f:
+            json.dump(meta, f)
+        return meta
+
+    def attach_block(self, conn: sqlite3.Connection, meta: Dict[str, Any]) -> bool:
+        """On the writer: move the staged block in place and drop its hot partition.
+
+        Returns False (and discards the staged files) if the partition changed
+        since write_block(); it is picked up again on the next run.
+        """
+        base, partition = meta["table"], meta["partition"]
+        staging = os.path.join(self.archive_dir, base, f"{partition}.staging")
+        registered = conn.execute("SELECT 1 FROM partitions WHERE partition_table = ?", (partition,)).fetchone()
+        current = conn.execute(f'SELECT COUNT(*), MAX(id) FROM "{partition}"').fetchone() if registered else None
+        if current is None or tuple(current) != (meta["rows"], meta["max_id"]):
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+
+        relative_path = os.path.join(base, partition)
+        final = os.path.join(self.archive_dir, relative_path)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(staging, final)
+        self._blocks.pop(relative_path, None)
+        conn.execute("""
+            INSERT OR REPLACE INTO cold_partitions (partition_table, base_table, period_start, period_end, path, row_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (partition, base, meta["period_start"], meta["period_end"], relative_path, meta["rows"]))
+        self.partitions.detach(conn, base, [partition])
+        logger.info(f"Archived {partition} ({meta['rows']} rows) to {final}")
+        return True
+
+    # Reads
+
+    def blocks(self, conn: sqlite3.Connection, base: str,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[ColdBlock]:
+        """Cold blocks of base overlapping [since, until), oldest first"""
+        sql = "SELECT path FROM cold_partitions WHERE base_table = ?"
+        params: list = [base]
+        if since is not None:
+            sql += " AND period_end > ?"
+            params.append(since.isoformat())
+        if until is not None:
+            sql += " AND period_start < ?"
+            params.append(until.isoformat())
+        return [self._block(row[0]) for row in conn.execute(sql + " ORDER BY period_start", params)]
+
+    def read(self, conn: sqlite3.Connection, base: str, resource_id: str,
+             since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Cold rows of one resource as dicts shaped like the hot rows (numeric and text columns, no ids)"""
+        rows = []
+        since_ms = to_epoch_ms(since) if since else None
+        until_ms = to_epoch_ms(until) if until else None
+        for block in self.blocks(conn, base, since, until):
+            timestamps, values = block.resource_rows(resource_id, since_ms=since_ms, until_ms=until_ms)
+            attributes = block.meta["attributes"].get(resource_id, {})
+            for i, ms in enumerate(timestamps.tolist()):
+                row = {block.meta["resource_column"]: resource_id,
+                       TIMESTAMP_COLUMN: from_epoch_ms(ms).isoformat(), TIMESTAMP_MS_COLUMN: ms}
+                row.update(attributes)
+                row.update({column: float(array[i]) for column, array in values.items()})
+                rows.append(row)
+        return rows
+
+    def series(self, conn: sqlite3.Connection, base: str, resource_id: str, column: str,
+               since: Optional[datetime] = None, until: Optional[datetime] = None
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """Cold samples of one column of one resource as (int64 epoch ms, float64 values)"""
+        since_ms = to_epoch_ms(since) if since else None
+        until_ms = to_epoch_ms(until) if until else None
+        timestamps, values = [], []
+        for block in self.blocks(conn, base, since, until):
+            block_timestamps, block_values = block.resource_rows(resource_id, [column], since_ms, until_ms)
+            timestamps.append(block_timestamps)
+            values.append(block_values.get(column, np.full(len(block_timestamps), np.nan, dtype=np.float32)))
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(timestamps), np.concatenate(values).astype(np.float64)
+
+    def scan(self, conn: sqlite3.Connection, base: str, columns: Sequence[str],
+             since: datetime, until: datetime) -> Iterator[Tuple[str, int, Tuple[float, ...]]]:
+        """(resource id, epoch ms, values of columns) for every cold sample in [since, until)"""
+        since_ms, until_ms = to_epoch_ms(since), to_epoch_ms(until)
+        for block in self.blocks(conn, base, since, until):
+            for resource_id in block.resources():
+                timestamps, values = block.resource_rows(resource_id, columns, since_ms, until_ms)
+                arrays = [values.get(column) for column in columns]
+                for i, ms in enumerate(timestamps.tolist()):
+                    yield resource_id, ms, tuple(
+                        None if array is None or np.isnan(array[i]) else float(array[i]) for array in arrays
+                    )
+
+    # Retention
+
+    def drop_expired(self, conn: sqlite3.Connection, now: Optional[datetime] = None) -> List[str]:
+        """Unregister blocks past their table's retention window; returns their paths.
+
+        The files are left for remove_files() so they are only deleted once
+        the caller has committed.
+        """
+        now = now or datetime.utcnow()
+        expired = []
+        for base, policy in self.partitions.policies(conn).items():
+            cutoff = now - timedelta(days=policy["retention_days"])
+            rows = conn.execute(
+                "SELECT partition_table, path FROM cold_partitions WHERE base_table = ? AND period_end <= ?",
+                (base, cutoff.isoformat())
+            ).fetchall()
+            for partition, path in rows:
+                conn.execute("DELETE FROM cold_partitions WHERE partition_table = ?", (partition,))
+                expired.append(path)
+        return expired
+
+    def remove_files(self, paths: Sequence[str]):
+        for path in paths:
+            self._blocks.pop(path, None)
+            shutil.rmtree(os.path.join(self.archive_dir, path), ignore_errors=True)
+            logger.info(f"Removed expired cold block {path}")
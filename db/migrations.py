@@ -0,0 +1,116 @@
+"""
+Schema Migrations
+Applies the ordered scripts in database/migrations/<set>/ once per database,
+recording each step in a schema_version table
+"""
+
+import hashlib
+import importlib.util
+import logging
+import re
+import sqlite3
+from pathlib import Path
+from typing import List, NamedTuple
+
+from db.sqlite_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_ROOT = Path(__file__).parent.parent / "database" / "migrations"
+
+# NNNN_description.sql or NNNN_description.py (the latter defines upgrade(conn))
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    migration_set TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (migration_set, version)
+)
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+def discover(migration_set: str, root: Path = MIGRATIONS_ROOT) -> List[Migration]:
+    """Migrations of a set in version order"""
+    migrations = []
+    for path in (root / migration_set).iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), path))
+    migrations.sort()
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {root / migration_set}")
+    return migrations
+
+
+def applied_versions(conn: sqlite3.Connection, migration_set: str) -> dict:
+    conn.execute(SCHEMA_VERSION_TABLE)
+    rows = conn.execute(
+        "SELECT version, checksum FROM schema_version WHERE migration_set = ?", (migration_set,)
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def _run_python(conn: sqlite3.Connection, migration: Migration):
+    spec = importlib.util.spec_from_file_location(f"migration_{migration.version}_{migration.name}", migration.path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(conn)
+
+
+def apply_migrations(conn: sqlite3.Connection, migration_set: str, root: Path = MIGRATIONS_ROOT) -> List[str]:
+    """Apply pending migrations of a set; each runs in its own transaction.
+
+    Returns the names of the migrations applied by this call.
+    """
+    conn.commit()
+    applied = applied_versions(conn, migration_set)
+    conn.commit()
+    newly_applied = []
+    for migration in discover(migration_set, root):
+        checksum = migration.checksum
+        if migration.version in applied:
+            if applied[migration.version] != checksum:
+                logger.warning(f"Migration {migration_set}/{migration.path.name} changed after it was applied")
+            continue
+        try:
+            if migration.path.suffix == ".sql":
+                # executescript commits any open transaction first, so the
+                # script brackets itself to stay atomic with its version row
+                conn.executescript("BEGIN;\n" + migration.path.read_text() + "\n;")
+            else:
+                conn.execute("BEGIN")
+                _run_python(conn, migration)
+            conn.execute(
+                "INSERT INTO schema_version (migration_set, version, name, checksum) VALUES (?, ?, ?, ?)",
+                (migration_set, migration.version, migration.name, checksum)
+            )
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Migration {migration_set}/{migration.path.name} failed")
+            raise
+        logger.info(f"Applied migration {migration_set}/{migration.path.name}")
+        newly_applied.append(f"{migration.version:04d}_{migration.name}")
+    return newly_applied
+
+
+def migrate(db_path: str, migration_set: str, root: Path = MIGRATIONS_ROOT) -> List[str]:
+    """Bring a database file up to date through its shared writer connection"""
+    with get_pool(db_path).writer() as conn:
+        return apply_migrations(conn, migration_set, root)
@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -32,3 +32,10 @@ class VMMetric(Base):
     net_io = Column(Float)
 
     vm = relationship("VirtualMachine", back_populates="metrics")
+
+    # Per-VM range scans and the grouped underutilization aggregate; on
+    # PostgreSQL the averaged metrics ride along for index-only scans
+    __table_args__ = (
+        Index("ix_vm_metrics_vm_id_timestamp", "vm_id", "timestamp",
+              postgresql_include=["cpu_usage", "memory_usage"]),
+    )
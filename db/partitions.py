@@ -0,0 +1,318 @@
+"""
+Time-Partitioned Tables
+Splits an append-only history table into per-day or per-week tables so
+retention is a DROP TABLE instead of a row-by-row DELETE
+"""
+
+import logging
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_COLUMN = "metric_timestamp"
+# Epoch milliseconds of TIMESTAMP_COLUMN, for integer range predicates and numpy readers
+TIMESTAMP_MS_COLUMN = "metric_ts_ms"
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+POLICY_TABLE = """
+CREATE TABLE IF NOT EXISTS partition_policies (
+    base_table TEXT PRIMARY KEY,
+    period TEXT NOT NULL CHECK (period IN ('day', 'week')),
+    retention_days INTEGER NOT NULL CHECK (retention_days > 0)
+)
+"""
+
+REGISTRY_TABLE = """
+CREATE TABLE IF NOT EXISTS partitions (
+    partition_table TEXT PRIMARY KEY,
+    base_table TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+REGISTRY_INDEX = "CREATE INDEX IF NOT EXISTS idx_partitions_base_period ON partitions(base_table, period_start)"
+
+# SQLite rejects a compound SELECT of more terms than this (SQLITE_MAX_COMPOUND_SELECT)
+MAX_COMPOUND_TERMS = 500
+
+
+def template_table(base: str) -> str:
+    """Empty table holding the schema (and index definitions) partitions are cloned from"""
+    return f"{base}_template"
+
+
+def period_start(timestamp: datetime, period: str) -> datetime:
+    """Midnight starting the day, or the Monday starting the week, of timestamp"""
+    day = datetime(timestamp.year, timestamp.month, timestamp.day)
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+# The one timestamp convention of the metric stores (history tables and
+# db.storage backends alike): naive datetimes and ISO text are UTC, aware
+# ones are converted, and stored instants are integer epoch milliseconds
+
+def to_epoch_ms(timestamp) -> int:
+    """ISO string or datetime -> epoch milliseconds (naive values are UTC)"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return round(timestamp.timestamp() * 1000)
+
+
+def from_epoch_ms(ms: int) -> datetime:
+    """Epoch milliseconds -> naive UTC datetime"""
+    return datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))
+
+
+def partition_table(base: str, period: str, start: datetime) -> str:
+    """<base>_dYYYYMMDD for daily partitions, <base>_wYYYYMMDD for weekly ones"""
+    return f"{base}_{period[0]}{start:%Y%m%d}"
+
+
+def union_all(tables: Sequence[str]) -> str:
+    """SELECT * over all tables as one UNION ALL, of any number of tables.
+
+    Past MAX_COMPOUND_TERMS tables the terms are grouped into parenthesised
+    sub-selects, each within the limit, so long retention without archiving
+    does not break the view or range reads.
+    """
+    selects = [f'SELECT * FROM "{table}"' for table in tables]
+    while len(selects) > MAX_COMPOUND_TERMS:
+        selects = [
+            "SELECT * FROM (" + " UNION ALL ".join(selects[i:i + MAX_COMPOUND_TERMS]) + ")"
+            for i in range(0, len(selects), MAX_COMPOUND_TERMS)
+        ]
+    return " UNION ALL ".join(selects)
+
+
+class PartitionedTables:
+    """Routing for time-partitioned history tables.
+
+    Each partitioned table `base` has a schema template `<base>_template`,
+    one table per period that holds rows (see partition_table), and a view
+    named `base` that UNION ALLs the template and every partition, so
+    ad-hoc reads of the original name keep working. Writers go through
+    insert(), which creates partitions on first use; readers that know
+    their time range use source() so only the overlapping partitions are
+    scanned. The period and retention of each table live in
+    partition_policies; drop_expired() drops whole partitions once their
+    period has fallen entirely outside the retention window.
+    """
+
+    def policy(self, conn: sqlite3.Connection, base: str) -> Dict:
+        row = conn.execute(
+            "SELECT period, retention_days FROM partition_policies WHERE base_table = ?", (base,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"{base} is not a partitioned table")
+        return {"period": row[0], "retention_days": row[1]}
+
+    def set_policy(self, conn: sqlite3.Connection, base: str, period: str, retention_days: int):
+        """Register a table (or change its retention). The period only applies to new partitions."""
+        if period not in PERIOD_DAYS:
+            raise ValueError(f"Unknown partition period: {period}")
+        if retention_days <= 0:
+            raise ValueError("retention_days must be positive")
+        conn.execute("""
+            INSERT INTO partition_policies (base_table, period, retention_days) VALUES (?, ?, ?)
+            ON CONFLICT(base_table) DO UPDATE SET
+                period = excluded.period, retention_days = excluded.retention_days
+        """, (base, period, retention_days))
+
+    def policies(self, conn: sqlite3.Connection) -> Dict[str, Dict]:
+        rows = conn.execute("SELECT base_table, period, retention_days FROM partition_policies").fetchall()
+        return {row[0]: {"period": row[1], "retention_days": row[2]} for row in rows}
+
+    # Partitions
+
+    def partitions(self, conn: sqlite3.Connection, base: str,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        """Partitions of base overlapping [since, until), oldest first"""
+        sql = "SELECT partition_table FROM partitions WHERE base_table = ?"
+        params: list = [base]
+        if since is not None:
+            sql += " AND period_end > ?"
+            params.append(since.isoformat())
+        if until is not None:
+            sql += " AND period_start < ?"
+            params.append(until.isoformat())
+        return [row[0] for row in conn.execute(sql + " ORDER BY period_start", params)]
+
+    def ensure_partition(self, conn: sqlite3.Connection, base: str, timestamp: datetime) -> str:
+        """Partition holding timestamp, created (and the view refreshed) if missing"""
+        # An existing partition wins even if the policy's period has changed since
+        existing = conn.execute(
+            "SELECT partition_table FROM partitions WHERE base_table = ? AND period_start <= ? AND period_end > ?",
+            (base, timestamp.isoformat(), timestamp.isoformat())
+        ).fetchone()
+        if existing:
+            return existing[0]
+
+        period = self.policy(conn, base)["period"]
+        start = period_start(timestamp, period)
+        name = partition_table(base, period, start)
+
+        template = template_table(base)
+        table_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (template,)
+        ).fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE IF NOT EXISTS "{name}"', table_sql))
+        indexes = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (template,)
+        ).fetchall()
+        for index_name, index_sql in indexes:
+            self._clone_index(conn, base, name, index_name, index_sql)
+        high_water = self._high_water(conn, base)
+        if high_water:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, high_water))
+        conn.execute(
+            "INSERT INTO partitions (partition_table, base_table, period_start, period_end) VALUES (?, ?, ?, ?)",
+            (name, base, start.isoformat(), (start + timedelta(days=PERIOD_DAYS[period])).isoformat())
+        )
+        self.refresh_view(conn, base)
+        logger.info(f"Created partition {name}")
+        return name
+
+    @staticmethod
+    def _clone_index(conn: sqlite3.Connection, base: str, partition: str, index_name: str, index_sql: str):
+        """Create a template index on one partition, named <index><partition suffix>"""
+        suffix = partition[len(base):]
+        conn.execute(re.sub(
+            r'^CREATE (UNIQUE )?INDEX\s+(IF NOT EXISTS\s+)?"?\w+"?\s+ON\s+"?\w+"?',
+            lambda m: f'CREATE {m.group(1) or ""}INDEX IF NOT EXISTS "{index_name}{suffix}" ON "{partition}"',
+            index_sql
+        ))
+
+    # Schema changes (template and every partition)
+
+    def add_column(self, conn: sqlite3.Connection, base: str, definition: str):
+        """ALTER TABLE ... ADD COLUMN on the template and every partition, then refresh the view"""
+        for name in [template_table(base)] + self.partitions(conn, base):
+            conn.execute(f'ALTER TABLE "{name}" ADD COLUMN {definition}')
+        self.refresh_view(conn, base)
+
+    def create_index(self, conn: sqlite3.Connection, base: str, index_name: str, columns: str):
+        """Create an index on the template (so new partitions inherit it) and every existing partition"""
+        index_sql = f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{template_table(base)}"({columns})'
+        conn.execute(index_sql)
+        for name in self.partitions(conn, base):
+            self._clone_index(conn, base, name, index_name, index_sql)
+
+    def drop_index(self, conn: sqlite3.Connection, base: str, index_name: str):
+        conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+        for name in self.partitions(conn, base):
+            conn.execute(f'DROP INDEX IF EXISTS "{index_name}{name[len(base):]}"')
+
+    def _high_water(self, conn: sqlite3.Connection, base: str) -> int:
+        """Highest row id allocated so far in any partition of base, past or present"""
+        names = [template_table(base)] + self.partitions(conn, base)
+        row = conn.execute(
+            "SELECT MAX(seq) FROM sqlite_sequence WHERE name IN (%s)" % ", ".join("?" for _ in names), names
+        ).fetchone()
+        return row[0] or 0
+
+    def detach(self, conn: sqlite3.Connection, base: str, names: Sequence[str]):
+        """Unregister and drop partitions.
+
+        The template's sequence remembers their highest id first, so a
+        partition later recreated under the same name (a late row for an
+        archived period) continues above it and row ids never repeat.
+        """
+        template = template_table(base)
+        high_water = self._high_water(conn, base)
+        if not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?",
+                            (high_water, template)).rowcount:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (template, high_water))
+        conn.execute(
+            "DELETE FROM partitions WHERE partition_table IN (%s)" % ", ".join("?" for _ in names), list(names)
+        )
+        # The view references the partitions, so it goes first
+        self.refresh_view(conn, base)
+        for name in names:
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+
+    def refresh_view(self, conn: sqlite3.Connection, base: str):
+        """(Re)create the view named base over the template and all partitions"""
+        sources = [template_table(base)] + self.partitions(conn, base)
+        conn.execute(f'DROP VIEW IF EXISTS "{base}"')
+        conn.execute(f'CREATE VIEW "{base}" AS ' + union_all(sources))
+
+    def source(self, conn: sqlite3.Connection, base: str,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> str:
+        """FROM-clause source covering [since, until): one partition, a UNION ALL of several, or the empty template"""
+        names = self.partitions(conn, base, since, until)
+        if not names:
+            return f'"{template_table(base)}"'
+        if len(names) == 1:
+            return f'"{names[0]}"'
+        return "(" + union_all(names) + ")"
+
+    # Writes
+
+    def insert(self, conn: sqlite3.Connection, base: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+        """Insert rows (ordered as columns) into the partitions their timestamps fall in.
+
+        TIMESTAMP_MS_COLUMN is derived from TIMESTAMP_COLUMN unless the
+        caller passes it; writers that already hold epoch milliseconds (or
+        write one timestamp for a whole batch) should, to skip the parse.
+        """
+        columns = list(columns)
+        ts_index = columns.index(TIMESTAMP_COLUMN)
+        derive_ms = TIMESTAMP_MS_COLUMN not in columns
+        if derive_ms:
+            columns.append(TIMESTAMP_MS_COLUMN)
+        # Partitions are whole days, so each day maps to exactly one of them;
+        # batches share timestamps, so each distinct one is parsed once
+        parsed: Dict[str, Tuple[datetime, int]] = {}
+        days: Dict[datetime, List[Sequence]] = {}
+        for row in rows:
+            timestamp = row[ts_index]
+            if timestamp not in parsed:
+                moment = datetime.fromisoformat(timestamp)
+                parsed[timestamp] = (period_start(moment, "day"), to_epoch_ms(moment))
+            day, ms = parsed[timestamp]
+            days.setdefault(day, []).append(tuple(row) + (ms,) if derive_ms else row)
+
+        known = len(self.partitions(conn, base))
+        groups: Dict[str, List[Sequence]] = {}
+        for day, day_rows in days.items():
+            groups.setdefault(self.ensure_partition(conn, base, day), []).extend(day_rows)
+        sql_columns = ", ".join(columns)
+        placeholders = ", ".join("?" for _ in columns)
+        for name, group in groups.items():
+            conn.executemany(f'INSERT INTO "{name}" ({sql_columns}) VALUES ({placeholders})', group)
+        if len(self.partitions(conn, base)) != known:
+            # New periods are the natural point to retire old ones
+            self.drop_expired(conn, [base])
+        return sum(len(group) for group in groups.values())
+
+    # Retention
+
+    def drop_expired(self, conn: sqlite3.Connection, bases: Optional[Iterable[str]] = None,
+                     now: Optional[datetime] = None) -> List[str]:
+        """Drop partitions whose whole period is older than the table's retention window"""
+        now = now or datetime.utcnow()
+        policies = self.policies(conn)
+        dropped = []
+        for base in bases or policies:
+            cutoff = now - timedelta(days=policies[base]["retention_days"])
+            expired = [row[0] for row in conn.execute(
+                "SELECT partition_table FROM partitions WHERE base_table = ? AND period_end <= ?",
+                (base, cutoff.isoformat())
+            )]
+            if not expired:
+                continue
+            self.detach(conn, base, expired)
+            for name in expired:
+                logger.info(f"Dropped expired partition {name}")
+            dropped.extend(expired)
+        return dropped
@@ -0,0 +1,224 @@
+"""
+SQLite Connection Pool
+Shared connection management for the local SQLite databases: WAL journaling,
+tuned pragmas, one serialised writer and a bounded pool of read-only readers
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_READERS = 8
+BUSY_TIMEOUT_MS = 5000
+# Negative cache_size is in KiB: 64 MiB page cache per connection
+CACHE_SIZE_KIB = 65536
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KIB}",
+    f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class SQLitePool:
+    """Connections for one database file.
+
+    In WAL mode readers never block the writer and the writer never blocks
+    readers, but SQLite still allows only one writer at a time. Writes are
+    therefore funnelled through a single connection behind a re-entrant
+    lock (nested use on the same thread joins the outer transaction), while
+    reads borrow one of at most `max_readers` query_only connections.
+    """
+
+    def __init__(self, db_path: str, max_readers: int = DEFAULT_MAX_READERS):
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+        self._idle_readers: List[sqlite3.Connection] = []
+        self._readers_open = 0
+        self._readers_cond = threading.Condition()
+        self.stats = {
+            "writer_acquires": 0, "writer_wait_seconds": 0.0, "writer_max_wait_seconds": 0.0,
+            "reader_acquires": 0, "reader_waits": 0, "reader_wait_seconds": 0.0,
+            "readers_created": 0, "rollbacks": 0
+        }
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            # Persistent for the database file once set
+            conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    # Writer
+
+    def acquire_writer(self) -> sqlite3.Connection:
+        """Take the writer connection; pair with release()"""
+        started = time.perf_counter()
+        self._writer_lock.acquire()
+        waited = time.perf_counter() - started
+        try:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+        except Exception:
+            self._writer_lock.release()
+            raise
+        self._writer_depth += 1
+        self.stats["writer_acquires"] += 1
+        self.stats["writer_wait_seconds"] += waited
+        self.stats["writer_max_wait_seconds"] = max(self.stats["writer_max_wait_seconds"], waited)
+        return self._writer
+
+    def _release_writer(self, commit: bool):
+        try:
+            self._writer_depth -= 1
+            if self._writer_depth == 0 and self._writer.in_transaction:
+                if commit:
+                    self._writer.commit()
+                else:
+                    # Whatever the caller left uncommitted must not leak into
+                    # the next writer's transaction
+                    self._writer.rollback()
+                    self.stats["rollbacks"] += 1
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def writer(self):
+        """Writer connection; commits on success, rolls back on error"""
+        conn = self.acquire_writer()
+        try:
+            yield conn
+        except BaseException:
+            self._release_writer(commit=False)
+            raise
+        self._release_writer(commit=True)
+
+    # Readers
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        """Borrow a read-only connection, waiting if all are in use; pair with release()"""
+        started = time.perf_counter()
+        with self._readers_cond:
+            waited = False
+            while not self._idle_readers and self._readers_open >= self.max_readers:
+                waited = True
+                self._readers_cond.wait()
+            if self._idle_readers:
+                conn = self._idle_readers.pop()
+            else:
+                self._readers_open += 1
+                conn = None
+            self.stats["reader_acquires"] += 1
+            if waited:
+                self.stats["reader_waits"] += 1
+                self.stats["reader_wait_seconds"] += time.perf_counter() - started
+        if conn is None:
+            try:
+                conn = self._connect(read_only=True)
+            except Exception:
+                with self._readers_cond:
+                    self._readers_open -= 1
+                    self._readers_cond.notify()
+                raise
+            self.stats["readers_created"] += 1
+        # One read transaction per borrow so multi-query reads see a single
+        # consistent snapshot even while the writer commits
+        conn.execute("BEGIN")
+        return conn
+
+    def _release_reader(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._readers_cond:
+            self._idle_readers.append(conn)
+            self._readers_cond.notify()
+
+    @contextmanager
+    def reader(self):
+        conn = self.acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    def release(self, conn: sqlite3.Connection, commit: bool = False):
+        """Return a connection from acquire_writer()/acquire_reader().
+
+        Writers are rolled back unless commit=True, matching a plain
+        connection that is closed without committing.
+        """
+        if conn is self._writer:
+            self._release_writer(commit)
+        else:
+            self._release_reader(conn)
+
+    # Housekeeping
+
+    def close(self):
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._readers_cond:
+            for conn in self._idle_readers:
+                conn.close()
+            self._readers_open -= len(self._idle_readers)
+            self._idle_readers = []
+
+    def status(self) -> Dict[str, Any]:
+        with self._readers_cond:
+            readers = {
+                "readers_open": self._readers_open,
+                "readers_idle": len(self._idle_readers),
+                "readers_in_use": self._readers_open - len(self._idle_readers),
+            }
+        return dict(
+            self.stats,
+            db_path=self.db_path,
+            max_readers=self.max_readers,
+            writer_open=self._writer is not None,
+            writer_wait_seconds=round(self.stats["writer_wait_seconds"], 4),
+            writer_max_wait_seconds=round(self.stats["writer_max_wait_seconds"], 4),
+            reader_wait_seconds=round(self.stats["reader_wait_seconds"], 4),
+            **readers
+        )
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> SQLitePool:
+    """Process-wide pool for a database file (keyed by absolute path)"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLitePool(db_path)
+        return pool
+
+
+def pool_statistics() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.status() for pool in pools]
@@ -0,0 +1,438 @@
+"""
+Metrics Storage Backends
+One interface over the db.models VM / VM metric store used by the monitors,
+analysis and ML modules: PostgreSQL through SQLAlchemy (COPY for bulk loads)
+or, in its place, the local SQLite database through the shared WAL pool.
+
+The API's metrics collector (api/metrics_collector.py) is deliberately not
+behind this interface. Its history tables hold vm, host and cluster capacity
+snapshots keyed by the source's own ids (vCenter moids, Prometheus
+instances), with allocation columns, daily partitions, rollups and a cold
+tier; this store holds four utilisation metrics per integer VM id. No writer
+puts the same sample in both (the vCenter, Zabbix and local monitors write
+here, the collector and the Prometheus backfill write history), and the
+workload routes read neither. Merging them needs a shared VM identity first.
+Both follow one timestamp convention (db.partitions.to_epoch_ms).
+"""
+
+import csv
+import io
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from db.migrations import migrate
+from db.models import VirtualMachine, VMMetric
+from db.partitions import from_epoch_ms, to_epoch_ms
+from db.sqlite_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+METRIC_COLUMNS = ("cpu_usage", "memory_usage", "disk_io", "net_io")
+DEFAULT_VM_SPEC = {"cluster": "default", "cpu_cores": 4, "memory_gb": 8, "disk_gb": 100}
+
+# Metrics the underutilization analysis thresholds, in threshold order
+UTILIZATION_COLUMNS = ("cpu_usage", "memory_usage")
+
+# Keep IN (...) lists well below driver parameter limits
+LOOKUP_CHUNK_SIZE = 500
+
+
+def utc_naive(timestamp: datetime) -> datetime:
+    """Naive UTC datetime; naive input is taken as UTC already, as the monitors write utcnow()"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _metric_row(row: Dict[str, Any]) -> tuple:
+    """(vm_id, naive UTC timestamp, *METRIC_COLUMNS) with missing metrics as None (NULL)"""
+    timestamp = row.get("timestamp") or datetime.utcnow()
+    return (row["vm_id"], utc_naive(timestamp)) + tuple(row.get(column) for column in METRIC_COLUMNS)
+
+
+def _empty_series() -> Dict[str, np.ndarray]:
+    series = {"timestamp_ms": np.empty(0, dtype=np.int64)}
+    series.update({column: np.empty(0, dtype=np.float64) for column in METRIC_COLUMNS})
+    return series
+
+
+def _aggregate_row(row: tuple) -> Dict[str, Any]:
+    result = {"vm_id": row[0], "name": row[1], "samples": row[2]}
+    result.update({f"avg_{column}": value for column, value in zip(METRIC_COLUMNS, row[3:])})
+    return result
+
+
+def _utilization_row(row: tuple) -> Dict[str, Any]:
+    """(vm_id, name, samples, *UTILIZATION_COLUMNS averages[, *UTILIZATION_COLUMNS p95s])"""
+    result = {"vm_id": row[0], "name": row[1], "samples": row[2]}
+    averages = row[3:3 + len(UTILIZATION_COLUMNS)]
+    result.update({f"avg_{column}": value for column, value in zip(UTILIZATION_COLUMNS, averages)})
+    percentiles = row[3 + len(UTILIZATION_COLUMNS):]
+    result.update({f"p95_{column}": value for column, value in zip(UTILIZATION_COLUMNS, percentiles)})
+    return result
+
+
+class MetricsStorage(ABC):
+    """VMs and their metric samples, whatever the database.
+
+    The monitors, analysis and ML modules read and write VMMetric-shaped
+    data through this interface (see get_storage()), so the same code runs
+    against PostgreSQL or SQLite. The backends are alternative homes for
+    that one store; the collector's history is separate (see the module
+    docstring). Timestamps are UTC: writers may pass naive UTC or aware
+    datetimes, readers get int64 epoch milliseconds.
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    def resolve_vms(self, specs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Map VM names to ids, creating the missing ones from their spec (DEFAULT_VM_SPEC fills gaps).
+
+        Returns {"ids": name -> id, "created": [names created]}.
+        """
+
+    @abstractmethod
+    def list_vms(self) -> List[Dict[str, Any]]:
+        """Every VM as {id, name, cluster}"""
+
+    @abstractmethod
+    def write_metrics(self, rows: Sequence[Dict[str, Any]]) -> int:
+        """Bulk-append samples: vm_id, timestamp and METRIC_COLUMNS (missing metrics are stored as NULL)"""
+
+    @abstractmethod
+    def read_metrics(self, vm_id: int, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """One VM's samples in [since, until), time ordered: timestamp_ms (int64) and a float64 array per metric.
+
+        Metrics a sample did not record are NaN.
+        """
+
+    @abstractmethod
+    def aggregate_metrics(self, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Per VM with samples in [since, until): vm_id, name, samples and avg_<metric> for each metric"""
+
+    @abstractmethod
+    def underutilized_vms(self, cpu_threshold: float, memory_threshold: float,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          limit: Optional[int] = None, offset: int = 0,
+                          percentiles: bool = False) -> Dict[str, Any]:
+        """VMs whose average cpu_usage and memory_usage in [since, until) are both below the thresholds.
+
+        Grouped and filtered (HAVING) by the database in one query, in
+        vm_id order. Returns {"total": matches, "items": [...]} where each
+        item is vm_id, name, samples, avg_cpu_usage and avg_memory_usage,
+        plus p95_cpu_usage / p95_memory_usage with percentiles.
+        """
+
+    def _page_percentiles(self, items: List[Dict[str, Any]], since: Optional[datetime],
+                          until: Optional[datetime]):
+        """p95 of each page item from its series, for databases without percentile aggregates"""
+        for item in items:
+            series = self.read_metrics(item["vm_id"], since, until)
+            for column in UTILIZATION_COLUMNS:
+                values = series[column][~np.isnan(series[column])]
+                item[f"p95_{column}"] = float(np.percentile(values, 95)) if len(values) else None
+
+
+class SQLAlchemyStorage(MetricsStorage):
+    """db.models tables through a SQLAlchemy session factory.
+
+    Production runs this on PostgreSQL, where write_metrics() streams rows
+    with COPY FROM STDIN instead of a multi-row INSERT; any other dialect
+    (tests use SQLite) takes the executemany path.
+    """
+
+    name = "sqlalchemy"
+
+    def __init__(self, session_factory: Callable):
+        self.session_factory = session_factory
+
+    def resolve_vms(self, specs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        names = list(specs)
+        ids: Dict[str, int] = {}
+        with self.session_factory() as db:
+            for i in range(0, len(names), LOOKUP_CHUNK_SIZE):
+                chunk = names[i:i + LOOKUP_CHUNK_SIZE]
+                rows = db.execute(
+                    select(VirtualMachine.name, VirtualMachine.id)
+                    .where(VirtualMachine.name.in_(chunk))
+                    .order_by(VirtualMachine.id)
+                ).all()
+                for name, vm_id in rows:
+                    ids.setdefault(name, vm_id)
+
+            missing = [name for name in names if name not in ids]
+            if missing:
+                created = db.execute(
+                    insert(VirtualMachine).returning(VirtualMachine.id, VirtualMachine.name),
+                    [dict(DEFAULT_VM_SPEC, **(specs[name] or {}), name=name) for name in missing]
+                ).all()
+                for vm_id, name in created:
+                    ids[name] = vm_id
+                db.commit()
+        return {"ids": ids, "created": missing}
+
+    def list_vms(self) -> List[Dict[str, Any]]:
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(VirtualMachine.id, VirtualMachine.name, VirtualMachine.cluster).order_by(VirtualMachine.id)
+            ).all()
+        return [{"id": vm_id, "name": name, "cluster": cluster} for vm_id, name, cluster in rows]
+
+    def write_metrics(self, rows: Sequence[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        values = [_metric_row(row) for row in rows]
+        with self.session_factory() as db:
+            if db.get_bind().dialect.name == "postgresql":
+                self._copy(db, values)
+            else:
+                db.execute(insert(VMMetric), [
+                    dict(zip(("vm_id", "timestamp") + METRIC_COLUMNS, value)) for value in values
+                ])
+            db.commit()
+        return len(values)
+
+    @staticmethod
+    def _copy(db, values: List[tuple]):
+        """COPY rows into vm_metrics on the session's own connection (same transaction)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for vm_id, timestamp, *metrics in values:
+            writer.writerow([vm_id, timestamp.isoformat(sep=" ")] + metrics)
+        buffer.seek(0)
+        raw = db.connection().connection.dbapi_connection
+        with raw.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY vm_metrics (vm_id, timestamp, {', '.join(METRIC_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+
+    def read_metrics(self, vm_id: int, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        query = select(VMMetric.timestamp, *(getattr(VMMetric, column) for column in METRIC_COLUMNS)) \
+            .where(VMMetric.vm_id == vm_id)
+        if since is not None:
+            query = query.where(VMMetric.timestamp >= utc_naive(since))
+        if until is not None:
+            query = query.where(VMMetric.timestamp < utc_naive(until))
+        with self.session_factory() as db:
+            rows = db.execute(query.order_by(VMMetric.timestamp)).all()
+        if not rows:
+            return _empty_series()
+        # numpy converts the naive UTC datetimes in one call
+        series = {"timestamp_ms": np.array([row[0] for row in rows], dtype="datetime64[ms]").astype(np.int64)}
+        values = np.array([row[1:] for row in rows], dtype=np.float64)
+        series.update({column: values[:, i] for i, column in enumerate(METRIC_COLUMNS)})
+        return series
+
+    def aggregate_metrics(self, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        query = select(
+            VirtualMachine.id, VirtualMachine.name, func.count(VMMetric.id),
+            *(func.avg(getattr(VMMetric, column)) for column in METRIC_COLUMNS)
+        ).join(VMMetric, VMMetric.vm_id == VirtualMachine.id)
+        if since is not None:
+            query = query.where(VMMetric.timestamp >= utc_naive(since))
+        if until is not None:
+            query = query.where(VMMetric.timestamp < utc_naive(until))
+        with self.session_factory() as db:
+            rows = db.execute(query.group_by(VirtualMachine.id, VirtualMachine.name).order_by(VirtualMachine.id)).all()
+        return [_aggregate_row(row) for row in rows]
+
+    def underutilized_vms(self, cpu_threshold: float, memory_threshold: float,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          limit: Optional[int] = None, offset: int = 0,
+                          percentiles: bool = False) -> Dict[str, Any]:
+        averages = [func.avg(getattr(VMMetric, column)) for column in UTILIZATION_COLUMNS]
+        columns = [VMMetric.vm_id.label("vm_id"), func.count(VMMetric.id).label("samples")]
+        columns += [average.label(f"avg_{column}") for average, column in zip(averages, UTILIZATION_COLUMNS)]
+        in_query_percentiles = percentiles and self._dialect() == "postgresql"
+        if in_query_percentiles:
+            columns += [func.percentile_cont(0.95).within_group(getattr(VMMetric, column)).label(f"p95_{column}")
+                        for column in UTILIZATION_COLUMNS]
+        grouped = select(*columns)
+        if since is not None:
+            grouped = grouped.where(VMMetric.timestamp >= utc_naive(since))
+        if until is not None:
+            grouped = grouped.where(VMMetric.timestamp < utc_naive(until))
+        grouped = grouped.group_by(VMMetric.vm_id).having(
+            averages[0].isnot(None), averages[0] < cpu_threshold,
+            averages[1].isnot(None), averages[1] < memory_threshold
+        ).subquery()
+
+        # The window count is taken after HAVING and before LIMIT: the page and the total in one query
+        query = select(
+            grouped.c.vm_id, VirtualMachine.name, *list(grouped.c)[1:], func.count().over()
+        ).join(VirtualMachine, VirtualMachine.id == grouped.c.vm_id).order_by(grouped.c.vm_id).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        with self.session_factory() as db:
+            rows = db.execute(query).all()
+            total = rows[0][-1] if rows else (db.execute(
+                select(func.count()).select_from(grouped)
+            ).scalar() if offset else 0)
+
+        items = [_utilization_row(tuple(row)[:-1]) for row in rows]
+        if percentiles and not in_query_percentiles:
+            self._page_percentiles(items, since, until)
+        return {"total": total, "items": items}
+
+    def _dialect(self) -> str:
+        with self.session_factory() as db:
+            return db.get_bind().dialect.name
+
+
+class SQLiteStorage(MetricsStorage):
+    """virtual_machines / vm_metrics in a local SQLite database (metrics migration 0008).
+
+    Writes take the pool's single writer; timestamps are stored as integer
+    UTC epoch milliseconds, so range reads compare integers and hand them
+    to numpy unchanged.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        migrate(db_path, "metrics")
+        self.pool = get_pool(db_path)
+
+    def resolve_vms(self, specs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        names = list(specs)
+        ids: Dict[str, int] = {}
+        with self.pool.writer() as conn:
+            for i in range(0, len(names), LOOKUP_CHUNK_SIZE):
+                chunk = names[i:i + LOOKUP_CHUNK_SIZE]
+                rows = conn.execute(
+                    "SELECT name, id FROM virtual_machines WHERE name IN (%s) ORDER BY id"
+                    % ", ".join("?" for _ in chunk), chunk
+                ).fetchall()
+                for name, vm_id in rows:
+                    ids.setdefault(name, vm_id)
+
+            missing = [name for name in names if name not in ids]
+            for name in missing:
+                spec = dict(DEFAULT_VM_SPEC, **(specs[name] or {}))
+                ids[name] = conn.execute(
+                    "INSERT INTO virtual_machines (name, cluster, cpu_cores, memory_gb, disk_gb) VALUES (?, ?, ?, ?, ?)",
+                    (name, spec["cluster"], spec["cpu_cores"], spec["memory_gb"], spec["disk_gb"])
+                ).lastrowid
+        return {"ids": ids, "created": missing}
+
+    def list_vms(self) -> List[Dict[str, Any]]:
+        with self.pool.reader() as conn:
+            rows = conn.execute("SELECT id, name, cluster FROM virtual_machines ORDER BY id").fetchall()
+        return [{"id": vm_id, "name": name, "cluster": cluster} for vm_id, name, cluster in rows]
+
+    def write_metrics(self, rows: Sequence[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        values = [
+            (vm_id, to_epoch_ms(timestamp)) + tuple(metrics)
+            for vm_id, timestamp, *metrics in (_metric_row(row) for row in rows)
+        ]
+        with self.pool.writer() as conn:
+            conn.executemany(
+                f"INSERT INTO vm_metrics (vm_id, timestamp_ms, {', '.join(METRIC_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                values
+            )
+        return len(values)
+
+    @staticmethod
+    def _range(since: Optional[datetime], until: Optional[datetime]) -> tuple:
+        sql, params = "", []
+        if since is not None:
+            sql += " AND timestamp_ms >= ?"
+            params.append(to_epoch_ms(since))
+        if until is not None:
+            sql += " AND timestamp_ms < ?"
+            params.append(to_epoch_ms(until))
+        return sql, params
+
+    def read_metrics(self, vm_id: int, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        sql, params = self._range(since, until)
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                f"SELECT timestamp_ms, {', '.join(METRIC_COLUMNS)} FROM vm_metrics WHERE vm_id = ?{sql} "
+                "ORDER BY timestamp_ms", [vm_id] + params
+            ).fetchall()
+        if not rows:
+            return _empty_series()
+        series = {"timestamp_ms": np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))}
+        values = np.array([tuple(row)[1:] for row in rows], dtype=np.float64)
+        series.update({column: values[:, i] for i, column in enumerate(METRIC_COLUMNS)})
+        return series
+
+    def aggregate_metrics(self, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        sql, params = self._range(since, until)
+        averages = ", ".join(f"AVG(m.{column})" for column in METRIC_COLUMNS)
+        with self.pool.reader() as conn:
+            rows = conn.execute(f"""
+                SELECT v.id, v.name, COUNT(*), {averages}
+                FROM vm_metrics m JOIN virtual_machines v ON v.id = m.vm_id
+                WHERE 1 = 1{sql.replace('timestamp_ms', 'm.timestamp_ms')}
+                GROUP BY v.id, v.name ORDER BY v.id
+            """, params).fetchall()
+        return [_aggregate_row(tuple(row)) for row in rows]
+
+    def underutilized_vms(self, cpu_threshold: float, memory_threshold: float,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          limit: Optional[int] = None, offset: int = 0,
+                          percentiles: bool = False) -> Dict[str, Any]:
+        sql, params = self._range(since, until)
+        averages = ", ".join(f"AVG({column})" for column in UTILIZATION_COLUMNS)
+        with self.pool.reader() as conn:
+            # Grouped straight off idx_vm_metrics_vm_ts, which covers vm_id,
+            # timestamp_ms and both averaged metrics; COUNT(*) OVER () is the
+            # match count after HAVING, before LIMIT
+            rows = conn.execute(f"""
+                SELECT a.*, v.name, COUNT(*) OVER ()
+                FROM (
+                    SELECT vm_id, COUNT(*) AS samples, {averages}
+                    FROM vm_metrics WHERE 1 = 1{sql}
+                    GROUP BY vm_id
+                    HAVING AVG(cpu_usage) IS NOT NULL AND AVG(cpu_usage) < ?
+                       AND AVG(memory_usage) IS NOT NULL AND AVG(memory_usage) < ?
+                ) a JOIN virtual_machines v ON v.id = a.vm_id
+                ORDER BY a.vm_id LIMIT ? OFFSET ?
+            """, params + [cpu_threshold, memory_threshold, -1 if limit is None else limit, offset]).fetchall()
+            total = rows[0][-1] if rows else (conn.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT vm_id FROM vm_metrics WHERE 1 = 1{sql} GROUP BY vm_id
+                    HAVING AVG(cpu_usage) IS NOT NULL AND AVG(cpu_usage) < ?
+                       AND AVG(memory_usage) IS NOT NULL AND AVG(memory_usage) < ?
+                ) a JOIN virtual_machines v ON v.id = a.vm_id
+            """, params + [cpu_threshold, memory_threshold]).fetchone()[0] if offset else 0)
+
+        width = 2 + len(UTILIZATION_COLUMNS)
+        items = [_utilization_row((row[0], row[width], row[1]) + tuple(row[2:width])) for row in rows]
+        if percentiles:
+            self._page_percentiles(items, since, until)
+        return {"total": total, "items": items}
+
+
+_storage: Optional[MetricsStorage] = None
+
+
+def get_storage() -> MetricsStorage:
+    """Process-wide backend chosen by settings.STORAGE_BACKEND ("postgres" or "sqlite")"""
+    global _storage
+    if _storage is None:
+        from config.config import settings
+        if settings.STORAGE_BACKEND == "sqlite":
+            _storage = SQLiteStorage(settings.SQLITE_DB_PATH)
+        else:
+            from db.init import SessionLocal
+            _storage = SQLAlchemyStorage(SessionLocal)
+        logger.info(f"Metrics storage backend: {_storage.name}")
+    return _storage
@@ -0,0 +1,309 @@
+"""
+Write-Behind Buffer
+Bounded queue in front of a database writer: callers submit row batches and
+return immediately, a dedicated thread groups everything pending into one
+transaction once enough rows or enough time has accumulated
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_ROWS = 5000
+DEFAULT_FLUSH_INTERVAL = 2.0
+# Memory budget: rows held in the queue plus the batch being written
+DEFAULT_MAX_ROWS = 200000
+
+# What submit() does when a batch does not fit in the budget
+OVERFLOW_BLOCK = "block"              # wait for the writer to make room
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # discard the oldest queued batches
+OVERFLOW_SPILL = "spill"              # write the batch to spill_dir, replayed by the writer
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL)
+
+# Writes of a batch that keeps failing before its spill file is set aside as .failed
+MAX_WRITE_ATTEMPTS = 3
+
+# How often a blocked producer checks that the writer thread is still running
+WRITER_CHECK_INTERVAL = 1.0
+
+Batch = Tuple[str, List[Sequence]]
+
+
+class WriteBuffer:
+    """Write-behind queue drained by one writer thread.
+
+    Batches are (key, rows). The writer calls sink({key: rows}) with every
+    batch taken from the queue (and spilled to disk) merged per key, so the
+    sink can commit them as one transaction. If that fails each batch is
+    written alone, so a bad row only fails the batch it came in. With a
+    spill_dir a failed batch is spilled (or its spill file kept) and retried
+    with the next replay; after MAX_WRITE_ATTEMPTS its file is renamed to
+    .failed and left for an operator. Without one the rows are counted as
+    failed and dropped.
+    """
+
+    def __init__(self, sink: Callable[[Dict[str, List[Sequence]]], Any],
+                 flush_rows: int = DEFAULT_FLUSH_ROWS, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_rows: int = DEFAULT_MAX_ROWS, overflow: str = OVERFLOW_BLOCK,
+                 spill_dir: Optional[str] = None, name: str = "write-buffer"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {', '.join(OVERFLOW_POLICIES)}")
+        if overflow == OVERFLOW_SPILL and not spill_dir:
+            raise ValueError("The spill overflow policy needs a spill_dir")
+        self.sink = sink
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.name = name
+        self.stats = {
+            "submitted_rows": 0, "written_rows": 0, "flushes": 0, "dropped_rows": 0,
+            "spilled_rows": 0, "retried_rows": 0, "failed_rows": 0, "blocked_seconds": 0.0,
+            "last_flush_seconds": None,
+        }
+        self._pending: Deque[Batch] = deque()
+        # Queued plus in-flight rows, the quantity max_rows bounds
+        self._rows = 0
+        self._oldest: Optional[float] = None
+        self._submitted = 0
+        self._completed = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._spill_seq = 0
+        # Spill files left by a previous process are replayed as well
+        self._spilled = len(self._spill_files())
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    # Producers
+
+    def submit(self, key: str, rows: Sequence[Sequence]) -> bool:
+        """Queue rows for the writer; False if they were not accepted (buffer closed or writer stopped)"""
+        rows = list(rows)
+        if not rows:
+            return True
+        with self._cond:
+            if self._closed:
+                return False
+            # A batch larger than the whole budget is still admitted alone
+            if self._rows and self._rows + len(rows) > self.max_rows:
+                if self.overflow == OVERFLOW_SPILL:
+                    self._spill(key, rows)
+                    return True
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._drop_oldest(len(rows))
+                else:
+                    started = time.perf_counter()
+                    while self._rows and self._rows + len(rows) > self.max_rows and not self._closed:
+                        if not self._thread.is_alive():
+                            logger.error(f"{self.name}: writer thread stopped, rejecting {len(rows)} {key} rows")
+                            break
+                        self._cond.wait(WRITER_CHECK_INTERVAL)
+                    self.stats["blocked_seconds"] += time.perf_counter() - started
+                    if self._closed or not self._thread.is_alive():
+                        return False
+            self._pending.append((key, rows))
+            self._rows += len(rows)
+            self._submitted += 1
+            self.stats["submitted_rows"] += len(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._rows >= self.flush_rows:
+                self._cond.notify_all()
+        return True
+
+    def _drop_oldest(self, incoming: int):
+        while self._pending and self._rows + incoming > self.max_rows:
+            _, dropped = self._pending.popleft()
+            self._rows -= len(dropped)
+            self._completed += 1
+            self.stats["dropped_rows"] += len(dropped)
+        if not self._pending:
+            self._oldest = None
+        logger.warning(f"{self.name}: buffer full, {self.stats['dropped_rows']} rows dropped so far")
+
+    def _spill(self, key: str, rows: List[Sequence]):
+        self._write_spill_file(self._spill_path(), key, rows)
+        self._spilled += 1
+        self.stats["spilled_rows"] += len(rows)
+        self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write everything submitted so far (including spilled batches); False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            while self._completed < target or self._spilled:
+                if not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                # Re-armed on every wake-up: spill files are replayed a chunk at a time
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting batches, write what is pending and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    # Writer thread
+
+    def _due(self) -> bool:
+        if self._closed or self._flush_requested or self._rows >= self.flush_rows:
+            return bool(self._pending or self._spilled) or self._closed
+        if self._oldest is not None:
+            return time.monotonic() - self._oldest >= self.flush_interval
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    wait = self.flush_interval
+                    if self._oldest is not None:
+                        wait = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+                    elif self._spilled:
+                        # Replay spill files once the queue has been idle a whole interval
+                        self._oldest = time.monotonic()
+                    self._cond.wait(wait)
+                batches = list(self._pending)
+                self._pending.clear()
+                self._oldest = None
+                self._flush_requested = False
+                closing = self._closed
+                replay = bool(self._spilled)
+
+            spilled = self._load_spilled() if replay else []
+            failed = self._write(batches + [batch for _, _, batch in spilled]) if batches or spilled else set()
+            for index, (key, rows) in enumerate(batches):
+                if index in failed:
+                    self._keep_failed(key, rows, 1)
+            for index, (path, attempts, (key, rows)) in enumerate(spilled, len(batches)):
+                if index in failed:
+                    self._keep_failed(key, rows, attempts + 1, path)
+                else:
+                    os.remove(path)
+
+            with self._cond:
+                self._rows -= sum(len(rows) for _, rows in batches)
+                self._completed += len(batches)
+                if replay or failed:
+                    self._spilled = len(self._spill_files())
+                self._cond.notify_all()
+                if closing and not self._pending and not self._spilled:
+                    return
+
+    def _write(self, batches: List[Batch]) -> set:
+        """Write batches in one sink call, or each alone if that fails; returns the indexes that failed"""
+        try:
+            self._sink(batches)
+            return set()
+        except Exception as e:
+            if len(batches) == 1:
+                logger.error(f"{self.name}: failed to write {len(batches[0][1])} rows: {e}")
+                return {0}
+            logger.warning(f"{self.name}: writing {len(batches)} batches together failed ({e}), writing each alone")
+        failed = set()
+        for index, batch in enumerate(batches):
+            try:
+                self._sink([batch])
+            except Exception as e:
+                logger.error(f"{self.name}: failed to write {len(batch[1])} {batch[0]} rows: {e}")
+                failed.add(index)
+        return failed
+
+    def _sink(self, batches: List[Batch]):
+        grouped: Dict[str, List[Sequence]] = {}
+        for key, rows in batches:
+            grouped.setdefault(key, []).extend(rows)
+        started = time.perf_counter()
+        self.sink(grouped)
+        with self._cond:
+            self.stats["written_rows"] += sum(len(rows) for rows in grouped.values())
+            self.stats["flushes"] += 1
+            self.stats["last_flush_seconds"] = round(time.perf_counter() - started, 4)
+
+    def _keep_failed(self, key: str, rows: List[Sequence], attempts: int, path: Optional[str] = None):
+        """Spill a failed batch for the next replay, or set its file aside once out of attempts"""
+        if not self.spill_dir:
+            with self._cond:
+                self.stats["failed_rows"] += len(rows)
+            return
+        path = path or self._spill_path()
+        if attempts < MAX_WRITE_ATTEMPTS:
+            self._write_spill_file(path, key, rows, attempts)
+            with self._cond:
+                self.stats["retried_rows"] += len(rows)
+            return
+        failed_path = path[:-len(".json")] + ".failed"
+        self._write_spill_file(failed_path, key, rows, attempts)
+        if os.path.exists(path):
+            os.remove(path)
+        logger.error(f"{self.name}: {len(rows)} {key} rows failed {attempts} times, kept in {failed_path}")
+        with self._cond:
+            self.stats["failed_rows"] += len(rows)
+
+    # Spill files
+
+    def _spill_path(self) -> str:
+        with self._cond:
+            self._spill_seq += 1
+            sequence = self._spill_seq
+        return os.path.join(self.spill_dir, f"{time.time_ns():020d}-{sequence:06d}.json")
+
+    def _write_spill_file(self, path: str, key: str, rows: List[Sequence], attempts: int = 0):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key": key, "rows": rows, "attempts": attempts}, f, default=str)
+        os.replace(path + ".tmp", path)
+
+    def _spill_files(self) -> List[str]:
+        if not self.spill_dir or not os.path.isdir(self.spill_dir):
+            return []
+        return sorted(
+            os.path.join(self.spill_dir, name) for name in os.listdir(self.spill_dir) if name.endswith(".json")
+        )
+
+    def _load_spilled(self) -> List[Tuple[str, int, Batch]]:
+        """(path, failed attempts, batch) of the oldest spill files, up to about flush_rows rows"""
+        spilled, rows = [], 0
+        for path in self._spill_files():
+            if rows >= self.flush_rows:
+                break
+            try:
+                with open(path) as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"{self.name}: setting aside unreadable spill file {path}: {e}")
+                os.replace(path, path[:-len(".json")] + ".failed")
+                continue
+            spilled.append((path, content.get("attempts", 0), (content["key"], content["rows"])))
+            rows += len(content["rows"])
+        return spilled
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(
+                self.stats,
+                blocked_seconds=round(self.stats["blocked_seconds"], 4),
+                buffered_rows=self._rows,
+                pending_batches=len(self._pending),
+                spilled_files=self._spilled,
+                overflow=self.overflow,
+                max_rows=self.max_rows,
+                writer_running=self._thread.is_alive(),
+            )
@@ -1,40 +1,35 @@
 
 import pandas as pd
-from db.init import SessionLocal
-from db.models import VMMetric
+import numpy as np
+from db.storage import from_epoch_ms, get_storage
 from sklearn.ensemble import IsolationForest
 
-def detect_anomalies(vm_id):
-    db = SessionLocal()
-    try:
-        metrics = db.query(VMMetric).filter(VMMetric.vm_id == vm_id).all()
-        if len(metrics) < 10:
-            return []
+def detect_anomalies(vm_id, storage=None):
+    storage = storage or get_storage()
+    series = storage.read_metrics(vm_id)
+    if len(series["timestamp_ms"]) < 10:
+        return []
 
-        # Extract features without pandas
-        features = []
-        for m in metrics:
-            features.append([m.cpu_usage, m.memory_usage, m.disk_io, m.net_io])
-        
-        import numpy as np
-        X = np.array(features)
+    # Feature columns straight from the storage arrays; samples missing a metric are left out
+    X = np.column_stack([series["cpu_usage"], series["memory_usage"], series["disk_io"], series["net_io"]])
+    complete = ~np.isnan(X).any(axis=1)
+    X, timestamps = X[complete], series["timestamp_ms"][complete]
+    if len(X) < 10:
+        return []
 
-        model = IsolationForest(contamination=0.1, random_state=42)
-        anomaly_labels = model.fit_predict(X)
+    model = IsolationForest(contamination=0.1, random_state=42)
+    anomaly_labels = model.fit_predict(X)
 
-        # Return indices and values of anomalies
-        anomalies = []
-        for i, label in enumerate(anomaly_labels):
-            if label == -1:
-                anomalies.append({
-                    "index": i,
-                    "cpu": features[i][0],
-                    "memory": features[i][1],
-                    "disk": features[i][2],
-                    "net": features[i][3],
-                    "timestamp": metrics[i].timestamp.isoformat()
-                })
-        
-        return anomalies
-    finally:
-        db.close()
+    # Return indices and values of anomalies
+    anomalies = []
+    for i in np.flatnonzero(anomaly_labels == -1).tolist():
+        anomalies.append({
+            "index": i,
+            "cpu": float(X[i, 0]),
+            "memory": float(X[i, 1]),
+            "disk": float(X[i, 2]),
+            "net": float(X[i, 3]),
+            "timestamp": from_epoch_ms(timestamps[i]).isoformat()
+        })
+
+    return anomalies
@@ -1,33 +1,26 @@
 
 import pandas as pd
-from db.init import SessionLocal
-from db.models import VMMetric
+from db.storage import get_storage
 from datetime import datetime
 from sklearn.linear_model import LinearRegression
 import numpy as np
 
-def forecast_cpu(vm_id, hours=24):
-    db = SessionLocal()
-    try:
-        metrics = db.query(VMMetric).filter(VMMetric.vm_id == vm_id).order_by(VMMetric.timestamp).all()
-        if len(metrics) < 10:
-            return []
+def forecast_cpu(vm_id, hours=24, storage=None):
+    storage = storage or get_storage()
+    cpu_values = storage.read_metrics(vm_id)["cpu_usage"]
+    cpu_values = cpu_values[~np.isnan(cpu_values)]
+    if len(cpu_values) < 10:
+        return []
 
-        # Simple linear regression without pandas
-        cpu_values = [m.cpu_usage for m in metrics]
-        time_indices = list(range(len(cpu_values)))
-        
-        # Convert to numpy arrays
-        X = np.array(time_indices).reshape(-1, 1)
-        y = np.array(cpu_values)
+    # Simple linear regression without pandas
+    X = np.arange(len(cpu_values)).reshape(-1, 1)
+    y = cpu_values
 
-        model = LinearRegression()
-        model.fit(X, y)
+    model = LinearRegression()
+    model.fit(X, y)
 
-        # Predict future values
-        future_times = np.arange(len(cpu_values), len(cpu_values) + hours).reshape(-1, 1)
-        forecast = model.predict(future_times)
+    # Predict future values
+    future_times = np.arange(len(cpu_values), len(cpu_values) + hours).reshape(-1, 1)
+    forecast = model.predict(future_times)
 
-        return forecast.tolist()
-    finally:
-        db.close()
+    return forecast.tolist()
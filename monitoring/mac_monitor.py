@@ -5,14 +5,20 @@ import subprocess
 import json
 import time
 from datetime import datetime, timezone
-from db.init import get_session
-from db.models import VirtualMachine, VMMetric
+from db.storage import SQLAlchemyStorage, get_storage
+from monitoring.system_sampler import get_system_sampler
 
 class MacSystemMonitor:
     """Monitor Mac system resources and simulate VM data for IROA"""
     
-    def __init__(self):
-        self.session = get_session()
+    def __init__(self, sampler=None, session=None, storage=None):
+        # A SQLAlchemy session pins the monitor to that database (tests)
+        if storage is None:
+            storage = SQLAlchemyStorage(lambda: session) if session is not None else get_storage()
+        self.storage = storage
+        # Readings come from the shared background sampler's latest snapshot
+        self.sampler = sampler or get_system_sampler()
+        self.last_written_sequence = 0
         
     def get_system_info(self):
         """Get basic system information"""
@@ -41,80 +47,50 @@ class MacSystemMonitor:
     
     def get_cpu_usage(self):
         """Get current CPU usage percentage"""
-        return psutil.cpu_percent(interval=1)
+        return self.sampler.latest()['cpu_percent']
     
     def get_memory_usage(self):
         """Get current memory usage percentage"""
-        memory = psutil.virtual_memory()
-        return memory.percent
+        return self.sampler.latest()['memory_percent']
     
     def get_disk_usage(self):
         """Get disk usage for root partition"""
-        disk = psutil.disk_usage('/')
-        return (disk.used / disk.total) * 100
+        return self.sampler.latest()['disk_percent']
     
     def get_network_stats(self):
         """Get network I/O statistics"""
-        net_io = psutil.net_io_counters()
-        return {
-            'bytes_sent': net_io.bytes_sent,
-            'bytes_recv': net_io.bytes_recv,
-            'packets_sent': net_io.packets_sent,
-            'packets_recv': net_io.packets_recv
-        }
+        return dict(self.sampler.latest()['network'])
     
     def get_process_info(self):
         """Get top processes by CPU usage"""
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-            try:
-                proc_info = proc.info
-                cpu_percent = proc_info.get('cpu_percent', 0)
-                if cpu_percent is not None and cpu_percent > 0:
-                    processes.append(proc_info)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
-        
-        # Sort by CPU usage and return top 10
-        return sorted(processes, key=lambda x: x['cpu_percent'], reverse=True)[:10]
+        return list(self.sampler.latest()['processes'])
     
     def create_virtual_vms(self):
         """Create virtual VMs based on running processes to simulate virtualization"""
         processes = self.get_process_info()
         system_info = self.get_system_info()
         
-        # Create or update VM records based on top processes
-        vm_count = 0
+        # Create VM records for the top processes that do not have one yet
+        specs = {}
         for i, proc in enumerate(processes[:5]):  # Top 5 processes as VMs
-            vm_count += 1
-            vm_name = f"mac-vm-{vm_count:02d}-{proc['name'][:10]}"
-            
-            # Check if VM already exists
-            existing_vm = self.session.query(VirtualMachine).filter_by(name=vm_name).first()
-            
-            if not existing_vm:
-                vm = VirtualMachine(
-                    name=vm_name,
-                    cluster=f"Mac-Cluster-{system_info['model'][:10]}",
-                    host=system_info['model'],
-                    cpu_cores=max(1, int(psutil.cpu_count() * (proc['cpu_percent'] / 100))),
-                    memory_gb=max(1, int(8 * (proc['memory_percent'] / 100))),  # Assume 8GB base
-                    status='running' if proc['cpu_percent'] > 1 else 'idle'
-                )
-                self.session.add(vm)
-                self.session.commit()
-                print(f"Created VM: {vm_name}")
-            else:
-                # Update existing VM status
-                existing_vm.status = 'running' if proc['cpu_percent'] > 1 else 'idle'
-                self.session.commit()
+            vm_name = f"mac-vm-{i + 1:02d}-{proc['name'][:10]}"
+            specs[vm_name] = {
+                "cluster": f"Mac-Cluster-{system_info['model'][:10]}",
+                "cpu_cores": max(1, int(psutil.cpu_count() * (proc['cpu_percent'] / 100))),
+                "memory_gb": max(1, int(8 * (proc['memory_percent'] / 100)))  # Assume 8GB base
+            }
+        for vm_name in self.storage.resolve_vms(specs)["created"]:
+            print(f"Created VM: {vm_name}")
     
     def collect_metrics(self):
-        """Collect current system metrics and store as VM metrics"""
-        cpu_usage = self.get_cpu_usage()
-        memory_usage = self.get_memory_usage()
-        disk_usage = self.get_disk_usage()
-        network = self.get_network_stats()
+        """Store every sample taken since the last call as VM metrics in one batch"""
+        samples = self.sampler.window(self.last_written_sequence)
+        # Without a new sample the latest one is only reported, it is already stored
+        latest = samples[-1] if samples else self.sampler.latest()
+        cpu_usage = latest['cpu_percent']
+        memory_usage = latest['memory_percent']
+        disk_usage = latest['disk_percent']
+        network = latest['network']
         
         print("🖥️  Mac System Metrics:")
         print(f"   CPU Usage: {cpu_usage:.1f}%")
@@ -123,27 +99,27 @@ class MacSystemMonitor:
         print(f"   Network: {network['bytes_sent']//1024//1024}MB sent, {network['bytes_recv']//1024//1024}MB received")
         
         # Get all VMs and create metrics for them
-        vms = self.session.query(VirtualMachine).all()
+        vms = self.storage.list_vms()
         
-        for vm in vms:
-            # Simulate VM-specific metrics based on system load
-            vm_cpu = min(100, cpu_usage + (hash(vm.name) % 20 - 10))  # Add some variance
-            vm_memory = min(100, memory_usage + (hash(vm.name) % 15 - 7))
-            vm_disk = min(100, disk_usage + (hash(vm.name) % 10 - 5))
-            
-            metric = VMMetric(
-                vm_id=vm.id,
-                timestamp=datetime.now(timezone.utc),
-                cpu_usage=max(0, vm_cpu),
-                memory_usage=max(0, vm_memory),
-                disk_io=max(0, vm_disk),  # Use disk_io instead of disk_usage
-                net_io=(network['bytes_recv'] + network['bytes_sent']) // len(vms)  # Combined network I/O
-            )
-            
-            self.session.add(metric)
+        rows = []
+        for sample in samples:
+            sample_net = sample['network']
+            for vm in vms:
+                # Simulate VM-specific metrics based on system load
+                variance = hash(vm['name'])
+                rows.append({
+                    'vm_id': vm['id'],
+                    'timestamp': sample['timestamp'],
+                    'cpu_usage': max(0, min(100, sample['cpu_percent'] + (variance % 20 - 10))),  # Add some variance
+                    'memory_usage': max(0, min(100, sample['memory_percent'] + (variance % 15 - 7))),
+                    'disk_io': max(0, min(100, sample['disk_percent'] + (variance % 10 - 5))),  # Use disk_io instead of disk_usage
+                    'net_io': (sample_net['bytes_recv'] + sample_net['bytes_sent']) // len(vms)  # Combined network I/O
+                })
         
-        self.session.commit()
-        print(f"📊 Stored metrics for {len(vms)} VMs")
+        if rows:
+            self.storage.write_metrics(rows)
+        self.last_written_sequence = latest['sequence']
+        print(f"📊 Stored {len(rows)} metrics for {len(vms)} VMs from {len(samples)} samples")
         
         return {
             'timestamp': datetime.now(timezone.utc).isoformat(),
@@ -151,6 +127,8 @@ class MacSystemMonitor:
             'system_memory': memory_usage,
             'system_disk': disk_usage,
             'vm_count': len(vms),
+            'samples': len(samples),
+            'rows': len(rows),
             'network': network
         }
     
@@ -169,8 +147,6 @@ class MacSystemMonitor:
                 
         except KeyboardInterrupt:
             print("\n🛑 Monitoring stopped by user")
-        finally:
-            self.session.close()
 
 def main():
     """Main function to run the Mac monitor"""
@@ -0,0 +1,177 @@
+"""
+Asyncio Prometheus Client
+Non-blocking instant and range queries over one shared connection pool
+"""
+
+import asyncio
+import json
+import logging
+from array import array
+from typing import Dict, List, Optional, Any, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 15.0
+# Range queries are split into windows of this size and fetched in parallel
+DEFAULT_CHUNK_SECONDS = 6 * 3600
+
+
+class RangeSeries:
+    """One range series held as compact float arrays instead of JSON lists"""
+
+    __slots__ = ("metric", "timestamps", "values")
+
+    def __init__(self, metric: Dict[str, str]):
+        self.metric = metric
+        self.timestamps = array("d")
+        self.values = array("d")
+
+    def __len__(self):
+        return len(self.values)
+
+    def extend(self, other: "RangeSeries"):
+        self.timestamps.extend(other.timestamps)
+        self.values.extend(other.values)
+
+    def to_matrix_entry(self) -> Dict[str, Any]:
+        """Prometheus API shape: {"metric": ..., "values": [[ts, "value"], ...]}"""
+        return {
+            "metric": self.metric,
+            "values": [[ts, repr(value)] for ts, value in zip(self.timestamps, self.values)]
+        }
+
+
+def _series_key(metric: Dict[str, str]) -> Tuple:
+    return tuple(sorted(metric.items()))
+
+
+def parse_matrix(body: bytes) -> Dict[Tuple, RangeSeries]:
+    """Reduce one query_range response to compact per-series arrays.
+
+    The decoded JSON of a chunk is dropped as soon as its samples are copied,
+    so at most one window per in-flight request is held as Python objects.
+    """
+    payload = json.loads(body)
+    if payload.get("status") != "success":
+        raise ValueError(payload.get("error", "query_range failed"))
+
+    series = {}
+    for entry in payload["data"]["result"]:
+        parsed = RangeSeries(entry.get("metric", {}))
+        for ts, value in entry.get("values", []):
+            try:
+                parsed.values.append(float(value))
+            except ValueError:
+                continue
+            parsed.timestamps.append(float(ts))
+        series[_series_key(parsed.metric)] = parsed
+    return series
+
+
+def split_range(start: int, end: int, step: int, chunk_seconds: int) -> List[Tuple[int, int]]:
+    """Step-aligned, non-overlapping [start, end] windows covering the range"""
+    points_per_chunk = max(1, chunk_seconds // step)
+    span = points_per_chunk * step
+    windows = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + span - step, end)
+        windows.append((window_start, window_end))
+        window_start = window_end + step
+    return windows
+
+
+class AsyncPrometheusClient:
+    """Prometheus HTTP API client for use inside the FastAPI event loop.
+
+    All requests share one httpx.AsyncClient connection pool and a semaphore
+    caps how many are in flight at once.
+    """
+
+    def __init__(self, base_url: str, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport
+        )
+        self.requests = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        async with self.semaphore:
+            self.requests += 1
+            response = await self.client.get(path, params=params)
+        response.raise_for_status()
+        return response
+
+    async def healthy(self) -> bool:
+        try:
+            await self._get("/-/healthy")
+            return True
+        except httpx.HTTPError as e:
+            logger.warning(f"Prometheus health check failed: {e}")
+            return False
+
+    async def query(self, query: str) -> List[Dict]:
+        response = await self._get("/api/v1/query", {"query": query})
+        return response.json().get("data", {}).get("result", [])
+
+    async def query_range(self, query: str, start: int, end: int, step: int = 300,
+                          chunk_seconds: int = DEFAULT_CHUNK_SECONDS) -> List[RangeSeries]:
+        """Range query fetched as parallel time-window chunks and merged per series"""
+        windows = split_range(start, end, step, chunk_seconds)
+
+        async def fetch(window):
+            response = await self._get("/api/v1/query_range", {
+                "query": query, "start": window[0], "end": window[1], "step": step
+            })
+            return parse_matrix(response.content)
+
+        chunks = await asyncio.gather(*(fetch(window) for window in windows))
+
+        merged: Dict[Tuple, RangeSeries] = {}
+        for chunk in chunks:  # gather keeps window order, so samples stay sorted
+            for key, series in chunk.items():
+                if key in merged:
+                    merged[key].extend(series)
+                else:
+                    merged[key] = series
+        return list(merged.values())
+
+    async def query_many(self, queries: Dict[str, str]) -> Dict[str, List[Dict]]:
+        """Run named instant queries concurrently; failed queries yield []"""
+        async def run(name, query):
+            try:
+                return name, await self.query(query)
+            except Exception as e:
+                logger.warning(f"Prometheus query {name} failed: {e}")
+                return name, []
+
+        return dict(await asyncio.gather(*(run(name, query) for name, query in queries.items())))
+
+    async def query_range_many(self, queries: Dict[str, str], start: int, end: int, step: int = 300,
+                               chunk_seconds: int = DEFAULT_CHUNK_SECONDS) -> Dict[str, List[RangeSeries]]:
+        """Run named range queries concurrently; failed queries yield []"""
+        async def run(name, query):
+            try:
+                return name, await self.query_range(query, start, end, step, chunk_seconds)
+            except Exception as e:
+                logger.warning(f"Prometheus range query {name} failed: {e}")
+                return name, []
+
+        return dict(await asyncio.gather(*(run(name, query) for name, query in queries.items())))
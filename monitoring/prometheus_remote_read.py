@@ -0,0 +1,411 @@
+"""
+Prometheus Remote-Read Backfill
+Fetches raw samples through /api/v1/read (snappy-compressed protobuf) and
+bulk-loads them into vm_metrics_history, one resumable time window at a time
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import struct
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+
+import numpy as np
+import requests
+
+from db.migrations import migrate
+from db.partitions import PartitionedTables, from_epoch_ms, to_epoch_ms
+from db.sqlite_pool import get_pool
+
+try:
+    import snappy as _snappy
+except ImportError:  # python-snappy is optional, the pure-Python codec is used instead
+    _snappy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_SECONDS = 3600
+
+# Column -> selector mapping used when the integration config has none.
+# Remote read returns stored series only, so these are node-exporter
+# recording rules holding 0..1 ratios (scaled to percent).
+DEFAULT_SELECTORS = [
+    {"column": "cpu_usage_percent", "selector": "instance:node_cpu_utilisation:rate5m", "scale": 100},
+    {"column": "memory_usage_percent", "selector": "instance:node_memory_utilisation:ratio", "scale": 100},
+]
+
+HISTORY_COLUMNS = (
+    "cpu_usage_percent", "memory_usage_percent", "storage_usage_gb", "network_rx_mbps", "network_tx_mbps"
+)
+
+# Order of the rows built by window_rows()
+BACKFILL_COLUMNS = (
+    "vm_id", "vm_name", "cluster_name", "cpu_usage_percent", "memory_usage_percent",
+    "storage_usage_gb", "network_rx_mbps", "network_tx_mbps",
+    "power_state", "vm_status", "metric_timestamp", "metric_ts_ms"
+)
+
+# ----------------------------------------------------------------------
+# Snappy block format
+# ----------------------------------------------------------------------
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    value &= 0xFFFFFFFFFFFFFFFF
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def snappy_compress(data: bytes) -> bytes:
+    if _snappy is not None:
+        return _snappy.compress(data)
+    # Literal-only encoding: valid snappy, just not smaller
+    out = bytearray(_varint(len(data)))
+    for i in range(0, len(data), 65536):
+        chunk = data[i:i + 65536]
+        n = len(chunk) - 1
+        if n < 60:
+            out.append(n << 2)
+        elif n < 256:
+            out += bytes((60 << 2, n))
+        else:
+            out.append(61 << 2)
+            out += n.to_bytes(2, "little")
+        out += chunk
+    return bytes(out)
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    if _snappy is not None:
+        return _snappy.uncompress(data)
+    length, pos = _read_varint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            n = tag >> 2
+            if n >= 60:
+                extra = n - 59
+                n = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            n += 1
+            out += data[pos:pos + n]
+            pos += n
+            continue
+        if kind == 1:
+            n = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif kind == 2:
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 2], "little")
+            pos += 2
+        else:
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(data[pos:pos + 4], "little")
+            pos += 4
+        start = len(out) - offset
+        if offset >= n:
+            out += out[start:start + n]
+        else:  # overlapping copy repeats the last `offset` bytes
+            for i in range(n):
+                out.append(out[start + i])
+    if len(out) != length:
+        raise ValueError(f"snappy: expected {length} bytes, got {len(out)}")
+    return bytes(out)
+
+# ----------------------------------------------------------------------
+# Remote-read protobuf messages (prompb), hand-encoded
+# ----------------------------------------------------------------------
+
+MATCH_TYPES = {"=": 0, "!=": 1, "=~": 2, "!~": 3}
+
+_SELECTOR_RE = re.compile(r'^\s*([a-zA-Z_:][a-zA-Z0-9_:]*)?\s*(?:\{(.*)\})?\s*$')
+_MATCHER_RE = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*"((?:[^"\\]|\\.)*)"\s*,?')
+
+
+def parse_selector(selector: str) -> List[Tuple[int, str, str]]:
+    """metric{label="value",other=~"re.*"} -> [(match type, name, value), ...]"""
+    match = _SELECTOR_RE.match(selector)
+    if not match:
+        raise ValueError(f"Invalid series selector: {selector}")
+    name, body = match.groups()
+    matchers = [(MATCH_TYPES["="], "__name__", name)] if name else []
+    body = body or ""
+    pos = 0
+    while pos < len(body):
+        part = _MATCHER_RE.match(body, pos)
+        if not part:
+            raise ValueError(f"Invalid label matcher in selector: {selector}")
+        label, op, value = part.groups()
+        matchers.append((MATCH_TYPES[op], label, value.encode().decode("unicode_escape")))
+        pos = part.end()
+    if not matchers:
+        raise ValueError(f"Empty series selector: {selector}")
+    return matchers
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def encode_read_request(queries: List[Tuple[int, int, List[Tuple[int, str, str]]]]) -> bytes:
+    """ReadRequest with one Query per (start_ms, end_ms, matchers); SAMPLES responses"""
+    body = bytearray()
+    for start_ms, end_ms, matchers in queries:
+        query = bytearray(_varint(1 << 3) + _varint(start_ms) + _varint(2 << 3) + _varint(end_ms))
+        for match_type, name, value in matchers:
+            matcher = _varint(1 << 3) + _varint(match_type) + _field(2, name.encode()) + _field(3, value.encode())
+            query += _field(3, matcher)
+        body += _field(1, bytes(query))
+    body += _varint(2 << 3) + _varint(0)  # accepted_response_types: SAMPLES
+    return bytes(body)
+
+
+def _iter_fields(buf, start: int, end: int) -> Iterator[Tuple[int, int, Any]]:
+    """Yield (field number, wire type, value); length-delimited values are (start, end) spans"""
+    pos = start
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, wire_type, value
+
+
+def _decode_series(buf, start: int, end: int) -> Tuple[Dict[str, str], np.ndarray, np.ndarray]:
+    labels = {}
+    sample_spans = []
+    for number, _, span in _iter_fields(buf, start, end):
+        if number == 1:
+            label = {}
+            for field, _, (s, e) in _iter_fields(buf, *span):
+                label[field] = bytes(buf[s:e]).decode()
+            labels[label.get(1, "")] = label.get(2, "")
+        elif number == 2:
+            sample_spans.append(span)
+
+    timestamps = np.empty(len(sample_spans), dtype=np.int64)
+    values = np.empty(len(sample_spans), dtype=np.float64)
+    for i, (s, e) in enumerate(sample_spans):
+        value, ts = 0.0, 0
+        for field, _, raw in _iter_fields(buf, s, e):
+            if field == 1:
+                value = struct.unpack("<d", raw)[0]
+            elif field == 2:
+                ts = raw - (1 << 64) if raw >= (1 << 63) else raw
+        timestamps[i] = ts
+        values[i] = value
+    return labels, timestamps, values
+
+
+def iter_read_response(buf: bytes) -> Iterator[Tuple[int, Dict[str, str], np.ndarray, np.ndarray]]:
+    """Decode a ReadResponse series by series: (query index, labels, ts_ms, values)"""
+    view = memoryview(buf)
+    query_index = 0
+    for number, _, span in _iter_fields(view, 0, len(view)):
+        if number != 1:
+            continue
+        for field, _, series_span in _iter_fields(view, *span):
+            if field == 1:
+                labels, timestamps, values = _decode_series(view, *series_span)
+                yield query_index, labels, timestamps, values
+        query_index += 1
+
+# ----------------------------------------------------------------------
+# Backfill
+# ----------------------------------------------------------------------
+
+class RemoteReadBackfill:
+    """Backfill vm_metrics_history from Prometheus remote read.
+
+    The range is processed in fixed, epoch-aligned windows. A window's
+    progress row records the part of it already loaded ([window_start_ms,
+    window_end_ms], found by its aligned start), and commits in one
+    transaction with that part's rows. Runs only fetch what no earlier run
+    covered, so an interrupted backfill resumes at the first incomplete
+    window, a run over a different range loads nothing twice and a window
+    cut short by the end of a run is completed by a later one.
+    """
+
+    def __init__(self, base_url: str, selectors: Optional[List[Dict[str, Any]]] = None,
+                 db_path: str = "database/iroa.db", window_seconds: int = DEFAULT_WINDOW_SECONDS,
+                 instance_label: str = "instance", cluster_label: str = "cluster",
+                 session: Optional[requests.Session] = None, timeout: float = 60.0):
+        self.read_url = base_url.rstrip("/") + "/api/v1/read"
+        self.selectors = selectors or DEFAULT_SELECTORS
+        for entry in self.selectors:
+            if entry["column"] not in HISTORY_COLUMNS:
+                raise ValueError(f"Unsupported vm_metrics_history column: {entry['column']}")
+        self.matchers = [parse_selector(entry["selector"]) for entry in self.selectors]
+        self.db_path = db_path
+        self.window_ms = window_seconds * 1000
+        self.instance_label = instance_label
+        self.cluster_label = cluster_label
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.partitions = PartitionedTables()
+        self.job_key = hashlib.sha1(
+            json.dumps([self.read_url, self.selectors, self.window_ms], sort_keys=True).encode()
+        ).hexdigest()[:16]
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        migrate(self.db_path, "metrics")
+
+    def windows(self, start_ms: int, end_ms: int) -> List[Tuple[int, int]]:
+        """Epoch-aligned [start, end] windows overlapping [start_ms, end_ms]"""
+        first = start_ms - start_ms % self.window_ms
+        return [(ws, ws + self.window_ms - 1) for ws in range(first, end_ms + 1, self.window_ms)]
+
+    def coverage(self, conn: sqlite3.Connection) -> Dict[int, Tuple[int, int, int, int]]:
+        """(loaded from, loaded to, samples, rows) per aligned window start"""
+        rows = conn.execute(
+            "SELECT window_start_ms, window_end_ms, samples, rows_loaded "
+            "FROM prometheus_backfill_progress WHERE job_key = ?",
+            (self.job_key,)
+        ).fetchall()
+        return {row[0] - row[0] % self.window_ms: tuple(row) for row in rows}
+
+    def fetch_window(self, start_ms: int, end_ms: int) -> bytes:
+        body = snappy_compress(encode_read_request([(start_ms, end_ms, m) for m in self.matchers]))
+        response = self.session.post(self.read_url, data=body, timeout=self.timeout, headers={
+            "Content-Type": "application/x-protobuf",
+            "Content-Encoding": "snappy",
+            "X-Prometheus-Remote-Read-Version": "0.1.0",
+        })
+        response.raise_for_status()
+        return snappy_decompress(response.content)
+
+    def window_rows(self, payload: bytes) -> Tuple[List[Tuple], int]:
+        """Align all selectors per instance on sample timestamps -> history rows"""
+        per_instance: Dict[str, Dict[str, Any]] = {}
+        samples = 0
+        for query_index, labels, timestamps, values in iter_read_response(payload):
+            samples += len(timestamps)
+            entry = self.selectors[query_index]
+            instance = labels.get(self.instance_label) or labels.get("__name__", "unknown")
+            target = per_instance.setdefault(instance, {"cluster": labels.get(self.cluster_label), "columns": {}})
+            target["columns"].setdefault(entry["column"], []).append(
+                (timestamps, values * entry.get("scale", 1))
+            )
+
+        rows = []
+        for instance, target in per_instance.items():
+            columns = {
+                column: (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+                for column, parts in target["columns"].items()
+            }
+            all_ts = np.unique(np.concatenate([ts for ts, _ in columns.values()]))
+            aligned = {}
+            for column, (ts, vals) in columns.items():
+                order = np.argsort(ts, kind="stable")
+                ts, vals = ts[order], vals[order]
+                idx = np.clip(np.searchsorted(ts, all_ts), 0, len(ts) - 1)
+                aligned[column] = np.where(ts[idx] == all_ts, vals[idx], 0.0)
+
+            cluster = target["cluster"] or "prometheus"
+            for i, ts in enumerate(all_ts.tolist()):
+                row = {column: float(aligned[column][i]) for column in aligned}
+                rows.append((
+                    instance, instance, cluster,
+                    row.get("cpu_usage_percent", 0.0), row.get("memory_usage_percent", 0.0),
+                    row.get("storage_usage_gb", 0.0), row.get("network_rx_mbps", 0.0),
+                    row.get("network_tx_mbps", 0.0), "poweredOn", "running",
+                    from_epoch_ms(ts).isoformat(), int(ts)
+                ))
+        return rows, samples
+
+    def run(self, start: datetime, end: datetime) -> Dict[str, Any]:
+        """Backfill [start, end] (naive times are UTC); windows completed by earlier runs are skipped"""
+        started = time.perf_counter()
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        stats = {"job_key": self.job_key, "windows": 0, "skipped": 0, "samples": 0, "rows": 0, "status": "success"}
+
+        pool = get_pool(self.db_path)
+        try:
+            with pool.reader() as conn:
+                coverage = self.coverage(conn)
+            for window_start, window_end in self.windows(start_ms, end_ms):
+                wanted = (max(window_start, start_ms), min(window_end, end_ms))
+                loaded = coverage.get(window_start)
+                if loaded is None:
+                    covered, samples, loaded_rows = wanted, 0, 0
+                    gaps = [wanted]
+                else:
+                    # Whatever lies between the loaded part and the requested
+                    # one is fetched too, so the loaded part stays one range
+                    covered = (min(wanted[0], loaded[0]), max(wanted[1], loaded[1]))
+                    samples, loaded_rows = loaded[2], loaded[3]
+                    gaps = [(covered[0], loaded[0] - 1), (loaded[1] + 1, covered[1])]
+                gaps = [(gap_start, gap_end) for gap_start, gap_end in gaps if gap_start <= gap_end]
+                if not gaps:
+                    stats["skipped"] += 1
+                    continue
+
+                rows, fetched = [], 0
+                for gap_start, gap_end in gaps:
+                    gap_rows, gap_samples = self.window_rows(self.fetch_window(gap_start, gap_end))
+                    rows += gap_rows
+                    fetched += gap_samples
+                samples += fetched
+                # Hold the shared writer only for the insert, not the fetch
+                with pool.writer() as conn:
+                    self.partitions.insert(conn, "vm_metrics_history", BACKFILL_COLUMNS, rows)
+                    conn.execute(
+                        "DELETE FROM prometheus_backfill_progress "
+                        "WHERE job_key = ? AND window_start_ms BETWEEN ? AND ?",
+                        (self.job_key, window_start, window_end)
+                    )
+                    conn.execute(
+                        "INSERT INTO prometheus_backfill_progress "
+                        "(job_key, window_start_ms, window_end_ms, samples, rows_loaded) VALUES (?, ?, ?, ?, ?)",
+                        (self.job_key, covered[0], covered[1], samples, loaded_rows + len(rows))
+                    )
+                coverage[window_start] = (covered[0], covered[1], samples, loaded_rows + len(rows))
+                stats["windows"] += 1
+                stats["samples"] += fetched
+                stats["rows"] += len(rows)
+        except Exception as e:
+            logger.error(f"Remote-read backfill stopped: {e}")
+            stats["status"] = "error"
+            stats["error"] = str(e)
+
+        elapsed = time.perf_counter() - started
+        stats["duration_seconds"] = round(elapsed, 3)
+        stats["samples_per_sec"] = round(stats["samples"] / elapsed, 1) if elapsed > 0 else 0.0
+        return stats
@@ -0,0 +1,235 @@
+"""
+Collection Scheduler
+Runs each configured integration on its own interval inside the API event loop
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 300
+DEFAULT_JITTER_RATIO = 0.1
+# A source whose runs take longer than interval / BACKPRESSURE_UTILIZATION is
+# slowed down so it never occupies more than that share of the wall clock
+BACKPRESSURE_UTILIZATION = 0.8
+MAX_BACKOFF_SECONDS = 3600
+CONFIG_REFRESH_SECONDS = 60
+
+JobFactory = Callable[[], Awaitable[Any]]
+
+
+class SourceState:
+    """Schedule and timing statistics for one integration"""
+
+    def __init__(self, name: str, job: JobFactory, interval: float, lock: Optional[asyncio.Lock] = None):
+        self.name = name
+        self.job = job
+        self.interval = interval
+        self.effective_interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.lock = lock or asyncio.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.skipped_overlaps = 0
+        self.behind = 0
+        self.last_started: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.avg_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.last_lag = 0.0
+        self.last_error: Optional[str] = None
+        self.next_run_at: Optional[float] = None
+
+    def record(self, duration: float, error: Optional[str]):
+        self.runs += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        # Exponentially weighted so a slow outlier does not stick forever
+        self.avg_duration = duration if self.avg_duration is None else 0.7 * self.avg_duration + 0.3 * duration
+        if error:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+        else:
+            self.consecutive_failures = 0
+            self.last_error = None
+
+    def next_interval(self) -> float:
+        """Configured interval, stretched when runs fall behind or keep failing"""
+        interval = self.interval
+        if self.avg_duration and self.avg_duration > interval * BACKPRESSURE_UTILIZATION:
+            interval = self.avg_duration / BACKPRESSURE_UTILIZATION
+            self.behind += 1
+        if self.consecutive_failures:
+            interval = interval * (2 ** min(self.consecutive_failures, 6))
+        self.effective_interval = min(interval, max(MAX_BACKOFF_SECONDS, self.interval))
+        return self.effective_interval
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "effective_interval_seconds": round(self.effective_interval, 1),
+            "running": self.lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "skipped_overlaps": self.skipped_overlaps,
+            "backpressure_events": self.behind,
+            "last_started": self.last_started,
+            "last_duration_seconds": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "avg_duration_seconds": round(self.avg_duration, 3) if self.avg_duration is not None else None,
+            "max_duration_seconds": round(self.max_duration, 3),
+            "last_start_lag_seconds": round(self.last_lag, 3),
+            "last_error": self.last_error,
+            "next_run_in_seconds": round(max(0.0, self.next_run_at - time.monotonic()), 1)
+            if self.next_run_at else None
+        }
+
+
+class CollectionScheduler:
+    """Per-source asyncio loops with jitter, no overlap and backpressure.
+
+    `load_config` returns the integrations.json dict; `jobs` maps an
+    integration name to a factory returning the coroutine to run. Jobs are
+    run in a worker thread with their own event loop so blocking SDK calls
+    inside them never stall API request handling.
+
+    `locks` maps a source name to the lock held while it runs. Pass the
+    dict the API's manual sync routes lock as well: a job runs off the
+    event loop, so that lock is all that keeps it from racing a manual sync
+    of the same source over shared trackers and caches.
+    """
+
+    def __init__(self, jobs: Dict[str, JobFactory], load_config: Callable[[], Dict],
+                 max_concurrent_jobs: int = 4, run_in_thread: bool = True,
+                 source_config: Optional[Callable[[Dict, str], Optional[Dict]]] = None,
+                 locks: Optional[Dict[str, asyncio.Lock]] = None):
+        self.jobs = jobs
+        self.load_config = load_config
+        # Integration config for a source, or None when it is not configured
+        self.source_config = source_config or (lambda config, name: config.get(name))
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.run_in_thread = run_in_thread
+        self.locks = locks if locks is not None else {}
+        self.sources: Dict[str, SourceState] = {}
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.supervisor: Optional[asyncio.Task] = None
+        self.started_at: Optional[str] = None
+        self._config: Dict = {}
+
+    def _settings(self, config: Dict) -> Dict[str, Any]:
+        return config.get("scheduler", {})
+
+    def _interval(self, config: Dict, name: str) -> float:
+        integration = self.source_config(config, name)
+        integration = integration if isinstance(integration, dict) else {}
+        default = self._settings(config).get("default_interval_seconds", DEFAULT_INTERVAL_SECONDS)
+        return float(integration.get("collection_interval_seconds", default))
+
+    def _jitter(self, interval: float) -> float:
+        ratio = self._settings(self._config).get("jitter_ratio", DEFAULT_JITTER_RATIO)
+        return random.uniform(-ratio, ratio) * interval
+
+    def refresh_sources(self):
+        """Start loops for newly configured integrations, stop removed ones"""
+        self._config = self.load_config()
+        wanted = set()
+        for name in self.jobs:
+            integration = self.source_config(self._config, name)
+            if integration and (not isinstance(integration, dict) or integration.get("collection_enabled", True)):
+                wanted.add(name)
+        for name in list(self.sources):
+            if name not in wanted:
+                self.sources.pop(name).task.cancel()
+                logger.info(f"Scheduler: stopped {name} collection")
+        for name in wanted:
+            interval = self._interval(self._config, name)
+            state = self.sources.get(name)
+            if state is None:
+                if name not in self.locks:
+                    self.locks[name] = asyncio.Lock()
+                state = SourceState(name, self.jobs[name], interval, self.locks[name])
+                state.task = asyncio.create_task(self._source_loop(state))
+                self.sources[name] = state
+                logger.info(f"Scheduler: collecting {name} every {interval:.0f}s")
+            else:
+                state.interval = interval
+
+    async def start(self):
+        if self.supervisor is not None:
+            return
+        self.semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        self.started_at = datetime.now().isoformat()
+        self.refresh_sources()
+        self.supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        tasks = [state.task for state in self.sources.values()]
+        if self.supervisor is not None:
+            tasks.append(self.supervisor)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.sources.clear()
+        self.supervisor = None
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(CONFIG_REFRESH_SECONDS)
+            try:
+                self.refresh_sources()
+            except Exception as e:
+                logger.error(f"Scheduler: config refresh failed: {e}")
+
+    async def _source_loop(self, state: SourceState):
+        # Spread the first runs so all sources do not fire together
+        delay = random.uniform(0, self._settings(self._config).get("jitter_ratio", DEFAULT_JITTER_RATIO) * state.interval)
+        while True:
+            state.next_run_at = time.monotonic() + delay
+            await asyncio.sleep(delay)
+            await self.run_now(state.name, scheduled_at=state.next_run_at)
+            interval = state.next_interval()
+            delay = max(0.0, interval + self._jitter(interval))
+
+    async def _execute(self, job: JobFactory):
+        if self.run_in_thread:
+            return await asyncio.to_thread(lambda: asyncio.run(job()))
+        return await job()
+
+    async def run_now(self, name: str, scheduled_at: Optional[float] = None) -> bool:
+        """Run one collection; returns False when a run of that source is still active"""
+        state = self.sources.get(name)
+        if state is None:
+            raise KeyError(name)
+        if state.lock.locked():
+            state.skipped_overlaps += 1
+            return False
+        async with state.lock:
+            async with self.semaphore:
+                started = time.monotonic()
+                state.last_lag = started - scheduled_at if scheduled_at else 0.0
+                state.last_started = datetime.now().isoformat()
+                error = None
+                try:
+                    await self._execute(state.job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    error = getattr(e, "detail", None) or str(e) or type(e).__name__
+                    logger.warning(f"Scheduler: {name} collection failed: {error}")
+                state.record(time.monotonic() - started, error)
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.supervisor is not None,
+            "started_at": self.started_at,
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "sources": {name: state.to_dict() for name, state in self.sources.items()}
+        }
@@ -1,31 +1,115 @@
-
-from db.init import SessionLocal
-from db.models import VMMetric, VirtualMachine
+from db.storage import SQLAlchemyStorage, get_storage
 from datetime import datetime
+import time
+import weakref
+
+# In-process name -> vm_id caches, one per storage backend: ids from one
+# database are never handed out for another
+_vm_id_caches = weakref.WeakKeyDictionary()
+
+# One SQLAlchemyStorage per session factory, so its cache outlives a scrape
+_factory_storages = weakref.WeakKeyDictionary()
+
+def storage_for(session_factory=None):
+    """Backend for a session factory (reused across calls), or get_storage()"""
+    if session_factory is None:
+        return get_storage()
+    storage = _factory_storages.get(session_factory)
+    if storage is None:
+        storage = _factory_storages[session_factory] = SQLAlchemyStorage(session_factory)
+    return storage
+
+def store_metrics(metrics, storage=None):
+    """Store metrics; kept for older callers, same path as store_metrics_bulk()"""
+    return store_metrics_bulk(metrics, storage=storage)
+
+def resolve_vm_ids(storage, names, vm_spec=None):
+    """Map VM names to ids, creating missing VMs in one set-based insert.
+
+    Returns (name -> id mapping, names created, cache hits). The backend's
+    cache is not touched here so a failed write cannot poison it; callers
+    publish the mapping with _remember_vm_ids() once the metrics are stored.
+    """
+    cache = _vm_id_caches.get(storage, {})
+    resolved = {}
+    misses = []
+    for name in names:
+        vm_id = cache.get(name)
+        if vm_id is None:
+            misses.append(name)
+        else:
+            resolved[name] = vm_id
+    cache_hits = len(resolved)
+
+    created = []
+    if misses:
+        # One lookup (and at most one insert) for everything the cache did not know about
+        result = storage.resolve_vms({name: vm_spec for name in misses})
+        resolved.update(result["ids"])
+        created = result["created"]
+
+    return resolved, created, cache_hits
+
+def _remember_vm_ids(storage, mapping):
+    _vm_id_caches.setdefault(storage, {}).update(mapping)
+
+def clear_vm_id_cache(storage=None):
+    """Drop the in-process name -> vm_id cache of one backend, or of all (e.g. after VMs are deleted)"""
+    if storage is None:
+        _vm_id_caches.clear()
+    else:
+        _vm_id_caches.pop(storage, None)
+
+def store_metrics_bulk(metrics, session_factory=None, vm_spec=None, storage=None):
+    """Store a scrape worth of metrics through the storage backend.
+
+    VM ids come from the backend's in-process cache, unknown VMs are created with one
+    multi-row INSERT and every sample goes out in one bulk write (COPY on
+    PostgreSQL). storage defaults to get_storage(); a session_factory wraps
+    a SQLAlchemy database instead. Returns ingest statistics including rows/sec.
+    """
+    started = time.perf_counter()
+    stats = {
+        "rows": 0,
+        "vms_created": 0,
+        "cache_hits": 0,
+        "duration_seconds": 0.0,
+        "rows_per_sec": 0.0,
+        "status": "success"
+    }
+    if not metrics:
+        return stats
 
-def store_metrics(metrics):
-    db = SessionLocal()
     try:
-        for metric in metrics:
-            vm = db.query(VirtualMachine).filter(VirtualMachine.name == metric['instance']).first()
-            if not vm:
-                vm = VirtualMachine(name=metric['instance'], cluster="default", cpu_cores=4, memory_gb=8, disk_gb=100)
-                db.add(vm)
-                db.commit()
-                db.refresh(vm)
-
-            vm_metric = VMMetric(
-                vm_id=vm.id,
-                cpu_usage=metric.get("cpu_usage", 0.0),
-                memory_usage=metric.get("memory_usage", 0.0),
-                disk_io=metric.get("disk_io", 0.0),
-                net_io=metric.get("net_io", 0.0),
-                timestamp=metric["timestamp"]
-            )
-            db.add(vm_metric)
-        db.commit()
+        if storage is None:
+            storage = storage_for(session_factory)
+        names = list(dict.fromkeys(metric['instance'] for metric in metrics))
+        vm_ids, created, cache_hits = resolve_vm_ids(storage, names, vm_spec)
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                "vm_id": vm_ids[metric['instance']],
+                "cpu_usage": metric.get("cpu_usage", 0.0),
+                "memory_usage": metric.get("memory_usage", 0.0),
+                "disk_io": metric.get("disk_io", 0.0),
+                "net_io": metric.get("net_io", 0.0),
+                "timestamp": metric.get("timestamp") or now
+            }
+            for metric in metrics
+        ]
+        storage.write_metrics(rows)
+        _remember_vm_ids(storage, vm_ids)
+
+        stats["rows"] = len(rows)
+        stats["vms_created"] = len(created)
+        stats["cache_hits"] = cache_hits
     except Exception as e:
-        print(f"[!] Error storing metrics: {e}")
-        db.rollback()
-    finally:
-        db.close()
+        print(f"[!] Error bulk storing metrics: {e}")
+        stats["status"] = "error"
+        stats["error"] = str(e)
+
+    elapsed = time.perf_counter() - started
+    stats["duration_seconds"] = round(elapsed, 4)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
@@ -0,0 +1,188 @@
+"""
+System Sampler
+Background thread that samples local CPU, memory, disk, network and top
+processes at a fixed cadence into a ring buffer, so readers never block on
+psutil.cpu_percent(interval=...)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 5.0
+# 10 minutes of history at the default cadence
+DEFAULT_WINDOW_SIZE = 120
+DEFAULT_TOP_PROCESSES = 10
+
+
+class SystemSampler:
+    """Fixed-cadence local system sampler backed by a bounded deque.
+
+    cpu_percent() is called with interval=None, which reports usage since the
+    previous call instead of sleeping, so one tick costs a few milliseconds.
+    Readers get the latest snapshot (a plain dict) without touching psutil.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, window_size: int = DEFAULT_WINDOW_SIZE,
+                 top_processes: int = DEFAULT_TOP_PROCESSES, disk_path: str = "/"):
+        self.interval = interval
+        self.top_processes = top_processes
+        self.disk_path = disk_path
+        self.samples: deque = deque(maxlen=window_size)
+        self.sequence = 0
+        self.sample_errors = 0
+        self.last_sample_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        # Serialises sampling so the background tick and an on-demand sample
+        # never interleave the network rate bookkeeping
+        self._sample_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_net = None
+        self._last_net_time: Optional[float] = None
+        # Prime the counters so the first real sample has a baseline
+        psutil.cpu_percent(interval=None)
+        self._process_cpu()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _process_cpu(self) -> List[Dict[str, Any]]:
+        # process_iter() keeps Process objects between calls, so their
+        # cpu_percent is also measured since the previous tick
+        processes = []
+        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
+            try:
+                info = proc.info
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if info.get('cpu_percent'):
+                processes.append(info)
+        processes.sort(key=lambda p: p['cpu_percent'], reverse=True)
+        return processes[:self.top_processes]
+
+    def _network(self, now: float) -> Dict[str, Any]:
+        net_io = psutil.net_io_counters()
+        network = {
+            'bytes_sent': net_io.bytes_sent,
+            'bytes_recv': net_io.bytes_recv,
+            'packets_sent': net_io.packets_sent,
+            'packets_recv': net_io.packets_recv,
+            'bytes_sent_per_sec': 0.0,
+            'bytes_recv_per_sec': 0.0
+        }
+        if self._last_net is not None and now > self._last_net_time:
+            elapsed = now - self._last_net_time
+            network['bytes_sent_per_sec'] = max(0, net_io.bytes_sent - self._last_net.bytes_sent) / elapsed
+            network['bytes_recv_per_sec'] = max(0, net_io.bytes_recv - self._last_net.bytes_recv) / elapsed
+        self._last_net = net_io
+        self._last_net_time = now
+        return network
+
+    def sample_once(self) -> Dict[str, Any]:
+        """Take one sample and append it to the window"""
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        sample = {
+            'timestamp': datetime.now(timezone.utc),
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'cpu_count': psutil.cpu_count(),
+            'memory_percent': memory.percent,
+            'memory_total': memory.total,
+            'disk_percent': (disk.used / disk.total) * 100 if disk.total else 0.0,
+            'network': self._network(time.monotonic()),
+            'processes': self._process_cpu()
+        }
+        self.last_sample_seconds = time.perf_counter() - started
+        with self._lock:
+            self.sequence += 1
+            sample['sequence'] = self.sequence
+            self.samples.append(sample)
+        return sample
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.sample_errors += 1
+                logger.warning(f"System sample failed: {e}")
+            # Fixed cadence: schedule from the previous tick, not from now
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self) -> "SystemSampler":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="system-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def latest(self) -> Dict[str, Any]:
+        """Most recent sample; takes one synchronously if the window is empty"""
+        with self._lock:
+            if self.samples:
+                return self.samples[-1]
+        return self.sample_once()
+
+    def window(self, after_sequence: int = 0) -> List[Dict[str, Any]]:
+        """Samples newer than after_sequence, oldest first"""
+        with self._lock:
+            return [sample for sample in self.samples if sample['sequence'] > after_sequence]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self.samples)
+        return {
+            'running': self.running,
+            'interval_seconds': self.interval,
+            'window_size': self.samples.maxlen,
+            'samples': size,
+            'sequence': self.sequence,
+            'sample_errors': self.sample_errors,
+            'last_sample_seconds': round(self.last_sample_seconds, 4) if self.last_sample_seconds is not None else None
+        }
+
+
+_sampler: Optional[SystemSampler] = None
+_sampler_lock = threading.Lock()
+
+
+def get_system_sampler() -> SystemSampler:
+    """Process-wide sampler, started on first use"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = SystemSampler()
+        return _sampler.start()
+
+
+def stop_system_sampler():
+    with _sampler_lock:
+        if _sampler is not None:
+            _sampler.stop()
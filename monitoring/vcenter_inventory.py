@@ -0,0 +1,633 @@
+"""
+vCenter Inventory Retrieval Engine
+Pulls the complete vCenter inventory through the PropertyCollector instead of
+walking managed objects attribute by attribute (one SOAP round trip each)
+"""
+
+from pyVmomi import vim, vmodl
+from typing import Dict, List, Optional, Any, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Explicit property paths per managed object type. Only these are transferred;
+# Folder/Datacenter/ComputeResource are needed for the local parent chain.
+INVENTORY_PROPERTIES = {
+    vim.Folder: ["name", "parent"],
+    vim.Datacenter: ["name", "parent"],
+    vim.ComputeResource: ["name", "parent"],
+    vim.ClusterComputeResource: [
+        "name", "parent",
+        "summary.numCpuCores", "summary.totalCpu", "summary.effectiveCpu",
+        "summary.totalMemory", "summary.effectiveMemory", "summary.numHosts",
+        "configuration.drsConfig.enabled", "configuration.dasConfig.enabled"
+    ],
+    vim.HostSystem: [
+        "name", "parent", "summary.hardware",
+        "summary.quickStats.overallCpuUsage", "summary.quickStats.overallMemoryUsage",
+        "summary.runtime.powerState", "summary.runtime.connectionState",
+        "summary.config.product.version"
+    ],
+    vim.Datastore: [
+        "name", "summary.accessible", "summary.type", "summary.capacity",
+        "summary.freeSpace", "summary.maintenanceMode"
+    ],
+    vim.Network: ["name", "summary.accessible"],
+    vim.VirtualMachine: [
+        "name", "summary.config", "summary.runtime.powerState",
+        "summary.quickStats.overallCpuUsage", "summary.quickStats.hostMemoryUsage",
+        "summary.storage.committed", "runtime.host", "guest.toolsStatus",
+        "datastore", "network"
+    ],
+}
+
+DEFAULT_PAGE_SIZE = 1000
+
+# Same nominal per-core clock the attribute-walking sync used for VM CPU %
+CPU_MHZ_PER_CORE = 2000
+
+
+class VCenterInventoryCollector:
+    """Bulk inventory retrieval with RetrievePropertiesEx pagination.
+
+    Retrieved properties are kept in a local object store keyed by MoRef id,
+    so parent chains (host -> cluster -> datacenter) and per-object VM counts
+    are resolved locally instead of with extra round trips.
+    """
+
+    def __init__(self, content, page_size: int = DEFAULT_PAGE_SIZE):
+        self.content = content
+        self.page_size = page_size
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.calls = 0
+
+    def build_filter_spec(self, view) -> vmodl.query.PropertyCollector.FilterSpec:
+        """Filter spec that traverses a ContainerView and selects explicit paths"""
+        PC = vmodl.query.PropertyCollector
+        traverse_view = PC.TraversalSpec(
+            name="traverseView", path="view", skip=False, type=vim.view.ContainerView
+        )
+        object_spec = PC.ObjectSpec(obj=view, skip=True, selectSet=[traverse_view])
+        prop_specs = [
+            PC.PropertySpec(type=mo_type, pathSet=paths, all=False)
+            for mo_type, paths in INVENTORY_PROPERTIES.items()
+        ]
+        return PC.FilterSpec(objectSet=[object_spec], propSet=prop_specs)
+
+    def create_view(self):
+        return self.content.viewManager.CreateContainerView(
+            self.content.rootFolder, list(INVENTORY_PROPERTIES.keys()), True
+        )
+
+    def retrieve(self) -> int:
+        """Fetch every inventory object; returns the number of objects received"""
+        collector = self.content.propertyCollector
+        view = self.create_view()
+        received = 0
+        try:
+            filter_spec = self.build_filter_spec(view)
+            options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=self.page_size)
+            result = collector.RetrievePropertiesEx([filter_spec], options)
+            self.calls += 1
+            while result:
+                received += self.ingest_objects(result.objects)
+                if not result.token:
+                    break
+                result = collector.ContinueRetrievePropertiesEx(result.token)
+                self.calls += 1
+        finally:
+            view.Destroy()
+
+        logger.info(f"Retrieved {received} vCenter objects in {self.calls} PropertyCollector calls")
+        return received
+
+    def ingest_objects(self, object_contents) -> int:
+        """Merge ObjectContent entries into the local object store"""
+        count = 0
+        for content in object_contents or []:
+            entry = self.objects.setdefault(content.obj._moId, {
+                "type": content.obj._wsdlName, "ref": content.obj, "props": {}
+            })
+            for prop in content.propSet or []:
+                entry["props"][prop.name] = prop.val
+            count += 1
+        return count
+
+    # ------------------------------------------------------------------
+    # Local parent-chain resolution
+    # ------------------------------------------------------------------
+
+    def _props(self, ref) -> Dict[str, Any]:
+        entry = self.objects.get(ref._moId) if ref is not None else None
+        return entry["props"] if entry else {}
+
+    def _name(self, ref, default: str = "Unknown") -> str:
+        return self._props(ref).get("name", default)
+
+    def _ancestor(self, ref, wsdl_name: str):
+        """Walk parent references in the object store until wsdl_name is found"""
+        seen = set()
+        current = ref
+        while current is not None and current._moId not in seen:
+            seen.add(current._moId)
+            entry = self.objects.get(current._moId)
+            if entry is None:
+                return None
+            if entry["type"] == wsdl_name:
+                return current
+            current = entry["props"].get("parent")
+        return None
+
+    def parent_chain_map(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """Resolve host -> compute resource -> datacenter names once per host"""
+        return {
+            moid: self.host_location(entry)
+            for moid, entry in self.objects.items() if entry["type"] == "HostSystem"
+        }
+
+    def host_location(self, entry: Dict) -> Dict[str, Optional[str]]:
+        compute = entry["props"].get("parent")
+        datacenter = self._ancestor(compute, "Datacenter") if compute is not None else None
+        return {
+            "host": entry["props"].get("name", "Unknown"),
+            "cluster": self._name(compute) if compute is not None else "Unknown",
+            "datacenter": self._name(datacenter) if datacenter is not None else "Unknown",
+        }
+
+    def _of_type(self, wsdl_name: str):
+        return [(moid, entry) for moid, entry in self.objects.items() if entry["type"] == wsdl_name]
+
+    # ------------------------------------------------------------------
+    # Conversion to the inventory dictionaries used by the API and DB layer
+    # ------------------------------------------------------------------
+
+    def build_inventory(self) -> Dict[str, List[Dict]]:
+        """Convert the object store into datacenter/cluster/host/... lists"""
+        chain = self.parent_chain_map()
+        vm_entries = self._of_type("VirtualMachine")
+
+        vms_per_host: Dict[str, int] = {}
+        vms_per_datastore: Dict[str, int] = {}
+        vms_per_network: Dict[str, int] = {}
+        for _, entry in vm_entries:
+            props = entry["props"]
+            host = props.get("runtime.host")
+            if host is not None:
+                vms_per_host[host._moId] = vms_per_host.get(host._moId, 0) + 1
+            for ds in props.get("datastore") or []:
+                vms_per_datastore[ds._moId] = vms_per_datastore.get(ds._moId, 0) + 1
+            for net in props.get("network") or []:
+                vms_per_network[net._moId] = vms_per_network.get(net._moId, 0) + 1
+
+        datacenters = [self.datacenter_data(moid, entry) for moid, entry in self._of_type("Datacenter")]
+
+        clusters = [self.cluster_data(moid, entry) for moid, entry in self._of_type("ClusterComputeResource")]
+        clusters_by_moid = {cluster["moid"]: cluster for cluster in clusters}
+
+        # Hosts and their VMs belong to the cluster that is the host's parent
+        # (by MoRef, so same-named clusters in other datacenters stay apart)
+        hosts = []
+        for moid, entry in self._of_type("HostSystem"):
+            host_data = self.host_data(moid, entry, chain, vms_per_host.get(moid, 0))
+            hosts.append(host_data)
+            parent = entry["props"].get("parent")
+            cluster = clusters_by_moid.get(parent._moId) if parent is not None else None
+            if cluster is not None:
+                cluster["hosts"].append(host_data)
+                cluster["num_vms"] += host_data["num_vms"]
+
+        datastores = []
+        for moid, entry in self._of_type("Datastore"):
+            ds_data = self.datastore_data(moid, entry, vms_per_datastore.get(moid, 0))
+            if ds_data is not None:
+                datastores.append(ds_data)
+
+        networks = [
+            self.network_data(moid, entry, vms_per_network.get(moid, 0))
+            for moid, entry in self._of_type("Network")
+        ]
+
+        vms = []
+        underutilized_vms = []
+        for moid, entry in vm_entries:
+            try:
+                vm_data = self.vm_data(moid, entry, chain)
+            except Exception as e:
+                logger.warning(f"Error processing VM {entry['props'].get('name', moid)}: {e}")
+                continue
+            vms.append(vm_data)
+            if vm_data["status"] == "running" and vm_data["cpu"] < 30 and vm_data["memory_usage"] < 50:
+                underutilized_vms.append(vm_data)
+
+        return {
+            "datacenters": datacenters,
+            "clusters": clusters,
+            "hosts": hosts,
+            "datastores": datastores,
+            "networks": networks,
+            "vms": vms,
+            "underutilized_vms": underutilized_vms
+        }
+
+    def datacenter_data(self, moid: str, entry: Dict) -> Dict:
+        return {
+            "name": entry["props"].get("name", "Unknown"),
+            "moid": moid,
+            "clusters": [],
+            "hosts": [],
+            "datastores": [],
+            "networks": []
+        }
+
+    def cluster_data(self, moid: str, entry: Dict) -> Dict:
+        props = entry["props"]
+        datacenter = self._ancestor(props.get("parent"), "Datacenter")
+        total_cpu = props.get("summary.totalCpu") or 0
+        effective_cpu = props.get("summary.effectiveCpu")
+        total_memory = props.get("summary.totalMemory") or 0
+        effective_memory = props.get("summary.effectiveMemory")
+        return {
+            "name": props.get("name", "Unknown"),
+            "moid": moid,
+            "datacenter": self._name(datacenter) if datacenter is not None else "Unknown",
+            "total_cpu_cores": props.get("summary.numCpuCores") or 0,
+            "total_cpu_mhz": total_cpu,
+            "used_cpu_mhz": total_cpu - effective_cpu if effective_cpu else 0,
+            "total_memory_gb": round(total_memory / (1024**3), 2),
+            "used_memory_gb": round((total_memory - effective_memory * 1024**2) / (1024**3), 2) if effective_memory else 0,
+            "num_hosts": props.get("summary.numHosts") or 0,
+            "num_vms": 0,
+            "drs_enabled": bool(props.get("configuration.drsConfig.enabled", False)),
+            "ha_enabled": bool(props.get("configuration.dasConfig.enabled", False)),
+            "hosts": []
+        }
+
+    def host_data(self, moid: str, entry: Dict, chain: Dict, num_vms: int) -> Dict:
+        props = entry["props"]
+        hardware = props.get("summary.hardware")
+        physical_cores = hardware.numCpuCores if hardware else 0
+        cpu_threads = hardware.numCpuThreads if hardware else 0
+        overall_memory = props.get("summary.quickStats.overallMemoryUsage")
+        location = chain.get(moid, {})
+        return {
+            "name": props.get("name", "Unknown"),
+            "moid": moid,
+            "cluster": location.get("cluster", "Unknown"),
+            "datacenter": location.get("datacenter", "Unknown"),
+            "cpu_cores": physical_cores,
+            "logical_cores": cpu_threads if cpu_threads else physical_cores * 2,
+            "cpu_threads": cpu_threads,
+            "cpu_mhz": (hardware.cpuMhz * physical_cores) if hardware else 0,
+            "memory_gb": round(hardware.memorySize / (1024**3), 2) if hardware else 0,
+            "cpu_usage_mhz": props.get("summary.quickStats.overallCpuUsage") or 0,
+            "memory_usage_gb": round(overall_memory / 1024, 2) if overall_memory else 0,
+            "power_state": str(props.get("summary.runtime.powerState", "unknown")),
+            "connection_state": str(props.get("summary.runtime.connectionState", "unknown")),
+            "num_vms": num_vms,
+            "vendor": hardware.vendor if hardware else None,
+            "model": hardware.model if hardware else None,
+            "version": props.get("summary.config.product.version") or "Unknown"
+        }
+
+    def datastore_data(self, moid: str, entry: Dict, num_vms: int) -> Optional[Dict]:
+        props = entry["props"]
+        if not props.get("summary.accessible"):
+            return None
+        capacity = props.get("summary.capacity") or 0
+        free_space = props.get("summary.freeSpace") or 0
+        return {
+            "name": props.get("name", "Unknown"),
+            "moid": moid,
+            "type": props.get("summary.type"),
+            "capacity_gb": round(capacity / (1024**3), 2),
+            "free_space_gb": round(free_space / (1024**3), 2),
+            "used_space_gb": round((capacity - free_space) / (1024**3), 2),
+            "usage_percent": round(((capacity - free_space) / capacity) * 100, 1) if capacity else 0,
+            "accessible": True,
+            "maintenance_mode": props.get("summary.maintenanceMode") or "normal",
+            "num_vms": num_vms
+        }
+
+    def network_data(self, moid: str, entry: Dict, num_vms: int) -> Dict:
+        props = entry["props"]
+        return {
+            "name": props.get("name", "Unknown"),
+            "moid": moid,
+            "accessible": props.get("summary.accessible", True),
+            "num_vms": num_vms
+        }
+
+    def vm_data(self, moid: str, entry: Dict, chain: Dict) -> Dict:
+        props = entry["props"]
+        config = props["summary.config"]
+        power_state = props.get("summary.runtime.powerState")
+        host = props.get("runtime.host")
+        location = chain.get(host._moId, {}) if host is not None else {}
+
+        cpu_usage = 0
+        memory_usage = 0
+        overall_cpu = props.get("summary.quickStats.overallCpuUsage")
+        host_memory = props.get("summary.quickStats.hostMemoryUsage")
+        if overall_cpu and config.numCpu:
+            cpu_usage = (overall_cpu / (config.numCpu * CPU_MHZ_PER_CORE)) * 100
+        if host_memory and config.memorySizeMB:
+            memory_usage = (host_memory / config.memorySizeMB) * 100
+
+        committed = props.get("summary.storage.committed")
+        return {
+            "vm": config.name,
+            "moid": moid,
+            "status": "running" if power_state == vim.VirtualMachinePowerState.poweredOn else "stopped",
+            "cpu": round(cpu_usage, 1),
+            "memory_usage": round(memory_usage, 1),
+            "cores": config.numCpu,
+            "memory": round((config.memorySizeMB or 0) / 1024, 1),
+            "cluster": location.get("cluster", "Unknown"),
+            "datacenter": location.get("datacenter", "Unknown"),
+            "host": location.get("host", "Unknown"),
+            "source": "vcenter",
+            "guest_os": config.guestFullName or "Unknown",
+            "tools_status": props.get("guest.toolsStatus") or "Unknown",
+            "uuid": config.uuid,
+            "details": {
+                "avg_cpu": round(cpu_usage, 1),
+                "avg_mem": round(memory_usage, 1),
+                "disk_usage": round(committed / (1024**3), 1) if committed else 0,
+                "power_state": str(power_state),
+                "annotation": config.annotation or ""
+            }
+        }
+
+
+# Inventory section each managed object type maps to when deltas are applied
+INVENTORY_SECTIONS = {
+    "Datacenter": "datacenters",
+    "ClusterComputeResource": "clusters",
+    "HostSystem": "hosts",
+    "Datastore": "datastores",
+    "Network": "networks",
+    "VirtualMachine": "vms",
+}
+
+
+class VCenterChangeTracker(VCenterInventoryCollector):
+    """Incremental inventory sync driven by WaitForUpdatesEx.
+
+    Keeps a dedicated PropertyCollector, a filter over the inventory
+    ContainerView and the last update version. The first poll returns the
+    whole inventory as "enter" updates; later polls only return the objects
+    that changed since the stored version.
+
+    Parent -> children and host/datastore/network -> VM links are indexed
+    as updates are applied, so build_delta() only converts the changed
+    objects and the parents whose counts or names they affect.
+    """
+
+    def __init__(self, content, page_size: int = DEFAULT_PAGE_SIZE):
+        super().__init__(content, page_size=page_size)
+        self.property_collector = None
+        self.filter = None
+        self.view = None
+        self.version: Optional[str] = None
+        self.children: Dict[str, Set[str]] = {}
+        self.linked_vms: Dict[str, Set[str]] = {}
+
+    @property
+    def started(self) -> bool:
+        return self.filter is not None
+
+    def start(self):
+        """Create the per-tracker PropertyCollector and filter"""
+        self.property_collector = self.content.propertyCollector.CreatePropertyCollector()
+        self.view = self.create_view()
+        self.filter = self.property_collector.CreateFilter(self.build_filter_spec(self.view), False)
+        self.version = ""
+        self.calls += 3
+
+    def stop(self):
+        """Release the server-side filter, view and collector"""
+        for release in (
+            lambda: self.filter.Destroy(),
+            lambda: self.view.Destroy(),
+            lambda: self.property_collector.DestroyPropertyCollector(),
+        ):
+            try:
+                release()
+            except Exception as e:
+                logger.debug(f"Error releasing vCenter change tracking objects: {e}")
+        self.filter = None
+        self.view = None
+        self.property_collector = None
+        self.version = None
+
+    def poll(self, max_wait_seconds: int = 0) -> Dict[str, Dict[str, Any]]:
+        """Pull pending updates and apply them to the local object store.
+
+        Returns {moid: {"kind": enter|modify|leave, "type": ..., "before": props}}
+        for every object touched since the previous poll.
+        """
+        if not self.started:
+            self.start()
+
+        changes: Dict[str, Dict[str, Any]] = {}
+        options = vmodl.query.PropertyCollector.WaitOptions(
+            maxWaitSeconds=max_wait_seconds, maxObjectUpdates=self.page_size
+        )
+        while True:
+            update_set = self.property_collector.WaitForUpdatesEx(self.version, options)
+            self.calls += 1
+            if update_set is None:
+                break
+            for filter_update in update_set.filterSet or []:
+                for object_update in filter_update.objectSet or []:
+                    self.apply_object_update(object_update, changes)
+            self.version = update_set.version
+            if not update_set.truncated:
+                break
+        return changes
+
+    def apply_object_update(self, object_update, changes: Dict[str, Dict[str, Any]]):
+        obj = object_update.obj
+        moid = obj._moId
+        kind = str(object_update.kind)
+        existing = self.objects.get(moid)
+
+        record = changes.get(moid)
+        if record is None:
+            record = {
+                "kind": kind,
+                "type": obj._wsdlName,
+                "before": dict(existing["props"]) if existing else {}
+            }
+            changes[moid] = record
+        elif kind == "leave" or record["kind"] != "enter":
+            record["kind"] = kind
+
+        if existing is not None:
+            self._index(moid, existing, add=False)
+        if kind == "leave":
+            self.objects.pop(moid, None)
+            return
+
+        entry = self.objects.setdefault(moid, {"type": obj._wsdlName, "ref": obj, "props": {}})
+        try:
+            self._apply_changes(entry, object_update.changeSet)
+        finally:
+            self._index(moid, entry, add=True)
+
+    @staticmethod
+    def _apply_changes(entry: Dict, change_set):
+        for change in change_set or []:
+            op = str(change.op)
+            if op == "assign":
+                entry["props"][change.name] = change.val
+            elif op == "add":
+                entry["props"].setdefault(change.name, [])
+                entry["props"][change.name] = list(entry["props"][change.name]) + [change.val]
+            else:  # remove / indirectRemove
+                entry["props"].pop(change.name, None)
+
+    def _index(self, moid: str, entry: Dict, add: bool):
+        """Add or drop an object's parent and VM links in the indexes"""
+        props = entry["props"]
+        links = [(self.children, props.get("parent"))]
+        if entry["type"] == "VirtualMachine":
+            refs = [props.get("runtime.host")] + list(props.get("datastore") or []) + list(props.get("network") or [])
+            links += [(self.linked_vms, ref) for ref in refs]
+        for index, ref in links:
+            if ref is None:
+                continue
+            if add:
+                index.setdefault(ref._moId, set()).add(moid)
+            else:
+                members = index.get(ref._moId)
+                if members is not None:
+                    members.discard(moid)
+                    if not members:
+                        del index[ref._moId]
+
+    def build_delta(self, changes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, List]]:
+        """Convert poll() changes into per-section upserts and removals.
+
+        Hosts, datastores, networks and clusters whose VM membership moved are
+        re-emitted so their num_vms stays correct; objects below a renamed or
+        moved parent are re-emitted with the new names. Removals are moids,
+        which key the stored inventory, so a renamed object is only
+        re-emitted. Work is proportional to the changes, not the inventory
+        size.
+        """
+        upserts = {section: {} for section in INVENTORY_SECTIONS.values()}
+        removals = {section: [] for section in INVENTORY_SECTIONS.values()}
+        dirty = set()
+
+        for moid, record in changes.items():
+            section = INVENTORY_SECTIONS.get(record["type"])
+            before = record["before"]
+            entry = self.objects.get(moid)
+            after = entry["props"] if entry else {}
+            if record["type"] == "VirtualMachine":
+                dirty.update(self._vm_links(before))
+                dirty.update(self._vm_links(after))
+            elif record["kind"] != "enter" and entry is not None:
+                old_parent, new_parent = before.get("parent"), after.get("parent")
+                moved = _moid(old_parent) != _moid(new_parent)
+                if moved:
+                    dirty.update(ref._moId for ref in (old_parent, new_parent) if ref is not None)
+                if moved or before.get("name") != after.get("name"):
+                    # Hosts/VMs carry their parents' names
+                    dirty.update(self._descendants(moid))
+            if section is None:
+                continue
+            if record["kind"] == "leave":
+                removals[section].append(moid)
+                continue
+            dirty.add(moid)
+
+        for moid in sorted(dirty):
+            entry = self.objects.get(moid)
+            section = INVENTORY_SECTIONS.get(entry["type"]) if entry else None
+            if section is None:
+                continue
+            item = self.section_item(moid, entry)
+            if item is not None:
+                upserts[section][moid] = item
+            elif section in ("vms", "datastores"):
+                # Still present but filtered out of the inventory (e.g. a
+                # datastore that became inaccessible)
+                removals[section].append(moid)
+
+        return {
+            "upserts": {section: list(items.values()) for section, items in upserts.items()},
+            "removals": removals
+        }
+
+    def section_item(self, moid: str, entry: Dict) -> Optional[Dict]:
+        """One object's inventory dictionary, as build_inventory() would produce it"""
+        wsdl_name = entry["type"]
+        linked = len(self.linked_vms.get(moid, ()))
+        if wsdl_name == "Datacenter":
+            return self.datacenter_data(moid, entry)
+        if wsdl_name == "ClusterComputeResource":
+            cluster = self.cluster_data(moid, entry)
+            for host_moid in sorted(self.children.get(moid, ())):
+                host_entry = self.objects.get(host_moid)
+                if host_entry is not None and host_entry["type"] == "HostSystem":
+                    host_data = self.section_item(host_moid, host_entry)
+                    cluster["hosts"].append(host_data)
+                    cluster["num_vms"] += host_data["num_vms"]
+            return cluster
+        if wsdl_name == "HostSystem":
+            return self.host_data(moid, entry, {moid: self.host_location(entry)}, linked)
+        if wsdl_name == "Datastore":
+            return self.datastore_data(moid, entry, linked)
+        if wsdl_name == "Network":
+            return self.network_data(moid, entry, linked)
+        if wsdl_name == "VirtualMachine":
+            host = entry["props"].get("runtime.host")
+            host_entry = self.objects.get(host._moId) if host is not None else None
+            chain = {host._moId: self.host_location(host_entry)} if host_entry is not None else {}
+            try:
+                return self.vm_data(moid, entry, chain)
+            except Exception as e:
+                logger.warning(f"Error processing VM {entry['props'].get('name', moid)}: {e}")
+        return None
+
+    def _descendants(self, moid: str) -> Set[str]:
+        """Objects below moid in the parent tree, plus the VMs running on hosts there"""
+        found: Set[str] = set()
+        stack = [moid]
+        while stack:
+            current = stack.pop()
+            entry = self.objects.get(current)
+            if entry is not None and entry["type"] == "HostSystem":
+                found.update(self.linked_vms.get(current, ()))
+            for child in self.children.get(current, ()):
+                if child not in found:
+                    found.add(child)
+                    stack.append(child)
+        return found
+
+    def _vm_links(self, props: Dict[str, Any]) -> List[str]:
+        links = []
+        host = props.get("runtime.host")
+        if host is not None:
+            links.append(host._moId)
+            compute = self._props(host).get("parent")
+            if compute is not None:
+                links.append(compute._moId)
+        for ref in list(props.get("datastore") or []) + list(props.get("network") or []):
+            links.append(ref._moId)
+        return links
+
+
+def _moid(ref) -> Optional[str]:
+    return ref._moId if ref is not None else None
+
+
+def collect_vcenter_inventory(content, page_size: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """Retrieve and convert the full inventory; includes PropertyCollector call count"""
+    collector = VCenterInventoryCollector(content, page_size=page_size)
+    collector.retrieve()
+    inventory = collector.build_inventory()
+    inventory["retrieval_calls"] = collector.calls
+    return inventory
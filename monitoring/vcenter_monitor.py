@@ -1,20 +1,19 @@
-
-from pyVim.connect import SmartConnectNoSSL, Disconnect
 from pyVmomi import vim
 from datetime import datetime
-from db.init import SessionLocal
-from db.models import VirtualMachine, VMMetric
-import atexit
+from db.storage import get_storage
+from monitoring.vcenter_session import vcenter_sessions
 
-def fetch_vcenter_metrics(host, user, pwd, port=443):
-    si = SmartConnectNoSSL(host=host, user=user, pwd=pwd, port=port)
-    atexit.register(Disconnect, si)
+def fetch_vcenter_metrics(host, user, pwd, port=443, storage=None):
+    # Pooled session: no per-call login, and the pool closes it once at exit
+    si = vcenter_sessions.get(host, user, pwd, port)
     content = si.RetrieveContent()
 
-    db = SessionLocal()
+    storage = storage or get_storage()
     now = datetime.utcnow()
 
     try:
+        specs = {}
+        samples = {}
         for datacenter in content.rootFolder.childEntity:
             for vm in datacenter.vmFolder.childEntity:
                 if isinstance(vm, vim.VirtualMachine):
@@ -27,35 +26,25 @@ def fetch_vcenter_metrics(host, user, pwd, port=443):
                     cpu_cores = summary.config.numCpu or 1
                     memory_gb = summary.config.memorySizeMB / 1024 if summary.config else 0
 
-                    vm_record = db.query(VirtualMachine).filter_by(name=name).first()
-                    if not vm_record:
-                        vm_record = VirtualMachine(
-                            name=name,
-                            cluster=datacenter.name,
-                            cpu_cores=cpu_cores,
-                            memory_gb=memory_gb,
-                            disk_gb=100
-                        )
-                        db.add(vm_record)
-                        db.commit()
-                        db.refresh(vm_record)
-
-                    metric = VMMetric(
-                        vm_id=vm_record.id,
-                        cpu_usage=cpu_usage,
-                        memory_usage=memory_usage,
-                        disk_io=0.0,
-                        net_io=0.0,
-                        timestamp=now
-                    )
-                    db.add(metric)
-        db.commit()
+                    specs[name] = {
+                        "cluster": datacenter.name,
+                        "cpu_cores": cpu_cores,
+                        "memory_gb": memory_gb,
+                        "disk_gb": 100
+                    }
+                    samples[name] = {
+                        "cpu_usage": cpu_usage,
+                        "memory_usage": memory_usage,
+                        "disk_io": 0.0,
+                        "net_io": 0.0,
+                        "timestamp": now
+                    }
+
+        # One VM lookup and one bulk write for the whole inventory
+        vm_ids = storage.resolve_vms(specs)["ids"]
+        storage.write_metrics([dict(sample, vm_id=vm_ids[name]) for name, sample in samples.items()])
     except Exception as e:
         print(f"Error fetching from vCenter: {e}")
-        db.rollback()
-    finally:
-        db.close()
-        Disconnect(si)
 
 # Example usage (replace with your real vCenter details)
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+"""
+Multi-vCenter Fan-out
+Collects several vCenters in parallel worker threads and merges the results
+into one inventory keyed by (vcenter, moid)
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_SECTIONS = ("datacenters", "clusters", "hosts", "datastores", "networks", "vms")
+
+# Overall budget for one fan-out; sites still running after it are reported
+# as timed out and keep their previous inventory
+DEFAULT_SITE_TIMEOUT = 600
+
+
+def vcenter_sites(config: Dict) -> List[Dict]:
+    """All configured vCenters: the `vcenters` list plus the legacy single `vcenter` entry"""
+    sites = []
+    seen = set()
+    for site in list(config.get("vcenters") or []) + ([config["vcenter"]] if config.get("vcenter") else []):
+        host = site.get("host")
+        if not host or host in seen:
+            continue
+        if not site.get("username") or not site.get("password"):
+            logger.warning(f"Skipping vCenter {host}: incomplete credentials")
+            continue
+        seen.add(host)
+        sites.append(site)
+    return sites
+
+
+def tag_inventory(inventory: Dict[str, Any], site: str) -> Dict[str, Any]:
+    """Stamp every inventory item with the vCenter it came from"""
+    for section in INVENTORY_SECTIONS:
+        for item in inventory.get(section, []):
+            item["vcenter"] = site
+    return inventory
+
+
+def collect_sites(sites: List[Dict], collect: Callable[[Dict], Dict[str, Any]],
+                  on_result: Optional[Callable[[Dict, Dict[str, Any]], None]] = None,
+                  timeout: float = DEFAULT_SITE_TIMEOUT, max_workers: Optional[int] = None) -> Dict[str, Dict]:
+    """Run collect(site) for every site in parallel.
+
+    on_result(site, result) is called in the calling thread as each site
+    finishes, so a slow site never delays handling of the fast ones.
+    Returns {host: {"status", "duration_seconds", "inventory"|"error"}}.
+    """
+    results: Dict[str, Dict] = {}
+    if not sites:
+        return results
+
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sites), thread_name_prefix="vcenter-sync")
+
+    def run(site):
+        site_started = time.perf_counter()
+        try:
+            inventory = tag_inventory(collect(site), site["host"])
+            return {"status": "success", "inventory": inventory,
+                    "duration_seconds": round(time.perf_counter() - site_started, 3)}
+        except Exception as e:
+            return {"status": "failed", "error": str(e),
+                    "duration_seconds": round(time.perf_counter() - site_started, 3)}
+
+    futures = {executor.submit(run, site): site for site in sites}
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            site = futures[future]
+            result = future.result()
+            results[site["host"]] = result
+            if on_result is not None:
+                try:
+                    on_result(site, result)
+                except Exception as e:
+                    logger.error(f"Handling vCenter {site['host']} result failed: {e}")
+    except FuturesTimeout:
+        for future, site in futures.items():
+            if site["host"] not in results:
+                future.cancel()
+                result = {"status": "timeout", "error": f"no result after {timeout}s",
+                          "duration_seconds": round(time.perf_counter() - started, 3)}
+                results[site["host"]] = result
+                if on_result is not None:
+                    try:
+                        on_result(site, result)
+                    except Exception as e:
+                        logger.error(f"Handling vCenter {site['host']} result failed: {e}")
+    finally:
+        # Do not wait for stuck sites; their threads finish in the background
+        executor.shutdown(wait=False)
+    return results
+
+
+def merge_inventories(previous: Dict[str, Any], results: Dict[str, Dict]) -> Dict[str, List[Dict]]:
+    """Unified inventory keyed by (vcenter, moid).
+
+    Sites that synced replace all of their items; items from sites that
+    failed or timed out are carried over from the previous inventory.
+    """
+    refreshed = {host for host, result in results.items() if result["status"] == "success"}
+    merged: Dict[str, List[Dict]] = {}
+    for section in INVENTORY_SECTIONS:
+        items: Dict[Any, Dict] = {}
+        for item in previous.get(section, []) or []:
+            site = item.get("vcenter")
+            if site is None or site in refreshed:
+                continue
+            items[(site, item.get("moid") or item.get("name") or item.get("vm"))] = item
+        for host in sorted(refreshed):
+            for item in results[host]["inventory"].get(section, []):
+                items[(host, item.get("moid") or item.get("name") or item.get("vm"))] = item
+        merged[section] = list(items.values())
+    return merged
@@ -0,0 +1,180 @@
+"""
+vCenter Session Pool
+Keeps authenticated ServiceInstances alive across requests instead of paying
+the TLS handshake and login on every SmartConnect
+"""
+
+import atexit
+import logging
+import ssl
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Sessions are re-validated against the server at most this often
+HEALTH_CHECK_INTERVAL = 60
+
+
+def _default_connect(host: str, user: str, pwd: str, port: int):
+    from pyVim.connect import SmartConnect
+
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.verify_mode = ssl.CERT_NONE
+    return SmartConnect(host=host, user=user, pwd=pwd, sslContext=context, port=port)
+
+
+def _default_disconnect(si):
+    from pyVim.connect import Disconnect
+
+    Disconnect(si)
+
+
+def _is_not_authenticated(error: Exception) -> bool:
+    try:
+        from pyVmomi import vim
+    except ImportError:
+        return False
+    return isinstance(error, vim.fault.NotAuthenticated)
+
+
+class PooledSession:
+    """One authenticated ServiceInstance plus bookkeeping"""
+
+    def __init__(self, si, pwd: str):
+        self.si = si
+        self.pwd = pwd
+        self.created_at = time.time()
+        self.last_checked = time.monotonic()
+        self.logins = 1
+        self.uses = 0
+        self.lock = threading.Lock()
+
+
+class VCenterSessionPool:
+    """Authenticated vCenter sessions keyed by (host, user, port).
+
+    pyVmomi's SOAP stub pools its own HTTP connections, so one
+    ServiceInstance is shared by concurrent requests; the per-key lock only
+    serialises login, health checks and re-login.
+    """
+
+    def __init__(self, connect: Callable = _default_connect, disconnect: Callable = _default_disconnect,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL):
+        self._connect = connect
+        self._disconnect = disconnect
+        self.health_check_interval = health_check_interval
+        self._sessions: Dict[Tuple[str, str, int], PooledSession] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "logins": 0, "relogins": 0, "health_checks": 0}
+        atexit.register(self.close_all)
+
+    def _entry(self, key) -> PooledSession:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = PooledSession(None, None)
+                entry.logins = 0
+                self._sessions[key] = entry
+            return entry
+
+    def _alive(self, entry: PooledSession) -> bool:
+        self.stats["health_checks"] += 1
+        try:
+            return entry.si.content.sessionManager.currentSession is not None
+        except Exception as e:
+            logger.debug(f"vCenter session health check failed: {e}")
+            return False
+
+    def _login(self, key, entry: PooledSession, pwd: str):
+        # Log in on a fresh ServiceInstance first: if the new credentials are
+        # rejected the pooled session (and its change trackers) stays usable
+        host, user, port = key
+        si = self._connect(host, user, pwd, port)
+        if not si:
+            raise ConnectionError(f"Failed to connect to vCenter {host}")
+        if entry.si is not None:
+            self._safe_disconnect(entry.si)
+            self.stats["relogins"] += 1
+        entry.si = si
+        entry.pwd = pwd
+        entry.created_at = time.time()
+        entry.last_checked = time.monotonic()
+        entry.logins += 1
+        self.stats["logins"] += 1
+        logger.info(f"vCenter session opened for {user}@{host}:{port}")
+
+    def _safe_disconnect(self, si):
+        try:
+            self._disconnect(si)
+        except Exception as e:
+            logger.debug(f"Ignoring vCenter disconnect error: {e}")
+
+    def get(self, host: str, user: str, pwd: str, port: int = 443):
+        """Return a healthy authenticated ServiceInstance, logging in if needed"""
+        key = (host, user, port)
+        entry = self._entry(key)
+        with entry.lock:
+            if entry.si is None or entry.pwd != pwd:
+                self._login(key, entry, pwd)
+            elif time.monotonic() - entry.last_checked >= self.health_check_interval:
+                if not self._alive(entry):
+                    logger.info(f"vCenter session for {user}@{host} expired, logging in again")
+                    self._login(key, entry, pwd)
+                entry.last_checked = time.monotonic()
+            else:
+                self.stats["hits"] += 1
+            entry.uses += 1
+            return entry.si
+
+    def run(self, host: str, user: str, pwd: str, fn: Callable[[Any], Any], port: int = 443):
+        """Call fn(si); on NotAuthenticated re-login once and retry"""
+        si = self.get(host, user, pwd, port)
+        try:
+            return fn(si)
+        except Exception as e:
+            if not _is_not_authenticated(e):
+                raise
+            logger.info(f"vCenter session for {user}@{host} rejected, retrying after re-login")
+            self.invalidate(host, user, port, si)
+            return fn(self.get(host, user, pwd, port))
+
+    def invalidate(self, host: str, user: str, port: int = 443, si=None):
+        """Force the next get() to log in again (only if si is still the pooled one)"""
+        key = (host, user, port)
+        with self._lock:
+            entry = self._sessions.get(key)
+        if entry is None:
+            return
+        with entry.lock:
+            if entry.si is not None and (si is None or entry.si is si):
+                self._safe_disconnect(entry.si)
+                entry.si = None
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in entries:
+            if entry.si is not None:
+                self._safe_disconnect(entry.si)
+                entry.si = None
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = [
+                {
+                    "host": host, "user": user, "port": port,
+                    "connected": entry.si is not None,
+                    "logins": entry.logins,
+                    "uses": entry.uses,
+                    "age_seconds": round(time.time() - entry.created_at, 1)
+                }
+                for (host, user, port), entry in self._sessions.items()
+            ]
+        return dict(self.stats, sessions=sessions)
+
+
+# Process-wide pool shared by the API routes and the metrics collector
+vcenter_sessions = VCenterSessionPool()
@@ -1,85 +1,175 @@
 
 import requests
 import json
-from db.init import SessionLocal
-from db.models import VirtualMachine, VMMetric
+from monitoring.store_metrics import storage_for, store_metrics_bulk
 from datetime import datetime
+import time
+
+CPU_IDLE_KEY = "system.cpu.util[,idle]"
+MEMORY_USED_KEY = "vm.memory.size[used]"
+
+# hostids per item.get request; chunks of one sync go out in a single batch
+HOST_CHUNK_SIZE = 1000
+
+ZABBIX_VM_SPEC = {"cluster": "zabbix", "cpu_cores": 2, "memory_gb": 8, "disk_gb": 100}
+
+class ZabbixAPIError(Exception):
+    pass
 
 class ZabbixConnector:
-    def __init__(self, url, user, password):
+    def __init__(self, url, user, password, session=None):
         self.url = url
         self.headers = {"Content-Type": "application/json-rpc"}
+        # One keep-alive connection pool for every call of this connector
+        self.session = session or requests.Session()
+        self.session.headers.update(self.headers)
+        self.batch_supported = True
+        self.api_calls = 0
+        self._request_id = 0
         self.auth_token = self.login(user, password)
 
-    def login(self, user, password):
+    def _payload(self, method, params, auth=True):
+        self._request_id += 1
         data = {
             "jsonrpc": "2.0",
-            "method": "user.login",
-            "params": {"user": user, "password": password},
-            "id": 1
+            "method": method,
+            "params": params,
+            "id": self._request_id
         }
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-        return response.json()["result"]
+        if auth:
+            data["auth"] = self.auth_token
+        return data
+
+    def _post(self, data):
+        self.api_calls += 1
+        response = self.session.post(self.url, data=json.dumps(data))
+        return response.json()
+
+    def call(self, method, params, auth=True):
+        reply = self._post(self._payload(method, params, auth))
+        if "error" in reply:
+            raise ZabbixAPIError(f"{method}: {reply['error']}")
+        return reply["result"]
+
+    def call_batch(self, calls):
+        """Run several (method, params) calls, as one JSON-RPC batch when the server allows it.
+
+        Servers that reject the batch array itself (no per-call replies) get
+        sequential calls from then on. An error reply to one call of an
+        accepted batch raises ZabbixAPIError, as call() does.
+        """
+        if len(calls) > 1 and self.batch_supported:
+            payloads = [self._payload(method, params) for method, params in calls]
+            try:
+                replies = self._post(payloads)
+            except ValueError:
+                replies = None
+            by_id = {reply.get("id"): reply for reply in replies if isinstance(reply, dict)} \
+                if isinstance(replies, list) else {}
+            if all(payload["id"] in by_id for payload in payloads):
+                results = []
+                for (method, _), payload in zip(calls, payloads):
+                    reply = by_id[payload["id"]]
+                    if "error" in reply:
+                        raise ZabbixAPIError(f"{method}: {reply['error']}")
+                    results.append(reply["result"])
+                return results
+            print("[!] Zabbix API rejected a JSON-RPC batch, falling back to sequential calls")
+            self.batch_supported = False
+        return [self.call(method, params) for method, params in calls]
+
+    def login(self, user, password):
+        return self.call("user.login", {"user": user, "password": password}, auth=False)
 
     def get_hosts(self):
-        data = {
-            "jsonrpc": "2.0",
-            "method": "host.get",
-            "params": {"output": ["hostid", "host"]},
-            "auth": self.auth_token,
-            "id": 2
-        }
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-        return response.json()["result"]
+        return self.call("host.get", {"output": ["hostid", "host"]})
 
     def get_latest_metric(self, hostid, key_):
-        data = {
-            "jsonrpc": "2.0",
-            "method": "item.get",
-            "params": {
-                "output": "extend",
-                "hostids": hostid,
-                "search": {"key_": key_},
-                "sortfield": "name"
-            },
-            "auth": self.auth_token,
-            "id": 3
-        }
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-        items = response.json().get("result", [])
+        items = self.call("item.get", {
+            "output": "extend",
+            "hostids": hostid,
+            "search": {"key_": key_},
+            "sortfield": "name"
+        })
         return float(items[0]["lastvalue"]) if items else 0.0
 
-    def ingest_zabbix_metrics(self):
-        db = SessionLocal()
+    def get_latest_metrics(self, hostids, keys):
+        """Latest values for keys on every host: {hostid: {key: value}}.
+
+        One item.get per HOST_CHUNK_SIZE hosts with an exact key filter,
+        all chunks sent together as a JSON-RPC batch.
+        """
+        calls = [
+            ("item.get", {
+                "output": ["hostid", "key_", "lastvalue"],
+                "hostids": hostids[i:i + HOST_CHUNK_SIZE],
+                "filter": {"key_": list(keys)}
+            })
+            for i in range(0, len(hostids), HOST_CHUNK_SIZE)
+        ]
+        values = {}
+        for items in self.call_batch(calls):
+            for item in items:
+                try:
+                    value = float(item["lastvalue"])
+                except (TypeError, ValueError):
+                    continue
+                values.setdefault(item["hostid"], {})[item["key_"]] = value
+        return values
+
+    def ingest_zabbix_metrics(self, bulk=True, session_factory=None, storage=None):
+        if storage is None:
+            storage = storage_for(session_factory)
+        if not bulk:
+            return self._ingest_per_host(storage)
+
+        started = time.perf_counter()
+        calls_before = self.api_calls
+        try:
+            hosts = self.get_hosts()
+            values = self.get_latest_metrics([host["hostid"] for host in hosts], [CPU_IDLE_KEY, MEMORY_USED_KEY])
+        except Exception as e:
+            print(f"Zabbix ingestion error: {e}")
+            return {"status": "error", "error": str(e), "rows": 0}
+
+        now = datetime.utcnow()
+        metrics = []
+        for host in hosts:
+            host_values = values.get(host["hostid"], {})
+            metrics.append({
+                "instance": host["host"],
+                "cpu_usage": 100 - host_values.get(CPU_IDLE_KEY, 0.0),  # convert idle to used
+                "memory_usage": host_values.get(MEMORY_USED_KEY, 0.0) / 1024 / 1024 / 1024,  # bytes to GB
+                "disk_io": 0.0,
+                "net_io": 0.0,
+                "timestamp": now
+            })
+
+        stats = store_metrics_bulk(metrics, vm_spec=ZABBIX_VM_SPEC, storage=storage)
+        stats["hosts"] = len(hosts)
+        stats["api_calls"] = self.api_calls - calls_before
+        stats["duration_seconds"] = round(time.perf_counter() - started, 4)
+        return stats
+
+    def _ingest_per_host(self, storage):
         try:
             for host in self.get_hosts():
                 host_name = host["host"]
                 host_id = host["hostid"]
-                cpu = self.get_latest_metric(host_id, "system.cpu.util[,idle]")
-                mem = self.get_latest_metric(host_id, "vm.memory.size[used]")
-
-                vm = db.query(VirtualMachine).filter_by(name=host_name).first()
-                if not vm:
-                    vm = VirtualMachine(name=host_name, cluster="zabbix", cpu_cores=2, memory_gb=8, disk_gb=100)
-                    db.add(vm)
-                    db.commit()
-                    db.refresh(vm)
-
-                metric = VMMetric(
-                    vm_id=vm.id,
-                    cpu_usage=100 - cpu,  # convert idle to used
-                    memory_usage=mem / 1024 / 1024 / 1024,  # bytes to GB
-                    disk_io=0.0,
-                    net_io=0.0,
-                    timestamp=datetime.utcnow()
-                )
-                db.add(metric)
-            db.commit()
+                cpu = self.get_latest_metric(host_id, CPU_IDLE_KEY)
+                mem = self.get_latest_metric(host_id, MEMORY_USED_KEY)
+
+                vm_id = storage.resolve_vms({host_name: ZABBIX_VM_SPEC})["ids"][host_name]
+                storage.write_metrics([{
+                    "vm_id": vm_id,
+                    "cpu_usage": 100 - cpu,  # convert idle to used
+                    "memory_usage": mem / 1024 / 1024 / 1024,  # bytes to GB
+                    "disk_io": 0.0,
+                    "net_io": 0.0,
+                    "timestamp": datetime.utcnow()
+                }])
         except Exception as e:
             print(f"Zabbix ingestion error: {e}")
-            db.rollback()
-        finally:
-            db.close()
 
 # Example usage:
 # z = ZabbixConnector("http://your-zabbix-server/api_jsonrpc.php", "Admin", "zabbix")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark InfrastructureDBManager inventory saves.
+
+Compares the set-based upsert path against the previous row-at-a-time save
+(SELECT, then UPDATE or INSERT, plus three parent id lookups per VM) on a
+synthetic inventory. Each size is saved twice: once into an empty database
+(all inserts) and once more unchanged (updates for the row-at-a-time save,
+last_sync touches only for the fingerprint diff).
+
+    python scripts/benchmark_inventory_save.py --sizes 1000 10000 100000
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import tempfile
+import time
+from datetime import datetime
+
+from api.database_manager import InfrastructureDBManager
+from db.sqlite_pool import get_pool
+
+
+def synthetic_inventory(num_vms, vms_per_host=25, hosts_per_cluster=16):
+    num_hosts = max(1, num_vms // vms_per_host)
+    num_clusters = max(1, num_hosts // hosts_per_cluster)
+    return {
+        'datacenters': [{'name': 'DC-01', 'moid': 'datacenter-1'}],
+        'clusters': [{'name': f'cluster-{c:03d}', 'datacenter': 'DC-01', 'num_hosts': hosts_per_cluster}
+                     for c in range(num_clusters)],
+        'hosts': [{'name': f'esx-{h:05d}', 'cluster': f'cluster-{h % num_clusters:03d}', 'cpu_cores': 32}
+                  for h in range(num_hosts)],
+        'vms': [
+            {
+                'vm': f'vm-{v:06d}', 'moid': f'vm-{v}', 'status': 'running', 'cores': 2, 'memory': 4,
+                'cpu': v % 100, 'memory_usage': (v * 7) % 100, 'datacenter': 'DC-01',
+                'cluster': f'cluster-{(v // vms_per_host) % num_clusters:03d}',
+                'host': f'esx-{(v // vms_per_host) % num_hosts:05d}'
+            }
+            for v in range(num_vms)
+        ]
+    }
+
+
+def parent_id(conn, table, name, source):
+    """One parent lookup by name, as the pre-upsert save did per VM"""
+    if not name:
+        return None
+    row = conn.execute(f"SELECT id FROM {table} WHERE name = ? AND source = ?", (name, source)).fetchone()
+    return row['id'] if row else None
+
+
+def row_at_a_time_save_vms(conn, source, vms):
+    """The pre-upsert VM save, kept here as the baseline"""
+    stats = {'processed': 0, 'added': 0, 'updated': 0}
+    for vm in vms:
+        stats['processed'] += 1
+        cluster_id = parent_id(conn, 'infrastructure_clusters', vm.get('cluster'), source)
+        host_id = parent_id(conn, 'infrastructure_hosts', vm.get('host'), source)
+        datacenter_id = parent_id(conn, 'infrastructure_datacenters', vm.get('datacenter'), source)
+        vm_name = vm.get('vm') or vm.get('name')
+        existing = conn.execute(
+            "SELECT id FROM infrastructure_vms WHERE name = ? AND source = ?", (vm_name, source)
+        ).fetchone()
+        now = datetime.now()
+        if existing:
+            conn.execute(
+                "UPDATE infrastructure_vms SET moid = ?, cluster_id = ?, host_id = ?, datacenter_id = ?, "
+                "status = ?, cpu_cores = ?, memory_gb = ?, cpu_usage_percent = ?, "
+                "memory_usage_percent = ?, updated_at = ?, last_sync = ? WHERE id = ?",
+                (vm.get('moid'), cluster_id, host_id, datacenter_id, vm.get('status', 'unknown'),
+                 vm.get('cores', 1), vm.get('memory', 1), vm.get('cpu', 0), vm.get('memory_usage', 0),
+                 now, now, existing['id'])
+            )
+            stats['updated'] += 1
+        else:
+            conn.execute(
+                "INSERT INTO infrastructure_vms (name, moid, cluster_id, host_id, datacenter_id, source, "
+                "status, cpu_cores, memory_gb, cpu_usage_percent, memory_usage_percent, last_sync) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (vm_name, vm.get('moid'), cluster_id, host_id, datacenter_id, source,
+                 vm.get('status', 'unknown'), vm.get('cores', 1), vm.get('memory', 1),
+                 vm.get('cpu', 0), vm.get('memory_usage', 0), now)
+            )
+            stats['added'] += 1
+    return stats
+
+
+def scratch_manager(directory):
+    return InfrastructureDBManager(os.path.join(directory, 'iroa.db'))
+
+
+def time_vm_save(inventory, legacy):
+    """Seconds for an insert pass and an update pass of the VM section"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = scratch_manager(directory)
+        with manager.get_connection() as conn:
+            for section, save in manager._save_methods()[:-1]:
+                save(conn, 'vcenter', inventory.get(section, []))
+            conn.commit()
+
+            timings = []
+            for _ in range(2):
+                started = time.perf_counter()
+                if legacy:
+                    stats = row_at_a_time_save_vms(conn, 'vcenter', inventory['vms'])
+                else:
+                    stats = manager._save_vms(conn, 'vcenter', inventory['vms'])
+                conn.commit()
+                timings.append((time.perf_counter() - started, stats))
+        get_pool(manager.db_path).close()
+        return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='skip the row-at-a-time baseline above this many VMs')
+    args = parser.parse_args()
+
+    print(f"{'VMs':>8} {'pass':>7} {'row-at-a-time':>15} {'bulk upsert':>12} {'speedup':>8}")
+    for size in args.sizes:
+        inventory = synthetic_inventory(size)
+        bulk = time_vm_save(inventory, legacy=False)
+        legacy = time_vm_save(inventory, legacy=True) if size <= args.legacy_max else None
+        for index, label in enumerate(('insert', 'update')):
+            bulk_seconds, bulk_stats = bulk[index]
+            if legacy:
+                legacy_seconds, legacy_stats = legacy[index]
+                # Unchanged rows are not counted as updates by the diff
+                assert legacy_stats['added'] == bulk_stats['added'], (legacy_stats, bulk_stats)
+                print(f"{size:>8} {label:>7} {legacy_seconds:>14.3f}s {bulk_seconds:>11.3f}s "
+                      f"{legacy_seconds / bulk_seconds:>7.1f}x")
+            else:
+                print(f"{size:>8} {label:>7} {'-':>15} {bulk_seconds:>11.3f}s {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
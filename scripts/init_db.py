@@ -4,70 +4,67 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from db.init import engine
-from db.models import Base, VirtualMachine, VMMetric
+from config.config import settings
+from db.storage import get_storage
 from datetime import datetime, timedelta
 import random
 
 def create_tables():
-    """Create all database tables"""
-    Base.metadata.create_all(bind=engine)
+    """Create all database tables (the SQLite backend migrates itself)"""
+    if settings.STORAGE_BACKEND != "sqlite":
+        from db.init import engine
+        from db.models import Base, VMMetric
+        Base.metadata.create_all(bind=engine)
+        # create_all skips indexes of tables that already exist
+        for index in VMMetric.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("Database tables created successfully!")
 
 def add_mock_data():
     """Add mock VM data and metrics"""
-    from db.init import SessionLocal
+    storage = get_storage()
+    # Create mock VMs
+    specs = {
+        "web-server-01": {"cluster": "prod-cluster", "cpu_cores": 4, "memory_gb": 8, "disk_gb": 100},
+        "db-server-01": {"cluster": "prod-cluster", "cpu_cores": 8, "memory_gb": 32, "disk_gb": 500},
+        "test-vm-01": {"cluster": "test-cluster", "cpu_cores": 2, "memory_gb": 4, "disk_gb": 50},
+        "backup-vm-01": {"cluster": "backup-cluster", "cpu_cores": 2, "memory_gb": 4, "disk_gb": 200},
+        "dev-server-01": {"cluster": "dev-cluster", "cpu_cores": 4, "memory_gb": 16, "disk_gb": 100},
+    }
+    vm_ids = storage.resolve_vms(specs)["ids"]
     
-    db = SessionLocal()
-    try:
-        # Create mock VMs
-        vms = [
-            VirtualMachine(name="web-server-01", cluster="prod-cluster", cpu_cores=4, memory_gb=8, disk_gb=100),
-            VirtualMachine(name="db-server-01", cluster="prod-cluster", cpu_cores=8, memory_gb=32, disk_gb=500),
-            VirtualMachine(name="test-vm-01", cluster="test-cluster", cpu_cores=2, memory_gb=4, disk_gb=50),
-            VirtualMachine(name="backup-vm-01", cluster="backup-cluster", cpu_cores=2, memory_gb=4, disk_gb=200),
-            VirtualMachine(name="dev-server-01", cluster="dev-cluster", cpu_cores=4, memory_gb=16, disk_gb=100),
-        ]
-        
-        for vm in vms:
-            db.add(vm)
-        db.commit()
-        
-        # Create mock metrics for the last 7 days
-        for vm in vms:
-            for days_ago in range(7):
-                for hour in range(0, 24, 2):  # Every 2 hours
-                    timestamp = datetime.utcnow() - timedelta(days=days_ago, hours=hour)
-                    
-                    # Generate realistic metrics based on VM type
-                    if "test" in vm.name or "backup" in vm.name:
-                        # Low utilization VMs
-                        cpu_usage = random.uniform(2, 8)
-                        memory_usage = random.uniform(10, 25)
-                    elif "db" in vm.name:
-                        # High utilization DB
-                        cpu_usage = random.uniform(60, 85)
-                        memory_usage = random.uniform(70, 90)
-                    else:
-                        # Normal utilization
-                        cpu_usage = random.uniform(25, 60)
-                        memory_usage = random.uniform(40, 70)
-                    
-                    metric = VMMetric(
-                        vm_id=vm.id,
-                        timestamp=timestamp,
-                        cpu_usage=cpu_usage,
-                        memory_usage=memory_usage,
-                        disk_io=random.uniform(10, 100),
-                        net_io=random.uniform(5, 50)
-                    )
-                    db.add(metric)
-        
-        db.commit()
-        print("Mock data added successfully!")
-        
-    finally:
-        db.close()
+    # Create mock metrics for the last 7 days
+    rows = []
+    for name, vm_id in vm_ids.items():
+        for days_ago in range(7):
+            for hour in range(0, 24, 2):  # Every 2 hours
+                timestamp = datetime.utcnow() - timedelta(days=days_ago, hours=hour)
+                
+                # Generate realistic metrics based on VM type
+                if "test" in name or "backup" in name:
+                    # Low utilization VMs
+                    cpu_usage = random.uniform(2, 8)
+                    memory_usage = random.uniform(10, 25)
+                elif "db" in name:
+                    # High utilization DB
+                    cpu_usage = random.uniform(60, 85)
+                    memory_usage = random.uniform(70, 90)
+                else:
+                    # Normal utilization
+                    cpu_usage = random.uniform(25, 60)
+                    memory_usage = random.uniform(40, 70)
+                
+                rows.append({
+                    "vm_id": vm_id,
+                    "timestamp": timestamp,
+                    "cpu_usage": cpu_usage,
+                    "memory_usage": memory_usage,
+                    "disk_io": random.uniform(10, 100),
+                    "net_io": random.uniform(5, 50)
+                })
+    
+    storage.write_metrics(rows)
+    print("Mock data added successfully!")
 
 if __name__ == "__main__":
     print("Initializing IROA database...")
@@ -0,0 +1,132 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from api.metrics_rollups import MetricsRollups
+from db.cold_tier import ColdTier
+from db.migrations import migrate
+from db.partitions import PartitionedTables, period_start, to_epoch_ms
+
+COLUMNS = ("vm_id", "vm_name", "cluster_name", "allocated_vcpus", "cpu_usage_percent", "metric_timestamp")
+# Old enough to archive (30 days), young enough to keep (90 days)
+DAY = period_start(datetime.utcnow() - timedelta(days=40), "day")
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    migrate(path, "metrics")
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def cold(tmp_path):
+    return ColdTier(str(tmp_path / "archive"))
+
+def _samples(vm_id, count, day=DAY, step_seconds=15.5):
+    return [
+        (vm_id, vm_id, "c1", 4, i * 0.25, (day + timedelta(seconds=i * step_seconds)).isoformat())
+        for i in range(count)
+    ]
+
+def _archive(conn, cold):
+    archived = []
+    for table, partition in cold.due(conn):
+        assert cold.attach_block(conn, cold.write_block(conn, table, partition))
+        archived.append(partition)
+    return archived
+
+def test_partitions_past_archive_age_move_to_columnar_files(conn, cold):
+    partitions = PartitionedTables()
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-b", 100) + _samples("vm-a", 50))
+    recent = period_start(datetime.utcnow(), "day")
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-a", 5, day=recent))
+
+    archived = _archive(conn, cold)
+    assert archived == [f"vm_metrics_history_d{DAY:%Y%m%d}"]
+    # Only the recent partition stays in SQLite
+    assert partitions.partitions(conn, "vm_metrics_history") == [f"vm_metrics_history_d{recent:%Y%m%d}"]
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 5
+
+    block = cold.blocks(conn, "vm_metrics_history")[0]
+    assert block.meta["rows"] == 150
+    assert block.array("cpu_usage_percent").dtype == np.float32
+    assert block.array("ts_delta").dtype == np.int32
+    assert isinstance(block.array("cpu_usage_percent"), np.memmap)
+    # Delta-encoded: one step per sample after each resource's first
+    start, end = block.meta["resources"]["vm-b"]
+    assert set(block.array("ts_delta")[start + 1:end].tolist()) == {15500}
+
+def test_cold_rows_read_back_like_hot_rows(conn, cold):
+    samples = _samples("vm-a", 20)
+    PartitionedTables().insert(conn, "vm_metrics_history", COLUMNS, samples)
+    _archive(conn, cold)
+
+    rows = cold.read(conn, "vm_metrics_history", "vm-a", since=DAY + timedelta(seconds=60))
+    expected = [s for s in samples if s[5] >= (DAY + timedelta(seconds=60)).isoformat()]
+    assert [datetime.fromisoformat(r["metric_timestamp"]) for r in rows] == \
+        [datetime.fromisoformat(s[5]) for s in expected]
+    assert [r["cpu_usage_percent"] for r in rows] == [s[4] for s in expected]
+    assert rows[0]["vm_name"] == "vm-a"
+    assert rows[0]["cluster_name"] == "c1"
+    assert rows[0]["allocated_vcpus"] == 4.0
+    assert cold.read(conn, "vm_metrics_history", "missing") == []
+
+def test_cold_series_returns_epoch_ms_arrays(conn, cold):
+    samples = _samples("vm-a", 20)
+    PartitionedTables().insert(conn, "vm_metrics_history", COLUMNS, samples)
+    _archive(conn, cold)
+
+    timestamps, values = cold.series(conn, "vm_metrics_history", "vm-a", "cpu_usage_percent")
+    assert timestamps.dtype == np.int64
+    assert values.dtype == np.float64
+    assert timestamps.tolist() == [to_epoch_ms(s[5]) for s in samples]
+    assert values.tolist() == [s[4] for s in samples]
+    assert len(cold.series(conn, "vm_metrics_history", "vm-b", "cpu_usage_percent")[0]) == 0
+
+def test_block_is_not_attached_if_partition_changed(conn, cold):
+    partitions = PartitionedTables()
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-a", 10))
+    (table, partition), = cold.due(conn)
+    meta = cold.write_block(conn, table, partition)
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-a", 1, day=DAY + timedelta(hours=1)))
+
+    assert not cold.attach_block(conn, meta)
+    assert partitions.partitions(conn, "vm_metrics_history") == [partition]
+    assert cold.blocks(conn, "vm_metrics_history") == []
+
+def test_rollups_rebuild_buckets_across_both_tiers(conn, cold):
+    partitions = PartitionedTables()
+    rollups = MetricsRollups(cold_tier=cold)
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-a", 10, step_seconds=10))
+    rollups.update(conn)
+    _archive(conn, cold)
+
+    # A late sample lands in a new hot partition for the archived day
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, [("vm-a", "vm-a", "c1", 4, 50.0, DAY.isoformat())])
+    rollups.update(conn)
+    count, total = conn.execute(
+        "SELECT sample_count, sum FROM metric_rollups WHERE resource_type = 'vm' AND resolution = '5m' "
+        "AND resource_id = 'vm-a' AND metric_name = 'cpu_usage_percent'"
+    ).fetchone()
+    assert count == 11
+    assert total == pytest.approx(sum(i * 0.25 for i in range(10)) + 50.0)
+
+def test_retention_expires_cold_blocks(conn, cold):
+    PartitionedTables().insert(conn, "vm_metrics_history", COLUMNS, _samples("vm-a", 10))
+    _archive(conn, cold)
+    (block,) = cold.blocks(conn, "vm_metrics_history")
+
+    assert cold.drop_expired(conn) == []
+    expired = cold.drop_expired(conn, now=datetime.utcnow() + timedelta(days=60))
+    assert expired == [os.path.join("vm_metrics_history", f"vm_metrics_history_d{DAY:%Y%m%d}")]
+    cold.remove_files(expired)
+    assert cold.blocks(conn, "vm_metrics_history") == []
+    assert not os.path.exists(block.path)
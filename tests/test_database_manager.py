@@ -0,0 +1,322 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from api.database_manager import InfrastructureDBManager
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """Manager on a scratch database"""
+    return InfrastructureDBManager(str(tmp_path / "iroa.db"))
+
+def _vm(name, status="running"):
+    return {"vm": name, "moid": f"moid-{name}", "status": status, "cpu": 5, "memory_usage": 10, "datacenter": "DC"}
+
+def test_inventory_delta_updates_and_soft_deletes(db_manager):
+    inventory = {"datacenters": [{"name": "DC"}], "vms": [_vm("a"), _vm("b"), _vm("c")]}
+    assert db_manager.save_infrastructure_inventory("vcenter", inventory)
+
+    stats = db_manager.apply_inventory_delta("vcenter", {"vms": [_vm("a", "stopped")]}, {"vms": ["moid-b"]})
+    assert stats == {"processed": 1, "added": 0, "updated": 1, "deleted": 1}
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert {vm["name"]: vm["status"] for vm in stored["vms"]} == {"a": "stopped", "c": "running"}
+    assert stored["summary"]["total_vms"] == 2
+
+    history = db_manager.get_sync_history("vcenter")
+    assert history[0]["sync_type"] == "incremental"
+    assert history[0]["records_deleted"] == 1
+
+def test_inventory_delta_reactivates_returning_objects(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]})
+    db_manager.apply_inventory_delta("vcenter", {}, {"vms": ["moid-a"]})
+    db_manager.apply_inventory_delta("vcenter", {"vms": [_vm("a")]}, {})
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert [vm["name"] for vm in stored["vms"]] == ["a"]
+
+def test_inventory_delta_removes_by_moid(db_manager):
+    twins = {"vms": [dict(_vm("web"), moid="vm-1"), dict(_vm("web"), moid="vm-2")]}
+    db_manager.save_infrastructure_inventory("vcenter", twins, site="vc1")
+    db_manager.save_infrastructure_inventory("vcenter", twins, site="vc2")
+    stats = db_manager.apply_inventory_delta("vcenter", {}, {"vms": ["vm-1"]}, site="vc1")
+    assert stats["deleted"] == 1
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")["vms"]
+    assert sorted((vm["site"], vm["moid"]) for vm in stored) == [("vc1", "vm-2"), ("vc2", "vm-1"), ("vc2", "vm-2")]
+
+def test_per_site_sync_history(db_manager):
+    from datetime import datetime, timedelta
+    started = datetime.now() - timedelta(seconds=5)
+    db_manager.save_infrastructure_inventory(
+        "vcenter", {"vms": [_vm("a")]}, sync_details={"site": "vc-eu"}, sync_start=started
+    )
+    db_manager.record_failed_sync("vcenter", started, "no result after 600s", {"site": "vc-us"}, status="timeout")
+
+    history = {row["status"]: row for row in db_manager.get_sync_history("vcenter")}
+    assert '"vc-eu"' in history["success"]["sync_details"]
+    assert history["success"]["duration_seconds"] >= 5
+    assert history["timeout"]["error_message"] == "no result after 600s"
+
+def test_bulk_save_keeps_stats_and_resolves_parents(db_manager):
+    inventory = {
+        "datacenters": [{"name": "DC"}],
+        "clusters": [{"name": "C1", "datacenter": "DC"}],
+        "hosts": [{"name": "h1", "cluster": "C1"}],
+        "vms": [_vm("a"), _vm("b"), dict(_vm("a", "stopped"), cluster="C1", host="h1")],
+    }
+    with db_manager.get_connection() as conn:
+        first = db_manager._save_vms(conn, "vcenter", inventory["vms"])
+    # A name repeated within one batch counts as an update, as before
+    assert first == {"processed": 3, "added": 2, "updated": 1}
+
+    assert db_manager.save_infrastructure_inventory("vcenter", inventory)
+    history = db_manager.get_sync_history("vcenter")[0]
+    assert (history["records_added"], history["records_updated"]) == (3, 3)
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    vms = {vm["name"]: vm for vm in stored["vms"]}
+    assert len(stored["vms"]) == 2
+    assert vms["a"]["status"] == "stopped"
+    assert (vms["a"]["cluster_name"], vms["a"]["host_name"], vms["a"]["datacenter_name"]) == ("C1", "h1", "DC")
+    assert stored["hosts"][0]["datacenter_name"] == "DC"
+
+def test_unchanged_rows_are_not_rewritten(db_manager):
+    inventory = {"datacenters": [{"name": "DC"}], "vms": [_vm("a"), _vm("b")]}
+    db_manager.save_infrastructure_inventory("vcenter", inventory)
+    with db_manager.get_connection() as conn:
+        conn.execute("UPDATE infrastructure_vms SET updated_at = '2000-01-01', last_sync = '2000-01-01'")
+
+    inventory["vms"][1] = _vm("b", "stopped")
+    inventory["vms"].append(_vm("c"))
+    assert db_manager.save_infrastructure_inventory("vcenter", inventory)
+    history = db_manager.get_sync_history("vcenter")[0]
+    assert (history["records_processed"], history["records_added"], history["records_updated"]) == (4, 1, 1)
+
+    with db_manager.get_read_connection() as conn:
+        rows = {row["name"]: row for row in conn.execute("SELECT * FROM infrastructure_vms")}
+    # "a" only had last_sync touched
+    assert rows["a"]["updated_at"] == "2000-01-01" and rows["a"]["last_sync"] != "2000-01-01"
+    assert rows["b"]["updated_at"] != "2000-01-01" and rows["b"]["status"] == "stopped"
+    assert rows["a"]["content_hash"] != rows["b"]["content_hash"]
+
+    events = [(e["event_type"], e["resource_id"], e["sync_id"]) for e in db_manager.get_infrastructure_events("vcenter")]
+    assert sorted(events[:2]) == [("vm_changed", "moid-b", history["id"]), ("vm_created", "moid-c", history["id"])]
+    # The first sync created the datacenter and both VMs
+    assert sorted(e[0] for e in events[2:]) == ["datacenter_created", "vm_created", "vm_created"]
+
+def test_utilization_changes_are_stored_without_events(db_manager):
+    inventory = {"hosts": [{"name": "h1", "cpu_usage_mhz": 100}], "vms": [_vm("a")]}
+    db_manager.save_infrastructure_inventory("vcenter", inventory)
+    with db_manager.get_connection() as conn:
+        conn.execute("UPDATE infrastructure_vms SET updated_at = '2000-01-01'")
+
+    inventory = {"hosts": [{"name": "h1", "cpu_usage_mhz": 900}], "vms": [dict(_vm("a"), cpu=75, memory_usage=60)]}
+    db_manager.save_infrastructure_inventory("vcenter", inventory)
+    history = db_manager.get_sync_history("vcenter")[0]
+    assert history["records_updated"] == 0
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert stored["hosts"][0]["cpu_usage_mhz"] == 900
+    vm = stored["vms"][0]
+    assert (vm["cpu_usage_percent"], vm["memory_usage_percent"], vm["updated_at"]) == (75, 60, "2000-01-01")
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")]
+    assert sorted(events) == ["host_created", "vm_created"]
+
+def test_inventory_delta_emits_removal_and_return_events(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]})
+    db_manager.apply_inventory_delta("vcenter", {}, {"vms": ["moid-a", "moid-missing"]})
+    stats = db_manager.apply_inventory_delta("vcenter", {"vms": [_vm("a")]}, {})
+    # Unchanged content, but the row is rewritten to re-activate it
+    assert stats["updated"] == 1
+
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")]
+    assert events == ["vm_created", "vm_deleted", "vm_created"]
+
+def test_full_sync_sweeps_objects_it_did_not_see(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {
+        "hosts": [{"name": "h1"}, {"name": "h2"}], "networks": [{"name": "n1"}],
+        "vms": [_vm("a"), _vm("b"), _vm("c")],
+    })
+    # Networks are not reported this time, so they are left alone
+    db_manager.save_infrastructure_inventory("vcenter", {"hosts": [{"name": "h1"}], "vms": [_vm("a")]})
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert [vm["name"] for vm in stored["vms"]] == ["a"]
+    assert [host["name"] for host in stored["hosts"]] == ["h1"]
+    assert [net["name"] for net in stored["networks"]] == ["n1"]
+    assert stored["summary"]["total_vms"] == 1
+    assert db_manager.get_sync_history("vcenter")[0]["records_deleted"] == 3
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")[:3]]
+    assert sorted(events) == ["host_deleted", "vm_deleted", "vm_deleted"]
+
+    # A VM that reappears is active again
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a"), _vm("b")]})
+    assert len(db_manager.get_infrastructure_inventory("vcenter")["vms"]) == 2
+
+def test_partial_saves_are_swept_once_all_parts_are_in(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("eu-1"), _vm("us-1"), _vm("us-2")]})
+
+    generation = db_manager.get_sync_generation() + 1
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("eu-1")]}, sweep=False)
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("us-1")]}, sweep=False)
+    assert len(db_manager.get_infrastructure_inventory("vcenter")["vms"]) == 3
+
+    assert db_manager.sweep_stale_inventory("vcenter", generation, ["vms"]) == 1
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert sorted(vm["name"] for vm in stored["vms"]) == ["eu-1", "us-1"]
+    assert stored["summary"]["total_vms"] == 2
+
+def test_a_sweep_moves_the_inventory_version_on(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a"), _vm("b")]})
+    generation = db_manager.get_sync_generation() + 1
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]}, sweep=False)
+    before = db_manager.get_serialized_inventory("vcenter")
+    assert before.vm_count == 2
+
+    assert db_manager.sweep_stale_inventory("vcenter", generation) == 1
+    # Other workers key their cache on the version, not on this invalidation
+    assert db_manager.get_inventory_version("vcenter") > before.version
+    assert db_manager.get_serialized_inventory("vcenter").vm_count == 1
+    history = db_manager.get_sync_history("vcenter")
+    assert (history[0]["sync_type"], history[0]["records_deleted"]) == ("sweep", 1)
+    # Nothing left to sweep: nothing recorded
+    assert db_manager.sweep_stale_inventory("vcenter", generation) == 0
+    assert len(db_manager.get_sync_history("vcenter")) == len(history)
+
+def test_same_named_objects_of_different_sites_are_kept_apart(db_manager):
+    for _ in range(2):
+        db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("web")]}, sweep=False, site="vc-eu")
+        db_manager.save_infrastructure_inventory(
+            "vcenter", {"vms": [dict(_vm("web"), moid="vm-7", cpu=80)]}, sweep=False, site="vc-us"
+        )
+
+    stored = db_manager.get_infrastructure_inventory("vcenter")["vms"]
+    assert sorted((vm["site"], vm["moid"]) for vm in stored) == [("vc-eu", "moid-web"), ("vc-us", "vm-7")]
+    # Repeated syncs of both sites find nothing changed
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")]
+    assert events == ["vm_created", "vm_created"]
+
+def test_a_full_sync_of_one_site_only_sweeps_that_site(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("eu-1")]}, sweep=False, site="vc-eu")
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("us-1"), _vm("us-2")]}, sweep=False, site="vc-us")
+
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("us-1")]}, site="vc-us")
+    stored = db_manager.get_infrastructure_inventory("vcenter")
+    assert sorted(vm["name"] for vm in stored["vms"]) == ["eu-1", "us-1"]
+
+def test_objects_are_keyed_by_moid(db_manager):
+    twins = {"vms": [dict(_vm("web"), moid="vm-1"), dict(_vm("web"), moid="vm-2", cpu=80)]}
+    db_manager.save_infrastructure_inventory("vcenter", twins, site="vc1")
+    stored = db_manager.get_infrastructure_inventory("vcenter")["vms"]
+    assert sorted(vm["moid"] for vm in stored) == ["vm-1", "vm-2"]
+    ids = {vm["moid"]: vm["id"] for vm in stored}
+
+    # A renamed object keeps its row
+    renamed = {"vms": [dict(_vm("web-old"), moid="vm-1"), dict(_vm("web"), moid="vm-2", cpu=80)]}
+    db_manager.save_infrastructure_inventory("vcenter", renamed, site="vc1")
+    stored = db_manager.get_infrastructure_inventory("vcenter")["vms"]
+    assert {vm["moid"]: (vm["id"], vm["name"]) for vm in stored} == {
+        "vm-1": (ids["vm-1"], "web-old"), "vm-2": (ids["vm-2"], "web")
+    }
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")]
+    assert sorted(events) == ["vm_changed", "vm_created", "vm_created"]
+
+def test_first_sited_sync_adopts_rows_stored_without_a_site(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"datastores": [{"name": "ds1", "moid": "datastore-1"}],
+                                                         "vms": [_vm("a"), _vm("b")]})
+    with db_manager.get_connection() as conn:
+        conn.execute("INSERT INTO vm_datastore_mapping (vm_id, datastore_id) "
+                     "SELECT vm.id, ds.id FROM infrastructure_vms vm, infrastructure_datastores ds WHERE vm.name = 'a'")
+    before = {vm["name"]: vm["id"] for vm in db_manager.get_infrastructure_inventory("vcenter")["vms"]}
+
+    db_manager.save_infrastructure_inventory("vcenter", {"datastores": [{"name": "ds1", "moid": "datastore-1"}],
+                                                         "vms": [_vm("a"), _vm("b")]}, site="vc1")
+    stored = db_manager.get_infrastructure_inventory("vcenter")["vms"]
+    assert {vm["name"]: (vm["id"], vm["site"]) for vm in stored} == {
+        name: (row_id, "vc1") for name, row_id in before.items()
+    }
+    assert db_manager.get_sync_history("vcenter")[0]["records_deleted"] == 0
+    events = [e["event_type"] for e in db_manager.get_infrastructure_events("vcenter")]
+    assert sorted(events) == ["datastore_created", "vm_created", "vm_created"]
+    with db_manager.get_read_connection() as conn:
+        assert conn.execute("SELECT vm_id FROM vm_datastore_mapping").fetchall()[0][0] == before["a"]
+
+def test_purge_deletes_long_inactive_objects(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a"), _vm("b")]})
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]})
+    assert db_manager.purge_inactive_inventory(retention_days=30)["vms"] == 0
+
+    with db_manager.get_connection() as conn:
+        conn.execute("UPDATE infrastructure_vms SET updated_at = '2000-01-01' WHERE name = 'b'")
+        conn.execute("UPDATE infrastructure_events SET event_timestamp = '2000-01-01'")
+    purged = db_manager.purge_inactive_inventory(retention_days=30)
+    assert purged["vms"] == 1 and purged["events"] > 0
+
+    with db_manager.get_read_connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT name FROM infrastructure_vms")] == ["a"]
+
+def test_summary_totals_are_not_multiplied_across_tables(db_manager):
+    inventory = {
+        "datacenters": [{"name": "DC"}, {"name": "DC2"}],
+        "clusters": [{"name": "C1", "datacenter": "DC"}],
+        "hosts": [{"name": f"h{i}", "cluster": "C1", "cpu_cores": 16} for i in range(3)],
+        "datastores": [{"name": f"ds{i}", "capacity_gb": 100, "used_space_gb": 40} for i in range(4)],
+        "networks": [{"name": "n1"}, {"name": "n2"}],
+        "vms": [_vm("a"), _vm("b"), dict(_vm("c", "stopped"), cpu=90)],
+    }
+    assert db_manager.save_infrastructure_inventory("vcenter", inventory)
+
+    summary = db_manager.get_infrastructure_inventory("vcenter")["summary"]
+    assert (summary["total_datacenters"], summary["total_clusters"], summary["total_hosts"],
+            summary["total_datastores"], summary["total_networks"]) == (2, 1, 3, 4, 2)
+    assert (summary["total_vms"], summary["running_vms"], summary["stopped_vms"]) == (3, 2, 1)
+    assert summary["total_cpu_cores"] == 48
+    assert (summary["total_storage_gb"], summary["used_storage_gb"]) == (400, 160)
+    assert summary["underutilized_vms"] == 2
+    assert summary["avg_cpu_utilization"] == pytest.approx(100 / 3)
+
+    # Every per-table aggregate is answered from a (source, is_active) index
+    with db_manager.get_connection() as conn:
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*), TOTAL(cpu_cores), TOTAL(memory_gb) "
+            "FROM infrastructure_hosts WHERE source = 'vcenter' AND is_active = 1"
+        ))
+    assert "COVERING INDEX idx_infrastructure_hosts_summary" in plan
+
+def test_inventory_cache_is_versioned_by_sync(db_manager):
+    import json
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]})
+    cache = db_manager.inventory_cache
+    misses = cache.stats["misses"]
+
+    first = db_manager.get_serialized_inventory("vcenter")
+    assert db_manager.get_serialized_inventory("vcenter") is first
+    assert cache.stats["misses"] == misses + 1 and cache.stats["hits"] >= 1
+    assert [vm["name"] for vm in json.loads(first.vms)] == ["a"]
+    assert json.loads(first.inventory)["summary"]["total_vms"] == first.total_vms == 1
+
+    # A committed sync invalidates; the next read reloads under the new sync id
+    db_manager.apply_inventory_delta("vcenter", {"vms": [_vm("b")]}, {})
+    second = db_manager.get_serialized_inventory("vcenter")
+    assert second.version > first.version
+    assert sorted(vm["name"] for vm in json.loads(second.vms)) == ["a", "b"]
+
+    # Another manager (e.g. the hyperv router's) sees the same entries
+    other = InfrastructureDBManager(db_manager.db_path)
+    assert other.get_serialized_inventory("vcenter") is second
+    assert other.get_serialized_inventory("hyperv") is None
+
+def test_inventory_cache_drops_loads_that_race_a_sync(db_manager):
+    db_manager.save_infrastructure_inventory("vcenter", {"vms": [_vm("a")]})
+    version = db_manager.get_inventory_version("vcenter")
+
+    def loader():
+        db_manager.inventory_cache.invalidate("vcenter")
+        return {"vms": [], "summary": {}}
+
+    assert db_manager.inventory_cache.get("vcenter", version, loader).vm_count == 0
+    assert db_manager.get_serialized_inventory("vcenter").vm_count == 1
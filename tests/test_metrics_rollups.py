@@ -0,0 +1,195 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from api.metrics_rollups import MetricsRollups, bucket_start, cover_range, percentile_95, pick_resolution
+from api.tdigest import TDigest
+from db.migrations import migrate
+from db.partitions import PartitionedTables
+
+# Recent enough to stay inside the raw-history retention window
+START = bucket_start(datetime.utcnow() - timedelta(days=3), "1d")
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    migrate(path, "metrics")
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+def _insert_vm_samples(conn, vm_id, samples):
+    PartitionedTables().insert(
+        conn, "vm_metrics_history",
+        ("vm_id", "vm_name", "cluster_name", "cpu_usage_percent", "memory_usage_percent", "metric_timestamp"),
+        [(vm_id, vm_id, "c1", cpu, cpu / 2, ts.isoformat()) for ts, cpu in samples]
+    )
+
+def _rollup(conn, resolution, vm_id="vm-1", metric="cpu_usage_percent"):
+    return conn.execute(
+        "SELECT * FROM metric_rollups WHERE resource_type = 'vm' AND resolution = ? "
+        "AND resource_id = ? AND metric_name = ? ORDER BY bucket_start",
+        (resolution, vm_id, metric)
+    ).fetchall()
+
+def test_bucket_start_aligns_to_resolution():
+    ts = datetime(2024, 3, 1, 13, 47, 29, 123456)
+    assert bucket_start(ts, "5m") == datetime(2024, 3, 1, 13, 45)
+    assert bucket_start(ts, "1h") == datetime(2024, 3, 1, 13, 0)
+    assert bucket_start(ts, "1d") == datetime(2024, 3, 1)
+
+def test_pick_resolution_prefers_finest_within_point_budget():
+    assert pick_resolution(24, None) is None
+    assert pick_resolution(24, 288) == "5m"
+    assert pick_resolution(24, 287) == "1h"
+    assert pick_resolution(24, 24) == "1h"
+    assert pick_resolution(24 * 30, 30) == "1d"
+    assert pick_resolution(24 * 30, 100) == "1d"
+    assert pick_resolution(24 * 30, 720) == "1h"
+    assert pick_resolution(1, 100) == "5m"
+    # More days than points: daily buckets are the best there is
+    assert pick_resolution(24 * 365, 100) == "1d"
+
+def test_rollups_match_raw_aggregates(conn):
+    # Two days of one-minute samples
+    samples = [(START + timedelta(minutes=i), float(i % 97)) for i in range(2 * 24 * 60)]
+    _insert_vm_samples(conn, "vm-1", samples)
+    processed = MetricsRollups(batch_size=500).update(conn)
+    assert processed["vm"] == len(samples)
+
+    five = _rollup(conn, "5m")
+    assert len(five) == 2 * 24 * 12
+    first = [cpu for ts, cpu in samples[:5]]
+    assert five[0]["sample_count"] == 5
+    assert five[0]["sum"] == sum(first)
+    assert five[0]["p95"] == percentile_95(first)
+
+    hourly = _rollup(conn, "1h")
+    assert len(hourly) == 48
+    hour = [cpu for ts, cpu in samples[60:120]]
+    assert hourly[1]["bucket_start"] == (START + timedelta(hours=1)).isoformat()
+    assert hourly[1]["sample_count"] == 60
+    assert hourly[1]["sum"] == pytest.approx(sum(hour))
+    assert hourly[1]["min_value"] == min(hour)
+    assert hourly[1]["max_value"] == max(hour)
+
+    daily = _rollup(conn, "1d")
+    assert [row["sample_count"] for row in daily] == [1440, 1440]
+    day = [cpu for ts, cpu in samples[:1440]]
+    assert daily[0]["sum_sq"] == pytest.approx(sum(v * v for v in day))
+    # Approximate p95 stays within a tenth of the value range of the exact one
+    assert abs(daily[0]["p95"] - percentile_95(day)) <= 0.1 * (max(day) - min(day))
+
+def test_update_only_folds_new_rows(conn):
+    rollups = MetricsRollups()
+    _insert_vm_samples(conn, "vm-1", [(START, 10.0), (START + timedelta(minutes=1), 20.0)])
+    assert rollups.update(conn)["vm"] == 2
+    assert rollups.update(conn)["vm"] == 0
+
+    # A late sample for an already rolled-up bucket recomputes that bucket
+    # and every coarser bucket above it
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=2), 60.0)])
+    assert rollups.update(conn)["vm"] == 1
+    for resolution in ("5m", "1h", "1d"):
+        (row,) = _rollup(conn, resolution)
+        assert row["sample_count"] == 3
+        assert row["sum"] == 90.0
+        assert row["max_value"] == 60.0
+
+def test_coarse_buckets_fold_in_new_samples_without_reading_children(conn):
+    rollups = MetricsRollups()
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=i), float(i)) for i in range(60)])
+    rollups.update(conn)
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=60), 100.0)])
+    rollups.update(conn)
+    conn.set_trace_callback(None)
+    # Hourly and daily buckets are read, never the 5-minute or hourly children
+    reads = [sql for sql in statements if "FROM metric_rollups" in sql]
+    assert reads and all("AND resolution = '1h'" in sql or "AND resolution = '1d'" in sql for sql in reads)
+
+    (day,) = _rollup(conn, "1d")
+    values = [float(i) for i in range(60)] + [100.0]
+    assert day["sample_count"] == 61
+    assert day["sum"] == sum(values)
+    assert day["sum_sq"] == sum(v * v for v in values)
+    assert (day["min_value"], day["max_value"]) == (0.0, 100.0)
+    assert TDigest.from_bytes(day["digest"]).count == 61
+
+def test_history_returns_bucket_averages(conn):
+    rollups = MetricsRollups()
+    samples = [(START + timedelta(minutes=i), float(i)) for i in range(120)]
+    _insert_vm_samples(conn, "vm-1", samples)
+    _insert_vm_samples(conn, "vm-2", samples)
+    rollups.update(conn)
+
+    history = rollups.history(conn, "vm", "vm-1", "1h", START)
+    assert [row["metric_timestamp"] for row in history] == [
+        START.isoformat(), (START + timedelta(hours=1)).isoformat()
+    ]
+    assert history[0]["vm_id"] == "vm-1"
+    assert history[0]["resolution"] == "1h"
+    assert history[0]["sample_count"] == 60
+    assert history[0]["cpu_usage_percent"] == pytest.approx(29.5)
+    assert history[0]["cpu_usage_percent_max"] == 59.0
+    assert history[0]["memory_usage_percent"] == pytest.approx(14.75)
+
+def test_cover_range_uses_coarsest_buckets():
+    day = datetime(2024, 3, 1)
+    cover = cover_range(day - timedelta(hours=1, minutes=7), day + timedelta(days=2, hours=2, minutes=3))
+    assert cover == [
+        ("5m", day - timedelta(hours=1, minutes=10), day - timedelta(hours=1)),
+        ("1h", day - timedelta(hours=1), day),
+        ("1d", day, day + timedelta(days=2)),
+        ("1h", day + timedelta(days=2), day + timedelta(days=2, hours=2)),
+        ("5m", day + timedelta(days=2, hours=2), day + timedelta(days=2, hours=2, minutes=5)),
+    ]
+
+def test_quantiles_merge_bucket_digests(conn):
+    rollups = MetricsRollups()
+    # A day and a half of one-minute samples
+    values = np.random.default_rng(3).gamma(2.0, 10.0, 36 * 60)
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=i), float(v)) for i, v in enumerate(values)])
+    rollups.update(conn)
+
+    hourly = _rollup(conn, "1h")
+    hour = values[60:120]
+    assert TDigest.from_bytes(hourly[1]["digest"]).count == 60
+    # Interpolated within a rank of the exact p95 on 60 samples
+    assert abs(hourly[1]["p95"] - percentile_95(list(hour))) <= 0.1 * (hour.max() - hour.min())
+
+    result = rollups.quantiles(conn, "vm", "vm-1", "cpu_usage_percent", START, START + timedelta(hours=36),
+                               (0.5, 0.95, 0.99))
+    # One day bucket and twelve hourly ones
+    assert (result["samples"], result["buckets"], result["buckets_without_digest"]) == (len(values), 13, 0)
+    assert (result["min"], result["max"]) == (values.min(), values.max())
+    assert set(result["quantiles"]) == {"p50", "p95", "p99"}
+    for q in (0.5, 0.95, 0.99):
+        assert result["quantiles"][f"p{round(q * 100):d}"] == pytest.approx(np.quantile(values, q), rel=0.02)
+
+def test_buckets_without_digests_fall_back(conn):
+    rollups = MetricsRollups()
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=i), float(i)) for i in range(10)])
+    rollups.update(conn)
+    # As if rolled up before the digest column existed
+    conn.execute("UPDATE metric_rollups SET digest = NULL")
+    _insert_vm_samples(conn, "vm-1", [(START + timedelta(minutes=10), 10.0)])
+    rollups.update(conn)
+
+    # Coarse buckets without a digest are rebuilt from their children
+    (hour,) = _rollup(conn, "1h")
+    assert hour["digest"] is None
+    assert hour["sample_count"] == 11
+    assert hour["max_value"] == 10.0
+    result = rollups.quantiles(conn, "vm", "vm-1", "cpu_usage_percent", START, START + timedelta(minutes=15))
+    assert (result["samples"], result["buckets"], result["buckets_without_digest"]) == (1, 3, 2)
@@ -0,0 +1,190 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from db.migrations import MIGRATIONS_ROOT, discover, migrate
+from db.partitions import PartitionedTables, period_start
+from db.sqlite_pool import get_pool
+
+def _plan(conn, sql, params=()):
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+@pytest.fixture
+def metrics_db(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    migrate(path, "metrics")
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+def test_migrations_apply_once_in_order(tmp_path):
+    path = str(tmp_path / "iroa.db")
+    applied = migrate(path, "inventory")
+    assert applied == [f"{m.version:04d}_{m.name}" for m in discover("inventory")]
+    assert migrate(path, "inventory") == []
+
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [m.version for m in discover("inventory")]
+    # Fresh databases now get the workload vm_profiles table
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(vm_profiles)")]
+    assert "workload_group_id" in columns
+    conn.close()
+
+def test_pre_migration_database_is_upgraded(tmp_path):
+    path = str(tmp_path / "iroa.db")
+    conn = sqlite3.connect(path)
+    for name in ("0001_core_schema.sql", "0002_infrastructure_inventory.sql"):
+        conn.executescript((MIGRATIONS_ROOT / "inventory" / name).read_text())
+    conn.executemany("INSERT INTO infrastructure_vms (name, source) VALUES (?, ?)",
+                     [("a", "vcenter"), ("a", "vcenter"), ("a", "hyperv")])
+    conn.commit()
+    conn.close()
+
+    migrate(path, "inventory")
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, source FROM infrastructure_vms ORDER BY id").fetchall()
+    assert rows == [(1, "vcenter"), (3, "hyperv")]
+    legacy_columns = [row[1] for row in conn.execute("PRAGMA table_info(vm_profiles_legacy)")]
+    assert "license_requirements" in legacy_columns
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE "
+                            "'update_infrastructure_summary%'").fetchall()
+    assert triggers == []
+    conn.close()
+
+def test_failed_migration_is_rolled_back_and_retried(tmp_path):
+    root = tmp_path / "migrations"
+    (root / "demo").mkdir(parents=True)
+    (root / "demo" / "0001_table.sql").write_text("CREATE TABLE t (v INTEGER);")
+    (root / "demo" / "0002_broken.sql").write_text("INSERT INTO t VALUES (1); INSERT INTO missing VALUES (1);")
+    path = str(tmp_path / "demo.db")
+
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(path, "demo", root)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    assert [row[0] for row in conn.execute("SELECT version FROM schema_version")] == [1]
+    conn.close()
+
+    (root / "demo" / "0002_broken.sql").write_text("INSERT INTO t VALUES (1);")
+    assert migrate(path, "demo", root) == ["0002_broken"]
+
+def test_vm_history_range_scan_uses_index(metrics_db):
+    plan = _plan(metrics_db, "SELECT * FROM vm_metrics_history WHERE vm_id = ? AND metric_ts_ms >= ? "
+                             "ORDER BY metric_ts_ms ASC", ("vm-1", 1704067200000))
+    assert "USING INDEX idx_vm_metrics_vm_ts_cover (vm_id=? AND metric_ts_ms>?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+@pytest.mark.parametrize("table,id_field,metric,index", [
+    ("vm_metrics_history", "vm_id", "cpu_usage_percent", "idx_vm_metrics_vm_ts_cover"),
+    ("vm_metrics_history", "cluster_name", "memory_usage_percent", "idx_vm_metrics_cluster_ts_cover"),
+    ("host_metrics_history", "host_id", "cpu_usage_percent", "idx_host_metrics_host_ts_cover"),
+    ("cluster_metrics_history", "cluster_name", "avg_cpu_usage_percent", "idx_cluster_metrics_cluster_ts_cover"),
+])
+def test_series_scans_are_covered(metrics_db, table, id_field, metric, index):
+    plan = _plan(metrics_db, f"SELECT {metric}, metric_ts_ms FROM {table} WHERE {id_field} = ? "
+                             "AND metric_ts_ms >= ? ORDER BY metric_ts_ms ASC", ("x", 1704067200000))
+    assert f"USING COVERING INDEX {index}" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_cluster_history_uses_index(metrics_db):
+    plan = _plan(metrics_db, "SELECT * FROM cluster_metrics_history WHERE cluster_name = ? "
+                             "AND metric_ts_ms >= ? ORDER BY metric_ts_ms ASC", ("c", 1704067200000))
+    assert "USING INDEX idx_cluster_metrics_cluster_ts_cover" in plan
+
+def test_forecasting_aggregates_are_replaced_not_appended(metrics_db):
+    plan = _plan(metrics_db, "SELECT * FROM forecasting_aggregates WHERE resource_type = ? AND resource_id = ? "
+                             "AND metric_name = ? ORDER BY last_updated DESC LIMIT 1", ("vm", "1", "cpu"))
+    assert "uq_forecasting_resource_metric" in plan
+    for value in (1.0, 2.0):
+        metrics_db.execute("INSERT OR REPLACE INTO forecasting_aggregates (resource_type, resource_id, metric_name, "
+                           "hourly_avg, period_start, period_end) VALUES ('vm', '1', 'cpu', ?, '', '')", (value,))
+    rows = metrics_db.execute("SELECT hourly_avg FROM forecasting_aggregates").fetchall()
+    assert rows == [(2.0,)]
+
+@pytest.fixture
+def new_york_time():
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+def test_local_history_timestamps_are_converted_to_utc(tmp_path, new_york_time):
+    root = tmp_path / "migrations"
+    (root / "metrics").mkdir(parents=True)
+    for source in sorted((MIGRATIONS_ROOT / "metrics").iterdir()):
+        if source.name < "0010":
+            shutil.copy(source, root / "metrics")
+    path = str(tmp_path / "metrics.db")
+    migrate(path, "metrics", root)
+
+    # Written as before: local wall-clock text, true epoch milliseconds
+    day = period_start(datetime.now() - timedelta(days=2), "day")
+    evening, noon = day + timedelta(hours=21, minutes=30), day + timedelta(hours=12)
+    with get_pool(path).writer() as conn:
+        PartitionedTables().insert(conn, "vm_metrics_history", ["vm_id", "vm_name", "cluster_name", "metric_timestamp", "metric_ts_ms"], [
+            ("vm-1", "app", "prod", moment.isoformat(), round(moment.timestamp() * 1000)) for moment in (noon, evening)
+        ])
+        conn.execute("INSERT INTO metric_rollups (resource_type, resolution, resource_id, metric_name, bucket_start, "
+                     "sample_count, sum, sum_sq, min_value, max_value, p95) "
+                     "VALUES ('vm', '1h', 'vm-2', 'cpu_usage_percent', ?, 1, 1, 1, 1, 1, 1)", (noon.isoformat(),))
+    assert migrate(path, "metrics") == ["0010_utc_history_timestamps"]
+
+    utc = {moment: moment.astimezone(timezone.utc).replace(tzinfo=None) for moment in (noon, evening)}
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT metric_timestamp, metric_ts_ms FROM vm_metrics_history ORDER BY metric_ts_ms").fetchall()
+    assert rows == [(utc[moment].isoformat(), round(moment.timestamp() * 1000)) for moment in (noon, evening)]
+    # 21:30 in New York is past midnight UTC: that row moved to the next day's partition
+    partition = PartitionedTables().partitions(conn, "vm_metrics_history", utc[evening], utc[evening])
+    assert partition == [f"vm_metrics_history_d{utc[evening]:%Y%m%d}"]
+    assert conn.execute(f'SELECT COUNT(*) FROM "{partition[0]}"').fetchone()[0] == 1
+    assert conn.execute("SELECT bucket_start FROM metric_rollups WHERE resource_id = 'vm-2'").fetchall() == [
+        (utc[noon].isoformat(),)
+    ]
+    conn.close()
+
+def test_inventory_rows_are_rekeyed_by_moid(tmp_path):
+    root = tmp_path / "migrations"
+    (root / "inventory").mkdir(parents=True)
+    for source in sorted((MIGRATIONS_ROOT / "inventory").iterdir()):
+        if source.name < "0011":
+            shutil.copy(source, root / "inventory")
+    path = str(tmp_path / "iroa.db")
+    migrate(path, "inventory", root)
+
+    # A VM renamed under name keys left its old row behind, still mapped
+    with get_pool(path).writer() as conn:
+        conn.executemany("INSERT INTO infrastructure_vms (name, moid, source, site, is_active, sync_generation) "
+                         "VALUES (?, ?, 'vcenter', 'vc1', ?, ?)",
+                         [("web-old", "vm-1", 0, 1), ("web", "vm-1", 1, 2), ("db", "", 1, 2)])
+        conn.execute("INSERT INTO infrastructure_datastores (name, moid, source, site) "
+                     "VALUES ('ds1', 'datastore-1', 'vcenter', 'vc1')")
+        conn.execute("INSERT INTO vm_datastore_mapping (vm_id, datastore_id) VALUES (1, 1)")
+        conn.execute("INSERT INTO infrastructure_datacenters (name, moid, source, site) "
+                     "VALUES ('DC', 'datacenter-1', 'vcenter', 'vc1')")
+    assert migrate(path, "inventory") == ["0011_inventory_moid_keys"]
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT id, name, moid FROM infrastructure_vms ORDER BY id").fetchall()
+    assert rows == [(2, "web", "vm-1"), (3, "db", None)]
+    assert conn.execute("SELECT vm_id FROM vm_datastore_mapping").fetchall() == [(2,)]
+    # Same-named objects with their own moids, and the same datacenter moid in another vCenter
+    conn.execute("INSERT INTO infrastructure_vms (name, moid, source, site) VALUES ('web', 'vm-2', 'vcenter', 'vc1')")
+    conn.execute("INSERT INTO infrastructure_datacenters (name, moid, source, site) "
+                 "VALUES ('DC', 'datacenter-1', 'vcenter', 'vc2')")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO infrastructure_vms (name, moid, source, site) VALUES ('other', 'vm-2', 'vcenter', 'vc1')")
+    conn.close()
@@ -0,0 +1,156 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from db.migrations import MIGRATIONS_ROOT, migrate
+from db.partitions import PartitionedTables, period_start, to_epoch_ms
+
+COLUMNS = ("vm_id", "vm_name", "cluster_name", "cpu_usage_percent", "metric_timestamp")
+TODAY = period_start(datetime.utcnow(), "day")
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    migrate(path, "metrics")
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+def _rows(days_ago, count=3):
+    day = TODAY - timedelta(days=days_ago)
+    return [("vm-1", "vm-1", "c1", float(i), (day + timedelta(hours=i)).isoformat()) for i in range(count)]
+
+def test_rows_are_routed_to_daily_partitions(conn):
+    partitions = PartitionedTables()
+    assert partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(2) + _rows(1) + _rows(0)) == 9
+
+    names = partitions.partitions(conn, "vm_metrics_history")
+    assert names == [f"vm_metrics_history_d{TODAY - timedelta(days=d):%Y%m%d}" for d in (2, 1, 0)]
+    for name in names:
+        assert conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] == 3
+    # The original table name is a view over every partition
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 9
+    # Range reads only touch the overlapping partitions
+    assert partitions.partitions(conn, "vm_metrics_history", since=TODAY + timedelta(hours=1)) == names[-1:]
+    assert partitions.source(conn, "vm_metrics_history", since=TODAY) == f'"{names[-1]}"'
+
+def test_partitions_carry_the_template_indexes(conn):
+    partitions = PartitionedTables()
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(0))
+    name = partitions.partitions(conn, "vm_metrics_history")[0]
+    plan = " | ".join(row[3] for row in conn.execute(
+        f'EXPLAIN QUERY PLAN SELECT cpu_usage_percent, metric_ts_ms FROM "{name}" '
+        "WHERE vm_id = ? AND metric_ts_ms >= ?", ("vm-1", to_epoch_ms(TODAY))
+    ))
+    assert f"idx_vm_metrics_vm_ts_cover{name[len('vm_metrics_history'):]}" in plan
+
+def test_cluster_history_is_partitioned_by_week(conn):
+    partitions = PartitionedTables()
+    monday = period_start(TODAY, "week")
+    rows = [("c1", (monday + timedelta(days=d)).isoformat()) for d in range(7)]
+    partitions.insert(conn, "cluster_metrics_history", ("cluster_name", "metric_timestamp"), rows)
+    assert partitions.partitions(conn, "cluster_metrics_history") == [f"cluster_metrics_history_w{monday:%Y%m%d}"]
+
+def test_retention_drops_whole_expired_partitions(conn):
+    partitions = PartitionedTables()
+    partitions.set_policy(conn, "vm_metrics_history", "day", 5)
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(10) + _rows(5) + _rows(4))
+    # Creating a new partition retires the ones past the window
+    assert len(partitions.partitions(conn, "vm_metrics_history")) == 2
+
+    dropped = partitions.drop_expired(conn, now=TODAY + timedelta(days=1))
+    assert dropped == [f"vm_metrics_history_d{TODAY - timedelta(days=5):%Y%m%d}"]
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 3
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = ?", (dropped[0],)).fetchone()[0] == 0
+
+def test_views_and_range_reads_span_more_partitions_than_a_compound_select_allows(conn):
+    partitions = PartitionedTables()
+    partitions.set_policy(conn, "vm_metrics_history", "day", 1000)
+    rows = [row for days_ago in range(600) for row in _rows(days_ago, count=1)]
+    assert partitions.insert(conn, "vm_metrics_history", COLUMNS, rows) == 600
+
+    assert len(partitions.partitions(conn, "vm_metrics_history")) == 600
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 600
+    source = partitions.source(conn, "vm_metrics_history", since=TODAY - timedelta(days=700))
+    assert conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0] == 600
+
+def test_existing_history_moves_into_partitions(tmp_path):
+    root = tmp_path / "migrations"
+    (root / "metrics").mkdir(parents=True)
+    for path in sorted((MIGRATIONS_ROOT / "metrics").iterdir()):
+        if path.name < "0005":
+            shutil.copy(path, root / "metrics")
+    db_path = str(tmp_path / "metrics.db")
+    migrate(db_path, "metrics", root)
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO vm_metrics_history (vm_id, vm_name, cluster_name, cpu_usage_percent, metric_timestamp) "
+        "VALUES (?, ?, ?, ?, ?)", _rows(1) + _rows(0) + _rows(200)
+    )
+    conn.commit()
+    conn.close()
+
+    shutil.copy(MIGRATIONS_ROOT / "metrics" / "0005_partition_metrics_history.py", root / "metrics")
+    assert migrate(db_path, "metrics", root) == ["0005_partition_metrics_history"]
+
+    conn = sqlite3.connect(db_path)
+    partitions = PartitionedTables()
+    # Rows past the 90-day window are gone with their partition
+    assert len(partitions.partitions(conn, "vm_metrics_history")) == 2
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 6
+    assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history_template").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0] == 0
+    conn.close()
+
+def test_recreated_partition_continues_row_ids(conn):
+    partitions = PartitionedTables()
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(1))
+    (name,) = partitions.partitions(conn, "vm_metrics_history")
+    partitions.detach(conn, "vm_metrics_history", [name])
+
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(1, count=1))
+    assert conn.execute(f'SELECT id FROM "{name}"').fetchone()[0] == 4
+
+def test_existing_rows_get_epoch_ms_timestamps(tmp_path):
+    root = tmp_path / "migrations"
+    (root / "metrics").mkdir(parents=True)
+    for path in sorted((MIGRATIONS_ROOT / "metrics").iterdir()):
+        if path.name < "0007":
+            shutil.copy(path, root / "metrics")
+    db_path = str(tmp_path / "metrics.db")
+    migrate(db_path, "metrics", root)
+
+    conn = sqlite3.connect(db_path)
+    partitions = PartitionedTables()
+    name = partitions.ensure_partition(conn, "vm_metrics_history", TODAY)
+    rows = _rows(0) + [("vm-1", "vm-1", "c1", 9.0, (TODAY + timedelta(hours=5, milliseconds=250)).isoformat())]
+    conn.executemany(f'INSERT INTO "{name}" ({", ".join(COLUMNS)}) VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    shutil.copy(MIGRATIONS_ROOT / "metrics" / "0007_epoch_ms_timestamps.py", root / "metrics")
+    assert migrate(db_path, "metrics", root) == ["0007_epoch_ms_timestamps"]
+
+    conn = sqlite3.connect(db_path)
+    converted = conn.execute(
+        "SELECT metric_timestamp, metric_ts_ms FROM vm_metrics_history ORDER BY metric_ts_ms"
+    ).fetchall()
+    # History text was local time until 0010
+    assert [ms for _, ms in converted] == [round(datetime.fromisoformat(ts).timestamp() * 1000) for ts, _ in converted]
+    assert len(converted) == 4
+    # New rows get the integer column without the caller passing it
+    partitions.insert(conn, "vm_metrics_history", COLUMNS, _rows(0, count=1))
+    assert conn.execute(f'SELECT COUNT(*) FROM "{name}" WHERE metric_ts_ms IS NULL').fetchone()[0] == 0
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                                               (name,))}
+    assert f"idx_vm_metrics_vm_ts_cover{name[len('vm_metrics_history'):]}" in indexes
+    assert not any("time" in index for index in indexes)
+    conn.close()
@@ -0,0 +1,73 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from monitoring.prometheus_async import AsyncPrometheusClient, split_range
+
+def _handler(seen):
+    """Fake Prometheus: two series, one sample per step inside the requested window"""
+    def handle(request):
+        params = request.url.params
+        seen.append(request.url.path)
+        if request.url.path == "/-/healthy":
+            return httpx.Response(200, text="Prometheus is Healthy.")
+        if request.url.path == "/api/v1/query":
+            return httpx.Response(200, json={"status": "success", "data": {
+                "resultType": "vector",
+                "result": [{"metric": {"instance": "node-1"}, "value": [1700000000, "42"]}]
+            }})
+        start, end, step = int(params["start"]), int(params["end"]), int(params["step"])
+        result = [
+            {"metric": {"instance": f"node-{n}"},
+             "values": [[ts, str(ts % 100)] for ts in range(start, end + 1, step)]}
+            for n in range(2)
+        ]
+        return httpx.Response(200, json={"status": "success", "data": {"resultType": "matrix", "result": result}})
+    return handle
+
+def test_split_range_is_step_aligned_and_non_overlapping():
+    windows = split_range(0, 86400, 300, 6 * 3600)
+    assert len(windows) == 5
+    assert windows[0] == (0, 21300)
+    assert windows[1][0] == 21600
+    assert windows[-1][1] == 86400
+
+def test_range_queries_are_chunked_and_merged_per_series():
+    seen = []
+
+    async def run():
+        async with AsyncPrometheusClient("http://prom", transport=httpx.MockTransport(_handler(seen))) as client:
+            assert await client.healthy()
+            return await asyncio.gather(
+                client.query_many({"cpu": "up", "mem": "up"}),
+                client.query_range_many({"cpu": "up"}, 0, 86400, step=300)
+            )
+
+    current, history = asyncio.run(run())
+    assert current["cpu"][0]["value"][1] == "42"
+    assert seen.count("/api/v1/query_range") == 5
+
+    series = history["cpu"]
+    assert len(series) == 2
+    timestamps = list(series[0].timestamps)
+    assert len(timestamps) == 86400 // 300 + 1
+    assert timestamps == sorted(timestamps)
+    assert series[0].to_matrix_entry()["values"][1] == [300.0, "0.0"]
+
+def test_failed_queries_yield_empty_results():
+    def handle(request):
+        return httpx.Response(503)
+
+    async def run():
+        async with AsyncPrometheusClient("http://prom", transport=httpx.MockTransport(handle)) as client:
+            return await client.query_many({"cpu": "up"}), await client.query_range_many({"cpu": "up"}, 0, 600)
+
+    current, history = asyncio.run(run())
+    assert current == {"cpu": []}
+    assert history == {"cpu": []}
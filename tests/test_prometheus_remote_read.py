@@ -0,0 +1,162 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from monitoring import prometheus_remote_read as rr
+
+STEP_MS = 15000
+
+def _encode_response(queries):
+    """ReadResponse holding two instances per query, one sample every STEP_MS"""
+    results = bytearray()
+    for start_ms, end_ms, matchers in queries:
+        name = dict((label, value) for _, label, value in matchers)["__name__"]
+        series_list = bytearray()
+        for instance in ("node-a:9100", "node-b:9100"):
+            series = bytearray()
+            for label, value in (("__name__", name), ("instance", instance)):
+                series += rr._field(1, rr._field(1, label.encode()) + rr._field(2, value.encode()))
+            first = start_ms + (-start_ms) % STEP_MS
+            for ts in range(first, end_ms + 1, STEP_MS):
+                value = 0.25 if "cpu" in name else 0.5
+                sample = rr._varint(1 << 3 | 1) + struct.pack("<d", value) + rr._varint(2 << 3) + rr._varint(ts)
+                series += rr._field(2, sample)
+            series_list += rr._field(1, bytes(series))
+        results += rr._field(1, bytes(series_list))
+    return bytes(results)
+
+def _decode_request(body):
+    queries = []
+    for number, _, span in rr._iter_fields(body, 0, len(body)):
+        if number != 1:
+            continue
+        start_ms = end_ms = 0
+        matchers = []
+        for field, _, value in rr._iter_fields(body, *span):
+            if field == 1:
+                start_ms = value
+            elif field == 2:
+                end_ms = value
+            elif field == 3:
+                parts = {f: v for f, _, v in rr._iter_fields(body, *value)}
+                matchers.append((parts.get(1, 0), bytes(body[slice(*parts[2])]).decode(),
+                                 bytes(body[slice(*parts[3])]).decode()))
+        queries.append((start_ms, end_ms, matchers))
+    return queries
+
+@pytest.fixture
+def remote_read_server():
+    """Local stand-in for Prometheus /api/v1/read; can be told to fail after N requests"""
+    state = {"requests": 0, "fail_after": None}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            state["requests"] += 1
+            if state["fail_after"] is not None and state["requests"] > state["fail_after"]:
+                self.send_response(503)
+                self.end_headers()
+                return
+            assert self.headers["Content-Encoding"] == "snappy"
+            payload = rr.snappy_compress(_encode_response(_decode_request(rr.snappy_decompress(body))))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+def test_snappy_roundtrip_handles_copies():
+    # literal "abc", then a 1-byte-offset copy of 6 bytes at offset 3 (overlapping)
+    compressed = bytes([9, 0x08]) + b"abc" + bytes([0x09, 3])
+    assert rr.snappy_decompress(compressed) == b"abcabcabc"
+    data = bytes(range(256)) * 300
+    assert rr.snappy_decompress(rr.snappy_compress(data)) == data
+
+def test_parse_selector():
+    assert rr.parse_selector('up{job="node",instance=~"db-.*"}') == [
+        (0, "__name__", "up"), (0, "job", "node"), (2, "instance", "db-.*")
+    ]
+    with pytest.raises(ValueError):
+        rr.parse_selector("rate(up[5m])")
+
+def test_backfill_is_resumable_per_window(tmp_path, remote_read_server):
+    url, state = remote_read_server
+    db_path = str(tmp_path / "metrics.db")
+    # Recent range: retention drops partitions older than 90 days
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = hour - timedelta(hours=5)
+    end = hour - timedelta(hours=1, milliseconds=1)
+
+    state["fail_after"] = 2
+    stats = rr.RemoteReadBackfill(url, db_path=db_path).run(start, end)
+    assert stats["status"] == "error"
+    assert stats["windows"] == 2
+
+    state["fail_after"] = None
+    state["requests"] = 0
+    stats = rr.RemoteReadBackfill(url, db_path=db_path).run(start, end)
+    assert stats["status"] == "success"
+    assert stats["skipped"] == 2
+    assert stats["windows"] == 2
+    assert state["requests"] == 2
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # 4h at 15s for two instances, cpu and memory aligned into one row
+        assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 2 * 4 * 240
+        row = conn.execute(
+            "SELECT vm_id, cluster_name, cpu_usage_percent, memory_usage_percent FROM vm_metrics_history LIMIT 1"
+        ).fetchone()
+        assert row == ("node-a:9100", "prometheus", 25.0, 50.0)
+        assert conn.execute("SELECT COUNT(*) FROM prometheus_backfill_progress").fetchone()[0] == 4
+    finally:
+        conn.close()
+
+def test_overlapping_runs_load_each_sample_once(tmp_path, remote_read_server):
+    url, state = remote_read_server
+    db_path = str(tmp_path / "metrics.db")
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = hour - timedelta(hours=4)
+
+    # Ends half way through a window, then a later run with a different
+    # start and end covers it again and carries on
+    first = rr.RemoteReadBackfill(url, db_path=db_path).run(
+        start + timedelta(minutes=20), hour - timedelta(hours=2, minutes=30)
+    )
+    assert first["windows"] == 2
+    state["requests"] = 0
+    second = rr.RemoteReadBackfill(url, db_path=db_path).run(start, hour - timedelta(hours=1, milliseconds=1))
+    assert second["status"] == "success"
+    # The first window's head, the cut-short window's tail and one new window
+    assert (second["windows"], second["skipped"]) == (3, 0)
+    assert state["requests"] == 3
+    assert rr.RemoteReadBackfill(url, db_path=db_path).run(start, hour - timedelta(hours=1, milliseconds=1))["skipped"] == 3
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # 3h at 15s for two instances, no duplicates
+        assert conn.execute("SELECT COUNT(*) FROM vm_metrics_history").fetchone()[0] == 2 * 3 * 240
+        assert conn.execute(
+            "SELECT COUNT(*) FROM (SELECT DISTINCT vm_id, metric_ts_ms FROM vm_metrics_history)"
+        ).fetchone()[0] == 2 * 3 * 240
+        assert conn.execute("SELECT COUNT(*) FROM prometheus_backfill_progress").fetchone()[0] == 3
+    finally:
+        conn.close()
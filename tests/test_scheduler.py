@@ -0,0 +1,102 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from monitoring.scheduler import CollectionScheduler, SourceState
+
+def _config(**intervals):
+    config = {"scheduler": {"jitter_ratio": 0.0}}
+    for name, interval in intervals.items():
+        config[name] = {"host": "x", "collection_interval_seconds": interval}
+    return config
+
+def test_sources_run_on_their_own_interval_without_overlap():
+    calls = {"fast": 0, "slow": 0}
+    active = {"slow": 0, "max_slow": 0}
+
+    async def fast():
+        calls["fast"] += 1
+
+    async def slow():
+        calls["slow"] += 1
+        active["slow"] += 1
+        active["max_slow"] = max(active["max_slow"], active["slow"])
+        await asyncio.sleep(0.15)
+        active["slow"] -= 1
+
+    async def run():
+        scheduler = CollectionScheduler(
+            {"fast": fast, "slow": slow, "unconfigured": fast},
+            lambda: _config(fast=0.02, slow=0.05), run_in_thread=False
+        )
+        await scheduler.start()
+        await asyncio.sleep(0.05)
+        # A manual trigger while the slow source is mid-run is skipped
+        assert await scheduler.run_now("slow") is False
+        await asyncio.sleep(0.3)
+        status = scheduler.status()
+        await scheduler.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert set(status["sources"]) == {"fast", "slow"}
+    assert calls["fast"] > calls["slow"] >= 1
+    assert active["max_slow"] == 1
+    slow_stats = status["sources"]["slow"]
+    assert slow_stats["skipped_overlaps"] == 1
+    # Runs take 3x the interval, so the schedule stretches instead of piling up
+    assert slow_stats["backpressure_events"] >= 1
+    assert slow_stats["effective_interval_seconds"] > 0.05
+
+def test_failures_back_off_and_are_reported():
+    state = SourceState("zabbix", None, 10)
+    state.record(1.0, "connection refused")
+    state.record(1.0, "connection refused")
+    assert state.next_interval() == 40
+    assert state.to_dict()["last_error"] == "connection refused"
+    state.record(1.0, None)
+    assert state.next_interval() == 10
+
+def test_blocking_jobs_do_not_stall_the_event_loop():
+    async def blocking():
+        time.sleep(0.3)  # e.g. a synchronous SDK call inside an async route
+
+    async def run():
+        scheduler = CollectionScheduler({"vcenter": blocking}, lambda: _config(vcenter=60))
+        await scheduler.start()
+        ticks = 0
+        started = time.monotonic()
+        while time.monotonic() - started < 0.2:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        await scheduler.stop()
+        return ticks
+
+    assert asyncio.run(run()) > 10
+
+def test_manual_runs_holding_the_shared_lock_are_not_overlapped():
+    calls = []
+
+    async def job():
+        calls.append("scheduled")
+
+    async def run():
+        locks = {}
+        scheduler = CollectionScheduler({"vcenter": job}, lambda: _config(vcenter=60), locks=locks)
+        await scheduler.start()
+        await asyncio.sleep(0)
+        # A manual sync route holds the same lock while it runs
+        async with locks["vcenter"]:
+            assert await scheduler.run_now("vcenter") is False
+        assert await scheduler.run_now("vcenter") is True
+        status = scheduler.status()
+        await scheduler.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert calls == ["scheduled"]
+    assert status["sources"]["vcenter"]["skipped_overlaps"] >= 1
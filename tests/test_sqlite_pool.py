@@ -0,0 +1,76 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+
+import pytest
+
+from db.sqlite_pool import SQLitePool
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "iroa.db"), max_readers=2)
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE t (v INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    yield pool
+    pool.close()
+
+def test_connections_use_wal_and_tuned_pragmas(pool):
+    with pool.writer() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    with pool.reader() as conn:
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -65536
+        with pytest.raises(Exception):
+            conn.execute("INSERT INTO t VALUES (2)")
+
+def test_reads_are_not_blocked_by_an_open_write(pool):
+    writer = pool.acquire_writer()
+    writer.execute("INSERT INTO t VALUES (2)")
+    started = time.perf_counter()
+    with pool.reader() as conn:
+        # Readers see the last committed snapshot without waiting
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    assert time.perf_counter() - started < 0.5
+    pool.release(writer, commit=True)
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 2
+
+def test_nested_writes_share_one_transaction_and_roll_back_together(pool):
+    with pytest.raises(RuntimeError):
+        with pool.writer() as outer:
+            outer.execute("INSERT INTO t VALUES (2)")
+            with pool.writer() as inner:
+                assert inner is outer
+                inner.execute("INSERT INTO t VALUES (3)")
+            raise RuntimeError("abort")
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    assert pool.status()["rollbacks"] == 1
+
+def test_reader_pool_is_bounded(pool):
+    first, second = pool.acquire_reader(), pool.acquire_reader()
+    acquired = threading.Event()
+
+    def third():
+        conn = pool.acquire_reader()
+        acquired.set()
+        pool.release(conn)
+
+    thread = threading.Thread(target=third)
+    thread.start()
+    assert not acquired.wait(0.1)
+    pool.release(first)
+    assert acquired.wait(2)
+    thread.join()
+    pool.release(second)
+
+    status = pool.status()
+    assert status["readers_open"] == 2
+    assert status["readers_in_use"] == 0
+    assert status["reader_waits"] == 1
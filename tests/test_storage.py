@@ -0,0 +1,119 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from analysis.engine import get_underutilized_vms
+from db.models import Base
+from db.storage import SQLAlchemyStorage, SQLiteStorage, to_epoch_ms
+
+START = datetime(2025, 3, 1, 12, 0)
+
+@pytest.fixture(params=["sqlalchemy", "sqlite"])
+def storage(request, tmp_path):
+    # The same contract runs against both backends
+    if request.param == "sqlalchemy":
+        engine = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+        Base.metadata.create_all(bind=engine)
+        return SQLAlchemyStorage(sessionmaker(bind=engine))
+    return SQLiteStorage(str(tmp_path / "metrics.db"))
+
+def _samples(vm_id, count, cpu=5.0, memory=10.0):
+    return [
+        {"vm_id": vm_id, "timestamp": START + timedelta(minutes=i), "cpu_usage": cpu + i, "memory_usage": memory}
+        for i in range(count)
+    ]
+
+def test_vms_are_created_once(storage):
+    first = storage.resolve_vms({"a": None, "b": {"cluster": "prod", "cpu_cores": 8}})
+    assert sorted(first["created"]) == ["a", "b"]
+    again = storage.resolve_vms({"a": None, "b": None, "c": None})
+    assert again["created"] == ["c"]
+    assert again["ids"]["a"] == first["ids"]["a"]
+    assert {vm["name"]: vm["cluster"] for vm in storage.list_vms()} == {"a": "default", "b": "prod", "c": "default"}
+
+def test_range_reads_return_time_ordered_arrays(storage):
+    vm_id = storage.resolve_vms({"a": None})["ids"]["a"]
+    # Written out of order; aware timestamps are converted to UTC
+    samples = _samples(vm_id, 10)
+    samples[3]["timestamp"] = samples[3]["timestamp"].replace(tzinfo=timezone.utc)
+    assert storage.write_metrics(samples[5:] + samples[:5]) == 10
+
+    series = storage.read_metrics(vm_id, since=START + timedelta(minutes=2), until=START + timedelta(minutes=8))
+    assert series["timestamp_ms"].dtype == np.int64
+    assert series["timestamp_ms"].tolist() == [to_epoch_ms(START + timedelta(minutes=i)) for i in range(2, 8)]
+    assert series["cpu_usage"].tolist() == [5.0 + i for i in range(2, 8)]
+    # Metrics the writer left out are stored as NULL and read as NaN, not 0
+    assert np.isnan(series["disk_io"]).all()
+    assert len(storage.read_metrics(vm_id + 1)["timestamp_ms"]) == 0
+
+def test_aggregates_are_per_vm_averages(storage):
+    ids = storage.resolve_vms({"idle": None, "busy": None})["ids"]
+    storage.write_metrics(_samples(ids["idle"], 4, cpu=1.0, memory=5.0) + _samples(ids["busy"], 4, cpu=80.0))
+
+    aggregates = {row["name"]: row for row in storage.aggregate_metrics(since=START + timedelta(minutes=1))}
+    assert aggregates["idle"]["samples"] == 3
+    assert aggregates["idle"]["avg_cpu_usage"] == pytest.approx(3.0)
+    assert aggregates["busy"]["avg_memory_usage"] == pytest.approx(10.0)
+    assert aggregates["busy"]["avg_disk_io"] is None
+    assert storage.aggregate_metrics(since=START + timedelta(days=1)) == []
+
+def test_underutilized_analysis_runs_on_either_backend(storage):
+    ids = storage.resolve_vms({"idle": None, "busy": None})["ids"]
+    now = datetime.utcnow()
+    storage.write_metrics([
+        {"vm_id": ids["idle"], "timestamp": now, "cpu_usage": 2.0, "memory_usage": 5.0},
+        {"vm_id": ids["busy"], "timestamp": now, "cpu_usage": 90.0, "memory_usage": 5.0},
+    ])
+    assert [vm["vm"] for vm in get_underutilized_vms(storage=storage)] == ["idle"]
+
+def test_underutilized_query_filters_and_paginates(storage):
+    names = {f"vm-{i}": None for i in range(5)}
+    ids = storage.resolve_vms(names)["ids"]
+    # vm-0..vm-3 are idle, vm-4 is busy on CPU
+    rows = []
+    for i in range(5):
+        rows += _samples(ids[f"vm-{i}"], 4, cpu=80.0 if i == 4 else 1.0, memory=5.0)
+    storage.write_metrics(rows)
+
+    page = storage.underutilized_vms(10.0, 20.0, since=START, limit=2, offset=1)
+    assert page["total"] == 4
+    assert [vm["name"] for vm in page["items"]] == ["vm-1", "vm-2"]
+    assert page["items"][0]["samples"] == 4
+    assert page["items"][0]["avg_cpu_usage"] == pytest.approx(2.5)
+    assert "p95_cpu_usage" not in page["items"][0]
+
+    # Past the last match the total still counts every match
+    assert storage.underutilized_vms(10.0, 20.0, since=START, limit=2, offset=10) == {"total": 4, "items": []}
+    assert storage.underutilized_vms(10.0, 20.0, since=START + timedelta(days=1)) == {"total": 0, "items": []}
+
+def test_vms_without_utilisation_samples_are_not_underutilized(storage):
+    ids = storage.resolve_vms({"idle": None, "no-data": None})["ids"]
+    storage.write_metrics([
+        {"vm_id": ids["idle"], "timestamp": START, "cpu_usage": 1.0, "memory_usage": 5.0},
+        {"vm_id": ids["no-data"], "timestamp": START, "disk_io": 3.0},
+    ])
+    page = storage.underutilized_vms(10.0, 20.0, since=START)
+    assert page["total"] == 1 and [vm["name"] for vm in page["items"]] == ["idle"]
+
+def test_underutilized_query_percentiles(storage):
+    vm_id = storage.resolve_vms({"idle": None})["ids"]["idle"]
+    storage.write_metrics(_samples(vm_id, 5, cpu=1.0))
+
+    item = storage.underutilized_vms(10.0, 20.0, percentiles=True)["items"][0]
+    assert item["p95_cpu_usage"] == pytest.approx(np.percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95))
+    assert item["p95_memory_usage"] == pytest.approx(10.0)
+
+def test_naive_timestamps_are_utc_in_every_store():
+    from db import partitions
+    moment = datetime(2025, 3, 30, 1, 30)
+    assert to_epoch_ms is partitions.to_epoch_ms
+    assert to_epoch_ms(moment) == to_epoch_ms(moment.replace(tzinfo=timezone.utc)) == to_epoch_ms(moment.isoformat())
+    assert to_epoch_ms(moment) == 1743298200000
@@ -0,0 +1,81 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, VirtualMachine, VMMetric
+from monitoring import store_metrics as sm
+
+def _session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def test_bulk_ingest_creates_vms_once_and_reports_throughput(tmp_path):
+    sm.clear_vm_id_cache()
+    Session = _session_factory(tmp_path)
+    now = datetime.utcnow()
+    metrics = [
+        {"instance": f"node-{i % 50}", "cpu_usage": float(i), "timestamp": now}
+        for i in range(500)
+    ]
+
+    stats = sm.store_metrics_bulk(metrics, session_factory=Session)
+    assert stats["status"] == "success"
+    assert stats["rows"] == 500
+    assert stats["vms_created"] == 50
+    assert stats["rows_per_sec"] > 0
+
+    # Second scrape resolves every VM from the in-process cache
+    stats = sm.store_metrics_bulk(metrics, session_factory=Session)
+    assert stats["vms_created"] == 0
+    assert stats["cache_hits"] == 50
+
+    db = Session()
+    try:
+        assert db.query(VirtualMachine).count() == 50
+        assert db.query(VMMetric).count() == 1000
+    finally:
+        db.close()
+
+def test_bulk_ingest_reuses_existing_vms(tmp_path):
+    sm.clear_vm_id_cache()
+    Session = _session_factory(tmp_path)
+    db = Session()
+    db.add(VirtualMachine(name="existing", cluster="prod", cpu_cores=2, memory_gb=4, disk_gb=50))
+    db.commit()
+    db.close()
+
+    stats = sm.store_metrics_bulk([{"instance": "existing", "timestamp": datetime.utcnow()}], session_factory=Session)
+    assert stats["vms_created"] == 0
+
+    db = Session()
+    try:
+        assert db.query(VirtualMachine).filter_by(name="existing").one().cluster == "prod"
+    finally:
+        db.close()
+
+def test_vm_id_cache_is_kept_per_backend(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first, second = _session_factory(tmp_path / "a"), _session_factory(tmp_path / "b")
+    db = second()
+    db.add(VirtualMachine(name="padding", cluster="prod", cpu_cores=1, memory_gb=1, disk_gb=1))
+    db.commit()
+    db.close()
+
+    sm.store_metrics_bulk([{"instance": "web", "timestamp": datetime.utcnow()}], session_factory=first)
+    stats = sm.store_metrics_bulk([{"instance": "web", "timestamp": datetime.utcnow()}], session_factory=second)
+    # Ids cached for the first database are not reused for the second
+    assert stats["cache_hits"] == 0 and stats["vms_created"] == 1
+
+    db = second()
+    try:
+        web = db.query(VirtualMachine).filter_by(name="web").one()
+        assert [metric.vm_id for metric in db.query(VMMetric).all()] == [web.id]
+    finally:
+        db.close()
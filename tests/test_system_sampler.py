@@ -0,0 +1,65 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, VirtualMachine, VMMetric
+from monitoring.mac_monitor import MacSystemMonitor
+from monitoring.system_sampler import SystemSampler
+
+def test_background_thread_fills_bounded_window():
+    sampler = SystemSampler(interval=0.02, window_size=5).start()
+    try:
+        deadline = time.monotonic() + 5
+        while sampler.sequence < 8 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        sampler.stop()
+    assert not sampler.running
+    assert sampler.sequence >= 8
+    assert len(sampler.samples) == 5
+    sample = sampler.latest()
+    assert sample["sequence"] == sampler.sequence
+    assert 0 <= sample["cpu_percent"] <= 100
+    assert {"bytes_sent_per_sec", "bytes_recv"} <= set(sample["network"])
+
+def test_readers_do_not_block_on_cpu_interval():
+    sampler = SystemSampler()
+    sampler.sample_once()
+    monitor = MacSystemMonitor(sampler=sampler, session=object())
+    started = time.perf_counter()
+    for _ in range(1000):
+        monitor.get_cpu_usage()
+        monitor.get_memory_usage()
+    assert time.perf_counter() - started < 0.5
+
+def test_collect_metrics_writes_window_in_one_batch(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([VirtualMachine(name=f"mac-vm-{i}") for i in range(3)])
+    session.commit()
+
+    sampler = SystemSampler()
+    for _ in range(4):
+        sampler.sample_once()
+    monitor = MacSystemMonitor(sampler=sampler, session=session)
+
+    result = monitor.collect_metrics()
+    assert result["samples"] == 4
+    assert result["rows"] == 12
+    assert session.query(VMMetric).count() == 12
+
+    # Only samples taken after the last write are stored next time
+    sampler.sample_once()
+    assert monitor.collect_metrics()["rows"] == 3
+    assert session.query(VMMetric).count() == 15
+
+    # Nothing new was sampled: the latest sample is not written again
+    assert monitor.collect_metrics()["rows"] == 0
+    assert session.query(VMMetric).count() == 15
+    session.close()
@@ -0,0 +1,50 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from api.tdigest import TDigest
+
+def _data(n=50000, seed=7):
+    return np.random.default_rng(seed).gamma(2.0, 10.0, n)
+
+def test_quantiles_track_exact_values():
+    data = _data()
+    digest = TDigest.of(data.tolist())
+    assert digest.count == len(data)
+    assert digest.quantile(0) == data.min()
+    assert digest.quantile(1) == data.max()
+    for q in (0.5, 0.95, 0.99):
+        assert digest.quantile(q) == pytest.approx(np.quantile(data, q), rel=0.01)
+
+def test_merged_digests_match_one_digest_of_all_samples():
+    data = _data()
+    # 5-minute sized pieces, merged as the rollups merge them
+    pieces = [TDigest.of(data[i:i + 5].tolist()) for i in range(0, len(data), 5)]
+    merged = TDigest.merged(pieces)
+    assert merged.count == len(data)
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == pytest.approx(np.quantile(data, q), rel=0.01)
+    # Merging does not modify its inputs
+    assert sum(piece.count for piece in pieces) == len(data)
+
+def test_small_inputs_keep_every_sample():
+    digest = TDigest.of([4.0, 1.0, 3.0, 2.0, 5.0])
+    assert digest.quantile(0.5) == 3.0
+    assert digest.centroids == [(1.0, 1.0), (2.0, 1.0), (3.0, 1.0), (4.0, 1.0), (5.0, 1.0)]
+    assert TDigest.of([7.0]).quantile(0.95) == 7.0
+    assert TDigest().quantile(0.5) is None
+
+def test_serialization_round_trips_and_stays_small():
+    digest = TDigest.of(_data().tolist())
+    blob = digest.to_bytes()
+    restored = TDigest.from_bytes(blob)
+    assert restored.centroids == pytest.approx(digest.centroids)
+    assert (restored.min, restored.max) == (digest.min, digest.max)
+    assert restored.quantile(0.99) == pytest.approx(digest.quantile(0.99))
+    assert len(blob) < 2000
+    with pytest.raises(ValueError):
+        TDigest.from_bytes(b"\x09" + blob[1:])
@@ -0,0 +1,300 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyVmomi")
+from pyVmomi import vim, vmodl
+
+from monitoring.vcenter_inventory import (
+    VCenterChangeTracker, VCenterInventoryCollector, collect_vcenter_inventory
+)
+
+PC = vmodl.query.PropertyCollector
+
+
+class FakeView(vim.view.ContainerView):
+    destroyed = False
+
+    def Destroy(self):
+        self.destroyed = True
+
+
+class FakePropertyCollector:
+    """Local stand-in for the vCenter PropertyCollector SOAP endpoint.
+
+    Honours the PropertySpec type/pathSet selection and maxObjects paging,
+    and counts round trips.
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = 0
+        self._pages = {}
+
+    def _select(self, spec_set):
+        prop_specs = spec_set[0].propSet
+        contents = []
+        for obj, props in self.objects:
+            paths = set()
+            for spec in prop_specs:
+                if isinstance(obj, spec.type):
+                    paths.update(spec.pathSet)
+            if not paths:
+                continue
+            contents.append(PC.ObjectContent(
+                obj=obj,
+                propSet=[vmodl.DynamicProperty(name=k, val=v) for k, v in props.items() if k in paths]
+            ))
+        return contents
+
+    def _page(self, contents, page_size):
+        page, rest = contents[:page_size], contents[page_size:]
+        token = None
+        if rest:
+            token = f"token-{len(self._pages)}"
+            self._pages[token] = (rest, page_size)
+        return PC.RetrieveResult(objects=page, token=token)
+
+    def RetrievePropertiesEx(self, spec_set, options):
+        self.calls += 1
+        return self._page(self._select(spec_set), options.maxObjects)
+
+    def ContinueRetrievePropertiesEx(self, token):
+        self.calls += 1
+        rest, page_size = self._pages.pop(token)
+        return self._page(rest, page_size)
+
+    # Change tracking: a dedicated collector with one filter, fed by queued updates
+
+    def CreatePropertyCollector(self):
+        self.pending = []
+        self.filter_spec = None
+        return self
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.filter_spec = spec
+        return SimpleNamespace(Destroy=lambda: None)
+
+    def DestroyPropertyCollector(self):
+        self.filter_spec = None
+
+    def queue(self, kind, obj, props=None):
+        changes = [PC.Change(name=k, op="assign", val=v) for k, v in (props or {}).items()]
+        self.pending.append(PC.ObjectUpdate(kind=kind, obj=obj, changeSet=changes))
+
+    def WaitForUpdatesEx(self, version, options):
+        self.calls += 1
+        if version == "":
+            self.pending = [
+                PC.ObjectUpdate(
+                    kind="enter", obj=content.obj,
+                    changeSet=[PC.Change(name=p.name, op="assign", val=p.val) for p in content.propSet]
+                )
+                for content in self._select([self.filter_spec])
+            ] + self.pending
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending[:options.maxObjectUpdates], self.pending[options.maxObjectUpdates:]
+        return PC.UpdateSet(
+            version=str(int(version or 0) + 1),
+            filterSet=[PC.FilterUpdate(objectSet=batch)],
+            truncated=bool(self.pending)
+        )
+
+
+def _fake_vcenter(num_hosts=3, vms_per_host=40):
+    dc = vim.Datacenter("datacenter-1")
+    host_folder = vim.Folder("group-h1")
+    cluster = vim.ClusterComputeResource("domain-c1")
+    ds = vim.Datastore("datastore-1")
+    net = vim.Network("network-1")
+    objects = [
+        (dc, {"name": "DC-East", "parent": vim.Folder("group-d1")}),
+        (host_folder, {"name": "host", "parent": dc}),
+        (cluster, {
+            "name": "Prod", "parent": host_folder,
+            "summary.numCpuCores": 96, "summary.totalCpu": 200000, "summary.effectiveCpu": 150000,
+            "summary.totalMemory": 512 * 1024**3, "summary.effectiveMemory": 400 * 1024,
+            "summary.numHosts": num_hosts,
+            "configuration.drsConfig.enabled": True, "configuration.dasConfig.enabled": False
+        }),
+        (ds, {
+            "name": "ds-01", "summary.accessible": True, "summary.type": "VMFS",
+            "summary.capacity": 1000 * 1024**3, "summary.freeSpace": 250 * 1024**3,
+            "summary.maintenanceMode": "normal"
+        }),
+        (net, {"name": "VM Network", "summary.accessible": True}),
+    ]
+    for h in range(num_hosts):
+        host = vim.HostSystem(f"host-{h}")
+        objects.append((host, {
+            "name": f"esxi-{h:02d}", "parent": cluster,
+            "summary.hardware": vim.host.Summary.HardwareSummary(
+                numCpuCores=32, numCpuThreads=64, cpuMhz=2500,
+                memorySize=256 * 1024**3, vendor="Dell", model="R750"
+            ),
+            "summary.quickStats.overallCpuUsage": 12000,
+            "summary.quickStats.overallMemoryUsage": 65536,
+            "summary.runtime.powerState": "poweredOn",
+            "summary.runtime.connectionState": "connected",
+            "summary.config.product.version": "8.0.2"
+        }))
+        for v in range(vms_per_host):
+            objects.append((vim.VirtualMachine(f"vm-{h}-{v}"), {
+                "name": f"vm-{h}-{v}",
+                "summary.config": vim.vm.Summary.ConfigSummary(
+                    name=f"vm-{h}-{v}", numCpu=2, memorySizeMB=4096,
+                    guestFullName="Ubuntu Linux (64-bit)", uuid=f"uuid-{h}-{v}", annotation=""
+                ),
+                "summary.runtime.powerState": "poweredOn" if v % 4 else "poweredOff",
+                "summary.quickStats.overallCpuUsage": 400,
+                "summary.quickStats.hostMemoryUsage": 1024,
+                "summary.storage.committed": 20 * 1024**3,
+                "runtime.host": host,
+                "guest.toolsStatus": "toolsOk",
+                "datastore": vim.Datastore.Array([ds]),
+                "network": vim.Network.Array([net]),
+            }))
+    collector = FakePropertyCollector(objects)
+    view = FakeView("session[fake]view-1")
+    content = SimpleNamespace(
+        rootFolder=vim.Folder("group-d1"),
+        propertyCollector=collector,
+        viewManager=SimpleNamespace(CreateContainerView=lambda *args: view),
+    )
+    return content, collector, view
+
+
+def test_inventory_arrives_in_a_handful_of_paginated_calls():
+    content, collector, view = _fake_vcenter(num_hosts=3, vms_per_host=40)
+    inventory = collect_vcenter_inventory(content, page_size=50)
+
+    # 5 infra objects + 3 hosts + 120 VMs = 128 objects -> 3 pages of 50
+    assert collector.calls == 3
+    assert inventory["retrieval_calls"] == 3
+    assert view.destroyed
+    assert len(inventory["vms"]) == 120
+    assert len(inventory["hosts"]) == 3
+    assert [dc["name"] for dc in inventory["datacenters"]] == ["DC-East"]
+
+
+def test_parent_chain_and_counts_are_resolved_locally():
+    content, _, _ = _fake_vcenter(num_hosts=2, vms_per_host=4)
+    inventory = collect_vcenter_inventory(content)
+
+    vm = inventory["vms"][0]
+    assert vm["cluster"] == "Prod"
+    assert vm["datacenter"] == "DC-East"
+    assert vm["host"].startswith("esxi-")
+    assert vm["cpu"] == 10.0
+    assert vm["memory_usage"] == 25.0
+
+    cluster = inventory["clusters"][0]
+    assert cluster["datacenter"] == "DC-East"
+    assert cluster["num_vms"] == 8
+    assert len(cluster["hosts"]) == 2
+    assert cluster["drs_enabled"] is True
+
+    assert all(host["num_vms"] == 4 for host in inventory["hosts"])
+    assert inventory["datastores"][0]["num_vms"] == 8
+    assert inventory["datastores"][0]["usage_percent"] == 75.0
+    assert inventory["networks"][0]["num_vms"] == 8
+    # powered on and below 30% CPU / 50% memory
+    assert len(inventory["underutilized_vms"]) == 6
+
+
+def test_only_requested_property_paths_are_transferred():
+    content, _, view = _fake_vcenter(num_hosts=1, vms_per_host=1)
+    collector = VCenterInventoryCollector(content)
+    spec = collector.build_filter_spec(view)
+    vm_spec = next(s for s in spec.propSet if s.type is vim.VirtualMachine)
+    assert "summary.config" in vm_spec.pathSet
+    assert not vm_spec.all
+
+
+def test_change_tracker_pulls_only_changed_objects():
+    content, collector, _ = _fake_vcenter(num_hosts=2, vms_per_host=50)
+    tracker = VCenterChangeTracker(content, page_size=40)
+
+    # Initial load arrives as paged "enter" updates
+    changes = tracker.poll()
+    assert len(changes) == 5 + 2 + 100
+    assert tracker.version == "3"
+    assert len(tracker.build_inventory()["vms"]) == 100
+
+    collector.calls = 0
+    vm = vim.VirtualMachine("vm-0-1")
+    collector.queue("modify", vm, {"summary.runtime.powerState": "poweredOff"})
+    collector.queue("leave", vim.VirtualMachine("vm-1-2"))
+    changes = tracker.poll()
+    assert collector.calls == 1
+    assert set(changes) == {"vm-0-1", "vm-1-2"}
+
+    delta = tracker.build_delta(changes)
+    assert [v["vm"] for v in delta["upserts"]["vms"]] == ["vm-0-1"]
+    assert delta["upserts"]["vms"][0]["status"] == "stopped"
+    assert delta["removals"]["vms"] == ["vm-1-2"]
+    # The host that lost a VM is re-emitted with its new count
+    assert {h["name"]: h["num_vms"] for h in delta["upserts"]["hosts"]}["esxi-01"] == 49
+
+    # Nothing pending -> a single empty round trip
+    assert tracker.poll() == {}
+    tracker.stop()
+    assert not tracker.started
+
+
+def test_change_tracker_updates_renamed_objects_under_their_moid():
+    content, collector, _ = _fake_vcenter(num_hosts=1, vms_per_host=2)
+    tracker = VCenterChangeTracker(content)
+    tracker.poll()
+
+    config = vim.vm.Summary.ConfigSummary(
+        name="renamed", numCpu=2, memorySizeMB=4096, guestFullName="Ubuntu", uuid="uuid-0-0", annotation=""
+    )
+    collector.queue("modify", vim.VirtualMachine("vm-0-0"), {"summary.config": config})
+    delta = tracker.build_delta(tracker.poll())
+    assert [(v["moid"], v["vm"]) for v in delta["upserts"]["vms"]] == [("vm-0-0", "renamed")]
+    assert delta["removals"]["vms"] == []
+
+
+def test_change_tracker_delta_scales_with_changes_not_inventory(monkeypatch):
+    content, collector, _ = _fake_vcenter(num_hosts=3, vms_per_host=50)
+    tracker = VCenterChangeTracker(content)
+    tracker.poll()
+    full = tracker.build_inventory()
+    monkeypatch.setattr(tracker, "build_inventory", lambda: pytest.fail("delta rebuilt the whole inventory"))
+
+    # A VM moving from host-0 to host-1
+    collector.queue("modify", vim.VirtualMachine("vm-0-3"), {"runtime.host": vim.HostSystem("host-1")})
+    delta = tracker.build_delta(tracker.poll())
+    upserts = delta["upserts"]
+    assert [v["vm"] for v in upserts["vms"]] == ["vm-0-3"]
+    assert upserts["vms"][0]["host"] == "esxi-01"
+    assert {h["name"]: h["num_vms"] for h in upserts["hosts"]} == {"esxi-00": 49, "esxi-01": 51}
+    # Unaffected hosts and the other 149 VMs are not re-emitted
+    (cluster,) = upserts["clusters"]
+    assert cluster["num_vms"] == 150
+    assert upserts["datastores"][0]["num_vms"] == 150
+    # Delta items match what a full build produces
+    expected = next(v for v in full["vms"] if v["moid"] == "vm-0-3")
+    assert upserts["vms"][0] == dict(expected, host="esxi-01")
+
+
+def test_change_tracker_reemits_descendants_of_renamed_parent():
+    content, collector, _ = _fake_vcenter(num_hosts=2, vms_per_host=3)
+    tracker = VCenterChangeTracker(content)
+    tracker.poll()
+
+    collector.queue("modify", vim.ClusterComputeResource("domain-c1"), {"name": "Production"})
+    delta = tracker.build_delta(tracker.poll())
+    assert delta["removals"]["clusters"] == []
+    assert [(c["moid"], c["name"]) for c in delta["upserts"]["clusters"]] == [("domain-c1", "Production")]
+    assert {h["cluster"] for h in delta["upserts"]["hosts"]} == {"Production"}
+    assert len(delta["upserts"]["vms"]) == 6
+    assert {v["cluster"] for v in delta["upserts"]["vms"]} == {"Production"}
+    assert delta["upserts"]["datastores"] == []
@@ -0,0 +1,79 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+
+from monitoring.vcenter_multisite import collect_sites, merge_inventories, tag_inventory, vcenter_sites
+
+def _site(host):
+    return {"host": host, "username": "admin", "password": "secret"}
+
+def _inventory(host, vms):
+    return {
+        "datacenters": [{"name": "DC", "moid": "datacenter-1"}],
+        "clusters": [], "hosts": [], "datastores": [], "networks": [],
+        "vms": [{"vm": name, "moid": f"vm-{i}"} for i, name in enumerate(vms)]
+    }
+
+def test_sites_come_from_list_and_legacy_entry():
+    config = {"vcenters": [_site("eu"), _site("us"), {"host": "ap"}], "vcenter": _site("eu")}
+    assert [s["host"] for s in vcenter_sites(config)] == ["eu", "us"]
+    assert [s["host"] for s in vcenter_sites({"vcenter": _site("eu")})] == ["eu"]
+
+def test_slow_site_does_not_block_the_others():
+    release = threading.Event()
+    handled = []
+
+    def collect(site):
+        if site["host"] == "slow":
+            release.wait(5)
+        if site["host"] == "broken":
+            raise ConnectionError("Cannot reach vCenter")
+        return _inventory(site["host"], [f"{site['host']}-app"])
+
+    started = time.perf_counter()
+    results = collect_sites(
+        [_site("eu"), _site("slow"), _site("broken")], collect,
+        on_result=lambda site, result: handled.append((site["host"], result["status"])),
+        timeout=0.3
+    )
+    release.set()
+
+    assert time.perf_counter() - started < 2
+    assert results["eu"]["status"] == "success"
+    assert results["broken"]["status"] == "failed"
+    assert results["slow"]["status"] == "timeout"
+    assert sorted(handled) == [("broken", "failed"), ("eu", "success"), ("slow", "timeout")]
+    assert results["eu"]["inventory"]["vms"][0]["vcenter"] == "eu"
+
+def test_failing_handler_does_not_stop_timed_out_sites_being_recorded():
+    release = threading.Event()
+    handled = []
+
+    def handle(site, result):
+        handled.append(site["host"])
+        raise RuntimeError("database is locked")
+
+    results = collect_sites(
+        [_site("slow-1"), _site("slow-2")], lambda site: release.wait(5), on_result=handle, timeout=0.1
+    )
+    release.set()
+
+    assert sorted(handled) == ["slow-1", "slow-2"]
+    assert [results[host]["status"] for host in ("slow-1", "slow-2")] == ["timeout", "timeout"]
+
+def test_merge_keys_by_site_and_moid_and_keeps_failed_sites():
+    previous = merge_inventories({}, {
+        "eu": {"status": "success", "inventory": tag_inventory(_inventory("eu", ["eu-old"]), "eu")},
+        "us": {"status": "success", "inventory": tag_inventory(_inventory("us", ["us-app"]), "us")},
+    })
+    merged = merge_inventories(previous, {
+        "eu": {"status": "success", "inventory": tag_inventory(_inventory("eu", ["eu-new"]), "eu")},
+        "us": {"status": "timeout", "error": "slow"},
+    })
+    # Same moid in two vCenters stays two objects; the timed-out site keeps its data
+    assert len(merged["datacenters"]) == 2
+    assert sorted(vm["vm"] for vm in merged["vms"]) == ["eu-new", "us-app"]
@@ -0,0 +1,94 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from monitoring.vcenter_session import VCenterSessionPool
+
+class FakeVCenter:
+    """Counts logins; sessions can be expired from the "server" side"""
+
+    def __init__(self):
+        self.logins = 0
+        self.disconnects = 0
+
+    def connect(self, host, user, pwd, port):
+        if pwd != "secret":
+            raise Exception("Login failure")
+        self.logins += 1
+        manager = SimpleNamespace(currentSession=SimpleNamespace(userName=user))
+        return SimpleNamespace(content=SimpleNamespace(sessionManager=manager), id=self.logins)
+
+    def disconnect(self, si):
+        self.disconnects += 1
+
+def _pool(vcenter, interval=0):
+    return VCenterSessionPool(vcenter.connect, vcenter.disconnect, health_check_interval=interval)
+
+def test_sessions_are_reused_per_host_and_user():
+    vcenter = FakeVCenter()
+    pool = _pool(vcenter, interval=60)
+    first = pool.get("vc1", "admin", "secret")
+    assert pool.get("vc1", "admin", "secret") is first
+    assert pool.get("vc2", "admin", "secret") is not first
+    assert vcenter.logins == 2
+    assert pool.status()["hits"] == 1
+
+    pool.close_all()
+    assert vcenter.disconnects == 2
+
+def test_expired_session_is_replaced_transparently():
+    vcenter = FakeVCenter()
+    pool = _pool(vcenter)
+    si = pool.get("vc1", "admin", "secret")
+    si.content.sessionManager.currentSession = None  # server-side expiry
+
+    fresh = pool.get("vc1", "admin", "secret")
+    assert fresh is not si
+    assert vcenter.logins == 2
+    assert pool.status()["relogins"] == 1
+
+def test_not_authenticated_during_a_call_triggers_one_relogin():
+    vim = pytest.importorskip("pyVmomi").vim
+    vcenter = FakeVCenter()
+    pool = _pool(vcenter, interval=60)
+    seen = []
+
+    def call(si):
+        seen.append(si.id)
+        if len(seen) == 1:
+            raise vim.fault.NotAuthenticated()
+        return "ok"
+
+    assert pool.run("vc1", "admin", "secret", call) == "ok"
+    assert seen == [1, 2]
+
+def test_wrong_password_is_not_served_from_the_pool():
+    vcenter = FakeVCenter()
+    pool = _pool(vcenter, interval=60)
+    si = pool.get("vc1", "admin", "secret")
+    with pytest.raises(Exception, match="Login failure"):
+        pool.get("vc1", "admin", "wrong")
+    # The rejected login leaves the pooled session connected
+    assert vcenter.disconnects == 0
+    assert pool.get("vc1", "admin", "secret") is si
+
+def test_concurrent_requests_share_one_login():
+    vcenter = FakeVCenter()
+    pool = _pool(vcenter, interval=60)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(pool.get("vc1", "admin", "secret")))
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert vcenter.logins == 1
+    assert len({id(si) for si in results}) == 1
@@ -0,0 +1,173 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+
+import pytest
+
+from db.write_buffer import WriteBuffer
+
+class RecordingSink:
+    """Sink that records each flush and can be held to simulate a slow disk"""
+
+    def __init__(self):
+        self.flushes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, batches):
+        self.release.wait(5)
+        self.flushes.append({key: list(rows) for key, rows in batches.items()})
+
+    def rows(self, key):
+        return [row for flush in self.flushes for row in flush.get(key, [])]
+
+@pytest.fixture
+def sink():
+    return RecordingSink()
+
+def test_batches_from_all_callers_are_grouped_into_one_flush(sink):
+    buffer = WriteBuffer(sink, flush_rows=1000, flush_interval=60)
+    threads = [threading.Thread(target=buffer.submit, args=("vm", [(i, n) for n in range(10)])) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buffer.submit("host", [("h1",)])
+
+    assert sink.flushes == []
+    assert buffer.flush(timeout=5)
+    assert len(sink.flushes) == 1
+    assert len(sink.rows("vm")) == 80 and sink.rows("host") == [("h1",)]
+    assert buffer.status()["written_rows"] == 81
+    buffer.close()
+
+def test_size_and_time_thresholds_trigger_writes(sink):
+    buffer = WriteBuffer(sink, flush_rows=5, flush_interval=0.05)
+    buffer.submit("vm", [(n,) for n in range(5)])
+    buffer.submit("vm", [(5,)])
+    # The full batch goes out at once, the single row once the interval passes
+    for _ in range(100):
+        if len(sink.rows("vm")) == 6:
+            break
+        threading.Event().wait(0.02)
+    assert len(sink.rows("vm")) == 6
+    buffer.close()
+
+def test_close_writes_what_is_pending(sink):
+    buffer = WriteBuffer(sink, flush_rows=1000, flush_interval=60)
+    buffer.submit("vm", [(1,), (2,)])
+    buffer.close(timeout=5)
+    assert sink.rows("vm") == [(1,), (2,)]
+    assert not buffer.submit("vm", [(3,)])
+
+def test_block_policy_waits_for_the_writer(sink):
+    buffer = WriteBuffer(sink, flush_rows=2, flush_interval=60, max_rows=3, overflow="block")
+    sink.release.clear()
+    buffer.submit("vm", [(1,), (2,)])
+    done = threading.Event()
+    threading.Thread(target=lambda: (buffer.submit("vm", [(3,), (4,)]), done.set())).start()
+    assert not done.wait(0.2)
+
+    sink.release.set()
+    assert done.wait(5)
+    buffer.close()
+    assert sink.rows("vm") == [(1,), (2,), (3,), (4,)]
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_block_policy_gives_up_when_the_writer_dies():
+    def crashing(batches):
+        raise SystemExit("writer killed")
+    buffer = WriteBuffer(crashing, flush_rows=2, flush_interval=60, max_rows=3, overflow="block")
+    buffer.submit("vm", [(1,), (2,)])
+    buffer._thread.join(5)
+    done = []
+    threading.Thread(target=lambda: done.append(buffer.submit("vm", [(3,), (4,)]))).start()
+    for _ in range(100):
+        if done:
+            break
+        threading.Event().wait(0.05)
+    assert done == [False]
+
+def test_drop_oldest_policy_keeps_the_newest_batches(sink):
+    buffer = WriteBuffer(sink, flush_rows=100, flush_interval=60, max_rows=4, overflow="drop_oldest")
+    for n in range(4):
+        buffer.submit("vm", [(n, "a"), (n, "b")])
+    assert buffer.status()["dropped_rows"] == 4
+    buffer.close()
+    assert [row[0] for row in sink.rows("vm")] == [2, 2, 3, 3]
+
+def test_spill_policy_replays_overflow_from_disk(sink, tmp_path):
+    buffer = WriteBuffer(sink, flush_rows=100, flush_interval=60, max_rows=2,
+                         overflow="spill", spill_dir=str(tmp_path))
+    buffer.submit("vm", [(1,), (2,)])
+    buffer.submit("vm", [(3,), (4,)])
+    assert buffer.status()["spilled_files"] == 1 and len(os.listdir(tmp_path)) == 1
+
+    assert buffer.flush(timeout=5)
+    assert sorted(row[0] for row in sink.rows("vm")) == [1, 2, 3, 4]
+    assert os.listdir(tmp_path) == []
+    buffer.close()
+
+def test_spill_files_left_by_a_previous_run_are_written(sink, tmp_path):
+    # As left by a process that stopped before replaying its spill
+    (tmp_path / "00000000000000000001-000001.json").write_text('{"key": "host", "rows": [["h1", 2]]}')
+
+    buffer = WriteBuffer(sink, flush_interval=60, overflow="spill", spill_dir=str(tmp_path))
+    assert buffer.status()["spilled_files"] == 1
+    assert buffer.flush(timeout=5)
+    assert sink.rows("host") == [["h1", 2]]
+    buffer.close()
+
+def test_sink_errors_are_counted_not_retried():
+    def failing(batches):
+        raise RuntimeError("disk full")
+    buffer = WriteBuffer(failing, flush_rows=100, flush_interval=60)
+    buffer.submit("vm", [(1,)])
+    assert buffer.flush(timeout=5)
+    assert buffer.status()["failed_rows"] == 1
+    buffer.close()
+
+def test_a_bad_batch_only_fails_itself(sink):
+    def picky(batches):
+        if any(row == ("bad",) for rows in batches.values() for row in rows):
+            raise ValueError("malformed row")
+        sink(batches)
+    buffer = WriteBuffer(picky, flush_rows=100, flush_interval=60)
+    buffer.submit("vm", [(1,), (2,)])
+    buffer.submit("vm", [("bad",)])
+    buffer.submit("host", [("h1",)])
+    assert buffer.flush(timeout=5)
+    assert sink.rows("vm") == [(1,), (2,)] and sink.rows("host") == [("h1",)]
+    assert buffer.status()["failed_rows"] == 1 and buffer.status()["written_rows"] == 3
+    buffer.close()
+
+def test_failed_spill_files_are_kept_and_set_aside(tmp_path):
+    attempts = []
+    def failing(batches):
+        attempts.append(batches)
+        raise RuntimeError("database is locked")
+    (tmp_path / "00000000000000000001-000001.json").write_text('{"key": "host", "rows": [["h1", 2]]}')
+
+    buffer = WriteBuffer(failing, flush_interval=60, overflow="spill", spill_dir=str(tmp_path))
+    assert buffer.flush(timeout=5)
+    assert len(attempts) == 3
+    assert os.listdir(tmp_path) == ["00000000000000000001-000001.failed"]
+    assert buffer.status()["failed_rows"] == 1 and buffer.status()["spilled_files"] == 0
+    buffer.close()
+
+def test_failed_batches_are_spilled_and_retried(sink, tmp_path):
+    failures = [RuntimeError("database is locked")]
+    def flaky(batches):
+        if failures:
+            raise failures.pop()
+        sink(batches)
+    buffer = WriteBuffer(flaky, flush_rows=100, flush_interval=60, spill_dir=str(tmp_path))
+    buffer.submit("vm", [(1,)])
+    assert buffer.flush(timeout=5)
+    assert sink.rows("vm") == [[1]]
+    assert buffer.status()["retried_rows"] == 1 and buffer.status()["failed_rows"] == 0
+    assert os.listdir(tmp_path) == []
+    buffer.close()
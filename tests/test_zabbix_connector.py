@@ -0,0 +1,97 @@
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, VMMetric
+from monitoring import store_metrics as sm
+from monitoring.zabbix_connector import ZabbixAPIError, ZabbixConnector, CPU_IDLE_KEY, MEMORY_USED_KEY
+
+class FakeZabbixSession:
+    """Answers Zabbix JSON-RPC calls for a fixed set of hosts and counts POSTs"""
+
+    def __init__(self, num_hosts, batch=True):
+        self.headers = {}
+        self.posts = 0
+        self.batch = batch
+        self.hosts = [{"hostid": str(i), "host": f"zbx-{i}"} for i in range(num_hosts)]
+
+    def _answer(self, request):
+        params = request["params"]
+        if request["method"] == "user.login":
+            result = "token"
+        elif request["method"] == "host.get":
+            result = self.hosts
+        else:
+            result = [
+                {"hostid": hostid, "key_": key, "lastvalue": "75" if key == CPU_IDLE_KEY else str(2 * 1024**3)}
+                for hostid in params["hostids"] for key in params["filter"]["key_"]
+            ]
+        return {"jsonrpc": "2.0", "result": result, "id": request["id"]}
+
+    def post(self, url, data):
+        self.posts += 1
+        request = json.loads(data)
+        if isinstance(request, list):
+            reply = [self._answer(r) for r in request] if self.batch else {
+                "jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid request."}, "id": None
+            }
+        else:
+            reply = self._answer(request)
+        return SimpleNamespace(json=lambda: reply)
+
+def _session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def test_bulk_ingest_uses_a_constant_number_of_calls(tmp_path):
+    sm.clear_vm_id_cache()
+    Session = _session_factory(tmp_path)
+    http = FakeZabbixSession(num_hosts=2500)
+    connector = ZabbixConnector("http://zabbix/api_jsonrpc.php", "Admin", "zabbix", session=http)
+
+    stats = connector.ingest_zabbix_metrics(session_factory=Session)
+    assert stats["status"] == "success"
+    assert stats["rows"] == 2500
+    # host.get + one batch holding three item.get chunks
+    assert stats["api_calls"] == 2
+    assert http.posts == 3
+
+    db = Session()
+    try:
+        metric = db.query(VMMetric).first()
+        assert metric.cpu_usage == 25.0
+        assert metric.memory_usage == 2.0
+        assert db.query(VMMetric).count() == 2500
+    finally:
+        db.close()
+
+def test_batch_rejection_falls_back_to_sequential_calls(tmp_path):
+    sm.clear_vm_id_cache()
+    http = FakeZabbixSession(num_hosts=2500, batch=False)
+    connector = ZabbixConnector("http://zabbix/api_jsonrpc.php", "Admin", "zabbix", session=http)
+
+    values = connector.get_latest_metrics([h["hostid"] for h in http.hosts], [CPU_IDLE_KEY, MEMORY_USED_KEY])
+    assert len(values) == 2500
+    assert not connector.batch_supported
+    assert values["0"][MEMORY_USED_KEY] == 2 * 1024**3
+
+def test_error_inside_a_batch_does_not_disable_batching():
+    http = FakeZabbixSession(num_hosts=10)
+    connector = ZabbixConnector("http://zabbix/api_jsonrpc.php", "Admin", "zabbix", session=http)
+    answer = http._answer
+    http._answer = lambda request: {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params."},
+                                    "id": request["id"]} if request["method"] == "bad.get" else answer(request)
+
+    with pytest.raises(ZabbixAPIError, match="bad.get"):
+        connector.call_batch([("host.get", {}), ("bad.get", {})])
+    assert connector.batch_supported
+    assert connector.call_batch([("host.get", {}), ("host.get", {})]) == [http.hosts, http.hosts]